@@ -0,0 +1,241 @@
+import boto3
+import functools
+import json
+import os
+import threading
+import time
+import weakref
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf')]
+
+THROTTLE_CODES = {
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottled',
+    'RequestThrottledException', 'TooManyRequestsException', 'RequestLimitExceeded',
+    'SlowDown', 'ProvisionedThroughputExceededException', 'BandwidthLimitExceeded'
+}
+
+METRICS_NAMESPACE = os.environ.get('API_METRICS_NAMESPACE', 'FinOpsPlatform/ApiCalls')
+EMIT_METRICS = os.environ.get('API_METRICS', 'emf').lower() == 'emf'
+
+_lock = threading.Lock()
+_stats = {}
+_installed = weakref.WeakSet()
+_depth = 0
+
+def install(session=None):
+    """Hook botocore call events on a session (the boto3 default session if none given)"""
+    if session is None:
+        if boto3.DEFAULT_SESSION is None:
+            boto3.setup_default_session()
+        session = boto3.DEFAULT_SESSION
+    
+    if session in _installed:
+        return session
+    
+    session.events.register('before-call', on_before_call)
+    session.events.register('after-call', on_after_call)
+    session.events.register('after-call-error', on_after_call_error)
+    session.events.register('needs-retry', on_needs_retry)
+    _installed.add(session)
+    return session
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+def operation_stats(service, operation):
+    key = f"{service}.{operation}"
+    if key not in _stats:
+        _stats[key] = {
+            'calls': 0,
+            'errors': 0,
+            'retries': 0,
+            'throttles': 0,
+            'total_ms': 0.0,
+            'max_ms': 0.0,
+            'histogram': [0] * len(LATENCY_BUCKETS_MS)
+        }
+    return _stats[key]
+
+def on_before_call(model, context, **kwargs):
+    context['instrumentation_start'] = time.perf_counter()
+    context['instrumentation_model'] = model
+
+def record_call(model, context, error_code=None, retries=0):
+    start = context.get('instrumentation_start')
+    elapsed_ms = (time.perf_counter() - start) * 1000 if start else 0.0
+    bucket = next(index for index, bound in enumerate(LATENCY_BUCKETS_MS) if elapsed_ms <= bound)
+    
+    with _lock:
+        stats = operation_stats(model.service_model.service_name, model.name)
+        stats['calls'] += 1
+        stats['retries'] += retries
+        stats['total_ms'] += elapsed_ms
+        stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+        stats['histogram'][bucket] += 1
+        if error_code:
+            stats['errors'] += 1
+
+def on_after_call(http_response, parsed, model, context, **kwargs):
+    # Fires once per logical call, after botocore's own retries are exhausted
+    error_code = parsed.get('Error', {}).get('Code') if http_response.status_code >= 300 else None
+    retries = parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+    record_call(model, context, error_code, retries)
+
+def on_after_call_error(context, exception, **kwargs):
+    # Connection-level failures never produce a parsed response (and carry no model)
+    if 'instrumentation_model' in context:
+        record_call(context['instrumentation_model'], context, type(exception).__name__)
+
+def on_needs_retry(response, operation, **kwargs):
+    # Fires per attempt; only counts throttles, the retry decision is left to botocore
+    if not response:
+        return None
+    
+    error_code = response[1].get('Error', {}).get('Code')
+    if error_code in THROTTLE_CODES:
+        with _lock:
+            operation_stats(operation.service_model.service_name, operation.name)['throttles'] += 1
+    return None
+
+def percentile_ms(histogram, fraction):
+    """Upper bound of the histogram bucket holding the given fraction of calls"""
+    total = sum(histogram)
+    if not total:
+        return 0
+    
+    running = 0
+    for bound, count in zip(LATENCY_BUCKETS_MS, histogram):
+        running += count
+        if running >= fraction * total:
+            return bound if bound != float('inf') else LATENCY_BUCKETS_MS[-2]
+    return LATENCY_BUCKETS_MS[-2]
+
+def summary():
+    """Per-operation counts and latency of the calls recorded since the last reset"""
+    with _lock:
+        snapshot = {key: dict(stats, histogram=list(stats['histogram'])) for key, stats in _stats.items()}
+    return summarize(snapshot)
+
+def summarize(snapshot):
+    # Slowest total time first, so the hot spots lead the report
+    operations = {}
+    for key, stats in sorted(snapshot.items(), key=lambda item: item[1]['total_ms'], reverse=True):
+        operations[key] = {
+            'calls': stats['calls'],
+            'errors': stats['errors'],
+            'retries': stats['retries'],
+            'throttles': stats['throttles'],
+            'latency_ms': {
+                'total': round(stats['total_ms'], 1),
+                'mean': round(stats['total_ms'] / stats['calls'], 1) if stats['calls'] else 0,
+                'max': round(stats['max_ms'], 1),
+                'p50': percentile_ms(stats['histogram'], 0.5),
+                'p95': percentile_ms(stats['histogram'], 0.95)
+            },
+            'histogram': stats['histogram']
+        }
+    
+    return {
+        'total_calls': sum(op['calls'] for op in operations.values()),
+        'total_throttles': sum(op['throttles'] for op in operations.values()),
+        'total_retries': sum(op['retries'] for op in operations.values()),
+        'latency_buckets_ms': [str(bound) for bound in LATENCY_BUCKETS_MS],
+        'operations': operations
+    }
+
+def merge_summaries(summaries):
+    """Combine summaries from separate invocations (e.g. shards) into one"""
+    merged = {}
+    
+    for api_summary in summaries:
+        for key, op in api_summary['operations'].items():
+            stats = merged.setdefault(key, {
+                'calls': 0, 'errors': 0, 'retries': 0, 'throttles': 0,
+                'total_ms': 0.0, 'max_ms': 0.0, 'histogram': [0] * len(LATENCY_BUCKETS_MS)
+            })
+            for field in ['calls', 'errors', 'retries', 'throttles']:
+                stats[field] += op[field]
+            stats['total_ms'] += op['latency_ms']['total']
+            stats['max_ms'] = max(stats['max_ms'], op['latency_ms']['max'])
+            stats['histogram'] = [a + b for a, b in zip(stats['histogram'], op['histogram'])]
+    
+    return summarize(merged)
+
+def emit_metrics(api_summary, function_name):
+    """Print one CloudWatch Embedded Metric Format record per operation (no PutMetricData calls)"""
+    timestamp = int(time.time() * 1000)
+    
+    for key, op in api_summary['operations'].items():
+        service, operation = key.split('.', 1)
+        print(json.dumps({
+            '_aws': {
+                'Timestamp': timestamp,
+                'CloudWatchMetrics': [{
+                    'Namespace': METRICS_NAMESPACE,
+                    'Dimensions': [['FunctionName', 'Service', 'Operation']],
+                    'Metrics': [
+                        {'Name': 'Calls', 'Unit': 'Count'},
+                        {'Name': 'Errors', 'Unit': 'Count'},
+                        {'Name': 'Retries', 'Unit': 'Count'},
+                        {'Name': 'Throttles', 'Unit': 'Count'},
+                        {'Name': 'LatencyTotal', 'Unit': 'Milliseconds'},
+                        {'Name': 'LatencyMax', 'Unit': 'Milliseconds'}
+                    ]
+                }]
+            },
+            'FunctionName': function_name,
+            'Service': service,
+            'Operation': operation,
+            'Calls': op['calls'],
+            'Errors': op['errors'],
+            'Retries': op['retries'],
+            'Throttles': op['throttles'],
+            'LatencyTotal': op['latency_ms']['total'],
+            'LatencyMax': op['latency_ms']['max']
+        }))
+
+def attach_summary(response, api_summary):
+    if not isinstance(response, dict) or not isinstance(response.get('body'), str):
+        return response
+    
+    try:
+        body = json.loads(response['body'])
+    except ValueError:
+        return response
+    
+    if isinstance(body, dict):
+        body['api_calls'] = api_summary
+        response['body'] = json.dumps(body, default=str)
+    return response
+
+def instrumented(handler):
+    """Record every AWS call a handler makes and attach the summary to its response body
+    
+    Only the outermost instrumented handler resets and reports, so handlers invoked
+    from other handlers (event replay, local shard runs) roll up into one summary.
+    """
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        global _depth
+        
+        install()
+        if _depth == 0:
+            reset()
+        
+        _depth += 1
+        try:
+            response = handler(event, context)
+        finally:
+            _depth -= 1
+        
+        if _depth > 0:
+            return response
+        
+        api_summary = summary()
+        if EMIT_METRICS:
+            emit_metrics(api_summary, getattr(context, 'function_name', handler.__module__))
+        return attach_summary(response, api_summary)
+    
+    return wrapper
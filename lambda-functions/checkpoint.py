@@ -0,0 +1,134 @@
+import boto3
+import json
+import os
+
+CHECKPOINT_LOCATION = os.environ.get('CHECKPOINT_LOCATION')
+SAFETY_MARGIN_MS = int(os.environ.get('CHECKPOINT_SAFETY_MARGIN_MS', '30000'))
+REINVOKE = os.environ.get('CHECKPOINT_REINVOKE', 'false').lower() == 'true'
+MAX_INVOCATIONS = int(os.environ.get('CHECKPOINT_MAX_INVOCATIONS', '50'))
+
+def new_state():
+    """Empty scan state: cursor into the current unit of work, finished items and running totals"""
+    return {
+        'cursor': {},
+        'completed': [],
+        'totals': {},
+        'invocations': 0,
+        'complete': False
+    }
+
+def deadline_near(context, margin_ms=SAFETY_MARGIN_MS):
+    """True once the invocation has less than margin_ms left; never without a Lambda context"""
+    if context is None or not hasattr(context, 'get_remaining_time_in_millis'):
+        return False
+    return context.get_remaining_time_in_millis() < margin_ms
+
+def remaining_items(items, id_key, cursor, phase, phases):
+    """Items of `phase` not yet processed according to the cursor, in ID order
+    
+    The cursor is {'phase': ..., 'last_id': ...} with last_id the last finished item.
+    """
+    items = sorted(items, key=lambda item: item[id_key])
+    if not cursor:
+        return items
+    
+    current, done = phases.index(phase), phases.index(cursor['phase'])
+    if current < done:
+        return []
+    if current > done:
+        return items
+    return [item for item in items if item[id_key] > cursor['last_id']]
+
+def checkpoint_path(name, location):
+    if location.startswith('s3://'):
+        bucket, _, prefix = location[5:].partition('/')
+        return bucket, f"{prefix.rstrip('/')}/{name}.json" if prefix else f"{name}.json"
+    return None, os.path.join(location, f"{name}.json")
+
+def load_checkpoint(name, location=CHECKPOINT_LOCATION):
+    """Resume state for a scan, or a fresh state when none is stored"""
+    state = new_state()
+    if not location:
+        return state
+    
+    bucket, key = checkpoint_path(name, location)
+    try:
+        if bucket:
+            s3 = boto3.client('s3')
+            try:
+                stored = json.loads(s3.get_object(Bucket=bucket, Key=key)['Body'].read())
+            except s3.exceptions.NoSuchKey:
+                return state
+        else:
+            if not os.path.exists(key):
+                return state
+            with open(key) as f:
+                stored = json.load(f)
+        
+        state.update(stored)
+        state['complete'] = False
+        print(f"Resuming {name} from checkpoint: {len(state['completed'])} items done, cursor {state['cursor']}")
+    except Exception as e:
+        print(f"Error loading checkpoint {name}: {str(e)}")
+    
+    return state
+
+def save_checkpoint(name, state, location=CHECKPOINT_LOCATION):
+    bucket, key = checkpoint_path(name, location)
+    data = json.dumps(state, default=str)
+    
+    if bucket:
+        boto3.client('s3').put_object(Bucket=bucket, Key=key, Body=data.encode())
+    else:
+        os.makedirs(os.path.dirname(key) or '.', exist_ok=True)
+        # Write-then-rename so a timeout mid-write never leaves a torn checkpoint
+        with open(f"{key}.tmp", 'w') as f:
+            f.write(data)
+        os.replace(f"{key}.tmp", key)
+
+def clear_checkpoint(name, location=CHECKPOINT_LOCATION):
+    bucket, key = checkpoint_path(name, location)
+    
+    if bucket:
+        boto3.client('s3').delete_object(Bucket=bucket, Key=key)
+    elif os.path.exists(key):
+        os.remove(key)
+
+def finish_checkpoint(name, state, location=CHECKPOINT_LOCATION, context=None, event=None):
+    """Clear the checkpoint of a finished scan, or flush an unfinished one and optionally re-invoke"""
+    state['invocations'] += 1
+    summary = {
+        'complete': state['complete'],
+        'invocations': state['invocations'],
+        'completed_items': len(state['completed'])
+    }
+    
+    if not location:
+        if not state['complete']:
+            print(f"Scan {name} stopped at the deadline with no CHECKPOINT_LOCATION; progress is lost")
+        return summary
+    
+    try:
+        if state['complete']:
+            clear_checkpoint(name, location)
+            return summary
+        
+        save_checkpoint(name, state, location)
+        summary['cursor'] = state['cursor']
+    except Exception as e:
+        print(f"Error saving checkpoint {name}: {str(e)}")
+        return summary
+    
+    # Chain the next invocation straight away instead of waiting for the next schedule
+    if REINVOKE and context is not None and state['invocations'] < MAX_INVOCATIONS:
+        try:
+            boto3.client('lambda').invoke(
+                FunctionName=context.function_name,
+                InvocationType='Event',
+                Payload=json.dumps(event or {})
+            )
+            summary['resumed'] = True
+        except Exception as e:
+            print(f"Error re-invoking {context.function_name}: {str(e)}")
+    
+    return summary
@@ -1,23 +1,93 @@
 import boto3
 import json
+import os
 from datetime import datetime, timedelta
+from botocore.exceptions import WaiterError
+import checkpoint
+from resource_events import parse_resource_event
+from api_instrumentation import instrumented
+from profiling import profiled
 
+# How long event mode waits for a new volume to leave 'creating' before leaving it to the scheduled scan
+VOLUME_WAIT_SECONDS = int(os.environ.get('VOLUME_WAIT_SECONDS', '60'))
+VOLUME_WAIT_DELAY = 5
+# ModifyVolume rejects volumes in any other state
+MODIFIABLE_STATES = ('available', 'in-use')
+
+@profiled
+@instrumented
 def lambda_handler(event, context):
-    ec2 = boto3.client('ec2')
-    cloudwatch = boto3.client('cloudwatch')
+    resource_event = parse_resource_event(event)
+    region = resource_event['region'] if resource_event else None
+    
+    ec2 = boto3.client('ec2', region_name=region)
+    cloudwatch = boto3.client('cloudwatch', region_name=region)
+    
+    if resource_event:
+        # Event mode: evaluate only the volume from the CreateVolume call, once it exists
+        volume_ids = resource_event['resource_ids']
+        inventory = {
+            'volumes': wait_for_volumes(ec2, volume_ids) if volume_ids else [],
+            'snapshots': []
+        }
+    else:
+        inventory = {
+            'volumes': ec2.describe_volumes()['Volumes'],
+            'snapshots': ec2.describe_snapshots(OwnerIds=['self'])['Snapshots']
+        }
+    
+    # Scheduled scans resume from the last checkpoint and stop short of the Lambda timeout
+    progress = None
+    if not resource_event:
+        checkpoint_name = f"cost_optimizer/{ec2.meta.region_name}"
+        checkpoint_location = event.get('checkpoint_location', checkpoint.CHECKPOINT_LOCATION)
+        progress = checkpoint.load_checkpoint(checkpoint_name, checkpoint_location)
+    
+    results = analyze_inventory(inventory, {'ec2': ec2}, context, progress)
+    
+    if resource_event:
+        results['event'] = resource_event
+    else:
+        results['checkpoint'] = checkpoint.finish_checkpoint(
+            checkpoint_name, progress, checkpoint_location, context, event
+        )
+    
+    # Totals are cumulative across resumed invocations, so publish once the scan is done
+    if progress is None or progress['complete']:
+        publish_metrics(cloudwatch, results)
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps(results)
+    }
+
+def analyze_inventory(inventory, clients, context=None, progress=None):
+    """Convert gp2 volumes to gp3 and delete stale snapshots of deleted volumes
+    
+    With a checkpoint state, resources are visited in ID order from its cursor and
+    the scan stops (progress['complete'] False) when the deadline is near.
+    """
+    ec2 = clients['ec2']
+    progress = progress if progress is not None else checkpoint.new_state()
+    phases = ['volumes', 'snapshots']
     
     results = {
         'volumes_optimized': 0,
         'snapshots_deleted': 0,
         'estimated_savings': 0
     }
+    results.update(progress['totals'])
+    progress['totals'] = results
     
     # Optimize EBS volumes (gp2 to gp3)
-    volumes = ec2.describe_volumes(
-        Filters=[{'Name': 'volume-type', 'Values': ['gp2']}]
-    )
-    
-    for volume in volumes['Volumes']:
+    for volume in checkpoint.remaining_items(inventory['volumes'], 'VolumeId', progress['cursor'], 'volumes', phases):
+        if checkpoint.deadline_near(context):
+            return results
+        
+        progress['cursor'] = {'phase': 'volumes', 'last_id': volume['VolumeId']}
+        if volume['VolumeType'] != 'gp2' or volume.get('State', 'available') not in MODIFIABLE_STATES:
+            continue
+        
         volume_id = volume['VolumeId']
         size = volume['Size']
         
@@ -37,24 +107,31 @@ def lambda_handler(event, context):
         except Exception as e:
             print(f"Failed to optimize volume {volume_id}: {str(e)}")
     
+    # Without a complete volume listing every old snapshot would look orphaned
+    listing_errors = inventory.get('errors', {})
+    if 'volumes' in listing_errors:
+        print(f"Skipping snapshot cleanup: volume listing failed: {listing_errors['volumes']}")
+        results['skipped'] = {'snapshots': f"volume listing failed: {listing_errors['volumes']}"}
+        progress['complete'] = True
+        return results
+    
     # Clean up stale snapshots
-    snapshots = ec2.describe_snapshots(OwnerIds=['self'])
+    existing_volumes = set(volume['VolumeId'] for volume in inventory['volumes'])
     cutoff_date = datetime.now() - timedelta(days=30)
     
-    for snapshot in snapshots['Snapshots']:
+    for snapshot in checkpoint.remaining_items(inventory['snapshots'], 'SnapshotId', progress['cursor'], 'snapshots', phases):
+        if checkpoint.deadline_near(context):
+            return results
+        
+        progress['cursor'] = {'phase': 'snapshots', 'last_id': snapshot['SnapshotId']}
         snapshot_date = snapshot['StartTime'].replace(tzinfo=None)
         
         if snapshot_date < cutoff_date:
+            # Keep snapshots whose source volume still exists
+            if snapshot.get('VolumeId') in existing_volumes:
+                continue
+            
             try:
-                # Check if snapshot is still needed
-                volume_id = snapshot.get('VolumeId')
-                if volume_id:
-                    try:
-                        ec2.describe_volumes(VolumeIds=[volume_id])
-                        continue  # Volume exists, keep snapshot
-                    except:
-                        pass  # Volume doesn't exist, can delete snapshot
-                
                 ec2.delete_snapshot(SnapshotId=snapshot['SnapshotId'])
                 results['snapshots_deleted'] += 1
                 
@@ -66,7 +143,27 @@ def lambda_handler(event, context):
             except Exception as e:
                 print(f"Failed to delete snapshot {snapshot['SnapshotId']}: {str(e)}")
     
-    # Send metrics to CloudWatch
+    progress['complete'] = True
+    return results
+
+def wait_for_volumes(ec2, volume_ids, timeout=VOLUME_WAIT_SECONDS):
+    """Describe volumes from a CreateVolume call once they are available
+    
+    CloudTrail reports the call while the volume is still 'creating'. Volumes that
+    are not ready by the timeout come back in their current state and are skipped.
+    """
+    try:
+        ec2.get_waiter('volume_available').wait(
+            VolumeIds=volume_ids,
+            WaiterConfig={'Delay': VOLUME_WAIT_DELAY, 'MaxAttempts': max(1, timeout // VOLUME_WAIT_DELAY)}
+        )
+    except WaiterError as e:
+        print(f"Volumes {', '.join(volume_ids)} not available yet: {str(e)}")
+    
+    # A filter rather than VolumeIds, so a volume deleted meanwhile is dropped instead of an error
+    return ec2.describe_volumes(Filters=[{'Name': 'volume-id', 'Values': volume_ids}])['Volumes']
+
+def publish_metrics(cloudwatch, results):
     cloudwatch.put_metric_data(
         Namespace='CostOptimization',
         MetricData=[
@@ -87,8 +184,3 @@ def lambda_handler(event, context):
             }
         ]
     )
-    
-    return {
-        'statusCode': 200,
-        'body': json.dumps(results)
-    }
@@ -0,0 +1,437 @@
+import boto3
+import csv
+import gzip
+import io
+import json
+import operator
+import os
+import re
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    # Parquet reports need pyarrow; gzip CSV reports are read with the standard library
+    pa = pc = pq = None
+
+CUR_LOCATION = os.environ.get('CUR_LOCATION')
+COST_COLUMN = os.environ.get('CUR_COST_COLUMN', 'line_item_unblended_cost')
+CHUNK_ROWS = int(os.environ.get('CUR_CHUNK_ROWS', '100000'))
+READ_BLOCK_BYTES = 1024 * 1024
+
+# Report columns by the short name they are decoded under. Legacy CSV headers
+# ("lineItem/UsageStartDate") are normalized to the Parquet/CUR 2.0 names first.
+COLUMNS = {
+    'hour': 'line_item_usage_start_date',
+    'usage': 'line_item_usage_amount',
+    'resource': 'line_item_resource_id',
+    'usage_type': 'line_item_usage_type',
+    'account': 'line_item_usage_account_id',
+    'product': 'line_item_product_code',
+    'line_item_type': 'line_item_line_item_type'
+}
+STRING_COLUMNS = ('resource', 'usage_type', 'account', 'product', 'line_item_type')
+
+# What Cost Explorer calls On Demand EC2 compute: instance hours billed at the On-Demand rate
+ON_DEMAND_EC2 = {
+    'product': {'AmazonEC2'},
+    'line_item_type': {'Usage'},
+    'usage_type': lambda value: 'BoxUsage' in value
+}
+
+PERIOD_PATTERN = re.compile(r'(\d{8})-(\d{8})|BILLING_PERIOD=(\d{4})-(\d{2})')
+HOUR_SECONDS = 3600
+TIMESTAMP_UNITS = {'s': 1, 'ms': 1000, 'us': 1000000, 'ns': 1000000000}
+
+def canonical(name):
+    """'lineItem/UnblendedCost' -> 'line_item_unblended_cost'; CUR 2.0 names pass through"""
+    parts = [re.sub(r'(?<=[a-z0-9])(?=[A-Z])', '_', part).lower() for part in name.strip().split('/')]
+    return '_'.join(parts)
+
+def to_hour(value):
+    """Hours since the epoch for a datetime or an ISO 8601 string"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value[:19])
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp()) // HOUR_SECONDS
+
+class Dictionary:
+    """Strings <-> dense int32 codes, shared by every chunk a reader yields"""
+    
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+        self._masks = {}
+    
+    def __len__(self):
+        return len(self.values)
+    
+    def encode(self, values):
+        codes = self.codes
+        for value in set(values).difference(codes):
+            codes[value] = len(self.values)
+            self.values.append(value)
+        return np.fromiter(map(codes.__getitem__, values), dtype=np.int32, count=len(values))
+    
+    def decode(self, codes):
+        return [self.values[code] for code in codes]
+    
+    def matches(self, condition):
+        """Boolean lookup table by code for a set of values or a predicate on a value"""
+        key = frozenset(condition) if isinstance(condition, (set, frozenset, list, tuple)) else condition
+        table = self._masks.setdefault(key, [])
+        # Only values added since the last call are tested
+        for value in self.values[len(table):]:
+            table.append(value in key if isinstance(key, frozenset) else bool(condition(value)))
+        return np.array(table, dtype=bool)
+
+class CurChunk:
+    """Up to CHUNK_ROWS line items as typed columns: int32 hours and codes, float64 cost and usage"""
+    
+    def __init__(self, columns, dictionaries):
+        self.columns = columns
+        self.dictionaries = dictionaries
+    
+    def __len__(self):
+        return len(self.columns['cost'])
+    
+    def __getitem__(self, name):
+        return self.columns[name]
+    
+    def values(self, name):
+        return self.dictionaries[name].decode(self.columns[name])
+    
+    def select(self, where):
+        """Row mask for {column: set of values or predicate}, evaluated once per distinct value"""
+        mask = np.ones(len(self), dtype=bool)
+        for name, condition in (where or {}).items():
+            mask &= self.dictionaries[name].matches(condition)[self.columns[name]]
+        return mask
+    
+    def take(self, mask):
+        return CurChunk({name: column[mask] for name, column in self.columns.items()}, self.dictionaries)
+
+def float_column(values):
+    try:
+        return np.array(values, dtype=np.float64)
+    except ValueError:
+        # Blank cells (e.g. usage on tax line items)
+        return np.array([float(value or 0) for value in values], dtype=np.float64)
+
+def period_bounds(key):
+    """(start hour, end hour) of the billing period a report object belongs to, if the key says"""
+    match = PERIOD_PATTERN.search(key)
+    if not match:
+        return None
+    
+    if match.group(1):
+        start = datetime.strptime(match.group(1), '%Y%m%d')
+        end = datetime.strptime(match.group(2), '%Y%m%d')
+    else:
+        year, month = int(match.group(3)), int(match.group(4))
+        start = datetime(year, month, 1)
+        end = datetime(year + month // 12, month % 12 + 1, 1)
+    return to_hour(start), to_hour(end)
+
+def is_report_file(key):
+    return key.endswith(('.csv.gz', '.csv', '.parquet', '.snappy.parquet'))
+
+def period_manifests(keys):
+    """{billing period folder: its root manifest key}
+    
+    Legacy CUR rewrites a period into a new assembly folder on every refresh and leaves the
+    old ones in place; the manifest at the period root lists the current assembly's files.
+    """
+    manifests = {}
+    for key in keys:
+        if key.endswith('-Manifest.json'):
+            match = PERIOD_PATTERN.search(key)
+            period_root = key[:match.end()] if match else None
+            # The root manifest sits directly under the period folder, not inside an assembly
+            if period_root and key.count('/') == period_root.count('/') + 1:
+                manifests[period_root] = key
+    return manifests
+
+def report_objects(location, start_hour=None, end_hour=None):
+    """(open callable, name, size) for each report file under a local directory or s3:// prefix
+    
+    In S3, files of superseded assemblies are skipped; a local directory is read whole.
+    """
+    def overlaps(key):
+        bounds = period_bounds(key)
+        if bounds is None or start_hour is None:
+            return True
+        return bounds[0] < (end_hour if end_hour is not None else bounds[1]) and bounds[1] > start_hour
+    
+    if location.startswith('s3://'):
+        s3 = boto3.client('s3')
+        bucket, _, prefix = location[5:].partition('/')
+        objects = {}
+        for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                objects[obj['Key']] = obj['Size']
+        
+        current = set()
+        manifests = period_manifests(objects)
+        for period_root, manifest_key in manifests.items():
+            if overlaps(period_root):
+                manifest = json.loads(s3.get_object(Bucket=bucket, Key=manifest_key)['Body'].read())
+                current.update(manifest.get('reportKeys', []))
+        
+        for key in sorted(objects):
+            if not is_report_file(key) or not overlaps(key):
+                continue
+            match = PERIOD_PATTERN.search(key)
+            if match and key[:match.end()] in manifests and key not in current:
+                continue
+            yield (lambda key=key: s3.get_object(Bucket=bucket, Key=key)['Body']), f"s3://{bucket}/{key}", objects[key]
+        return
+    
+    for root, _, names in sorted(os.walk(location)):
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            if is_report_file(name) and overlaps(path):
+                yield (lambda path=path: open(path, 'rb')), path, os.path.getsize(path)
+
+def projected_rows(lines, width):
+    """CSV rows from text lines, split only as far as the first `width` fields where possible
+    
+    Line items carry a hundred or more columns and the ones read here come first, so splitting
+    off just the leading fields avoids building every cell. Lines with quotes in those fields,
+    or quoted newlines, go through the csv module.
+    """
+    for line in lines:
+        if '"' not in line:
+            yield line.rstrip('\r\n').split(',', width)
+            continue
+        
+        # An odd number of quotes means a quoted field runs onto the next line
+        quotes = line.count('"')
+        while quotes % 2:
+            more = next(lines, '')
+            if not more:
+                break
+            line += more
+            quotes += more.count('"')
+        
+        line = line.rstrip('\r\n')
+        fields = line.split(',', width)
+        if len(fields) <= width or '"' in line[:len(line) - len(fields[-1])]:
+            fields = next(csv.reader([line]))
+        yield fields
+
+class CurReader:
+    """Streams CUR report files as CurChunks, decoding only the projected columns
+    
+    Memory is bounded by the chunk size and the string dictionaries, not the report size:
+    gzip CSV is decompressed and parsed incrementally and Parquet is read in record batches.
+    Rows outside [start, end) are dropped per chunk.
+    """
+    
+    def __init__(self, location, start=None, end=None, columns=STRING_COLUMNS, chunk_rows=CHUNK_ROWS, cost_column=COST_COLUMN):
+        self.location = location
+        self.start_hour = to_hour(start) if start is not None else None
+        self.end_hour = to_hour(end) if end is not None else None
+        self.columns = ['hour', 'cost', 'usage'] + [name for name in STRING_COLUMNS if name in columns]
+        self.source_columns = dict(COLUMNS, cost=canonical(cost_column))
+        self.chunk_rows = chunk_rows
+        self.dictionaries = {name: Dictionary() for name in STRING_COLUMNS if name in columns}
+        self._hours = {}
+        self.stats = {'files': 0, 'bytes_read': 0, 'rows_read': 0, 'rows_kept': 0, 'errors': 0}
+    
+    def __iter__(self):
+        return self.chunks()
+    
+    def chunks(self):
+        started = time.perf_counter()
+        
+        for open_stream, name, size in report_objects(self.location, self.start_hour, self.end_hour):
+            try:
+                for chunk in self.read_file(open_stream, name):
+                    yield chunk
+                self.stats['files'] += 1
+                self.stats['bytes_read'] += size
+            except Exception as e:
+                print(f"Error reading CUR file {name}: {str(e)}")
+                self.stats['errors'] += 1
+        
+        self.stats['seconds'] = round(time.perf_counter() - started, 2)
+    
+    def read_file(self, open_stream, name):
+        if name.endswith('.parquet'):
+            batches = self.parquet_batches(open_stream)
+        else:
+            batches = self.csv_batches(open_stream, compressed=name.endswith('.gz'))
+        
+        for columns in batches:
+            self.stats['rows_read'] += len(columns['cost'])
+            chunk = CurChunk(columns, self.dictionaries)
+            if self.start_hour is not None or self.end_hour is not None:
+                hours = columns['hour']
+                keep = np.ones(len(hours), dtype=bool)
+                if self.start_hour is not None:
+                    keep &= hours >= self.start_hour
+                if self.end_hour is not None:
+                    keep &= hours < self.end_hour
+                if not keep.all():
+                    chunk = chunk.take(keep)
+            
+            self.stats['rows_kept'] += len(chunk)
+            if len(chunk):
+                yield chunk
+    
+    def encode_hours(self, values):
+        # A month of line items has at most ~744 distinct start dates, so parse each once
+        hours = self._hours
+        for value in set(values).difference(hours):
+            hours[value] = to_hour(value) if value else -1
+        return np.fromiter(map(hours.__getitem__, values), dtype=np.int32, count=len(values))
+    
+    def csv_batches(self, open_stream, compressed=True):
+        stream = open_stream()
+        try:
+            raw = gzip.GzipFile(fileobj=stream) if compressed else stream
+            text = io.TextIOWrapper(io.BufferedReader(raw, READ_BLOCK_BYTES), encoding='utf-8', newline='')
+            header = [canonical(name) for name in next(csv.reader([text.readline()]))]
+            
+            missing = [self.source_columns[name] for name in self.columns if self.source_columns[name] not in header]
+            if missing:
+                raise ValueError(f"report has no {', '.join(missing)} column")
+            positions = [header.index(self.source_columns[name]) for name in self.columns]
+            
+            project = operator.itemgetter(*positions)
+            rows = []
+            for row in projected_rows(text, max(positions) + 1):
+                # Project as we go so a chunk holds only the needed cells, not whole rows
+                rows.append(project(row))
+                if len(rows) >= self.chunk_rows:
+                    yield self.decode_rows(rows)
+                    rows = []
+            if rows:
+                yield self.decode_rows(rows)
+        finally:
+            stream.close()
+    
+    def decode_rows(self, rows):
+        columns = {}
+        for name, values in zip(self.columns, zip(*rows)):
+            if name == 'hour':
+                columns[name] = self.encode_hours(values)
+            elif name in ('cost', 'usage'):
+                columns[name] = float_column(values)
+            else:
+                columns[name] = self.dictionaries[name].encode(values)
+        return columns
+    
+    def parquet_batches(self, open_stream):
+        if pq is None:
+            raise RuntimeError('pyarrow is required to read Parquet reports')
+        
+        # Parquet needs random access for its footer, so S3 objects are staged in /tmp
+        stream = open_stream()
+        with tempfile.NamedTemporaryFile(suffix='.parquet', delete=False) as f:
+            staged = f.name
+            try:
+                for block in iter(lambda: stream.read(8 * 1024 * 1024), b''):
+                    f.write(block)
+            finally:
+                stream.close()
+        
+        try:
+            parquet = pq.ParquetFile(staged)
+            available = {canonical(name): name for name in parquet.schema_arrow.names}
+            missing = [self.source_columns[name] for name in self.columns if self.source_columns[name] not in available]
+            if missing:
+                raise ValueError(f"report has no {', '.join(missing)} column")
+            
+            names = [available[self.source_columns[name]] for name in self.columns]
+            for batch in parquet.iter_batches(batch_size=self.chunk_rows, columns=names):
+                yield self.decode_batch(batch)
+        finally:
+            os.remove(staged)
+    
+    def decode_batch(self, batch):
+        columns = {}
+        for name, array in zip(self.columns, batch.columns):
+            if name == 'hour':
+                if pa.types.is_timestamp(array.type):
+                    ticks = array.cast(pa.int64()).fill_null(-1).to_numpy()
+                    columns[name] = (ticks // (TIMESTAMP_UNITS[array.type.unit] * HOUR_SECONDS)).astype(np.int32)
+                else:
+                    columns[name] = self.encode_hours(array.fill_null('').to_pylist())
+            elif name in ('cost', 'usage'):
+                columns[name] = pc.cast(array, pa.float64()).fill_null(0).to_numpy()
+            else:
+                # Translate the batch's own dictionary once, then map its indices
+                encoded = pc.dictionary_encode(pc.cast(array, pa.string()).fill_null(''))
+                table = self.dictionaries[name].encode(encoded.dictionary.to_pylist())
+                columns[name] = table[encoded.indices.to_numpy()]
+        return columns
+
+def cost_series(chunks, start, end, step_hours=1, where=None, value='cost'):
+    """Dense float64 totals per `step_hours` bucket of [start, end), e.g. hourly or daily cost"""
+    start_hour = to_hour(start)
+    buckets = max(0, -(-(to_hour(end) - start_hour) // step_hours))
+    totals = np.zeros(buckets, dtype=np.float64)
+    
+    for chunk in chunks:
+        offsets = chunk['hour'].astype(np.int64) - start_hour
+        mask = (offsets >= 0) & (offsets < buckets * step_hours)
+        if where:
+            mask &= chunk.select(where)
+        totals += np.bincount(offsets[mask] // step_hours, weights=chunk[value][mask], minlength=buckets)
+    
+    return totals
+
+def cost_series_by(chunks, column, start, end, step_hours=1, where=None, value='cost'):
+    """([value of `column`], float64 array of one cost_series row per value), in a single pass"""
+    start_hour = to_hour(start)
+    buckets = max(0, -(-(to_hour(end) - start_hour) // step_hours))
+    totals = np.zeros((0, buckets), dtype=np.float64)
+    dictionary = None
+    
+    for chunk in chunks:
+        dictionary = chunk.dictionaries[column]
+        if len(totals) < len(dictionary):
+            totals = np.pad(totals, ((0, len(dictionary) - len(totals)), (0, 0)))
+        
+        offsets = chunk['hour'].astype(np.int64) - start_hour
+        mask = (offsets >= 0) & (offsets < buckets * step_hours)
+        if where:
+            mask &= chunk.select(where)
+        cells = chunk[column][mask].astype(np.int64) * buckets + offsets[mask] // step_hours
+        totals += np.bincount(cells, weights=chunk[value][mask], minlength=totals.size).reshape(totals.shape)
+    
+    if dictionary is None:
+        return [], totals
+    return list(dictionary.values[:len(totals)]), totals
+
+def cost_by(chunks, column, windows, where=None, value='cost'):
+    """{value of `column`: total} for each (start, end) window, from a single pass over the report"""
+    bounds = [(to_hour(start), to_hour(end)) for start, end in windows]
+    totals = np.zeros((len(bounds), 0), dtype=np.float64)
+    dictionary = None
+    
+    for chunk in chunks:
+        dictionary = chunk.dictionaries[column]
+        if totals.shape[1] < len(dictionary):
+            totals = np.pad(totals, ((0, 0), (0, len(dictionary) - totals.shape[1])))
+        
+        selected = chunk.select(where) if where else np.ones(len(chunk), dtype=bool)
+        for i, (start_hour, end_hour) in enumerate(bounds):
+            mask = selected & (chunk['hour'] >= start_hour) & (chunk['hour'] < end_hour)
+            totals[i] += np.bincount(chunk[column][mask], weights=chunk[value][mask], minlength=totals.shape[1])
+    
+    if dictionary is None:
+        return [{} for _ in bounds]
+    return [
+        {dictionary.values[code]: float(row[code]) for code in np.flatnonzero(row)}
+        for row in totals
+    ]
@@ -1,9 +1,111 @@
 import boto3
 import json
+import os
+from datetime import datetime, timedelta
+import flow_log_analyzer
+from api_instrumentation import instrumented
+from profiling import profiled
 
+# VPC Flow Log files (s3://bucket/AWSLogs/... prefix or local directory) and how far back to read
+FLOW_LOG_LOCATION = os.environ.get('FLOW_LOG_LOCATION')
+FLOW_LOG_HOURS = int(os.environ.get('FLOW_LOG_HOURS', '24'))
+
+# NAT Gateway and interface endpoint list prices (us-east-1): per hour and per GB processed
+NAT_HOURLY_RATE = 0.045
+NAT_PROCESSING_PER_GB = 0.045
+INTERFACE_ENDPOINT_HOURLY_RATE = 0.01
+INTERFACE_ENDPOINT_PER_GB = 0.01
+# Interface endpoints are billed per AZ; assume the usual two-AZ deployment
+INTERFACE_ENDPOINT_AZS = 2
+HOURS_PER_MONTH = 730
+NAT_METRIC_DAYS = int(os.environ.get('NAT_METRIC_DAYS', '14'))
+
+# Bytes entering the gateway from either side are what it bills as processed
+NAT_METRICS = ['BytesInFromSource', 'BytesInFromDestination', 'BytesOutToDestination']
+# GetMetricData takes up to 500 queries per request
+METRIC_QUERIES_PER_REQUEST = 500
+
+# Endpoint candidates: endpoint type and the share of NAT traffic they typically carry from
+# private subnets, used when flow logs do not measure it. Override with NAT_ENDPOINT_TRAFFIC_SHARE.
+ENDPOINT_SERVICES = {
+    's3': ('Gateway', 0.30),
+    'ecr.dkr': ('Interface', 0.10),
+    'dynamodb': ('Gateway', 0.05),
+    'logs': ('Interface', 0.05),
+    'ec2': ('Interface', 0.01),
+    'ssm': ('Interface', 0.01)
+}
+ENDPOINT_TRAFFIC_SHARE = {service: share for service, (_, share) in ENDPOINT_SERVICES.items()}
+ENDPOINT_TRAFFIC_SHARE.update(json.loads(os.environ.get('NAT_ENDPOINT_TRAFFIC_SHARE', '{}')))
+
+# ip-ranges.json services whose prefixes are exactly what the endpoint carries. The EC2
+# ranges cover every public instance IP, not the EC2 API, so 'ec2' stays assumed.
+MEASURED_ENDPOINT_SERVICES = {'S3': 's3', 'DYNAMODB': 'dynamodb'}
+
+@profiled
+@instrumented
 def lambda_handler(event, context):
     ec2 = boto3.client('ec2')
     cloudfront = boto3.client('cloudfront')
+    cloudwatch = boto3.client('cloudwatch')
+    
+    # Analyze NAT Gateway usage and costs
+    nat_gateways = [
+        nat
+        for page in ec2.get_paginator('describe_nat_gateways').paginate()
+        for nat in page['NatGateways']
+    ]
+    
+    # Load balancers live in ELBv2, not EC2
+    load_balancers = []
+    try:
+        for page in boto3.client('elbv2').get_paginator('describe_load_balancers').paginate():
+            load_balancers.extend(page['LoadBalancers'])
+    except Exception as e:
+        print(f"Error listing load balancers: {str(e)}")
+    
+    # Every enabled region, so flow log peers in any of them are located rather than priced as internet
+    instance_counts = {}
+    regional_clients = {}
+    
+    for region in enabled_regions(ec2):
+        try:
+            regional_ec2 = boto3.client('ec2', region_name=region)
+            regional_clients[region] = regional_ec2
+            instance_counts[region] = sum(
+                len(reservation['Instances'])
+                for page in regional_ec2.get_paginator('describe_instances').paginate()
+                for reservation in page['Reservations']
+            )
+        except Exception as e:
+            print(f"Error listing instances in {region}: {str(e)}")
+    
+    inventory = {
+        'region': ec2.meta.region_name,
+        'nat_gateways': nat_gateways,
+        'vpc_endpoints': list_vpc_endpoints(ec2),
+        'load_balancers': load_balancers,
+        'regional_instance_counts': instance_counts
+    }
+    
+    flow_log_location = event.get('flow_log_location', FLOW_LOG_LOCATION)
+    if flow_log_location:
+        # Only measured transfer is priced; without flow logs cross-region is reported unmeasured
+        inventory['flow_logs'] = measure_flow_logs(
+            flow_log_location, regional_clients, int(event.get('flow_log_hours', FLOW_LOG_HOURS))
+        )
+    
+    results = analyze_inventory(inventory, {'ec2': ec2, 'cloudfront': cloudfront, 'cloudwatch': cloudwatch})
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps(results)
+    }
+
+def analyze_inventory(inventory, clients):
+    """Recommend VPC endpoints, CloudFront and workload consolidation to cut transfer costs"""
+    ec2 = clients['ec2']
+    cloudfront = clients['cloudfront']
     
     results = {
         'nat_gateway_optimization': [],
@@ -13,67 +115,45 @@ def lambda_handler(event, context):
         'potential_savings': 0
     }
     
-    # Analyze NAT Gateway usage and costs
-    nat_gateways = ec2.describe_nat_gateways()
+    # Price each gateway from the traffic it processed, then rank the endpoints that would remove it
+    region = inventory.get('region') or ec2.meta.region_name
+    gateways = [nat for nat in inventory['nat_gateways'] if nat['State'] == 'available']
+    traffic = nat_gateway_traffic(clients['cloudwatch'], [nat['NatGatewayId'] for nat in gateways]) if gateways else {}
+    shares = endpoint_traffic_shares(inventory.get('flow_logs'))
+    # One endpoint listing per region serves every gateway, however many share a VPC
+    endpoint_index = vpc_endpoint_index(inventory['vpc_endpoints'] if 'vpc_endpoints' in inventory else list_vpc_endpoints(ec2))
     
-    for nat in nat_gateways['NatGateways']:
-        if nat['State'] == 'available':
-            nat_id = nat['NatGatewayId']
-            vpc_id = nat['VpcId']
-            
-            # Check if VPC has VPC endpoints that could replace NAT traffic
-            vpc_endpoints = ec2.describe_vpc_endpoints(
-                Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}]
-            )
-            
-            existing_endpoints = [ep['ServiceName'] for ep in vpc_endpoints['VpcEndpoints']]
-            
-            # Recommend VPC endpoints for common services
-            recommended_endpoints = []
-            common_services = [
-                'com.amazonaws.region.s3',
-                'com.amazonaws.region.dynamodb',
-                'com.amazonaws.region.ec2',
-                'com.amazonaws.region.ssm'
-            ]
-            
-            for service in common_services:
-                service_name = service.replace('region', nat['AvailabilityZone'][:-1])
-                if service_name not in existing_endpoints:
-                    recommended_endpoints.append({
-                        'service': service_name.split('.')[-1].upper(),
-                        'estimated_savings': '$50-200/month',
-                        'benefit': 'Eliminate NAT Gateway charges for this service'
-                    })
-            
-            if recommended_endpoints:
-                results['vpc_endpoint_recommendations'].append({
-                    'nat_gateway_id': nat_id,
-                    'vpc_id': vpc_id,
-                    'current_monthly_cost': '$45 + data processing',
-                    'recommended_endpoints': recommended_endpoints,
-                    'potential_savings': '$100-500/month'
-                })
+    for nat in gateways:
+        nat_id = nat['NatGatewayId']
+        vpc_id = nat['VpcId']
+        usage = nat_gateway_cost(traffic.get(nat_id, {}))
+        results['nat_gateway_optimization'].append(dict(usage, nat_gateway_id=nat_id, vpc_id=vpc_id))
+        
+        # Check if VPC has VPC endpoints that could replace NAT traffic
+        existing_endpoints = endpoint_index.get(vpc_id, set())
+        recommended_endpoints = rank_endpoints(region, usage['monthly_processed_gb'], existing_endpoints, shares)
+        
+        if recommended_endpoints:
+            results['vpc_endpoint_recommendations'].append({
+                'nat_gateway_id': nat_id,
+                'vpc_id': vpc_id,
+                'current_monthly_cost': usage['monthly_cost'],
+                'recommended_endpoints': recommended_endpoints,
+                'potential_savings': round(sum(endpoint['monthly_savings'] for endpoint in recommended_endpoints), 2)
+            })
+    
+    results['nat_gateway_optimization'].sort(key=lambda gateway: gateway['monthly_cost'], reverse=True)
+    results['vpc_endpoint_recommendations'].sort(key=lambda recommendation: recommendation['potential_savings'], reverse=True)
     
     # Analyze CloudFront distribution opportunities
     try:
-        distributions = cloudfront.list_distributions()
-        
-        # Check for origins that could benefit from CloudFront
-        # This is a simplified analysis - real implementation would check ALB/S3 traffic patterns
-        
-        load_balancers = ec2.describe_load_balancers() if hasattr(ec2, 'describe_load_balancers') else {'LoadBalancers': []}
+        origin_domains = cloudfront_origin_domains(cloudfront)
         
-        for lb in load_balancers.get('LoadBalancers', []):
+        for lb in inventory['load_balancers']:
             lb_dns = lb.get('DNSName', '')
             
             # Check if this LB is already behind CloudFront
-            is_cached = any(
-                lb_dns in str(dist.get('Origins', {}).get('Items', []))
-                for dist in distributions.get('DistributionList', {}).get('Items', [])
-            )
-            
-            if not is_cached:
+            if normalize_domain(lb_dns) not in origin_domains:
                 results['cloudfront_opportunities'].append({
                     'load_balancer': lb.get('LoadBalancerName', 'Unknown'),
                     'dns_name': lb_dns,
@@ -90,37 +170,201 @@ def lambda_handler(event, context):
         print(f"CloudFront analysis error: {str(e)}")
     
     # Cross-region data transfer analysis
-    regions = ['us-east-1', 'us-west-2', 'eu-west-1', 'ap-southeast-1']
+    if 'flow_logs' in inventory:
+        results['transfer_costs'] = inventory['flow_logs']
+        results['cross_region_analysis'] = measured_cross_region(inventory['flow_logs'])
+    elif 'regional_instance_counts' in inventory:
+        results['cross_region_analysis'] = analyze_cross_region(inventory['regional_instance_counts'])
     
-    for region in regions:
+    results['potential_savings'] = estimate_potential_savings(results)
+    
+    return results
+
+def list_vpc_endpoints(ec2):
+    return [
+        endpoint
+        for page in ec2.get_paginator('describe_vpc_endpoints').paginate()
+        for endpoint in page['VpcEndpoints']
+    ]
+
+def vpc_endpoint_index(vpc_endpoints):
+    """VPC ID -> service names of its endpoints; deleted or failed endpoints carry no traffic"""
+    index = {}
+    for endpoint in vpc_endpoints:
+        if endpoint.get('State', 'available').lower() in ('deleting', 'deleted', 'failed', 'rejected', 'expired'):
+            continue
+        index.setdefault(endpoint['VpcId'], set()).add(endpoint['ServiceName'])
+    return index
+
+def normalize_domain(domain):
+    """Compare origins and DNS names case-insensitively, without the root dot or ELB's dualstack prefix"""
+    domain = domain.strip().lower().rstrip('.')
+    return domain[len('dualstack.'):] if domain.startswith('dualstack.') else domain
+
+def cloudfront_origin_domains(cloudfront):
+    """Normalized origin domain names of every distribution, for O(1) coverage checks"""
+    domains = set()
+    for page in cloudfront.get_paginator('list_distributions').paginate():
+        for distribution in page.get('DistributionList', {}).get('Items', []):
+            for origin in distribution.get('Origins', {}).get('Items', []):
+                domains.add(normalize_domain(origin['DomainName']))
+    return domains
+
+def nat_gateway_traffic(cloudwatch, nat_gateway_ids, days=NAT_METRIC_DAYS):
+    """Bytes per NAT_METRICS name for each gateway over the last `days`, in batched GetMetricData calls"""
+    traffic = {nat_id: {metric: 0.0 for metric in NAT_METRICS} for nat_id in nat_gateway_ids}
+    queries = [
+        {
+            'Id': f"m{gateway_index}_{metric_index}",
+            'MetricStat': {
+                'Metric': {
+                    'Namespace': 'AWS/NATGateway',
+                    'MetricName': metric,
+                    'Dimensions': [{'Name': 'NatGatewayId', 'Value': nat_id}]
+                },
+                'Period': 86400,
+                'Stat': 'Sum'
+            }
+        }
+        for gateway_index, nat_id in enumerate(nat_gateway_ids)
+        for metric_index, metric in enumerate(NAT_METRICS)
+    ]
+    end_time = datetime.utcnow()
+    
+    for start in range(0, len(queries), METRIC_QUERIES_PER_REQUEST):
         try:
-            regional_ec2 = boto3.client('ec2', region_name=region)
-            instances = regional_ec2.describe_instances()
-            
-            instance_count = sum(
-                len(reservation['Instances'])
-                for reservation in instances['Reservations']
-            )
-            
-            if instance_count > 0:
-                results['cross_region_analysis'].append({
-                    'region': region,
-                    'instance_count': instance_count,
-                    'recommendation': 'Consolidate workloads to reduce cross-region transfer',
-                    'potential_savings': f"${instance_count * 10}-{instance_count * 50}/month"
-                })
-                
+            paginator = cloudwatch.get_paginator('get_metric_data')
+            for page in paginator.paginate(
+                MetricDataQueries=queries[start:start + METRIC_QUERIES_PER_REQUEST],
+                StartTime=end_time - timedelta(days=days),
+                EndTime=end_time
+            ):
+                for result in page['MetricDataResults']:
+                    gateway_index, metric_index = map(int, result['Id'][1:].split('_'))
+                    traffic[nat_gateway_ids[gateway_index]][NAT_METRICS[metric_index]] += sum(result['Values'])
         except Exception as e:
+            print(f"Error getting NAT Gateway metrics: {str(e)}")
+    
+    for values in traffic.values():
+        values['days'] = days
+    return traffic
+
+def nat_gateway_cost(traffic):
+    """Processed GB and monthly hourly + processing cost of one gateway from its metric sums"""
+    days = traffic.get('days', NAT_METRIC_DAYS)
+    processed_gb = (traffic.get('BytesInFromSource', 0) + traffic.get('BytesInFromDestination', 0)) / 1024 ** 3
+    monthly_gb = processed_gb * HOURS_PER_MONTH / (days * 24)
+    hourly_cost = NAT_HOURLY_RATE * HOURS_PER_MONTH
+    processing_cost = monthly_gb * NAT_PROCESSING_PER_GB
+    
+    return {
+        'processed_gb': round(processed_gb, 3),
+        'outbound_gb': round(traffic.get('BytesOutToDestination', 0) / 1024 ** 3, 3),
+        'monthly_processed_gb': round(monthly_gb, 3),
+        'monthly_hourly_cost': round(hourly_cost, 2),
+        'monthly_processing_cost': round(processing_cost, 2),
+        'monthly_cost': round(hourly_cost + processing_cost, 2)
+    }
+
+def endpoint_traffic_shares(flow_summary=None):
+    """Share of NAT traffic per endpoint service: measured from flow logs where the service has
+    published IP ranges (S3, DynamoDB), assumed from ENDPOINT_TRAFFIC_SHARE otherwise"""
+    shares = {service: (share, 'assumed') for service, share in ENDPOINT_TRAFFIC_SHARE.items()}
+    if not flow_summary:
+        return shares
+    
+    by_type = flow_summary['by_transfer_type']
+    egress_gb = sum(
+        by_type.get(transfer_type, {}).get('gb', 0)
+        for transfer_type in ('internet', 'public_ip_same_region', 'aws_service_same_region', 'aws_service_cross_region')
+    )
+    if egress_gb > 0:
+        for service, gb in flow_summary.get('by_service_gb', {}).items():
+            if service in MEASURED_ENDPOINT_SERVICES:
+                shares[MEASURED_ENDPOINT_SERVICES[service]] = (gb / egress_gb, 'measured')
+    return shares
+
+def rank_endpoints(region, monthly_gb, existing_endpoints, shares):
+    """Missing endpoints with a positive net saving, highest first
+    
+    An endpoint removes its share of the gateway's processing charge; interface endpoints
+    cost an hourly charge per AZ plus their own per-GB processing.
+    """
+    endpoints = []
+    
+    for service, (endpoint_type, _) in ENDPOINT_SERVICES.items():
+        service_name = f"com.amazonaws.{region}.{service}"
+        if service_name in existing_endpoints:
             continue
+        
+        share, share_source = shares.get(service, (0.0, 'assumed'))
+        removed_gb = monthly_gb * share
+        endpoint_cost = 0.0
+        if endpoint_type == 'Interface':
+            endpoint_cost = INTERFACE_ENDPOINT_HOURLY_RATE * HOURS_PER_MONTH * INTERFACE_ENDPOINT_AZS + removed_gb * INTERFACE_ENDPOINT_PER_GB
+        savings = removed_gb * NAT_PROCESSING_PER_GB - endpoint_cost
+        
+        if savings > 0:
+            endpoints.append({
+                'service': service.upper(),
+                'service_name': service_name,
+                'endpoint_type': endpoint_type,
+                'traffic_share': round(share, 4),
+                'traffic_share_source': share_source,
+                'monthly_gb_removed': round(removed_gb, 3),
+                'endpoint_monthly_cost': round(endpoint_cost, 2),
+                'monthly_savings': round(savings, 2),
+                'benefit': 'Eliminate NAT Gateway processing charges for this service'
+            })
+    
+    endpoints.sort(key=lambda endpoint: endpoint['monthly_savings'], reverse=True)
+    return endpoints
+
+def analyze_cross_region(instance_counts):
+    """Regions with running workloads, reported as unmeasured: instance counts say nothing about transfer"""
+    cross_region_analysis = []
+    
+    for region, instance_count in instance_counts.items():
+        if instance_count > 0:
+            cross_region_analysis.append({
+                'region': region,
+                'instance_count': instance_count,
+                'measured': False,
+                'recommendation': 'Set FLOW_LOG_LOCATION to measure cross-region transfer from VPC Flow Logs',
+                'monthly_cost': None,
+                'potential_savings': 0
+            })
+    
+    return cross_region_analysis
+
+def enabled_regions(ec2):
+    """Regions enabled for the account, or just the client's own if they cannot be listed"""
+    try:
+        return sorted(region['RegionName'] for region in ec2.describe_regions()['Regions'])
+    except Exception as e:
+        print(f"Error listing regions: {str(e)}")
+        return [ec2.meta.region_name]
+
+def measure_flow_logs(location, regional_clients, hours=FLOW_LOG_HOURS):
+    """Flow log transfer summary, with addresses located through the given regional EC2 clients"""
+    index = flow_log_analyzer.build_location_index(regional_clients, flow_log_analyzer.load_ip_ranges())
+    return flow_log_analyzer.analyze_flow_logs(location, index, hours=hours)
+
+def measured_cross_region(flow_summary):
+    """Cross-region transfer measured from flow logs, per region pair, priced per month"""
+    return [
+        dict(pair, recommendation='Co-locate the communicating workloads or replicate the data locally')
+        for pair in flow_summary['by_region_pair']
+        if pair['monthly_cost'] > 0
+    ]
+
+def estimate_potential_savings(results):
+    # Measured cross-region spend is what consolidation can remove; unmeasured regions add nothing
+    cross_region = sum(entry['monthly_cost'] for entry in results['cross_region_analysis'] if entry.get('monthly_cost'))
     
     # Calculate total potential savings
-    results['potential_savings'] = sum([
-        len(results['vpc_endpoint_recommendations']) * 300,  # $300/month per NAT optimization
+    return sum([
+        sum(recommendation['potential_savings'] for recommendation in results['vpc_endpoint_recommendations']),
         len(results['cloudfront_opportunities']) * 200,     # $200/month per CloudFront optimization
-        len(results['cross_region_analysis']) * 500        # $500/month per region consolidation
+        cross_region
     ])
-    
-    return {
-        'statusCode': 200,
-        'body': json.dumps(results)
-    }
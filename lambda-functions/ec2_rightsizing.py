@@ -1,63 +1,118 @@
 import boto3
 import json
 from datetime import datetime, timedelta
+from shard_executor import plan_response, shard_items
+from api_instrumentation import instrumented
+from profiling import profiled
+from result_sink import collection, open_sink
 
+@profiled
+@instrumented
 def lambda_handler(event, context):
     ec2 = boto3.client('ec2')
     cloudwatch = boto3.client('cloudwatch')
     
-    results = {
-        'underutilized_instances': [],
-        'potential_savings': 0,
-        'recommendations': []
+    assigned = shard_items(event)
+    if assigned is not None:
+        # Fan-out worker: only the instances planned into this shard
+        instances = describe_instances_by_id(ec2, assigned)
+    else:
+        # Get all running instances, every page of them, so plans cover the whole fleet
+        instances = {'Reservations': [
+            reservation
+            for page in ec2.get_paginator('describe_instances').paginate(
+                Filters=[{'Name': 'instance-state-name', 'Values': ['running']}]
+            )
+            for reservation in page['Reservations']
+        ]}
+    
+    inventory = {
+        'instances': [
+            instance
+            for reservation in instances['Reservations']
+            for instance in reservation['Instances']
+        ]
     }
     
-    # Get all running instances
-    instances = ec2.describe_instances(
-        Filters=[{'Name': 'instance-state-name', 'Values': ['running']}]
-    )
+    if event.get('mode') == 'plan':
+        # One CloudWatch query per instance, so every instance weighs the same
+        instance_ids = [instance['InstanceId'] for instance in inventory['instances']]
+        return plan_response(instance_ids, [1] * len(instance_ids), event)
     
-    for reservation in instances['Reservations']:
-        for instance in reservation['Instances']:
-            instance_id = instance['InstanceId']
-            instance_type = instance['InstanceType']
-            
-            # Get CPU utilization for last 7 days
-            cpu_metrics = cloudwatch.get_metric_statistics(
-                Namespace='AWS/EC2',
-                MetricName='CPUUtilization',
-                Dimensions=[{'Name': 'InstanceId', 'Value': instance_id}],
-                StartTime=datetime.utcnow() - timedelta(days=7),
-                EndTime=datetime.utcnow(),
-                Period=3600,
-                Statistics=['Average']
-            )
-            
-            if cpu_metrics['Datapoints']:
-                avg_cpu = sum(dp['Average'] for dp in cpu_metrics['Datapoints']) / len(cpu_metrics['Datapoints'])
-                
-                # Recommend downsizing if CPU < 20%
-                if avg_cpu < 20:
-                    recommendation = get_smaller_instance_type(instance_type)
-                    if recommendation:
-                        current_cost = get_instance_cost(instance_type)
-                        new_cost = get_instance_cost(recommendation)
-                        monthly_savings = (current_cost - new_cost) * 24 * 30
-                        
-                        results['underutilized_instances'].append({
-                            'instance_id': instance_id,
-                            'current_type': instance_type,
-                            'recommended_type': recommendation,
-                            'avg_cpu': round(avg_cpu, 2),
-                            'monthly_savings': round(monthly_savings, 2)
-                        })
-                        
-                        results['potential_savings'] += monthly_savings
+    sink = open_sink('ec2_rightsizing', event, context, ec2.meta.region_name)
+    results = analyze_inventory(inventory, {'cloudwatch': cloudwatch}, sink)
+    
+    if assigned is not None:
+        results['shard'] = {'shard_index': event['shard']['shard_index'], 'items': len(assigned)}
     
     return {
         'statusCode': 200,
-        'body': json.dumps(results)
+        'body': json.dumps(sink.finish(results) if sink else results)
+    }
+
+def analyze_inventory(inventory, clients, sink=None):
+    """Recommend smaller instance types for running instances with low CPU
+    
+    With a result sink, findings stream to object storage instead of accumulating in memory.
+    """
+    cloudwatch = clients['cloudwatch']
+    
+    results = {
+        'underutilized_instances': collection(sink, 'underutilized_instances'),
+        'potential_savings': 0,
+        'recommendations': collection(sink, 'recommendations')
     }
+    
+    for instance in inventory['instances']:
+        if instance['State']['Name'] != 'running':
+            continue
+        
+        instance_id = instance['InstanceId']
+        instance_type = instance['InstanceType']
+        
+        # Get CPU utilization for last 7 days
+        cpu_metrics = cloudwatch.get_metric_statistics(
+            Namespace='AWS/EC2',
+            MetricName='CPUUtilization',
+            Dimensions=[{'Name': 'InstanceId', 'Value': instance_id}],
+            StartTime=datetime.utcnow() - timedelta(days=7),
+            EndTime=datetime.utcnow(),
+            Period=3600,
+            Statistics=['Average']
+        )
+        
+        if cpu_metrics['Datapoints']:
+            avg_cpu = sum(dp['Average'] for dp in cpu_metrics['Datapoints']) / len(cpu_metrics['Datapoints'])
+            
+            # Recommend downsizing if CPU < 20%
+            if avg_cpu < 20:
+                recommendation = get_smaller_instance_type(instance_type)
+                if recommendation:
+                    current_cost = get_instance_cost(instance_type)
+                    new_cost = get_instance_cost(recommendation)
+                    monthly_savings = (current_cost - new_cost) * 24 * 30
+                    
+                    results['underutilized_instances'].append({
+                        'instance_id': instance_id,
+                        'current_type': instance_type,
+                        'recommended_type': recommendation,
+                        'avg_cpu': round(avg_cpu, 2),
+                        'monthly_savings': round(monthly_savings, 2)
+                    })
+                    
+                    results['potential_savings'] += monthly_savings
+    
+    return results
+
+def describe_instances_by_id(ec2, instance_ids):
+    # Filter instead of InstanceIds so instances terminated since planning are skipped, not errors
+    reservations = []
+    for start in range(0, len(instance_ids), 200):
+        response = ec2.describe_instances(
+            Filters=[{'Name': 'instance-id', 'Values': instance_ids[start:start + 200]}]
+        )
+        reservations.extend(response['Reservations'])
+    return {'Reservations': reservations}
 
 def get_smaller_instance_type(current_type):
     # Simplified downsizing logic
@@ -1,11 +1,35 @@
 import boto3
 import json
-from kubernetes import client, config
-import base64
+import os
+from concurrent.futures import ThreadPoolExecutor
+import k8s_inventory
+import rate_limiter
+from api_instrumentation import instrumented
+from profiling import profiled
 
+MAX_WORKERS = int(os.environ.get('EKS_MAX_WORKERS', '8'))
+# Pod analysis reads the cluster API, which needs network access and an RBAC mapping
+POD_ANALYSIS = os.environ.get('EKS_POD_ANALYSIS', 'true').lower() == 'true'
+# Nodes whose pods request less than this share of allocatable CPU and memory
+LOW_REQUEST_THRESHOLD = 0.3
+
+# Approximate On-Demand hourly prices; other types fall back to DEFAULT_HOURLY_COST
+INSTANCE_HOURLY_COST = {
+    't3.small': 0.0208, 't3.medium': 0.0416, 't3.large': 0.0832,
+    'm5.large': 0.096, 'm5.xlarge': 0.192, 'm5.2xlarge': 0.384,
+    'c5.large': 0.085, 'c5.xlarge': 0.17, 'c5.2xlarge': 0.34,
+    'r5.large': 0.126, 'r5.xlarge': 0.252
+}
+DEFAULT_HOURLY_COST = 0.1
+
+@profiled
+@instrumented
 def lambda_handler(event, context):
-    eks = boto3.client('eks')
-    ec2 = boto3.client('ec2')
+    session = boto3.session.Session()
+    # Cluster workers share this client, so their calls share one rate limiter
+    rate_limiter.install(session)
+    eks = session.client('eks')
+    max_workers = int(event.get('max_workers', MAX_WORKERS))
     
     results = {
         'cluster_analysis': [],
@@ -16,67 +40,88 @@ def lambda_handler(event, context):
     }
     
     # Get all EKS clusters
-    clusters = eks.list_clusters()
+    cluster_names = sorted(
+        name
+        for page in eks.get_paginator('list_clusters').paginate()
+        for name in page['clusters']
+    )
     
-    for cluster_name in clusters['clusters']:
-        cluster_info = eks.describe_cluster(name=cluster_name)
-        cluster = cluster_info['cluster']
-        
-        # Analyze cluster costs
-        cluster_analysis = analyze_cluster_costs(eks, ec2, cluster_name)
-        results['cluster_analysis'].append(cluster_analysis)
-        
-        # Analyze node groups
-        node_groups = eks.list_nodegroups(clusterName=cluster_name)
+    # Clusters are analyzed concurrently and merged in name order, so output never depends on timing
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {name: pool.submit(analyze_cluster, eks, name) for name in cluster_names}
         
-        for ng_name in node_groups['nodegroups']:
-            ng_info = eks.describe_nodegroup(
-                clusterName=cluster_name,
-                nodegroupName=ng_name
-            )
+        for cluster_name, future in futures.items():
+            try:
+                analysis = future.result()
+            except Exception as e:
+                print(f"Error analyzing cluster {cluster_name}: {str(e)}")
+                results.setdefault('errors', {})[cluster_name] = str(e)
+                continue
             
-            nodegroup = ng_info['nodegroup']
-            
-            # Check for optimization opportunities
-            optimization = analyze_nodegroup(nodegroup, cluster_name)
-            if optimization:
+            results['cluster_analysis'].append(analysis['cluster_analysis'])
+            for optimization in analysis['node_group_optimization']:
                 results['node_group_optimization'].append(optimization)
                 results['potential_savings'] += optimization.get('monthly_savings', 0)
-        
-        # Analyze pod resource requests vs usage (requires cluster access)
+            results['pod_rightsizing'].extend(analysis['pod_rightsizing'])
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps(results)
+    }
+
+def analyze_cluster(eks, cluster_name):
+    """Cluster costs, node group optimizations and pod analysis for one cluster
+    
+    The cluster and each node group are described once and shared by every check.
+    """
+    cluster = eks.describe_cluster(name=cluster_name)['cluster']
+    nodegroups = list_nodegroups(eks, cluster_name)
+    
+    # Analyze node groups
+    optimizations = []
+    for nodegroup in nodegroups:
+        optimization = analyze_nodegroup(nodegroup, cluster_name)
+        if optimization:
+            optimizations.append(optimization)
+    
+    # Analyze pod resource requests against node capacity (requires cluster access)
+    pod_analysis = []
+    if POD_ANALYSIS:
         try:
-            pod_analysis = analyze_pod_resources(cluster_name)
-            results['pod_rightsizing'].extend(pod_analysis)
+            client = k8s_inventory.eks_client(cluster, boto3.session.Session())
+            pod_analysis = analyze_pod_resources(cluster_name, k8s_inventory.cluster_inventory(client, f"eks/{cluster_name}"))
         except Exception as e:
             print(f"Could not analyze pods for {cluster_name}: {str(e)}")
     
     return {
-        'statusCode': 200,
-        'body': json.dumps(results)
+        'cluster_analysis': analyze_cluster_costs(cluster, nodegroups),
+        'node_group_optimization': optimizations,
+        'pod_rightsizing': pod_analysis
     }
 
-def analyze_cluster_costs(eks, ec2, cluster_name):
+def list_nodegroups(eks, cluster_name):
+    """Every node group of a cluster, described, in name order"""
+    names = sorted(
+        name
+        for page in eks.get_paginator('list_nodegroups').paginate(clusterName=cluster_name)
+        for name in page['nodegroups']
+    )
+    return [
+        eks.describe_nodegroup(clusterName=cluster_name, nodegroupName=name)['nodegroup']
+        for name in names
+    ]
+
+def analyze_cluster_costs(cluster, nodegroups):
     """Analyze EKS cluster cost optimization opportunities"""
     
-    # Get cluster details
-    cluster_info = eks.describe_cluster(name=cluster_name)
-    cluster = cluster_info['cluster']
-    
     # Calculate control plane costs ($0.10/hour = $73/month)
     control_plane_cost = 73.0
     
-    # Get node groups and calculate compute costs
-    node_groups = eks.list_nodegroups(clusterName=cluster_name)
+    # Calculate compute costs from the node groups
     total_node_cost = 0
     total_nodes = 0
     
-    for ng_name in node_groups['nodegroups']:
-        ng_info = eks.describe_nodegroup(
-            clusterName=cluster_name,
-            nodegroupName=ng_name
-        )
-        nodegroup = ng_info['nodegroup']
-        
+    for nodegroup in nodegroups:
         # Calculate node costs
         instance_types = nodegroup['instanceTypes']
         desired_capacity = nodegroup['scalingConfig']['desiredSize']
@@ -88,7 +133,7 @@ def analyze_cluster_costs(eks, ec2, cluster_name):
             total_nodes += desired_capacity
     
     return {
-        'cluster_name': cluster_name,
+        'cluster_name': cluster['name'],
         'control_plane_cost': control_plane_cost,
         'node_cost': round(total_node_cost, 2),
         'total_monthly_cost': round(control_plane_cost + total_node_cost, 2),
@@ -163,20 +208,43 @@ def analyze_nodegroup(nodegroup, cluster_name):
     
     return None
 
-def analyze_pod_resources(cluster_name):
-    """Analyze pod resource requests vs actual usage"""
-    
-    # This would require cluster access - simplified for demo
-    pod_recommendations = [
-        {
-            'namespace': 'default',
-            'pod_name': 'example-app',
-            'current_requests': {'cpu': '1000m', 'memory': '2Gi'},
-            'actual_usage': {'cpu': '200m', 'memory': '512Mi'},
-            'recommendation': 'Reduce CPU request to 300m, memory to 1Gi',
-            'cost_impact': 'Enable better pod packing, reduce node requirements'
-        }
-    ]
+def analyze_pod_resources(cluster_name, inventory):
+    """Nodes mostly unclaimed by pod requests, and namespaces running pods without requests"""
+    pod_recommendations = []
+    requested = inventory.requests_by_node()
+    
+    for node in sorted(inventory.nodes(), key=lambda node: node['name']):
+        if not node['cpu_allocatable'] or not node['memory_allocatable']:
+            continue
+        cpu_share = requested[node['name']][0] / node['cpu_allocatable']
+        memory_share = requested[node['name']][1] / node['memory_allocatable']
+        
+        if cpu_share < LOW_REQUEST_THRESHOLD and memory_share < LOW_REQUEST_THRESHOLD:
+            pod_recommendations.append({
+                'type': 'LOW_REQUEST_UTILIZATION',
+                'cluster_name': cluster_name,
+                'node': node['name'],
+                'nodegroup': node['nodegroup'],
+                'instance_type': node['instance_type'],
+                'cpu_requested': f"{cpu_share * 100:.1f}%",
+                'memory_requested': f"{memory_share * 100:.1f}%",
+                'recommendation': 'Pods fit on fewer nodes; let Cluster Autoscaler or Karpenter consolidate',
+                'potential_savings': f"${get_instance_hourly_cost(node['instance_type']) * 24 * 30:.2f}/month"
+            })
+    
+    # Pods without requests are invisible to the scheduler's packing and to cost allocation
+    missing = {}
+    for pod in inventory.pods():
+        if not pod['cpu_request'] and not pod['memory_request']:
+            missing[pod['namespace']] = missing.get(pod['namespace'], 0) + 1
+    for namespace, count in sorted(missing.items()):
+        pod_recommendations.append({
+            'type': 'MISSING_REQUESTS',
+            'cluster_name': cluster_name,
+            'namespace': namespace,
+            'pods': count,
+            'recommendation': 'Set CPU and memory requests from observed usage (e.g. VPA recommendations)'
+        })
     
     return pod_recommendations
 
@@ -213,12 +281,4 @@ def generate_cluster_recommendations(cluster, node_count):
 
 def get_instance_hourly_cost(instance_type):
     """Get approximate hourly cost for instance type"""
-    
-    pricing = {
-        't3.small': 0.0208, 't3.medium': 0.0416, 't3.large': 0.0832,
-        'm5.large': 0.096, 'm5.xlarge': 0.192, 'm5.2xlarge': 0.384,
-        'c5.large': 0.085, 'c5.xlarge': 0.17, 'c5.2xlarge': 0.34,
-        'r5.large': 0.126, 'r5.xlarge': 0.252
-    }
-    
-    return pricing.get(instance_type, 0.1)
+    return INSTANCE_HOURLY_COST.get(instance_type, DEFAULT_HOURLY_COST)
@@ -0,0 +1,74 @@
+import boto3
+from concurrent.futures import ThreadPoolExecutor
+
+# Resource types collected for every account/region and the call that lists them.
+# Each entry is (client, operation, kwargs, response key, paginated)
+INVENTORY_SOURCES = {
+    'instances': ('ec2', 'describe_instances', {}, 'Reservations', True),
+    'volumes': ('ec2', 'describe_volumes', {}, 'Volumes', True),
+    'snapshots': ('ec2', 'describe_snapshots', {'OwnerIds': ['self']}, 'Snapshots', True),
+    'security_groups': ('ec2', 'describe_security_groups', {}, 'SecurityGroups', True),
+    'addresses': ('ec2', 'describe_addresses', {}, 'Addresses', False),
+    'nat_gateways': ('ec2', 'describe_nat_gateways', {}, 'NatGateways', True),
+    'vpc_endpoints': ('ec2', 'describe_vpc_endpoints', {}, 'VpcEndpoints', True),
+    'load_balancers': ('elbv2', 'describe_load_balancers', {}, 'LoadBalancers', True),
+    'auto_scaling_groups': ('autoscaling', 'describe_auto_scaling_groups', {}, 'AutoScalingGroups', True)
+}
+
+CLIENT_SERVICES = ['ec2', 'elbv2', 'autoscaling', 'cloudwatch', 'cloudfront']
+
+def create_clients(region=None, session=None):
+    """Create the regional clients shared by inventory collection and the analysis stages"""
+    session = session or boto3.session.Session()
+    return {service: session.client(service, region_name=region) for service in CLIENT_SERVICES}
+
+def collect_inventory(clients, resource_types=None, max_workers=4):
+    """List every resource type once for the clients' account/region"""
+    resource_types = resource_types or list(INVENTORY_SOURCES)
+    
+    inventory = {
+        'region': clients['ec2'].meta.region_name,
+        'errors': {}
+    }
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            resource_type: pool.submit(list_resources, clients, resource_type)
+            for resource_type in resource_types
+        }
+        
+        for resource_type, future in futures.items():
+            try:
+                inventory[resource_type] = future.result()
+            except Exception as e:
+                print(f"Error listing {resource_type}: {str(e)}")
+                inventory[resource_type] = []
+                inventory['errors'][resource_type] = str(e)
+    
+    return inventory
+
+def list_resources(clients, resource_type):
+    service, operation, kwargs, key, paginated = INVENTORY_SOURCES[resource_type]
+    client = clients[service]
+    
+    if paginated:
+        pages = client.get_paginator(operation).paginate(**kwargs)
+    else:
+        pages = [getattr(client, operation)(**kwargs)]
+    
+    items = []
+    for page in pages:
+        items.extend(page.get(key, []))
+    
+    # Flatten reservations so every consumer sees a plain instance list
+    if resource_type == 'instances':
+        items = [instance for reservation in items for instance in reservation['Instances']]
+    
+    return items
+
+def inventory_counts(inventory):
+    return {
+        resource_type: len(inventory.get(resource_type, []))
+        for resource_type in INVENTORY_SOURCES
+        if resource_type in inventory
+    }
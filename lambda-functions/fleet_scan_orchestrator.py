@@ -0,0 +1,167 @@
+import boto3
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import api_instrumentation
+import cost_optimizer
+import data_transfer_optimizer
+import ec2_rightsizing
+import fleet_inventory
+import inventory_snapshot
+import profiling
+import rate_limiter
+import result_sink
+import spot_optimizer
+import unused_resources_cleanup
+
+# Analysis stages run against the shared inventory, with the result key holding monthly savings
+STAGES = {
+    'ec2_rightsizing': (ec2_rightsizing.analyze_inventory, 'potential_savings'),
+    'spot_optimizer': (spot_optimizer.analyze_inventory, 'potential_savings'),
+    'unused_resources_cleanup': (unused_resources_cleanup.analyze_inventory, 'estimated_savings'),
+    'cost_optimizer': (cost_optimizer.analyze_inventory, 'estimated_savings'),
+    'data_transfer_optimizer': (data_transfer_optimizer.analyze_inventory, 'potential_savings')
+}
+
+# Stages whose findings can stream to RESULTS_LOCATION instead of riding in the report
+STREAMED_STAGES = {'ec2_rightsizing', 'spot_optimizer'}
+
+MAX_WORKERS = int(os.environ.get('ORCHESTRATOR_MAX_WORKERS', '8'))
+SNAPSHOT_LOCATION = os.environ.get('SNAPSHOT_LOCATION')
+
+@profiling.profiled
+@api_instrumentation.instrumented
+def lambda_handler(event, context):
+    """Collect each region's inventory once and run every optimizer stage against it in parallel"""
+    session = api_instrumentation.install(boto3.session.Session())
+    # Stages share these clients across worker threads, so their calls share one rate limiter
+    rate_limiter.install(session)
+    regions = event.get('regions') or [session.region_name]
+    stages = event.get('stages') or list(STAGES)
+    max_workers = int(event.get('max_workers', MAX_WORKERS))
+    snapshot_location = event.get('snapshot_location', SNAPSHOT_LOCATION)
+    
+    unknown_stages = [stage for stage in stages if stage not in STAGES]
+    if unknown_stages:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': f"Unknown stages: {', '.join(unknown_stages)}"})
+        }
+    
+    account_id = session.client('sts').get_caller_identity()['Account']
+    
+    # boto3 sessions are not thread-safe, so clients are created up front and shared
+    clients = {region: fleet_inventory.create_clients(region, session) for region in regions}
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        inventory_futures = {
+            region: pool.submit(fleet_inventory.collect_inventory, clients[region])
+            for region in regions
+        }
+        inventories = {region: future.result() for region, future in inventory_futures.items()}
+        
+        stage_futures = {
+            (region, stage): pool.submit(
+                run_stage, stage, inventories[region], clients[region],
+                result_sink.open_sink(stage, event, context, region, account_id) if stage in STREAMED_STAGES else None
+            )
+            for region in regions
+            for stage in stages
+        }
+        stage_results = {key: future.result() for key, future in stage_futures.items()}
+    
+    report = {
+        'account_id': account_id,
+        'regions': {},
+        'savings_by_stage': {stage: 0 for stage in stages},
+        'total_monthly_savings': 0
+    }
+    
+    for region in regions:
+        report['regions'][region] = {
+            'inventory': fleet_inventory.inventory_counts(inventories[region]),
+            'inventory_errors': inventories[region]['errors']
+        }
+        
+        # Persist this run's columnar snapshot and report what changed since the last one
+        if snapshot_location:
+            report['regions'][region]['changes'] = record_snapshot(
+                inventories[region], snapshot_location, account_id
+            )
+        
+        for stage in stages:
+            result = stage_results[(region, stage)]
+            report['regions'][region][stage] = result
+            
+            savings_key = STAGES[stage][1]
+            report['savings_by_stage'][stage] += result.get(savings_key, 0)
+    
+    # Cross-region transfer is an account-level view, priced only when flow logs measure it
+    if 'data_transfer_optimizer' in stages:
+        flow_log_location = event.get('flow_log_location', data_transfer_optimizer.FLOW_LOG_LOCATION)
+        if flow_log_location:
+            # Interfaces in every enabled region are indexed, not only the scanned ones
+            enabled = data_transfer_optimizer.enabled_regions(clients[regions[0]]['ec2'])
+            flow_logs = data_transfer_optimizer.measure_flow_logs(
+                flow_log_location,
+                {
+                    region: clients[region]['ec2'] if region in clients else session.client('ec2', region_name=region)
+                    for region in sorted(set(enabled) | set(regions))
+                },
+                int(event.get('flow_log_hours', data_transfer_optimizer.FLOW_LOG_HOURS))
+            )
+            report['transfer_costs'] = flow_logs
+            report['cross_region_analysis'] = data_transfer_optimizer.measured_cross_region(flow_logs)
+            report['savings_by_stage']['data_transfer_optimizer'] += sum(
+                entry['monthly_cost'] for entry in report['cross_region_analysis']
+            )
+        else:
+            report['cross_region_analysis'] = data_transfer_optimizer.analyze_cross_region({
+                region: len(inventories[region]['instances']) for region in regions
+            })
+    
+    report['total_monthly_savings'] = round(sum(report['savings_by_stage'].values()), 2)
+    report['rate_limits'] = rate_limiter.stats()
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps(report, default=str)
+    }
+
+def run_stage(stage, inventory, clients, sink=None):
+    analyze, _ = STAGES[stage]
+    
+    try:
+        if sink is not None:
+            return sink.finish(analyze(inventory, clients, sink=sink))
+        return analyze(inventory, clients)
+    except Exception as e:
+        print(f"Stage {stage} failed in {inventory['region']}: {str(e)}")
+        return {'error': str(e)}
+
+def record_snapshot(inventory, location, account_id):
+    """Store this run's snapshot and count what changed since the last one
+    
+    This is change reporting only; the stages always analyze the full inventory,
+    since their rules (unused groups, orphaned snapshots, idle instances) depend on
+    resources and metrics that did not change.
+    """
+    try:
+        snapshot = inventory_snapshot.build_snapshot(inventory)
+        previous = inventory_snapshot.load_latest_snapshot(
+            location, account_id, inventory['region'], before=snapshot['run_id']
+        )
+        inventory_snapshot.save_snapshot(snapshot, location, account_id)
+        
+        if previous is None:
+            return {'previous_run': None}
+        
+        changes = inventory_snapshot.diff_counts(inventory_snapshot.diff_snapshots(previous, snapshot))
+        changes['previous_run'] = previous['run_id']
+        # Types with a failed listing in either run have no trustworthy diff
+        changes['not_compared'] = sorted(set(snapshot['skipped']) | set(previous['skipped']))
+        return changes
+    except Exception as e:
+        print(f"Snapshot error in {inventory['region']}: {str(e)}")
+        return {'error': str(e)}
@@ -0,0 +1,478 @@
+import boto3
+import json
+import os
+import socket
+import time
+import urllib.request
+import zlib
+from itertools import chain, compress
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+# Default (version 2) VPC Flow Log fields, used when a file has no header line
+DEFAULT_FIELDS = [
+    'version', 'account-id', 'interface-id', 'srcaddr', 'dstaddr', 'srcport', 'dstport',
+    'protocol', 'packets', 'bytes', 'start', 'end', 'action', 'log-status'
+]
+
+IP_RANGES_SOURCE = os.environ.get('FLOW_LOG_IP_RANGES', 'https://ip-ranges.amazonaws.com/ip-ranges.json')
+READ_BLOCK_BYTES = 1024 * 1024
+# Decompressed bytes handed to the parser at a time; bounds memory whatever the file size
+DECOMPRESSED_BLOCK_BYTES = 4 * 1024 * 1024
+CHUNK_LINES = 50000
+# Classified addresses kept between chunks; internet peers make this unbounded otherwise
+ADDRESS_CACHE_LIMIT = 500000
+
+# USD per GB by transfer type (us-east-1 list prices). Cross-AZ and traffic to a public IPv4
+# address in the same region are billed out and in, $0.01 each way. Private peers outside the
+# index (peered VPCs, on-premises) are reported as unknown and left unpriced.
+TRANSFER_PRICING = {
+    'same_az': 0.0,
+    'cross_az': 0.02,
+    'cross_region': 0.02,
+    'public_ip_same_region': 0.02,
+    'aws_service_same_region': 0.0,
+    'aws_service_cross_region': 0.02,
+    'internet': 0.09,
+    'unknown': 0.0
+}
+
+INTERNET = 'internet'
+UNKNOWN = 'unknown'
+# ip-ranges.json service holding EC2 public addresses; ours are placed under it too
+PUBLIC_EC2_SERVICE = 'EC2'
+# RFC 1918 blocks as (network, mask)
+PRIVATE_NETWORKS = [(0x0A000000, 0xFF000000), (0xAC100000, 0xFFF00000), (0xC0A80000, 0xFFFF0000)]
+
+class LocationIndex:
+    """Private/public IP -> (ENI, AZ) for the account's network interfaces, plus AWS service ranges"""
+    
+    def __init__(self):
+        self.ip_location = {}
+        self.eni_codes = {}
+        self.eni_byte_codes = {}
+        self.places = []
+        self.place_codes = {}
+        self.place_region = []
+        self.range_starts = np.zeros(0, dtype=np.int64)
+        self.range_ends = np.zeros(0, dtype=np.int64)
+        self.range_places = np.zeros(0, dtype=np.int32)
+        self.place(INTERNET, None)
+        self.place(UNKNOWN, None)
+    
+    def place(self, name, region):
+        """Code for an AZ (e.g. 'us-east-1a') or service location (e.g. 'S3@us-east-1')"""
+        if name not in self.place_codes:
+            self.place_codes[name] = len(self.places)
+            self.places.append(name)
+            self.place_region.append(region)
+        return self.place_codes[name]
+    
+    def add_network_interface(self, eni):
+        eni_code = self.eni_codes.setdefault(eni['NetworkInterfaceId'], len(self.eni_codes))
+        self.eni_byte_codes[eni['NetworkInterfaceId'].encode()] = eni_code
+        zone = eni.get('AvailabilityZone')
+        place = self.place(zone, zone[:-1]) if zone else self.place_codes[UNKNOWN]
+        
+        addresses = [address['PrivateIpAddress'] for address in eni.get('PrivateIpAddresses', [])]
+        addresses.append(eni.get('PrivateIpAddress'))
+        for address in addresses:
+            if address:
+                self.ip_location[address.encode()] = (eni_code, place)
+        
+        # Traffic sent to a public address is billed as public-IP transfer even when it is ours
+        public_ip = (eni.get('Association') or {}).get('PublicIp')
+        if public_ip:
+            public_place = self.place(f"{PUBLIC_EC2_SERVICE}@{zone[:-1]}", zone[:-1]) if zone else self.place_codes[UNKNOWN]
+            self.ip_location[public_ip.encode()] = (eni_code, public_place)
+    
+    def add_service_ranges(self, ip_ranges):
+        """Load IPv4 prefixes from AWS ip-ranges.json; the catch-all AMAZON set is skipped"""
+        ranges = []
+        for prefix in ip_ranges.get('prefixes', []):
+            if prefix['service'] == 'AMAZON':
+                continue
+            network, _, length = prefix['ip_prefix'].partition('/')
+            start = ip_to_int(network.encode())
+            ranges.append((start, start + (1 << (32 - int(length))) - 1,
+                           self.place(f"{prefix['service']}@{prefix['region']}", prefix['region'])))
+        
+        ranges = flatten_ranges(ranges)
+        if ranges:
+            starts, ends, places = zip(*ranges)
+            self.range_starts = np.array(starts, dtype=np.int64)
+            self.range_ends = np.array(ends, dtype=np.int64)
+            self.range_places = np.array(places, dtype=np.int32)
+    
+    def classify(self, addresses):
+        """ENI code (-1 if not ours) and place code for each address in a list of bytes"""
+        eni = np.full(len(addresses), -1, dtype=np.int64)
+        place = np.full(len(addresses), self.place_codes[INTERNET], dtype=np.int64)
+        external = []
+        
+        for position, address in enumerate(addresses):
+            location = self.ip_location.get(address)
+            if location is None:
+                external.append(position)
+            else:
+                eni[position], place[position] = location
+        
+        if not external:
+            return eni, place
+        
+        # Everything not on one of our interfaces is matched against the service prefixes at once
+        numbers = np.array([ip_to_int(addresses[position]) for position in external], dtype=np.int64)
+        external = np.array(external)
+        if len(self.range_starts):
+            candidate = np.searchsorted(self.range_starts, numbers, side='right') - 1
+            inside = (candidate >= 0) & (numbers <= self.range_ends[np.maximum(candidate, 0)])
+            place[external[inside]] = self.range_places[candidate[inside]]
+        
+        # A private address we do not index is a peer we cannot place, not the internet
+        private = np.zeros(len(numbers), dtype=bool)
+        for network, mask in PRIVATE_NETWORKS:
+            private |= (numbers >= 0) & ((numbers & mask) == network)
+        place[external[private]] = self.place_codes[UNKNOWN]
+        
+        return eni, place
+
+def flatten_ranges(ranges):
+    """Non-overlapping (start, end, place) intervals from nested prefixes, the most specific winning
+    
+    ip-ranges.json nests prefixes (an EC2 /14 holds an EC2_INSTANCE_CONNECT /29), and a
+    binary search over start addresses only finds the containing range when none overlap.
+    CIDR prefixes either nest or are disjoint, so a stack of the open prefixes suffices.
+    """
+    flat = []
+    open_ranges = []
+    position = 0
+    
+    def emit(start, end, place):
+        if start <= end:
+            flat.append((start, end, place))
+    
+    # Outer prefixes sort before the prefixes they contain
+    for start, end, place in sorted(ranges, key=lambda item: (item[0], -item[1], item[2])):
+        while open_ranges and open_ranges[-1][0] < start:
+            outer_end, outer_place = open_ranges.pop()
+            emit(position, outer_end, outer_place)
+            position = outer_end + 1
+        if open_ranges:
+            emit(position, start - 1, open_ranges[-1][1])
+        open_ranges.append((end, place))
+        position = start
+    
+    while open_ranges:
+        outer_end, outer_place = open_ranges.pop()
+        emit(position, outer_end, outer_place)
+        position = outer_end + 1
+    
+    return flat
+
+def ip_to_int(address):
+    try:
+        return int.from_bytes(socket.inet_aton(address.decode()), 'big')
+    except (OSError, UnicodeDecodeError):
+        # IPv6 or malformed; never inside an IPv4 service prefix
+        return -1
+
+def load_ip_ranges(source=None):
+    """AWS service IP ranges from a local path or URL (FLOW_LOG_IP_RANGES); empty if unreachable"""
+    source = IP_RANGES_SOURCE if source is None else source
+    if not source:
+        return {}
+    
+    try:
+        if source.startswith(('http://', 'https://')):
+            with urllib.request.urlopen(source, timeout=10) as response:
+                return json.loads(response.read())
+        with open(source) as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Could not load AWS IP ranges from {source}: {str(e)}")
+        return {}
+
+def build_location_index(ec2_clients, ip_ranges=None):
+    """Index every network interface in the given regional EC2 clients"""
+    index = LocationIndex()
+    
+    for region, ec2 in ec2_clients.items():
+        try:
+            for page in ec2.get_paginator('describe_network_interfaces').paginate():
+                for eni in page['NetworkInterfaces']:
+                    index.add_network_interface(eni)
+        except Exception as e:
+            print(f"Error indexing network interfaces in {region}: {str(e)}")
+    
+    if ip_ranges:
+        index.add_service_ranges(ip_ranges)
+    return index
+
+def decompressed_blocks(stream):
+    """Decompress a (possibly multi-member) gzip stream in blocks of at most DECOMPRESSED_BLOCK_BYTES"""
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    
+    while True:
+        data = stream.read(READ_BLOCK_BYTES)
+        if not data:
+            break
+        while data:
+            yield decompressor.decompress(data, DECOMPRESSED_BLOCK_BYTES)
+            if decompressor.eof:
+                # Next gzip member, if any
+                data = decompressor.unused_data
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            else:
+                data = decompressor.unconsumed_tail
+    
+    yield decompressor.flush()
+
+def line_chunks(stream, compressed=True):
+    """Lists of up to CHUNK_LINES complete lines (bytes), reading the stream incrementally"""
+    blocks = decompressed_blocks(stream) if compressed else iter(lambda: stream.read(READ_BLOCK_BYTES), b'')
+    remainder = b''
+    lines = []
+    
+    for block in blocks:
+        if not block:
+            continue
+        parts = (remainder + block).split(b'\n')
+        remainder = parts.pop()
+        lines.extend(parts)
+        if len(lines) >= CHUNK_LINES:
+            yield lines
+            lines = []
+    
+    if remainder:
+        lines.append(remainder)
+    if lines:
+        yield lines
+
+class FlowAggregate:
+    """Bytes per (source place, destination place) pair; memory grows with places, not records"""
+    
+    def __init__(self, index):
+        self.index = index
+        self.pair_bytes = {}
+        self.records = 0
+        self.counted = 0
+        self.skipped = 0
+        self.first_start = None
+        self.last_end = None
+        self.address_cache = {}
+    
+    def locate(self, sources, destinations):
+        """(ENI, place) codes of the sources and place codes of the destinations"""
+        cache = self.address_cache
+        missing = list({address for address in chain(sources, destinations) if address not in cache})
+        if missing:
+            if len(cache) + len(missing) > ADDRESS_CACHE_LIMIT:
+                cache.clear()
+                missing = list(set(chain(sources, destinations)))
+            eni, place = self.index.classify(missing)
+            cache.update(zip(missing, zip(eni.tolist(), place.tolist())))
+        
+        source_codes = np.array([cache[address] for address in sources], dtype=np.int64).reshape(-1, 2)
+        destination_places = np.fromiter((cache[address][1] for address in destinations), dtype=np.int64, count=len(destinations))
+        return source_codes[:, 0], source_codes[:, 1], destination_places
+    
+    def add_chunk(self, lines, fields):
+        position = {name: i for i, name in enumerate(fields)}
+        width = len(fields)
+        interface_at, src_at, dst_at = position['interface-id'], position['srcaddr'], position['dstaddr']
+        bytes_at, action_at = position['bytes'], position.get('action')
+        status_at = position.get('log-status')
+        start_at, end_at = position.get('start'), position.get('end')
+        
+        rows = [line.split(b' ') for line in lines if line]
+        self.records += len(rows)
+        malformed = len(rows)
+        rows = [row for row in rows if len(row) == width]
+        self.skipped += malformed - len(rows)
+        if not rows:
+            return
+        
+        # Transpose once in C, then work on whole columns
+        columns = list(zip(*rows))
+        del rows
+        keep = np.ones(len(columns[0]), dtype=bool)
+        # Rejected flows move no billable bytes; NODATA/SKIPDATA rows carry '-' placeholders
+        if action_at is not None:
+            keep &= np.array(columns[action_at]) == b'ACCEPT'
+        if status_at is not None:
+            keep &= np.array(columns[status_at]) == b'OK'
+        
+        self.skipped += len(keep) - int(keep.sum())
+        sources = list(compress(columns[src_at], keep))
+        destinations = list(compress(columns[dst_at], keep))
+        byte_counts = np.array(columns[bytes_at])[keep].astype(np.int64)
+        interface_codes = np.fromiter(
+            (self.index.eni_byte_codes.get(interface, -2) for interface in compress(columns[interface_at], keep)),
+            dtype=np.int64, count=len(sources)
+        )
+        if start_at is not None and end_at is not None and len(sources):
+            starts = np.array(columns[start_at])[keep].astype(np.int64)
+            ends = np.array(columns[end_at])[keep].astype(np.int64)
+            self.first_start = int(starts.min()) if self.first_start is None else min(self.first_start, int(starts.min()))
+            self.last_end = int(ends.max()) if self.last_end is None else max(self.last_end, int(ends.max()))
+        
+        src_eni, src_place, dst_place = self.locate(sources, destinations)
+        
+        # Both ends of an internal flow log it; count only the sender's egress record
+        egress = src_eni == interface_codes
+        self.counted += int(egress.sum())
+        
+        places = len(self.index.places)
+        pairs = src_place[egress] * places + dst_place[egress]
+        totals = np.bincount(pairs, weights=byte_counts[egress])
+        for pair in np.nonzero(totals)[0].tolist():
+            key = divmod(pair, places)
+            self.pair_bytes[key] = self.pair_bytes.get(key, 0) + int(totals[pair])
+    
+    def transfer_type(self, source, destination):
+        index = self.index
+        src_name, dst_name = index.places[source], index.places[destination]
+        src_region, dst_region = index.place_region[source], index.place_region[destination]
+        
+        if UNKNOWN in (src_name, dst_name):
+            return 'unknown'
+        if dst_name == INTERNET:
+            return 'internet'
+        if dst_name.startswith(f"{PUBLIC_EC2_SERVICE}@"):
+            return 'public_ip_same_region' if dst_region == src_region else 'cross_region'
+        if '@' in dst_name:
+            return 'aws_service_same_region' if dst_region == src_region else 'aws_service_cross_region'
+        if src_region != dst_region:
+            return 'cross_region'
+        return 'same_az' if src_name == dst_name else 'cross_az'
+    
+    def summary(self, top=50):
+        window_seconds = (self.last_end - self.first_start) if self.first_start is not None else 0
+        # Scale the observed window to a 30-day month so costs compare with monthly savings
+        monthly_factor = (30 * 86400 / window_seconds) if window_seconds > 0 else 0
+        
+        flows = []
+        by_type = {transfer_type: {'gb': 0.0, 'cost': 0.0} for transfer_type in TRANSFER_PRICING}
+        region_pairs = {}
+        by_service = {}
+        for (source, destination), byte_total in self.pair_bytes.items():
+            transfer_type = self.transfer_type(source, destination)
+            gb = byte_total / 1024 ** 3
+            cost = gb * TRANSFER_PRICING[transfer_type]
+            destination_name = self.index.places[destination]
+            
+            flows.append({
+                'src_az': self.index.places[source],
+                'dst_az': destination_name if '@' not in destination_name else self.index.place_region[destination],
+                'dst_service': destination_name.split('@')[0] if '@' in destination_name else ('internet' if destination_name == INTERNET else 'vpc'),
+                'transfer_type': transfer_type,
+                'gb': round(gb, 3),
+                'cost': round(cost, 2),
+                'monthly_cost': round(cost * monthly_factor, 2)
+            })
+            by_type[transfer_type]['gb'] += gb
+            by_type[transfer_type]['cost'] += cost
+            if '@' in destination_name:
+                service = destination_name.split('@')[0]
+                by_service[service] = by_service.get(service, 0.0) + gb
+            
+            if transfer_type in ('cross_region', 'aws_service_cross_region'):
+                pair = region_pairs.setdefault((self.index.place_region[source], self.index.place_region[destination]), [0.0, 0.0])
+                pair[0] += gb
+                pair[1] += cost
+        
+        flows.sort(key=lambda flow: (flow['cost'], flow['gb']), reverse=True)
+        total_cost = sum(values['cost'] for values in by_type.values())
+        
+        return {
+            'window': {
+                'start': datetime.fromtimestamp(self.first_start, timezone.utc).isoformat() if self.first_start is not None else None,
+                'end': datetime.fromtimestamp(self.last_end, timezone.utc).isoformat() if self.last_end is not None else None,
+                'seconds': int(window_seconds)
+            },
+            'records': self.records,
+            'records_counted': self.counted,
+            'records_skipped': self.skipped,
+            'by_transfer_type': {
+                transfer_type: {
+                    'gb': round(values['gb'], 3),
+                    'cost': round(values['cost'], 2),
+                    'monthly_cost': round(values['cost'] * monthly_factor, 2)
+                }
+                for transfer_type, values in by_type.items()
+            },
+            'by_service_gb': {service: round(gb, 3) for service, gb in sorted(by_service.items())},
+            'by_region_pair': [
+                {
+                    'source_region': source_region,
+                    'destination_region': destination_region,
+                    'gb': round(gb, 3),
+                    'cost': round(cost, 2),
+                    'monthly_cost': round(cost * monthly_factor, 2)
+                }
+                for (source_region, destination_region), (gb, cost) in sorted(region_pairs.items(), key=lambda item: item[1][1], reverse=True)
+            ],
+            'total_cost': round(total_cost, 2),
+            'monthly_cost': round(total_cost * monthly_factor, 2),
+            'top_flows': flows[:top]
+        }
+
+def parse_header(line):
+    fields = line.decode().split()
+    return fields if 'srcaddr' in fields and 'bytes' in fields else None
+
+def analyze_stream(aggregate, stream, compressed=True):
+    fields = None
+    for lines in line_chunks(stream, compressed):
+        if fields is None:
+            fields = parse_header(lines[0])
+            if fields is not None:
+                lines = lines[1:]
+            else:
+                fields = DEFAULT_FIELDS
+        aggregate.add_chunk(lines, fields)
+
+def flow_log_objects(location, hours=None):
+    """(open callable, name, size) for each flow log file under a local directory or s3:// prefix"""
+    since = datetime.now(timezone.utc) - timedelta(hours=hours) if hours else None
+    
+    if location.startswith('s3://'):
+        s3 = boto3.client('s3')
+        bucket, _, prefix = location[5:].partition('/')
+        for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                if obj['Key'].endswith(('.log.gz', '.log')) and (since is None or obj['LastModified'] >= since):
+                    yield (lambda key=obj['Key']: s3.get_object(Bucket=bucket, Key=key)['Body']), obj['Key'], obj['Size']
+        return
+    
+    for root, _, names in os.walk(location):
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            if name.endswith(('.log.gz', '.log')) and (since is None or datetime.fromtimestamp(os.path.getmtime(path), timezone.utc) >= since):
+                yield (lambda path=path: open(path, 'rb')), path, os.path.getsize(path)
+
+def analyze_flow_logs(location, index, hours=None, top=50):
+    """Stream every flow log file under `location` and price the transfer it records"""
+    start = time.perf_counter()
+    aggregate = FlowAggregate(index)
+    files = 0
+    compressed_bytes = 0
+    
+    for open_stream, name, size in flow_log_objects(location, hours):
+        try:
+            stream = open_stream()
+            try:
+                analyze_stream(aggregate, stream, compressed=name.endswith('.gz'))
+            finally:
+                stream.close()
+            files += 1
+            compressed_bytes += size
+        except Exception as e:
+            print(f"Error reading flow log {name}: {str(e)}")
+    
+    summary = aggregate.summary(top)
+    summary['files'] = files
+    summary['bytes_read'] = compressed_bytes
+    summary['seconds'] = round(time.perf_counter() - start, 2)
+    return summary
@@ -0,0 +1,162 @@
+import json
+import os
+from statistics import NormalDist
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# History each model sees at a forecast origin; ml_forecast fits its trend on the last 14 days
+LOOKBACK = 14
+SEASON = 7
+HORIZON = int(os.environ.get('BACKTEST_HORIZON', '30'))
+# Nominal coverage of the prediction interval checked by the backtest
+INTERVAL = float(os.environ.get('BACKTEST_INTERVAL', '0.8'))
+# Window and target values materialized per block of series (float64)
+BLOCK_VALUES = 4 * 1024 * 1024
+
+def linear_trend(windows, horizon):
+    """Least-squares line through each window, extended `horizon` steps (what ml_forecast does)"""
+    x = np.arange(windows.shape[1], dtype=np.float64)
+    centered = x - x.mean()
+    slope = windows @ (centered / (centered @ centered))
+    intercept = windows.mean(axis=1) - slope * x.mean()
+    steps = np.arange(windows.shape[1], windows.shape[1] + horizon, dtype=np.float64)
+    return intercept[:, None] + slope[:, None] * steps
+
+def naive(windows, horizon):
+    """Last value carried forward"""
+    return np.repeat(windows[:, -1:], horizon, axis=1)
+
+def seasonal_naive(windows, horizon):
+    """Same day last week"""
+    return windows[:, -SEASON + np.arange(horizon) % SEASON]
+
+def moving_average(windows, horizon):
+    """Mean of the last week"""
+    return np.repeat(windows[:, -SEASON:].mean(axis=1, keepdims=True), horizon, axis=1)
+
+MODELS = {
+    'linear_trend': linear_trend,
+    'naive': naive,
+    'seasonal_naive': seasonal_naive,
+    'moving_average': moving_average
+}
+
+class Targets:
+    """What followed each origin, with the masks every model is scored through"""
+    
+    def __init__(self, actual):
+        self.observed = ~np.isnan(actual)
+        self.actual = np.where(self.observed, actual, 0)
+        # MAPE is undefined on zero-cost days, so they only count towards sMAPE
+        self.inverse = np.divide(1, self.actual, out=np.zeros_like(self.actual), where=self.actual > 0)
+        self.positive = (self.actual > 0).sum(axis=0)
+        self.count = self.observed.sum(axis=0)
+
+class ErrorTotals:
+    """Running error sums per horizon step for one model"""
+    
+    def __init__(self, horizon):
+        self.ape = np.zeros(horizon)
+        self.ape_count = np.zeros(horizon, dtype=np.int64)
+        self.sape = np.zeros(horizon)
+        self.covered = np.zeros(horizon, dtype=np.int64)
+        self.count = np.zeros(horizon, dtype=np.int64)
+    
+    def add(self, forecast, targets, sigma):
+        """Score (forecasts x horizon) predictions against the targets of one block"""
+        # Unobserved days get a zero forecast too, so they add no error
+        forecast = np.where(targets.observed, forecast, 0)
+        error = np.abs(targets.actual - forecast)
+        
+        self.ape += (error * targets.inverse).sum(axis=0)
+        scale = targets.actual + forecast
+        self.sape += 2 * np.divide(error, scale, out=np.zeros_like(error), where=scale > 0).sum(axis=0)
+        self.covered += (targets.observed & (error <= sigma)).sum(axis=0)
+        self.ape_count += targets.positive
+        self.count += targets.count
+    
+    def report(self):
+        def ratio(total, count):
+            return np.where(count > 0, total / np.maximum(count, 1), np.nan)
+        
+        mape = ratio(self.ape, self.ape_count) * 100
+        smape = ratio(self.sape, self.count) * 100
+        coverage = ratio(self.covered, self.count)
+        smape_overall = self.sape.sum() / self.count.sum() * 100 if self.count.sum() else None
+        
+        return {
+            'forecasts': int(self.count.sum()),
+            'mape': rounded(mape),
+            'smape': rounded(smape),
+            'coverage': rounded(coverage, 3),
+            'mape_overall': round(self.ape.sum() / self.ape_count.sum() * 100, 2) if self.ape_count.sum() else None,
+            'smape_overall': round(smape_overall, 2) if smape_overall is not None else None,
+            'coverage_overall': round(self.covered.sum() / self.count.sum(), 3) if self.count.sum() else None,
+            # A series with no nonzero actuals scores a perfect sMAPE against a zero forecast, which measures nothing
+            'confidence': confidence(smape_overall) if self.ape_count.sum() else None
+        }
+
+def rounded(values, digits=2):
+    return [None if np.isnan(value) else round(float(value), digits) for value in values]
+
+def confidence(smape):
+    """0-1 confidence from measured error: 1 - sMAPE, so a 15% sMAPE scores 0.85"""
+    if smape is None:
+        return None
+    return round(float(np.clip(1 - smape / 100, 0, 1)), 2)
+
+def backtest(series, horizon=HORIZON, models=None, min_history=LOOKBACK, step=1, interval=INTERVAL):
+    """Rolling-origin evaluation of each model over many series at once
+    
+    `series` is (series x days). Every `step` days from `min_history` on, each model
+    forecasts `horizon` days from the LOOKBACK days before the origin, and is scored
+    against what followed; origins near the end are scored on the days they have.
+    The prediction interval is forecast +/- z * sigma * sqrt(h), sigma being the
+    spread of day-over-day changes in the window.
+    
+    Returns {model: {'mape', 'smape', 'coverage' per horizon step, overall figures,
+    'confidence'}}.
+    """
+    series = np.atleast_2d(np.asarray(series, dtype=np.float64))
+    models = models or list(MODELS)
+    min_history = max(min_history, LOOKBACK)
+    totals = {name: ErrorTotals(horizon) for name in models}
+    
+    days = series.shape[1]
+    origins = np.arange(min_history, days, step)
+    if len(origins) == 0:
+        return {name: totals[name].report() for name in models}
+    
+    z = NormalDist().inv_cdf((1 + interval) / 2)
+    spread = z * np.sqrt(np.arange(1, horizon + 1))
+    block = max(1, BLOCK_VALUES // (len(origins) * (LOOKBACK + horizon)))
+    
+    for first in range(0, len(series), block):
+        chunk = series[first:first + block]
+        # Targets past the last day are NaN and drop out of every metric
+        padded = np.concatenate([chunk, np.full((len(chunk), horizon), np.nan)], axis=1)
+        windows = sliding_window_view(chunk, LOOKBACK, axis=1)[:, origins - LOOKBACK].reshape(-1, LOOKBACK)
+        targets = Targets(sliding_window_view(padded, horizon, axis=1)[:, origins].reshape(-1, horizon))
+        
+        sigma = np.diff(windows, axis=1).std(axis=1, ddof=1)[:, None] * spread
+        for name in models:
+            totals[name].add(np.maximum(MODELS[name](windows, horizon), 0), targets, sigma)
+    
+    return {name: totals[name].report() for name in models}
+
+def best_model(report):
+    """Name of the model with the lowest overall sMAPE"""
+    scored = [(values['smape_overall'], name) for name, values in report.items() if values['smape_overall'] is not None]
+    return min(scored)[1] if scored else None
+
+if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Backtest the cost forecasters on daily series')
+    parser.add_argument('series', help='.npy file of (series x days) daily costs')
+    parser.add_argument('--horizon', type=int, default=HORIZON)
+    parser.add_argument('--step', type=int, default=1)
+    args = parser.parse_args()
+    
+    print(json.dumps(backtest(np.load(args.series), args.horizon, step=args.step), indent=2))
@@ -0,0 +1,280 @@
+import boto3
+import io
+import json
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+
+import cur_reader
+
+ANOMALY_STATE_LOCATION = os.environ.get('ANOMALY_STATE_LOCATION')
+# Whole weeks of hourly cost kept per series; Cost Explorer keeps 14 days of hourly data
+RING_DAYS = int(os.environ.get('HOURLY_RING_DAYS', '14'))
+# Newest hours are left alone until billing data for them has settled
+LAG_HOURS = int(os.environ.get('HOURLY_LAG_HOURS', '3'))
+Z_THRESHOLD = float(os.environ.get('HOURLY_Z_THRESHOLD', '4'))
+# Spikes smaller than this many dollars per hour are never reported
+MIN_IMPACT = float(os.environ.get('HOURLY_MIN_IMPACT', '1'))
+HOURS_PER_WEEK = 168
+HOUR_SECONDS = 3600
+# Cost Explorer serves hourly data for the last 14 days only
+CE_HOURLY_HOURS = 14 * 24
+
+class RingState:
+    """Last RING_DAYS of hourly cost per series as float32, the slot for hour h being h % capacity
+    
+    Capacity is a whole number of weeks, so a row reshaped to (weeks, 168) puts every
+    hour of the week in its own column.
+    """
+    
+    def __init__(self, ring_days=RING_DAYS, keys=None, values=None, last_hour=None):
+        if ring_days % 7:
+            raise ValueError(f"Ring must hold whole weeks, not {ring_days} days")
+        self.capacity = ring_days * 24
+        self.keys = list(keys or [])
+        self.rows = {key: row for row, key in enumerate(self.keys)}
+        self.values = values if values is not None else np.full((0, self.capacity), np.nan, dtype=np.float32)
+        self.last_hour = last_hour
+    
+    def __len__(self):
+        return len(self.keys)
+    
+    def row_indices(self, keys):
+        """Rows for `keys`, adding empty rows for series not seen before"""
+        new = [key for key in dict.fromkeys(keys) if key not in self.rows]
+        for key in new:
+            self.rows[key] = len(self.keys)
+            self.keys.append(key)
+        if new:
+            self.values = np.concatenate([self.values, np.full((len(new), self.capacity), np.nan, dtype=np.float32)])
+        return np.array([self.rows[key] for key in keys], dtype=np.int64)
+    
+    def weeks(self):
+        return self.values.reshape(len(self.keys), -1, HOURS_PER_WEEK)
+    
+    def write(self, hour, costs):
+        """Store one hour for every series; `costs` is aligned with self.keys"""
+        self.values[:, hour % self.capacity] = costs
+        self.last_hour = hour
+    
+    def reset(self):
+        self.values[:] = np.nan
+        self.last_hour = None
+
+def hour_start(hour):
+    return datetime.fromtimestamp(hour * HOUR_SECONDS, tz=timezone.utc).replace(tzinfo=None)
+
+def series_spread(state):
+    """Robust per-series spread of hourly cost around its same-hour-of-week mean
+    
+    Residuals against a mean of n weeks shrink by sqrt(1 - 1/n), which is undone here.
+    It takes two weeks of history; until then the spread is NaN and nothing is scored.
+    """
+    weeks = state.weeks()
+    counts = np.sum(~np.isnan(weeks), axis=1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.nansum(weeks, axis=1, keepdims=True) / counts
+        residuals = (weeks - means) / np.sqrt(1 - 1 / counts)
+    residuals[np.broadcast_to(counts < 2, residuals.shape)] = np.nan
+    
+    flat = np.abs(residuals.reshape(len(state), -1))
+    spread = np.full(len(state), np.nan)
+    known = ~np.all(np.isnan(flat), axis=1)
+    if known.any():
+        spread[known] = 1.4826 * np.nanmedian(flat[known], axis=1)
+    return spread
+
+def score_hour(state, hour, costs, spread):
+    """z-scores of one new hour against the same hour in earlier weeks (NaN without history)"""
+    history = state.weeks()[:, :, hour % HOURS_PER_WEEK]
+    counts = np.sum(~np.isnan(history), axis=1)
+    expected = np.full(len(state), np.nan)
+    seen = counts > 0
+    expected[seen] = np.nanmean(history[seen], axis=1)
+    
+    # A flat series has no spread; 1% of its usual cost stands in so a change still scores
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scale = np.maximum(spread * np.sqrt(1 + 1 / counts), 0.01 * expected)
+        z_scores = (costs - expected) / np.maximum(scale, 1e-6)
+    return expected, z_scores
+
+def process_hours(state, keys, costs, first_hour):
+    """Score then store each new hour in order; `costs` is (len(keys) x hours)
+    
+    Only spikes are reported: cost at least Z_THRESHOLD spreads and MIN_IMPACT dollars
+    above the same hour in earlier weeks.
+    """
+    anomalies = []
+    if costs.shape[1] == 0:
+        return anomalies
+    
+    # A gap longer than the ring leaves nothing comparable in it
+    if state.last_hour is not None and first_hour - state.last_hour > state.capacity:
+        state.reset()
+    
+    rows = state.row_indices(keys)
+    hourly = np.zeros((len(state), costs.shape[1]), dtype=np.float32)
+    hourly[rows] = costs
+    
+    spread = series_spread(state)
+    for offset in range(costs.shape[1]):
+        hour = first_hour + offset
+        expected, z_scores = score_hour(state, hour, hourly[:, offset], spread)
+        flagged = np.flatnonzero((z_scores >= Z_THRESHOLD) & (hourly[:, offset] - expected >= MIN_IMPACT))
+        for row in flagged:
+            anomalies.append({
+                'series': state.keys[row],
+                'hour': hour_start(hour).isoformat(),
+                'cost': round(float(hourly[row, offset]), 4),
+                'expected': round(float(expected[row]), 4),
+                'impact': round(float(hourly[row, offset] - expected[row]), 4),
+                'z_score': round(float(z_scores[row]), 2)
+            })
+        
+        state.write(hour, hourly[:, offset])
+        # The spread moves slowly; refresh it once per day of new data
+        if (offset + 1) % 24 == 0:
+            spread = series_spread(state)
+    
+    anomalies.sort(key=lambda anomaly: anomaly['impact'], reverse=True)
+    return anomalies
+
+def hourly_costs_ce(ce, start_hour, end_hour, group_by='SERVICE'):
+    """([group], (groups x hours) cost) for hours [start_hour, end_hour) from Cost Explorer
+    
+    Needs hourly granularity enabled in Cost Explorer preferences.
+    """
+    hours = end_hour - start_hour
+    columns = {}
+    request = {
+        'TimePeriod': {
+            'Start': hour_start(start_hour).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'End': hour_start(end_hour).strftime('%Y-%m-%dT%H:%M:%SZ')
+        },
+        'Granularity': 'HOURLY',
+        'Metrics': ['UnblendedCost'],
+        'GroupBy': [{'Type': 'DIMENSION', 'Key': group_by}]
+    }
+    
+    while True:
+        response = ce.get_cost_and_usage(**request)
+        for result in response['ResultsByTime']:
+            offset = cur_reader.to_hour(result['TimePeriod']['Start']) - start_hour
+            if not 0 <= offset < hours:
+                continue
+            for group in result.get('Groups', []):
+                key = group['Keys'][0]
+                if key not in columns:
+                    columns[key] = np.zeros(hours, dtype=np.float32)
+                columns[key][offset] += float(group['Metrics']['UnblendedCost']['Amount'])
+        
+        if not response.get('NextPageToken'):
+            break
+        request['NextPageToken'] = response['NextPageToken']
+    
+    keys = sorted(columns)
+    return keys, np.array([columns[key] for key in keys], dtype=np.float32).reshape(len(keys), hours)
+
+def hourly_costs_cur(location, start_hour, end_hour, column='product'):
+    """([value of `column`], (values x hours) cost) for hours [start_hour, end_hour) from the CUR"""
+    reader = cur_reader.CurReader(location, hour_start(start_hour), hour_start(end_hour), columns=(column,))
+    keys, costs = cur_reader.cost_series_by(reader, column, hour_start(start_hour), hour_start(end_hour))
+    print(f"Read CUR for hourly anomalies: {json.dumps(reader.stats)}")
+    return keys, costs.astype(np.float32)
+
+def state_path(name, location):
+    if location.startswith('s3://'):
+        bucket, _, prefix = location[5:].partition('/')
+        return bucket, f"{prefix.rstrip('/')}/{name}.npz" if prefix else f"{name}.npz"
+    return None, os.path.join(location, f"{name}.npz")
+
+def load_state(name, location=ANOMALY_STATE_LOCATION, ring_days=RING_DAYS):
+    """Stored ring buffers, or an empty state when none is stored or the ring size changed"""
+    if not location:
+        return RingState(ring_days)
+    
+    bucket, key = state_path(name, location)
+    try:
+        if bucket:
+            s3 = boto3.client('s3')
+            try:
+                data = s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+            except s3.exceptions.NoSuchKey:
+                return RingState(ring_days)
+        else:
+            if not os.path.exists(key):
+                return RingState(ring_days)
+            with open(key, 'rb') as f:
+                data = f.read()
+        
+        arrays = np.load(io.BytesIO(data), allow_pickle=False)
+        meta = json.loads(str(arrays['meta'][0]))
+        if arrays['values'].shape[1] != ring_days * 24:
+            print(f"Hourly anomaly state {name} holds a different ring size; starting over")
+            return RingState(ring_days)
+        return RingState(ring_days, arrays['keys'].tolist(), arrays['values'].astype(np.float32), meta['last_hour'])
+    except Exception as e:
+        print(f"Error loading hourly anomaly state {name}: {str(e)}")
+        return RingState(ring_days)
+
+def save_state(name, state, location=ANOMALY_STATE_LOCATION):
+    buffer = io.BytesIO()
+    np.savez_compressed(
+        buffer,
+        keys=np.array(state.keys, dtype=str),
+        values=state.values,
+        meta=np.array([json.dumps({'last_hour': state.last_hour})])
+    )
+    bucket, key = state_path(name, location)
+    
+    if bucket:
+        boto3.client('s3').put_object(Bucket=bucket, Key=key, Body=buffer.getvalue())
+    else:
+        os.makedirs(os.path.dirname(key) or '.', exist_ok=True)
+        # Write-then-rename so a timeout mid-write never leaves a torn state file
+        with open(f"{key}.tmp", 'wb') as f:
+            f.write(buffer.getvalue())
+        os.replace(f"{key}.tmp", key)
+
+def detect(ce=None, cur_location=None, location=ANOMALY_STATE_LOCATION, now=None):
+    """Fetch the hours since the last run (at most one ring), score them, and store the ring
+    
+    Trailing hours with no cost in any series are not billed yet; they are left out of
+    the ring and fetched again by the next run instead of being stored as $0.
+    """
+    source = 'cur' if cur_location else 'ce'
+    name = f"hourly-anomaly-{source}"
+    state = load_state(name, location)
+    
+    now_hour = cur_reader.to_hour(now or datetime.utcnow())
+    end_hour = now_hour - LAG_HOURS
+    start_hour = end_hour - state.capacity
+    if not cur_location:
+        start_hour = max(start_hour, now_hour - CE_HOURLY_HOURS)
+    if state.last_hour is not None:
+        start_hour = max(start_hour, state.last_hour + 1)
+    
+    if start_hour >= end_hour:
+        keys, costs = [], np.zeros((0, 0), dtype=np.float32)
+    elif cur_location:
+        keys, costs = hourly_costs_cur(cur_location, start_hour, end_hour)
+    else:
+        keys, costs = hourly_costs_ce(ce, start_hour, end_hour)
+    
+    billed = np.flatnonzero(costs.any(axis=0))
+    costs = costs[:, :billed[-1] + 1] if len(billed) else costs[:, :0]
+    
+    anomalies = process_hours(state, keys, costs, start_hour)
+    if location:
+        save_state(name, state, location)
+    else:
+        print('No ANOMALY_STATE_LOCATION; the next run will refetch the whole ring')
+    
+    return {
+        'source': source,
+        'hours_processed': costs.shape[1],
+        'series': len(state),
+        'through_hour': hour_start(state.last_hour).isoformat() if state.last_hour is not None else None,
+        'anomalies': anomalies
+    }
@@ -0,0 +1,268 @@
+import boto3
+import hashlib
+import io
+import json
+import os
+import numpy as np
+from datetime import datetime
+
+# Identity key and stored columns for each inventory resource type (dotted paths into the boto3 dict)
+SNAPSHOT_SCHEMA = {
+    'instances': ('InstanceId', {
+        'instance_type': 'InstanceType',
+        'state': 'State.Name',
+        'availability_zone': 'Placement.AvailabilityZone',
+        'lifecycle': 'InstanceLifecycle',
+        'launch_time': 'LaunchTime'
+    }),
+    'volumes': ('VolumeId', {
+        'volume_type': 'VolumeType',
+        'size': 'Size',
+        'state': 'State',
+        'availability_zone': 'AvailabilityZone',
+        'create_time': 'CreateTime'
+    }),
+    'snapshots': ('SnapshotId', {
+        'volume_id': 'VolumeId',
+        'volume_size': 'VolumeSize',
+        'start_time': 'StartTime'
+    }),
+    'security_groups': ('GroupId', {
+        'group_name': 'GroupName',
+        'vpc_id': 'VpcId'
+    }),
+    'addresses': ('AllocationId', {
+        'public_ip': 'PublicIp',
+        'instance_id': 'InstanceId',
+        'network_interface_id': 'NetworkInterfaceId'
+    }),
+    'nat_gateways': ('NatGatewayId', {
+        'vpc_id': 'VpcId',
+        'subnet_id': 'SubnetId',
+        'state': 'State'
+    }),
+    'vpc_endpoints': ('VpcEndpointId', {
+        'vpc_id': 'VpcId',
+        'service_name': 'ServiceName',
+        'endpoint_type': 'VpcEndpointType',
+        'state': 'State'
+    }),
+    'load_balancers': ('LoadBalancerArn', {
+        'name': 'LoadBalancerName',
+        'dns_name': 'DNSName',
+        'type': 'Type'
+    }),
+    'auto_scaling_groups': ('AutoScalingGroupName', {
+        'desired_capacity': 'DesiredCapacity',
+        'min_size': 'MinSize',
+        'max_size': 'MaxSize'
+    })
+}
+
+MISSING_CODE = -1
+
+def build_snapshot(inventory, run_id=None):
+    """Encode an inventory as per-type columns over one shared string dictionary
+    
+    Strings become int32 codes into the dictionary, numbers float64 (NaN when
+    missing) and datetimes int64 epoch seconds. Every row also carries a 64-bit
+    fingerprint of the full record so changes outside the stored columns are seen.
+    Types whose listing failed (inventory['errors']) are left out and recorded as
+    skipped, since their empty list is not the account's real state.
+    """
+    strings = {}
+    skipped = sorted(resource_type for resource_type in inventory.get('errors', {}) if resource_type in SNAPSHOT_SCHEMA)
+    
+    def encode(value):
+        if value is None:
+            return MISSING_CODE
+        return strings.setdefault(str(value), len(strings))
+    
+    tables = {}
+    for resource_type, (id_key, columns) in SNAPSHOT_SCHEMA.items():
+        if resource_type not in inventory or resource_type in skipped:
+            continue
+        records = inventory[resource_type]
+        
+        table = {
+            'ids': np.array([encode(record[id_key]) for record in records], dtype=np.int32),
+            'fingerprints': np.array([fingerprint(record) for record in records], dtype=np.uint64),
+            'columns': {}
+        }
+        
+        for name, path in columns.items():
+            values = [lookup(record, path) for record in records]
+            table['columns'][name] = encode_column(values, encode)
+        
+        tables[resource_type] = table
+    
+    # Codes are handed out in insertion order, so the keys are the dictionary
+    return {
+        'run_id': run_id or datetime.utcnow().strftime('%Y%m%dT%H%M%SZ'),
+        'region': inventory.get('region'),
+        'dictionary': np.array(list(strings), dtype=str),
+        'tables': tables,
+        'skipped': skipped
+    }
+
+def encode_column(values, encode):
+    present = [value for value in values if value is not None]
+    
+    if present and all(isinstance(value, datetime) for value in present):
+        return np.array([int(value.timestamp()) if value is not None else MISSING_CODE for value in values], dtype=np.int64)
+    
+    if present and all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in present):
+        return np.array([value if value is not None else np.nan for value in values], dtype=np.float64)
+    
+    return np.array([encode(value) for value in values], dtype=np.int32)
+
+def lookup(record, path):
+    value = record
+    for key in path.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+def fingerprint(record):
+    digest = hashlib.blake2b(
+        json.dumps(record, sort_keys=True, default=str).encode(),
+        digest_size=8
+    ).digest()
+    return int.from_bytes(digest, 'little')
+
+def resource_ids(snapshot, resource_type):
+    return snapshot['dictionary'][snapshot['tables'][resource_type]['ids']]
+
+def column_values(snapshot, resource_type, name):
+    """Decode one stored column; missing strings decode to ''"""
+    column = snapshot['tables'][resource_type]['columns'][name]
+    if column.dtype != np.int32:
+        return column
+    # MISSING_CODE (-1) indexes the appended empty string
+    return np.append(snapshot['dictionary'], '')[column]
+
+def diff_snapshots(old, new):
+    """Added, removed and changed resource IDs per type between two snapshots
+    
+    Types either snapshot skipped are not compared: a failed listing would
+    otherwise show every resource as removed, and the run after it every one as added.
+    """
+    diff = {}
+    skipped = set(old.get('skipped', [])) | set(new.get('skipped', []))
+    
+    for resource_type in new['tables']:
+        if resource_type in skipped:
+            continue
+        new_ids = resource_ids(new, resource_type)
+        new_prints = new['tables'][resource_type]['fingerprints']
+        
+        if resource_type not in old['tables']:
+            diff[resource_type] = {'added': new_ids, 'removed': np.array([], dtype=str), 'changed': np.array([], dtype=str)}
+            continue
+        
+        old_ids = resource_ids(old, resource_type)
+        old_prints = old['tables'][resource_type]['fingerprints']
+        
+        # Sort-merge on the ID strings; fingerprints decide whether common rows changed
+        common, old_index, new_index = np.intersect1d(old_ids, new_ids, assume_unique=True, return_indices=True)
+        changed = common[old_prints[old_index] != new_prints[new_index]]
+        
+        diff[resource_type] = {
+            'added': np.setdiff1d(new_ids, common, assume_unique=True),
+            'removed': np.setdiff1d(old_ids, common, assume_unique=True),
+            'changed': changed
+        }
+    
+    return diff
+
+def diff_counts(diff):
+    return {
+        resource_type: {kind: int(len(ids)) for kind, ids in changes.items()}
+        for resource_type, changes in diff.items()
+    }
+
+def serialize_snapshot(snapshot):
+    arrays = {
+        'dictionary': snapshot['dictionary'],
+        'meta': np.array([json.dumps({
+            'run_id': snapshot['run_id'],
+            'region': snapshot['region'],
+            'skipped': snapshot.get('skipped', [])
+        })])
+    }
+    
+    for resource_type, table in snapshot['tables'].items():
+        arrays[f"{resource_type}/ids"] = table['ids']
+        arrays[f"{resource_type}/fingerprints"] = table['fingerprints']
+        for name, column in table['columns'].items():
+            arrays[f"{resource_type}/columns/{name}"] = column
+    
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    return buffer.getvalue()
+
+def deserialize_snapshot(data):
+    arrays = np.load(io.BytesIO(data), allow_pickle=False)
+    meta = json.loads(str(arrays['meta'][0]))
+    
+    snapshot = {
+        'run_id': meta['run_id'],
+        'region': meta['region'],
+        'dictionary': arrays['dictionary'],
+        'tables': {},
+        'skipped': meta.get('skipped', [])
+    }
+    
+    for key in arrays.files:
+        parts = key.split('/')
+        if len(parts) < 2:
+            continue
+        table = snapshot['tables'].setdefault(parts[0], {'columns': {}})
+        if parts[1] == 'columns':
+            table['columns'][parts[2]] = arrays[key]
+        else:
+            table[parts[1]] = arrays[key]
+    
+    return snapshot
+
+def save_snapshot(snapshot, location, account_id):
+    """Write a snapshot under <location>/<account>/<region>/<run_id>.npz (local directory or s3://bucket/prefix)"""
+    key = f"{account_id}/{snapshot['region']}/{snapshot['run_id']}.npz"
+    data = serialize_snapshot(snapshot)
+    
+    if location.startswith('s3://'):
+        bucket, _, prefix = location[5:].partition('/')
+        object_key = f"{prefix.rstrip('/')}/{key}" if prefix else key
+        boto3.client('s3').put_object(Bucket=bucket, Key=object_key, Body=data)
+        return f"s3://{bucket}/{object_key}"
+    
+    path = os.path.join(location, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+def load_latest_snapshot(location, account_id, region, before=None):
+    """Load the newest stored snapshot for an account/region, optionally older than run ID `before`"""
+    if location.startswith('s3://'):
+        s3 = boto3.client('s3')
+        bucket, _, prefix = location[5:].partition('/')
+        prefix = f"{prefix.rstrip('/')}/{account_id}/{region}/" if prefix else f"{account_id}/{region}/"
+        
+        keys = []
+        for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+            keys.extend(obj['Key'] for obj in page.get('Contents', []))
+        candidates = sorted(key for key in keys if key.endswith('.npz') and (before is None or key[len(prefix):-4] < before))
+        if not candidates:
+            return None
+        return deserialize_snapshot(s3.get_object(Bucket=bucket, Key=candidates[-1])['Body'].read())
+    
+    directory = os.path.join(location, account_id, region)
+    if not os.path.isdir(directory):
+        return None
+    candidates = sorted(name for name in os.listdir(directory) if name.endswith('.npz') and (before is None or name[:-4] < before))
+    if not candidates:
+        return None
+    with open(os.path.join(directory, candidates[-1]), 'rb') as f:
+        return deserialize_snapshot(f.read())
@@ -0,0 +1,139 @@
+import numpy as np
+
+# On-demand price per vCPU-hour and per GiB-hour, used only as the ratio that splits a
+# node's price between its CPU and its memory
+CPU_HOURLY_WEIGHT = 0.031611
+GIB_HOURLY_WEIGHT = 0.004237
+GIB = 2 ** 30
+# Pod-hours materialized per chunk of time (float32, per resource)
+CHUNK_VALUES = 8 * 1024 * 1024
+UNLABELLED = '__unlabelled__'
+
+def split_node_price(prices, cpu, memory):
+    """(CPU part, memory part) of each node's hourly price, in proportion to its resources"""
+    cpu_weight = np.asarray(cpu, dtype=np.float64) * CPU_HOURLY_WEIGHT
+    memory_weight = np.asarray(memory, dtype=np.float64) / GIB * GIB_HOURLY_WEIGHT
+    total = cpu_weight + memory_weight
+    cpu_fraction = np.divide(cpu_weight, total, out=np.full_like(total, 0.5), where=total > 0)
+    prices = np.asarray(prices, dtype=np.float64)
+    return prices * cpu_fraction, prices * (1 - cpu_fraction)
+
+def constant_matrices(cpu_request, memory_request, cpu_usage=None, memory_usage=None):
+    """Pod matrices for a snapshot: the same values every hour, without materializing them"""
+    columns = {
+        'cpu_request': cpu_request,
+        'memory_request': memory_request,
+        'cpu_usage': cpu_usage,
+        'memory_usage': memory_usage
+    }
+    
+    def matrices(start, stop):
+        return {
+            name: np.broadcast_to(np.asarray(values, dtype=np.float32)[:, None], (len(values), stop - start))
+            for name, values in columns.items()
+            if values is not None
+        }
+    return matrices
+
+class NodeSegments:
+    """Pods sorted by node once, so per-node sums are a single reduceat per chunk"""
+    
+    def __init__(self, pod_nodes, node_count):
+        pod_nodes = np.asarray(pod_nodes, dtype=np.int64)
+        # Unscheduled pods (node -1) hold no node capacity and are left out
+        scheduled = np.flatnonzero(pod_nodes >= 0)
+        self.order = scheduled[np.argsort(pod_nodes[scheduled], kind='stable')]
+        self.nodes, self.starts, self.counts = np.unique(pod_nodes[self.order], return_index=True, return_counts=True)
+        self.node_count = node_count
+    
+    def sums(self, weights):
+        """(nodes with pods x hours) sums of node-sorted (pods x hours) weights"""
+        if len(self.order) == 0:
+            return np.zeros((0, weights.shape[1]), dtype=np.float64)
+        return np.add.reduceat(weights, self.starts, axis=0, dtype=np.float64)
+    
+    def spread(self, per_node):
+        """Repeat a (nodes with pods x hours) value onto each of the node's pods"""
+        return np.repeat(per_node, self.counts, axis=0)
+
+def resource_weights(matrices, resource, order):
+    """max(request, usage) per pod-hour in node order; a missing matrix counts as zero"""
+    request = matrices.get(f"{resource}_request")
+    usage = matrices.get(f"{resource}_usage")
+    if request is None and usage is None:
+        return None
+    if usage is None:
+        return np.asarray(request, dtype=np.float32)[order]
+    if request is None:
+        return np.asarray(usage, dtype=np.float32)[order]
+    return np.maximum(np.asarray(request, dtype=np.float32)[order], np.asarray(usage, dtype=np.float32)[order])
+
+def allocate(node_prices, node_cpu, node_memory, pod_nodes, hours, pod_matrices, node_active=None, chunk_hours=None):
+    """Apportion every node-hour's cost to the pods on it, and what is left over to idle
+    
+    Each node-hour's price is split into CPU and memory parts. A pod gets a share of
+    each part equal to max(request, usage) over the node's allocatable amount; when
+    pods together claim more than is allocatable, the part is split between them
+    pro rata instead. What no pod claims is the node's idle cost.
+    
+    `pod_matrices(start, stop)` returns {'cpu_request', 'cpu_usage', 'memory_request',
+    'memory_usage'} as (pods x stop - start) arrays for those hours (missing keys are
+    zero), so the full pods x hours matrices never have to be in memory at once.
+    `node_active` is an optional (nodes x hours) 0/1 matrix of when each node ran.
+    
+    Returns {'pod_cost': (pods,), 'node_cost': (nodes,), 'node_idle': (nodes,)}.
+    """
+    node_count = len(node_prices)
+    segments = NodeSegments(pod_nodes, node_count)
+    cpu_price, memory_price = split_node_price(node_prices, node_cpu, node_memory)
+    allocatable = {
+        'cpu': np.asarray(node_cpu, dtype=np.float64)[segments.nodes],
+        'memory': np.asarray(node_memory, dtype=np.float64)[segments.nodes]
+    }
+    parts = {'cpu': cpu_price, 'memory': memory_price}
+    
+    pod_cost = np.zeros(len(pod_nodes), dtype=np.float64)
+    node_cost = np.zeros(node_count, dtype=np.float64)
+    node_allocated = np.zeros(node_count, dtype=np.float64)
+    chunk_hours = chunk_hours or max(1, CHUNK_VALUES // max(1, len(pod_nodes)))
+    
+    for start in range(0, hours, chunk_hours):
+        stop = min(hours, start + chunk_hours)
+        active = np.ones((node_count, stop - start)) if node_active is None else np.asarray(node_active[:, start:stop], dtype=np.float64)
+        node_cost += (np.asarray(node_prices, dtype=np.float64)[:, None] * active).sum(axis=1)
+        matrices = pod_matrices(start, stop)
+        
+        sorted_cost = np.zeros(len(segments.order), dtype=np.float64)
+        for resource, price in parts.items():
+            weights = resource_weights(matrices, resource, segments.order)
+            if weights is None:
+                continue
+            
+            claimed = segments.sums(weights)
+            capacity = np.maximum(claimed, allocatable[resource][:, None])
+            hourly = price[segments.nodes][:, None] * active[segments.nodes]
+            # Cost per unit of resource on each node-hour
+            rate = np.divide(hourly, capacity, out=np.zeros_like(hourly), where=capacity > 0)
+            
+            sorted_cost += np.einsum('ph,ph->p', weights, segments.spread(rate.astype(np.float32)), dtype=np.float64)
+            node_allocated[segments.nodes] += (rate * claimed).sum(axis=1)
+        
+        pod_cost[segments.order] += sorted_cost
+    
+    return {
+        'pod_cost': pod_cost,
+        'node_cost': node_cost,
+        'node_idle': np.maximum(node_cost - node_allocated, 0)
+    }
+
+def rollup(keys, costs):
+    """{key: total cost}, largest first"""
+    if len(keys) == 0:
+        return {}
+    values, inverse = np.unique(np.asarray(keys, dtype=str), return_inverse=True)
+    totals = np.bincount(inverse, weights=costs, minlength=len(values))
+    order = np.argsort(-totals, kind='stable')
+    return {str(values[index]): round(float(totals[index]), 2) for index in order}
+
+def label_values(pods, label):
+    return [pod.get('labels', {}).get(label, UNLABELLED) for pod in pods]
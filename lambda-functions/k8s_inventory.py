@@ -0,0 +1,330 @@
+import base64
+import boto3
+import gzip
+import json
+import os
+import ssl
+import urllib.error
+import urllib.parse
+import urllib.request
+from botocore.signers import RequestSigner
+
+K8S_INVENTORY_LOCATION = os.environ.get('K8S_INVENTORY_LOCATION')
+# Objects per LIST page; the API server hands back a continue token for the rest
+LIST_PAGE_SIZE = int(os.environ.get('K8S_LIST_PAGE_SIZE', '500'))
+# Times a LIST starts over when its continue token expires mid-way (410 Gone)
+LIST_RESTARTS = 3
+# How long a run waits on WATCH for deltas before it stops
+WATCH_SECONDS = int(os.environ.get('K8S_WATCH_SECONDS', '10'))
+REQUEST_TIMEOUT = 30
+
+# API path per indexed resource type
+RESOURCES = {
+    'nodes': '/api/v1/nodes',
+    'pods': '/api/v1/pods'
+}
+
+QUANTITY_SUFFIXES = {
+    'Ki': 2 ** 10, 'Mi': 2 ** 20, 'Gi': 2 ** 30, 'Ti': 2 ** 40, 'Pi': 2 ** 50, 'Ei': 2 ** 60,
+    'n': 1e-9, 'u': 1e-6, 'm': 1e-3, 'k': 1e3, 'M': 1e6, 'G': 1e9, 'T': 1e12, 'P': 1e15, 'E': 1e18
+}
+
+class ResourceExpired(Exception):
+    """The stored resourceVersion fell out of the API server's watch window (410 Gone)"""
+
+class KubeClient:
+    """Minimal Kubernetes API client over urllib: JSON GETs and streamed watches"""
+    
+    def __init__(self, server, token=None, ca_data=None):
+        self.server = server.rstrip('/')
+        self.token = token
+        self.context = None
+        if server.startswith('https://'):
+            self.context = ssl.create_default_context(cadata=ca_data) if ca_data else ssl.create_default_context()
+        self.requests = 0
+    
+    def _open(self, path, params, timeout):
+        query = urllib.parse.urlencode({key: value for key, value in params.items() if value is not None})
+        request = urllib.request.Request(f"{self.server}{path}?{query}", headers={'Accept': 'application/json'})
+        if self.token:
+            request.add_header('Authorization', f"Bearer {self.token}")
+        self.requests += 1
+        
+        try:
+            return urllib.request.urlopen(request, timeout=timeout, context=self.context)
+        except urllib.error.HTTPError as e:
+            if e.code == 410:
+                raise ResourceExpired(path)
+            raise
+    
+    def get(self, path, **params):
+        with self._open(path, params, REQUEST_TIMEOUT) as response:
+            return json.loads(response.read())
+    
+    def watch(self, path, resource_version, seconds):
+        """Watch events after resource_version; the server ends the stream after `seconds`"""
+        params = {
+            'watch': 'true',
+            'resourceVersion': resource_version,
+            'allowWatchBookmarks': 'true',
+            'timeoutSeconds': seconds
+        }
+        with self._open(path, params, seconds + REQUEST_TIMEOUT) as response:
+            for line in response:
+                if line.strip():
+                    yield json.loads(line)
+
+def eks_token(cluster_name, session=None):
+    """Bearer token for an EKS cluster: a presigned STS GetCallerIdentity URL, as aws-iam-authenticator makes
+    
+    The caller's role must be mapped to a Kubernetes group that may list and watch pods and nodes.
+    """
+    session = session or boto3.session.Session()
+    sts = session.client('sts')
+    region = sts.meta.region_name
+    signer = RequestSigner(sts.meta.service_model.service_id, region, 'sts', 'v4', session.get_credentials(), session.events)
+    url = signer.generate_presigned_url({
+        'method': 'GET',
+        'url': f"https://sts.{region}.amazonaws.com/?Action=GetCallerIdentity&Version=2011-06-15",
+        'body': {},
+        'headers': {'x-k8s-aws-id': cluster_name},
+        'context': {}
+    }, region_name=region, expires_in=60, operation_name='')
+    return 'k8s-aws-v1.' + base64.urlsafe_b64encode(url.encode()).decode().rstrip('=')
+
+def eks_client(cluster, session=None):
+    """KubeClient for a describe_cluster result"""
+    return KubeClient(
+        cluster['endpoint'],
+        eks_token(cluster['name'], session),
+        base64.b64decode(cluster['certificateAuthority']['data']).decode()
+    )
+
+def parse_quantity(value):
+    """Kubernetes quantity ('250m', '1.5', '512Mi', '1e3') as a float in base units"""
+    value = str(value).strip()
+    if not value:
+        return 0.0
+    
+    for suffix in (value[-2:], value[-1:]):
+        if suffix in QUANTITY_SUFFIXES:
+            try:
+                return float(value[:-len(suffix)]) * QUANTITY_SUFFIXES[suffix]
+            except ValueError:
+                break
+    return float(value)
+
+def container_requests(containers):
+    cpu = memory = 0.0
+    for container in containers or []:
+        requests = (container.get('resources') or {}).get('requests') or {}
+        cpu += parse_quantity(requests.get('cpu', 0))
+        memory += parse_quantity(requests.get('memory', 0))
+    return cpu, memory
+
+def pod_requests(spec):
+    """Effective (cpu cores, memory bytes) request, the way the scheduler counts it
+    
+    The larger of the app containers' sum and the largest init container, plus pod overhead.
+    """
+    cpu, memory = container_requests(spec.get('containers'))
+    for init in spec.get('initContainers') or []:
+        init_cpu, init_memory = container_requests([init])
+        cpu, memory = max(cpu, init_cpu), max(memory, init_memory)
+    
+    overhead = spec.get('overhead') or {}
+    return cpu + parse_quantity(overhead.get('cpu', 0)), memory + parse_quantity(overhead.get('memory', 0))
+
+def workload_of(metadata):
+    """'Kind/name' of the controller that owns a pod; ReplicaSets resolve to their Deployment"""
+    for owner in metadata.get('ownerReferences') or []:
+        if not owner.get('controller'):
+            continue
+        kind, name = owner['kind'], owner['name']
+        template_hash = (metadata.get('labels') or {}).get('pod-template-hash')
+        if kind == 'ReplicaSet' and template_hash and name.endswith(f"-{template_hash}"):
+            return f"Deployment/{name[:-len(template_hash) - 1]}"
+        return f"{kind}/{name}"
+    return f"Pod/{metadata['name']}"
+
+def index_pod(pod):
+    metadata, spec = pod['metadata'], pod.get('spec') or {}
+    cpu, memory = pod_requests(spec)
+    return {
+        'namespace': metadata.get('namespace', 'default'),
+        'name': metadata['name'],
+        'node': spec.get('nodeName'),
+        'phase': (pod.get('status') or {}).get('phase'),
+        'workload': workload_of(metadata),
+        'labels': metadata.get('labels') or {},
+        'cpu_request': cpu,
+        'memory_request': memory
+    }
+
+def index_node(node):
+    labels = node['metadata'].get('labels') or {}
+    allocatable = (node.get('status') or {}).get('allocatable') or {}
+    return {
+        'name': node['metadata']['name'],
+        'instance_type': labels.get('node.kubernetes.io/instance-type', labels.get('beta.kubernetes.io/instance-type')),
+        'capacity_type': labels.get('eks.amazonaws.com/capacityType', 'ON_DEMAND'),
+        'nodegroup': labels.get('eks.amazonaws.com/nodegroup'),
+        'zone': labels.get('topology.kubernetes.io/zone'),
+        'cpu_allocatable': parse_quantity(allocatable.get('cpu', 0)),
+        'memory_allocatable': parse_quantity(allocatable.get('memory', 0))
+    }
+
+INDEXERS = {'nodes': index_node, 'pods': index_pod}
+
+def object_key(resource_type, obj):
+    metadata = obj['metadata']
+    return f"{metadata['namespace']}/{metadata['name']}" if resource_type == 'pods' else metadata['name']
+
+class Inventory:
+    """Informer-style index of a cluster's nodes and pods
+    
+    The first sync pages through a LIST; later syncs only WATCH from the stored
+    resourceVersion and apply the deltas. A resourceVersion older than the API
+    server's watch window (410 Gone) falls back to a fresh LIST, and so does a
+    continue token that expires part-way through one.
+    """
+    
+    def __init__(self, objects=None, resource_versions=None):
+        self.objects = objects or {resource_type: {} for resource_type in RESOURCES}
+        self.resource_versions = resource_versions or {}
+        self.stats = {'listed': 0, 'list_pages': 0, 'events': 0, 'relists': 0}
+    
+    def list(self, client, resource_type, page_size=LIST_PAGE_SIZE):
+        objects = {}
+        token = None
+        restarts = 0
+        while True:
+            try:
+                page = client.get(RESOURCES[resource_type], limit=page_size, **{'continue': token})
+            except ResourceExpired:
+                # The snapshot behind the continue token was compacted away; pages already
+                # read belong to it, so the LIST starts over from the first page
+                if token is None or restarts >= LIST_RESTARTS:
+                    raise
+                print(f"Continue token expired while listing {resource_type}; listing again")
+                objects, token = {}, None
+                restarts += 1
+                self.stats['relists'] += 1
+                continue
+            
+            for item in page.get('items', []):
+                objects[object_key(resource_type, item)] = INDEXERS[resource_type](item)
+            self.stats['list_pages'] += 1
+            self.stats['listed'] += len(page.get('items', []))
+            
+            token = page['metadata'].get('continue')
+            if not token:
+                break
+        
+        # A paged LIST is a consistent snapshot as of the first page's resourceVersion,
+        # which the last page repeats
+        self.objects[resource_type] = objects
+        self.resource_versions[resource_type] = page['metadata']['resourceVersion']
+    
+    def watch(self, client, resource_type, seconds=WATCH_SECONDS):
+        objects = self.objects[resource_type]
+        for event in client.watch(RESOURCES[resource_type], self.resource_versions[resource_type], seconds):
+            kind, obj = event['type'], event['object']
+            if kind == 'ERROR':
+                if obj.get('code') == 410:
+                    raise ResourceExpired(resource_type)
+                raise RuntimeError(f"Watch on {resource_type} failed: {obj.get('message')}")
+            
+            if kind == 'DELETED':
+                objects.pop(object_key(resource_type, obj), None)
+            elif kind in ('ADDED', 'MODIFIED'):
+                objects[object_key(resource_type, obj)] = INDEXERS[resource_type](obj)
+            self.resource_versions[resource_type] = obj['metadata']['resourceVersion']
+            self.stats['events'] += 1
+    
+    def sync(self, client, page_size=LIST_PAGE_SIZE, watch_seconds=WATCH_SECONDS):
+        """Bring every resource type up to date: WATCH deltas when possible, LIST otherwise"""
+        for resource_type in RESOURCES:
+            if resource_type in self.resource_versions:
+                try:
+                    self.watch(client, resource_type, watch_seconds)
+                    continue
+                except ResourceExpired:
+                    print(f"Watch window passed for {resource_type}; listing again")
+                    self.stats['relists'] += 1
+            self.list(client, resource_type, page_size)
+        return self
+    
+    def pods(self, running=True):
+        """Indexed pods, by default only those holding node resources (scheduled, not finished)"""
+        return [
+            pod for pod in self.objects['pods'].values()
+            if not running or (pod['node'] and pod['phase'] not in ('Succeeded', 'Failed'))
+        ]
+    
+    def nodes(self):
+        return list(self.objects['nodes'].values())
+    
+    def requests_by_node(self):
+        """{node: [cpu requested, memory requested]} over running pods"""
+        totals = {name: [0.0, 0.0] for name in self.objects['nodes']}
+        for pod in self.pods():
+            total = totals.setdefault(pod['node'], [0.0, 0.0])
+            total[0] += pod['cpu_request']
+            total[1] += pod['memory_request']
+        return totals
+    
+    def to_json(self):
+        return {'resource_versions': self.resource_versions, 'objects': self.objects}
+
+def inventory_path(name, location):
+    if location.startswith('s3://'):
+        bucket, _, prefix = location[5:].partition('/')
+        return bucket, f"{prefix.rstrip('/')}/{name}.json.gz" if prefix else f"{name}.json.gz"
+    return None, os.path.join(location, f"{name}.json.gz")
+
+def load_inventory(name, location=K8S_INVENTORY_LOCATION):
+    """Stored index for a cluster, or an empty one that will LIST on its first sync"""
+    if not location:
+        return Inventory()
+    
+    bucket, key = inventory_path(name, location)
+    try:
+        if bucket:
+            s3 = boto3.client('s3')
+            try:
+                data = s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+            except s3.exceptions.NoSuchKey:
+                return Inventory()
+        else:
+            if not os.path.exists(key):
+                return Inventory()
+            with open(key, 'rb') as f:
+                data = f.read()
+        
+        stored = json.loads(gzip.decompress(data))
+        return Inventory(stored['objects'], stored['resource_versions'])
+    except Exception as e:
+        print(f"Error loading Kubernetes inventory {name}: {str(e)}")
+        return Inventory()
+
+def save_inventory(name, inventory, location=K8S_INVENTORY_LOCATION):
+    data = gzip.compress(json.dumps(inventory.to_json(), separators=(',', ':')).encode())
+    bucket, key = inventory_path(name, location)
+    
+    if bucket:
+        boto3.client('s3').put_object(Bucket=bucket, Key=key, Body=data)
+    else:
+        os.makedirs(os.path.dirname(key) or '.', exist_ok=True)
+        # Write-then-rename so a timeout mid-write never leaves a torn index
+        with open(f"{key}.tmp", 'wb') as f:
+            f.write(data)
+        os.replace(f"{key}.tmp", key)
+
+def cluster_inventory(client, name, location=K8S_INVENTORY_LOCATION, watch_seconds=WATCH_SECONDS):
+    """Load, sync and store the index for one cluster"""
+    inventory = load_inventory(name, location)
+    inventory.sync(client, watch_seconds=watch_seconds)
+    if location:
+        save_inventory(name, inventory, location)
+    return inventory
@@ -1,18 +1,42 @@
 import json
 import boto3
 import logging
+import numpy as np
 from datetime import datetime, timedelta
+import os
 import statistics
+import cur_reader
+import forecast_backtest
+import hourly_anomaly
+from api_instrumentation import instrumented
+from profiling import profiled
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+FORECAST_DAYS = 30
+# History and grouping for the optional per-series backtest of the forecasters
+BACKTEST_DAYS = int(os.environ.get('BACKTEST_DAYS', '365'))
+BACKTEST_BY = os.environ.get('BACKTEST_BY', 'product')
+
+@profiled
+@instrumented
 def lambda_handler(event, context):
     """ML-based cost anomaly detection with forecasting"""
     
     ce = boto3.client('ce')
     cloudwatch = boto3.client('cloudwatch')
     
+    # Hourly mode scores only the hours since the last run against the stored ring buffers
+    if event.get('mode') == 'hourly':
+        try:
+            results = hourly_anomaly.detect(ce, event.get('cur_location', cur_reader.CUR_LOCATION))
+            send_hourly_metrics(cloudwatch, results)
+            return {'statusCode': 200, 'body': json.dumps(results)}
+        except Exception as e:
+            logger.error(f"Hourly anomaly detection error: {str(e)}")
+            return {'statusCode': 500, 'body': json.dumps({'error': str(e)})}
+    
     try:
         # Get recent anomalies from AWS Cost Anomaly Detection
         end_date = datetime.utcnow().strftime('%Y-%m-%d')
@@ -23,7 +47,8 @@ def lambda_handler(event, context):
         )
         
         # Analyze cost trends for ML forecasting
-        cost_forecast = analyze_cost_trends(ce)
+        cur_location = event.get('cur_location', cur_reader.CUR_LOCATION)
+        cost_forecast = analyze_cost_trends(ce, cur_location)
         
         # Generate ML insights
         ml_insights = generate_ml_insights(anomalies, cost_forecast)
@@ -31,42 +56,51 @@ def lambda_handler(event, context):
         # Send metrics to CloudWatch
         send_ml_metrics(cloudwatch, ml_insights)
         
+        results = {
+            'anomalies_detected': len(anomalies.get('Anomalies', [])),
+            'ml_forecast': cost_forecast,
+            'risk_assessment': ml_insights,
+            'recommendations': generate_recommendations(ml_insights)
+        }
+        
+        # Measure every forecasting model on a year of per-service history
+        if event.get('backtest') and cur_location:
+            results['forecast_backtest'] = backtest_cur(cur_location, event.get('backtest_by', BACKTEST_BY))
+        
         return {
             'statusCode': 200,
-            'body': json.dumps({
-                'anomalies_detected': len(anomalies.get('Anomalies', [])),
-                'ml_forecast': cost_forecast,
-                'risk_assessment': ml_insights,
-                'recommendations': generate_recommendations(ml_insights)
-            })
+            'body': json.dumps(results)
         }
         
     except Exception as e:
         logger.error(f"ML anomaly detection error: {str(e)}")
         return {'statusCode': 500, 'body': json.dumps({'error': str(e)})}
 
-def analyze_cost_trends(ce):
+def analyze_cost_trends(ce, cur_location=None):
     """ML-based cost trend analysis and forecasting"""
     try:
         # Get 60 days of cost data
         end_date = datetime.utcnow()
         start_date = end_date - timedelta(days=60)
         
-        response = ce.get_cost_and_usage(
-            TimePeriod={
-                'Start': start_date.strftime('%Y-%m-%d'),
-                'End': end_date.strftime('%Y-%m-%d')
-            },
-            Granularity='DAILY',
-            Metrics=['BlendedCost']
-        )
-        
-        # Extract daily costs
-        daily_costs = []
-        for result in response['ResultsByTime']:
-            total_cost = sum(float(group['Metrics']['BlendedCost']['Amount']) 
-                           for group in result['Groups'])
-            daily_costs.append(total_cost)
+        if cur_location:
+            daily_costs = get_daily_costs_cur(cur_location, start_date, end_date)
+        else:
+            response = ce.get_cost_and_usage(
+                TimePeriod={
+                    'Start': start_date.strftime('%Y-%m-%d'),
+                    'End': end_date.strftime('%Y-%m-%d')
+                },
+                Granularity='DAILY',
+                Metrics=['BlendedCost']
+            )
+            
+            # Extract daily costs
+            daily_costs = []
+            for result in response['ResultsByTime']:
+                total_cost = sum(float(group['Metrics']['BlendedCost']['Amount']) 
+                               for group in result['Groups'])
+                daily_costs.append(total_cost)
         
         if len(daily_costs) < 14:
             return {'error': 'insufficient_data'}
@@ -77,20 +111,53 @@ def analyze_cost_trends(ce):
         volatility = statistics.stdev(daily_costs) if len(daily_costs) > 1 else 0
         
         # Linear regression forecast
-        forecast = ml_forecast(daily_costs, 30)
+        forecast = ml_forecast(daily_costs, FORECAST_DAYS)
+        accuracy = forecast_accuracy(daily_costs)
         
         return {
             'current_daily_avg': round(recent_avg, 2),
             'trend_change': round((recent_avg - historical_avg) / historical_avg * 100, 2),
             'volatility_score': round(volatility / recent_avg * 100, 2) if recent_avg > 0 else 0,
             'forecast_30_days': forecast,
-            'confidence_score': calculate_confidence(daily_costs)
+            'forecast_accuracy': accuracy,
+            'confidence_score': calculate_confidence(daily_costs, accuracy)
         }
         
     except Exception as e:
         logger.error(f"Cost trend analysis error: {str(e)}")
         return {'error': str(e)}
 
+def get_daily_costs_cur(location, start_date, end_date):
+    """Daily cost from the Cost and Usage Report over whole UTC days in [start_date, end_date)"""
+    start = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    end = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    
+    reader = cur_reader.CurReader(location, start, end, columns=())
+    daily_costs = cur_reader.cost_series(reader, start, end, step_hours=24)
+    logger.info(f"Read CUR for cost trends: {json.dumps(reader.stats)}")
+    # Days the report has not caught up with yet would read as a cost drop
+    return np.trim_zeros(daily_costs, 'b').tolist()
+
+def backtest_cur(location, column=BACKTEST_BY, days=BACKTEST_DAYS):
+    """Rolling-origin accuracy of every forecasting model over daily cost per `column` value"""
+    end = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = end - timedelta(days=days)
+    
+    reader = cur_reader.CurReader(location, start, end, columns=(column,))
+    keys, series = cur_reader.cost_series_by(reader, column, start, end, step_hours=24)
+    # Days the report has not caught up with yet would read as a cost drop
+    observed = series.any(axis=0)
+    series = series[:, :np.flatnonzero(observed)[-1] + 1] if observed.any() else series[:, :0]
+    
+    report = forecast_backtest.backtest(series, FORECAST_DAYS)
+    return {
+        'series': len(keys),
+        'days': series.shape[1],
+        'grouped_by': column,
+        'best_model': forecast_backtest.best_model(report),
+        'models': report
+    }
+
 def ml_forecast(daily_costs, days_ahead):
     """Simple ML forecasting using linear regression"""
     if len(daily_costs) < 7:
@@ -157,31 +224,36 @@ def generate_ml_insights(anomalies, forecast):
     if forecast.get('forecast_30_days'):
         insights['predicted_monthly_cost'] = round(sum(forecast['forecast_30_days']), 2)
     
-    # Adjust confidence based on volatility
+    # Confidence measured by backtesting the forecast, else estimated from volatility
     volatility = forecast.get('volatility_score', 0)
-    if volatility > 50:
+    if 'confidence_score' in forecast:
+        insights['confidence_score'] = forecast['confidence_score']
+    elif volatility > 50:
         insights['confidence_score'] = 0.6
     elif volatility > 25:
         insights['confidence_score'] = 0.75
     
     return insights
 
-def calculate_confidence(daily_costs):
-    """Calculate ML model confidence based on data quality"""
-    if len(daily_costs) < 7:
+def forecast_accuracy(daily_costs):
+    """Backtested error of ml_forecast's model on this history, or None if it is too short"""
+    report = forecast_backtest.backtest([daily_costs], FORECAST_DAYS, models=['linear_trend'])['linear_trend']
+    if not report['forecasts']:
+        return None
+    return {
+        'mape': report['mape_overall'],
+        'smape': report['smape_overall'],
+        'interval_coverage': report['coverage_overall'],
+        'forecasts': report['forecasts'],
+        'confidence': report['confidence']
+    }
+
+def calculate_confidence(daily_costs, accuracy=None):
+    """Model confidence from ml_forecast's measured error when backtested on this history"""
+    accuracy = accuracy or forecast_accuracy(daily_costs)
+    if accuracy is None or accuracy['confidence'] is None:
         return 0.3
-    
-    # More data = higher confidence
-    data_score = min(len(daily_costs) / 30, 1.0) * 0.4
-    
-    # Lower volatility = higher confidence
-    if len(daily_costs) > 1:
-        volatility = statistics.stdev(daily_costs) / statistics.mean(daily_costs)
-        stability_score = max(0, 1 - volatility) * 0.6
-    else:
-        stability_score = 0.5
-    
-    return round(data_score + stability_score, 2)
+    return accuracy['confidence']
 
 def generate_recommendations(ml_insights):
     """Generate ML-based recommendations"""
@@ -246,3 +318,25 @@ def send_ml_metrics(cloudwatch, ml_insights):
         
     except Exception as e:
         logger.error(f"Error sending ML metrics: {str(e)}")
+
+def send_hourly_metrics(cloudwatch, results):
+    """Send hourly anomaly counts and impact as CloudWatch metrics"""
+    try:
+        cloudwatch.put_metric_data(
+            Namespace='CostOptimization/ML',
+            MetricData=[
+                {
+                    'MetricName': 'HourlyAnomalies',
+                    'Value': len(results['anomalies']),
+                    'Unit': 'Count'
+                },
+                {
+                    'MetricName': 'HourlyAnomalyImpact',
+                    'Value': round(sum(anomaly['impact'] for anomaly in results['anomalies']), 2),
+                    'Unit': 'None'
+                }
+            ]
+        )
+        
+    except Exception as e:
+        logger.error(f"Error sending hourly anomaly metrics: {str(e)}")
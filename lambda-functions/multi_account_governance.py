@@ -1,10 +1,25 @@
 import boto3
 import json
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+import cur_reader
+import tag_compliance
+from api_instrumentation import instrumented
+from profiling import profiled
 
+BUDGET_MAX_WORKERS = int(os.environ.get('BUDGET_MAX_WORKERS', '16'))
+# Share of the limit at which a budget is reported before it is exceeded
+BUDGET_WARNING_THRESHOLD = 0.8
+
+@profiled
+@instrumented
 def lambda_handler(event, context):
     organizations = boto3.client('organizations')
     ce = boto3.client('ce')
+    # Resolved once; it decides which account is read with the function's own credentials
+    caller_account_id = boto3.client('sts').get_caller_identity()['Account']
+    accounts = []
     
     results = {
         'account_analysis': [],
@@ -13,37 +28,59 @@ def lambda_handler(event, context):
         'tagging_compliance': {}
     }
     
+    # One pass over the Cost and Usage Report replaces two Cost Explorer calls per account
+    cur_location = event.get('cur_location', cur_reader.CUR_LOCATION)
+    cur_costs = get_account_costs_cur(cur_location) if cur_location else None
+    
     # Get all accounts in organization
     try:
-        accounts = organizations.list_accounts()
+        accounts = [
+            account
+            for page in organizations.get_paginator('list_accounts').paginate()
+            for account in page['Accounts']
+            if account.get('Status', 'ACTIVE') == 'ACTIVE'
+        ]
         
-        for account in accounts['Accounts']:
+        # Tag compliance for every account and region is scanned in parallel up front
+        compliance = check_tagging_compliance([account['Id'] for account in accounts], caller_account_id, event.get('regions'))
+        results['tagging_compliance'] = compliance['organization'] or {}
+        if compliance['errors']:
+            results['tagging_compliance']['errors'] = compliance['errors']
+        
+        for account in accounts:
             account_id = account['Id']
             account_name = account['Name']
+            previous_month_cost = 0
             
-            # Get cost data for each account
-            cost_data = ce.get_cost_and_usage(
-                TimePeriod={
-                    'Start': (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d'),
-                    'End': datetime.now().strftime('%Y-%m-%d')
-                },
-                Granularity='MONTHLY',
-                Metrics=['BlendedCost'],
-                GroupBy=[{'Type': 'DIMENSION', 'Key': 'LINKED_ACCOUNT'}]
-            )
-            
-            # Find this account's costs
-            account_cost = 0
-            for result in cost_data['ResultsByTime']:
-                for group in result['Groups']:
-                    if group['Keys'][0] == account_id:
-                        account_cost = float(group['Metrics']['BlendedCost']['Amount'])
-                        break
+            if cur_costs is not None:
+                account_cost = cur_costs[0].get(account_id, 0)
+            else:
+                # Get cost data for each account
+                cost_data = ce.get_cost_and_usage(
+                    TimePeriod={
+                        'Start': (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d'),
+                        'End': datetime.now().strftime('%Y-%m-%d')
+                    },
+                    Granularity='MONTHLY',
+                    Metrics=['BlendedCost'],
+                    GroupBy=[{'Type': 'DIMENSION', 'Key': 'LINKED_ACCOUNT'}]
+                )
+                
+                # Find this account's costs
+                account_cost = 0
+                for result in cost_data['ResultsByTime']:
+                    for group in result['Groups']:
+                        if group['Keys'][0] == account_id:
+                            account_cost = float(group['Metrics']['BlendedCost']['Amount'])
+                            break
             
             # Analyze cost trends and anomalies
             if account_cost > 10000:  # Accounts with >$10k spend
                 # Check for cost anomalies (>50% increase)
-                previous_month_cost = get_previous_month_cost(ce, account_id)
+                if cur_costs is not None:
+                    previous_month_cost = cur_costs[1].get(account_id, 0)
+                else:
+                    previous_month_cost = get_previous_month_cost(ce, account_id)
                 if previous_month_cost > 0:
                     cost_change = ((account_cost - previous_month_cost) / previous_month_cost) * 100
                     
@@ -58,48 +95,45 @@ def lambda_handler(event, context):
                         })
             
             # Check tagging compliance
-            tagging_compliance = check_tagging_compliance(account_id)
+            account_compliance = compliance['accounts'].get(account_id)
             
             results['account_analysis'].append({
                 'account_id': account_id,
                 'account_name': account_name,
                 'monthly_cost': f"${account_cost:.2f}",
-                'tagging_compliance': f"{tagging_compliance:.1f}%",
+                'tagging_compliance': f"{account_compliance['compliance_percentage']:.1f}%" if account_compliance else 'unavailable',
+                'tagging_compliance_by_rule': account_compliance['by_rule'] if account_compliance else {},
                 'cost_trend': 'INCREASING' if account_cost > previous_month_cost else 'STABLE'
             })
     
     except Exception as e:
         print(f"Error accessing Organizations: {str(e)}")
     
-    # Check for budget violations across organization
-    budgets = boto3.client('budgets')
-    try:
-        budget_list = budgets.describe_budgets(AccountId=boto3.Session().get_credentials().access_key[:12])
-        
-        for budget in budget_list.get('Budgets', []):
-            budget_name = budget['BudgetName']
-            budget_limit = float(budget['BudgetLimit']['Amount'])
-            
-            # Get actual spend vs budget
-            actual_spend = get_budget_actual_spend(budgets, budget_name)
-            
-            if actual_spend > budget_limit * 0.8:  # >80% of budget
-                results['budget_violations'].append({
-                    'budget_name': budget_name,
-                    'budget_limit': f"${budget_limit:.2f}",
-                    'actual_spend': f"${actual_spend:.2f}",
-                    'utilization': f"{(actual_spend/budget_limit*100):.1f}%",
-                    'status': 'EXCEEDED' if actual_spend > budget_limit else 'WARNING'
-                })
-                
-    except Exception as e:
-        print(f"Error checking budgets: {str(e)}")
+    # Check for budget violations across organization, or this account outside one
+    account_ids = [account['Id'] for account in accounts] or [caller_account_id]
+    results['budget_violations'], budget_errors = evaluate_budgets(account_ids, caller_account_id)
+    if budget_errors:
+        results['budget_errors'] = budget_errors
     
     return {
         'statusCode': 200,
         'body': json.dumps(results)
     }
 
+def get_account_costs_cur(location):
+    """Cost per account for the last 30 days and the 30 days before, from the Cost and Usage Report"""
+    now = datetime.utcnow()
+    windows = [(now - timedelta(days=30), now), (now - timedelta(days=60), now - timedelta(days=30))]
+    
+    try:
+        reader = cur_reader.CurReader(location, windows[1][0], now, columns=('account',))
+        costs = cur_reader.cost_by(reader, 'account', windows)
+        print(f"Read CUR for account costs: {json.dumps(reader.stats)}")
+        return costs
+    except Exception as e:
+        print(f"Error reading CUR, falling back to Cost Explorer: {str(e)}")
+        return None
+
 def get_previous_month_cost(ce, account_id):
     try:
         cost_data = ce.get_cost_and_usage(
@@ -120,11 +154,86 @@ def get_previous_month_cost(ce, account_id):
         pass
     return 0
 
-def check_tagging_compliance(account_id):
-    # Simplified tagging compliance check
-    # In real implementation, would check resource tagging across services
-    return 75.0  # Placeholder compliance percentage
+def check_tagging_compliance(account_ids, caller_account_id=None, regions=None):
+    """Tag compliance per account and for the organization, from the Resource Groups Tagging API"""
+    try:
+        accounts, organization, errors = tag_compliance.scan_organization(account_ids, regions, caller_account_id=caller_account_id)
+        return {'accounts': accounts, 'organization': organization, 'errors': errors}
+    except Exception as e:
+        print(f"Error checking tag compliance: {str(e)}")
+        return {'accounts': {}, 'organization': None, 'errors': {'all': str(e)}}
+
+def list_budgets(account_id, caller_account_id):
+    """Every budget of one account, in its own session so accounts can be read in parallel"""
+    # Budgets quotas are per account; the shared limiter keys on region only and would
+    # serialize the accounts, so throttling is left to botocore's retries here
+    session = tag_compliance.account_session(account_id, caller_account_id, rate_limited=False)
+    budgets = session.client('budgets', region_name='us-east-1')
+    
+    return [
+        budget
+        for page in budgets.get_paginator('describe_budgets').paginate(AccountId=account_id)
+        for budget in page.get('Budgets', [])
+    ]
+
+def budget_health(account_id, budget):
+    """Violation entry from a budget's own CalculatedSpend, or None when it is within limits"""
+    limit = float(budget.get('BudgetLimit', {}).get('Amount', 0))
+    if limit <= 0:
+        return None
+    
+    spend = budget.get('CalculatedSpend', {})
+    actual_spend = float(spend.get('ActualSpend', {}).get('Amount', 0))
+    forecasted_spend = float(spend.get('ForecastedSpend', {}).get('Amount', 0))
+    unit = budget['BudgetLimit'].get('Unit', 'USD')
+    
+    if actual_spend > limit:
+        status = 'EXCEEDED'
+    elif actual_spend > limit * BUDGET_WARNING_THRESHOLD:
+        status = 'WARNING'
+    elif forecasted_spend > limit:
+        status = 'FORECASTED_TO_EXCEED'
+    else:
+        return None
+    
+    amount = (lambda value: f"${value:.2f}") if unit == 'USD' else (lambda value: f"{value:.2f} {unit}")
+    return {
+        'account_id': account_id,
+        'budget_name': budget['BudgetName'],
+        'budget_type': budget.get('BudgetType'),
+        'time_unit': budget.get('TimeUnit'),
+        'budget_limit': amount(limit),
+        'actual_spend': amount(actual_spend),
+        'forecasted_spend': amount(forecasted_spend),
+        'utilization': f"{(actual_spend / limit * 100):.1f}%",
+        'forecasted_utilization': f"{(forecasted_spend / limit * 100):.1f}%",
+        'status': status
+    }
 
-def get_budget_actual_spend(budgets_client, budget_name):
-    # Simplified budget spend check
-    return 850.0  # Placeholder actual spend
+def evaluate_budgets(account_ids, caller_account_id, max_workers=BUDGET_MAX_WORKERS):
+    """Budget violations across accounts, listed in parallel with no per-budget calls
+    
+    Returns (violations ordered by utilization, {account_id: error}).
+    """
+    violations = []
+    errors = {}
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            account_id: pool.submit(list_budgets, account_id, caller_account_id)
+            for account_id in account_ids
+        }
+        
+        for account_id, future in futures.items():
+            try:
+                for budget in future.result():
+                    violation = budget_health(account_id, budget)
+                    if violation:
+                        violations.append(violation)
+            except Exception as e:
+                print(f"Error checking budgets for {account_id}: {str(e)}")
+                errors[account_id] = str(e)
+    
+    status_order = {'EXCEEDED': 0, 'WARNING': 1, 'FORECASTED_TO_EXCEED': 2}
+    violations.sort(key=lambda violation: (status_order[violation['status']], -float(violation['utilization'][:-1])))
+    return violations, errors
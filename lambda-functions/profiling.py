@@ -0,0 +1,255 @@
+import boto3
+import cProfile
+import functools
+import json
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+# Comma-separated profilers to run on every invocation ("cpu", "memory"); empty means off
+PROFILE = os.environ.get('PROFILE', '')
+PROFILE_LOCATION = os.environ.get('PROFILE_LOCATION', os.path.join(tempfile.gettempdir(), 'profiles'))
+TOP_N = int(os.environ.get('PROFILE_TOP_N', '20'))
+SAMPLE_INTERVAL_MS = float(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', '5'))
+TRACEMALLOC_FRAMES = int(os.environ.get('PROFILE_TRACEMALLOC_FRAMES', '10'))
+
+_active = False
+
+def profile_options(event):
+    """Resolve which profilers to run: the event's 'profile' key wins over the PROFILE variable
+    
+    Accepts true, "cpu", "memory", "cpu,memory" or a dict such as
+    {"cpu": true, "memory": false, "location": "s3://bucket/profiles", "top": 10}.
+    """
+    flag = event.get('profile') if isinstance(event, dict) else None
+    if flag is None:
+        flag = PROFILE
+    
+    if isinstance(flag, dict):
+        options = {
+            'cpu': bool(flag.get('cpu', True)),
+            'memory': bool(flag.get('memory', True)),
+            'location': flag.get('location', PROFILE_LOCATION),
+            'top': int(flag.get('top', TOP_N))
+        }
+    elif flag is True:
+        options = {'cpu': True, 'memory': True}
+    elif isinstance(flag, str) and flag:
+        kinds = {kind.strip().lower() for kind in flag.split(',')}
+        options = {'cpu': bool(kinds & {'cpu', 'all', 'true'}), 'memory': bool(kinds & {'memory', 'all', 'true'})}
+    else:
+        return None
+    
+    options.setdefault('location', PROFILE_LOCATION)
+    options.setdefault('top', TOP_N)
+    return options if options['cpu'] or options['memory'] else None
+
+class StackSampler:
+    """Background thread recording the stacks of all other threads in collapsed-stack form
+    
+    cProfile only keeps caller/callee pairs, so full stacks for a flame graph come from sampling.
+    """
+    
+    def __init__(self, interval_ms=SAMPLE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.stacks = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+    
+    def start(self):
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+    
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if len(names) != len(frames):
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            
+            for thread_id, frame in frames.items():
+                if thread_id == own_id:
+                    continue
+                
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                
+                key = ';'.join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+    
+    def collapsed(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+def top_functions(profiler, limit):
+    stats = pstats.Stats(profiler)
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+    
+    return {
+        'total_seconds': round(stats.total_tt, 3),
+        'top': [
+            {
+                'function': f"{name} ({os.path.basename(filename)}:{line})",
+                'calls': primitive_calls,
+                'total_calls': total_calls,
+                'self_seconds': round(self_time, 4),
+                'cumulative_seconds': round(cumulative_time, 4)
+            }
+            for (filename, line, name), (primitive_calls, total_calls, self_time, cumulative_time, _) in rows
+        ]
+    }
+
+def top_allocations(snapshot, peak_bytes, limit):
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__)
+    ])
+    
+    return {
+        'peak_bytes': peak_bytes,
+        'top': [
+            {
+                'site': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                'size_bytes': stat.size,
+                'count': stat.count
+            }
+            for stat in snapshot.statistics('lineno')[:limit]
+        ]
+    }
+
+def artifact_target(location, name):
+    if location.startswith('s3://'):
+        bucket, _, prefix = location[5:].partition('/')
+        return bucket, f"{prefix.rstrip('/')}/{name}" if prefix else name
+    return None, os.path.join(location, name)
+
+def write_artifact(location, name, data):
+    bucket, key = artifact_target(location, name)
+    
+    if bucket:
+        boto3.client('s3').put_object(Bucket=bucket, Key=key, Body=data)
+        return f"s3://{bucket}/{key}"
+    
+    os.makedirs(os.path.dirname(key), exist_ok=True)
+    with open(key, 'wb') as f:
+        f.write(data)
+    return key
+
+def write_artifacts(options, prefix, profiler, sampler, memory_summary):
+    artifacts = []
+    
+    if profiler is not None:
+        # pstats only dumps to a path, so stage it in /tmp before copying to the destination
+        with tempfile.NamedTemporaryFile(suffix='.pstats', delete=False) as f:
+            staged = f.name
+        try:
+            profiler.dump_stats(staged)
+            with open(staged, 'rb') as f:
+                artifacts.append(write_artifact(options['location'], f"{prefix}.pstats", f.read()))
+        finally:
+            os.remove(staged)
+    
+    if sampler is not None:
+        artifacts.append(write_artifact(options['location'], f"{prefix}.collapsed", sampler.collapsed().encode()))
+    
+    if memory_summary is not None:
+        artifacts.append(write_artifact(options['location'], f"{prefix}.memory.json", json.dumps(memory_summary, indent=2).encode()))
+    
+    return artifacts
+
+def attach_profile(response, profile):
+    if not isinstance(response, dict) or not isinstance(response.get('body'), str):
+        return response
+    
+    try:
+        body = json.loads(response['body'])
+    except ValueError:
+        return response
+    
+    if isinstance(body, dict):
+        body['profile'] = profile
+        response['body'] = json.dumps(body, default=str)
+    return response
+
+def run_profiled(handler, event, context, options):
+    global _active
+    
+    name = getattr(context, 'function_name', None) or handler.__module__
+    request_id = getattr(context, 'aws_request_id', None) or str(os.getpid())
+    prefix = f"{name}/{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{request_id}"
+    
+    profiler = cProfile.Profile() if options['cpu'] else None
+    sampler = StackSampler() if options['cpu'] else None
+    # Leave tracemalloc alone if something else (e.g. the benchmark) already started it
+    started_tracing = options['memory'] and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    if options['memory']:
+        tracemalloc.reset_peak()
+    
+    _active = True
+    start = time.perf_counter()
+    try:
+        if sampler is not None:
+            sampler.start()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            response = handler(event, context)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            if sampler is not None:
+                sampler.stop()
+    finally:
+        _active = False
+    
+    profile = {'wall_seconds': round(time.perf_counter() - start, 3)}
+    memory_summary = None
+    try:
+        if options['memory']:
+            snapshot = tracemalloc.take_snapshot()
+            memory_summary = top_allocations(snapshot, tracemalloc.get_traced_memory()[1], options['top'])
+            profile['memory'] = memory_summary
+        if profiler is not None:
+            profile['cpu'] = top_functions(profiler, options['top'])
+            profile['cpu']['samples'] = sampler.samples
+        profile['artifacts'] = write_artifacts(options, prefix, profiler, sampler, memory_summary)
+    except Exception as e:
+        print(f"Error writing profile for {name}: {str(e)}")
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+    
+    print(f"Profile for {name}: {json.dumps({k: v for k, v in profile.items() if k != 'memory'}, default=str)[:2000]}")
+    return attach_profile(response, profile)
+
+def profiled(handler):
+    """Run a handler under cProfile, a stack sampler and/or tracemalloc when asked to
+    
+    With neither the event's 'profile' key nor PROFILE set, the handler is called directly.
+    Nested profiled handlers run unprofiled inside the outermost one.
+    """
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        options = None if _active else profile_options(event)
+        if options is None:
+            return handler(event, context)
+        return run_profiled(handler, event, context, options)
+    
+    return wrapper
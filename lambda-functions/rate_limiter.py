@@ -0,0 +1,194 @@
+import json
+import os
+import threading
+import time
+import weakref
+
+# Documented steady-state rate and burst (requests/second, bucket size) per service and
+# operation. "read"/"write" cover the remaining Describe/List/Get vs mutating calls of a
+# service and "*" everything else; ('*', '*') is the fallback for undocumented APIs.
+DEFAULT_LIMITS = {
+    # EC2 API request throttling: non-mutating 20/s refill with a 100 bucket, mutating 5/s with 200
+    ('ec2', 'read'): (20, 100),
+    ('ec2', 'write'): (5, 200),
+    # CloudWatch service quotas
+    ('cloudwatch', 'GetMetricStatistics'): (400, 400),
+    ('cloudwatch', 'GetMetricData'): (50, 50),
+    ('cloudwatch', 'ListMetrics'): (25, 25),
+    ('cloudwatch', 'PutMetricData'): (500, 500),
+    ('cloudwatch', 'DescribeAlarms'): (9, 9),
+    # Cost Explorer and Pricing are low-rate APIs; stay well under them
+    ('ce', '*'): (5, 5),
+    ('pricing', '*'): (10, 10),
+    ('sts', '*'): (100, 100),
+    ('s3', 'read'): (500, 500),
+    ('s3', 'write'): (300, 300),
+    ('*', '*'): (10, 20)
+}
+
+READ_PREFIXES = ('Describe', 'List', 'Get', 'Head', 'Search', 'Lookup')
+
+THROTTLE_CODES = {
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottled',
+    'RequestThrottledException', 'TooManyRequestsException', 'RequestLimitExceeded',
+    'SlowDown', 'ProvisionedThroughputExceededException', 'BandwidthLimitExceeded'
+}
+
+# Multiplicative decrease on throttling, at most once per window so a burst of throttled
+# responses from concurrent workers counts as one congestion signal
+DECREASE_FACTOR = float(os.environ.get('RATE_LIMIT_DECREASE_FACTOR', '0.5'))
+DECREASE_WINDOW_SECONDS = float(os.environ.get('RATE_LIMIT_DECREASE_WINDOW_SECONDS', '1.0'))
+# Additive increase: regain this fraction of the documented rate per second of clean calls
+INCREASE_FRACTION = float(os.environ.get('RATE_LIMIT_INCREASE_FRACTION', '0.05'))
+MIN_RATE = float(os.environ.get('RATE_LIMIT_MIN_RATE', '0.5'))
+
+_lock = threading.Lock()
+_buckets = {}
+_installed = weakref.WeakSet()
+
+def configured_limits():
+    """DEFAULT_LIMITS plus RATE_LIMITS overrides, e.g. '{"ec2.DescribeInstances": [10, 50]}'"""
+    limits = dict(DEFAULT_LIMITS)
+    
+    try:
+        overrides = json.loads(os.environ.get('RATE_LIMITS', '{}'))
+    except ValueError as e:
+        print(f"Ignoring invalid RATE_LIMITS: {str(e)}")
+        overrides = {}
+    
+    for key, (rate, burst) in overrides.items():
+        service, _, operation = key.partition('.')
+        limits[(service, operation or '*')] = (float(rate), float(burst))
+    return limits
+
+LIMITS = configured_limits()
+
+def limit_for(service, operation):
+    category = 'read' if operation.startswith(READ_PREFIXES) else 'write'
+    
+    for key in [(service, operation), (service, category), (service, '*'), ('*', '*')]:
+        if key in LIMITS:
+            return LIMITS[key]
+
+class AdaptiveBucket:
+    """Token bucket whose refill rate follows AIMD between MIN_RATE and the documented ceiling"""
+    
+    def __init__(self, rate, burst):
+        self.ceiling = float(rate)
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.last_decrease = 0.0
+        self.calls = 0
+        self.throttles = 0
+        self.waited = 0.0
+        self._lock = threading.Lock()
+    
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def acquire(self):
+        """Block until a token is available; returns the seconds spent waiting"""
+        waited = 0.0
+        
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.calls += 1
+                    self.waited += waited
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            
+            # Sleep outside the lock so other workers can refill and take their own turn
+            time.sleep(wait)
+            waited += wait
+    
+    def on_success(self):
+        # Adding increase/rate per call grows the rate by `increase` per second at any rate
+        with self._lock:
+            if self.rate < self.ceiling:
+                increase = max(self.ceiling * INCREASE_FRACTION, 0.1)
+                self.rate = min(self.ceiling, self.rate + increase / self.rate)
+    
+    def on_throttle(self):
+        with self._lock:
+            self.throttles += 1
+            now = time.monotonic()
+            if now - self.last_decrease < DECREASE_WINDOW_SECONDS:
+                return
+            
+            self._refill(now)
+            self.rate = max(MIN_RATE, self.rate * DECREASE_FACTOR)
+            # Drop the banked burst too, otherwise queued workers keep hammering the API
+            self.tokens = min(self.tokens, 0.0)
+            self.last_decrease = now
+
+def bucket_for(service, operation, region):
+    key = (service, operation, region)
+    bucket = _buckets.get(key)
+    if bucket is None:
+        with _lock:
+            bucket = _buckets.get(key)
+            if bucket is None:
+                bucket = _buckets[key] = AdaptiveBucket(*limit_for(service, operation))
+    return bucket
+
+def on_before_call(model, context, request_signer=None, **kwargs):
+    region = getattr(request_signer, 'region_name', None) or 'global'
+    bucket = bucket_for(model.service_model.service_name, model.name, region)
+    context['rate_limit_bucket'] = bucket
+    bucket.acquire()
+
+def on_needs_retry(response, request_dict, **kwargs):
+    # Fires per attempt: a throttled attempt shrinks the rate and the retry waits for a token,
+    # so botocore's retries are paced by the shared limiter instead of storming the API
+    bucket = request_dict.get('context', {}).get('rate_limit_bucket')
+    if bucket is None or not response:
+        return None
+    
+    error_code = response[1].get('Error', {}).get('Code')
+    if error_code in THROTTLE_CODES:
+        bucket.on_throttle()
+        bucket.acquire()
+    elif response[0].status_code < 300:
+        bucket.on_success()
+    return None
+
+def install(session):
+    """Rate-limit every client created from this boto3 session through the shared buckets
+    
+    Meant for sessions whose clients are used from worker threads; the limiter is shared
+    by all installed sessions in the process.
+    """
+    if session in _installed:
+        return session
+    
+    # Registered first so the wait is not counted as API latency by the instrumentation hooks
+    session.events.register_first('before-call', on_before_call)
+    session.events.register_first('needs-retry', on_needs_retry)
+    _installed.add(session)
+    return session
+
+def stats():
+    """Current rate, plus calls, throttles and waiting since the container started, per bucket"""
+    with _lock:
+        buckets = dict(_buckets)
+    
+    return {
+        f"{service}.{operation}@{region}": {
+            'calls': bucket.calls,
+            'throttles': bucket.throttles,
+            'rate': round(bucket.rate, 2),
+            'ceiling': bucket.ceiling,
+            'waited_seconds': round(bucket.waited, 3)
+        }
+        for (service, operation, region), bucket in sorted(buckets.items())
+    }
+
+def reset():
+    with _lock:
+        _buckets.clear()
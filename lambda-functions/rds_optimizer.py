@@ -1,21 +1,65 @@
 import boto3
 import json
 from datetime import datetime, timedelta
+from resource_events import parse_resource_event
+from shard_executor import plan_response, shard_items
+from api_instrumentation import instrumented
+from profiling import profiled
+from result_sink import collection, open_sink
 
+@profiled
+@instrumented
 def lambda_handler(event, context):
-    rds = boto3.client('rds')
-    cloudwatch = boto3.client('cloudwatch')
+    resource_event = parse_resource_event(event)
+    region = resource_event['region'] if resource_event else None
     
+    rds = boto3.client('rds', region_name=region)
+    cloudwatch = boto3.client('cloudwatch', region_name=region)
+    
+    assigned = shard_items(event)
+    
+    if resource_event:
+        # Event mode: evaluate only the database from the ModifyDBInstance call. The filter
+        # drops a database renamed or deleted since the call instead of raising DBInstanceNotFound.
+        db_instances = describe_db_instances_by_id(rds, resource_event['resource_ids'])
+    elif assigned is not None:
+        # Fan-out worker: only the databases planned into this shard
+        db_instances = describe_db_instances_by_id(rds, assigned)
+    else:
+        # Get all RDS instances, every page of them, so plans cover the whole fleet
+        db_instances = {'DBInstances': [
+            db
+            for page in rds.get_paginator('describe_db_instances').paginate()
+            for db in page['DBInstances']
+        ]}
+    
+    if event.get('mode') == 'plan':
+        # Two CloudWatch queries (CPU, connections) per database
+        db_ids = [db['DBInstanceIdentifier'] for db in db_instances['DBInstances']]
+        return plan_response(db_ids, [2] * len(db_ids), event)
+    
+    sink = open_sink('rds_optimizer', event, context, rds.meta.region_name)
+    results = analyze_db_instances(db_instances['DBInstances'], cloudwatch, sink)
+    
+    if resource_event:
+        results['event'] = resource_event
+    if assigned is not None:
+        results['shard'] = {'shard_index': event['shard']['shard_index'], 'items': len(assigned)}
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps(sink.finish(results) if sink else results)
+    }
+
+def analyze_db_instances(db_instances, cloudwatch, sink=None):
+    """Flag idle and oversized databases from 7-day CPU and connection averages"""
     results = {
-        'idle_databases': [],
-        'oversized_databases': [],
+        'idle_databases': collection(sink, 'idle_databases'),
+        'oversized_databases': collection(sink, 'oversized_databases'),
         'potential_savings': 0
     }
     
-    # Get all RDS instances
-    db_instances = rds.describe_db_instances()
-    
-    for db in db_instances['DBInstances']:
+    for db in db_instances:
         db_id = db['DBInstanceIdentifier']
         db_class = db['DBInstanceClass']
         
@@ -75,10 +119,16 @@ def lambda_handler(event, context):
                     })
                     results['potential_savings'] += monthly_savings
     
-    return {
-        'statusCode': 200,
-        'body': json.dumps(results)
-    }
+    return results
+
+def describe_db_instances_by_id(rds, db_ids):
+    db_instances = []
+    for start in range(0, len(db_ids), 100):
+        response = rds.describe_db_instances(
+            Filters=[{'Name': 'db-instance-id', 'Values': db_ids[start:start + 100]}]
+        )
+        db_instances.extend(response['DBInstances'])
+    return {'DBInstances': db_instances}
 
 def get_rds_cost(db_class):
     # Simplified RDS pricing (USD per hour)
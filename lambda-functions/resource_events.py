@@ -0,0 +1,77 @@
+import importlib
+import json
+
+# CloudTrail API calls handled in event mode, mapped to the handler that owns the rule.
+# CreateSecurityGroup and CreateBucket are not routed: a new group is always unattached
+# and a new bucket is always empty, so their rules can only be judged by the scheduled scan.
+EVENT_ROUTES = {
+    'RunInstances': 'spot_optimizer',
+    'CreateVolume': 'cost_optimizer',
+    'ModifyDBInstance': 'rds_optimizer'
+}
+
+def extract_resource_ids(event_name, detail):
+    request = detail.get('requestParameters') or {}
+    response = detail.get('responseElements') or {}
+    
+    if event_name == 'RunInstances':
+        return [item['instanceId'] for item in response.get('instancesSet', {}).get('items', [])]
+    if event_name == 'CreateVolume':
+        return [response['volumeId']] if 'volumeId' in response else []
+    if event_name == 'ModifyDBInstance':
+        db_id = response.get('dBInstanceIdentifier') or request.get('dBInstanceIdentifier')
+        return [db_id] if db_id else []
+    return []
+
+def parse_resource_event(event):
+    """Return the API call and resource IDs of an EventBridge/CloudTrail event, or None for scheduled runs
+    
+    Accepts the EventBridge envelope ("AWS API Call via CloudTrail") as well as a
+    bare CloudTrail record. Failed calls (errorCode set) carry no resource.
+    """
+    if not isinstance(event, dict):
+        return None
+    
+    if event.get('detail-type') == 'AWS API Call via CloudTrail':
+        detail = event.get('detail') or {}
+    elif 'eventName' in event and 'eventSource' in event:
+        detail = event
+    else:
+        return None
+    
+    event_name = detail.get('eventName')
+    if event_name not in EVENT_ROUTES or detail.get('errorCode'):
+        return None
+    
+    return {
+        'event_name': event_name,
+        'resource_ids': extract_resource_ids(event_name, detail),
+        'region': detail.get('awsRegion') or event.get('region'),
+        'account_id': (detail.get('userIdentity') or {}).get('accountId') or event.get('account')
+    }
+
+def load_event_replay(path):
+    """Read events from a JSON array or NDJSON file (one event per line)"""
+    with open(path) as f:
+        content = f.read().strip()
+    
+    if not content:
+        return []
+    if content.startswith('['):
+        return json.loads(content)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+def replay_events(path, context=None):
+    """Feed recorded events through their owning handlers, as EventBridge would"""
+    responses = []
+    
+    for event in load_event_replay(path):
+        resource_event = parse_resource_event(event)
+        if resource_event is None:
+            print(f"Skipping unrouted event: {event.get('detail', event).get('eventName')}")
+            continue
+        
+        handler = importlib.import_module(EVENT_ROUTES[resource_event['event_name']]).lambda_handler
+        responses.append(handler(event, context))
+    
+    return responses
@@ -0,0 +1,144 @@
+import boto3
+import gzip
+import io
+import json
+import os
+from datetime import datetime
+
+RESULTS_LOCATION = os.environ.get('RESULTS_LOCATION')
+# Compressed bytes per part; a part is buffered in memory until it is flushed
+PART_BYTES = int(os.environ.get('RESULTS_PART_BYTES', str(8 * 1024 * 1024)))
+
+class StreamedList:
+    """Stands in for a results list: appended findings go to the sink, only the count stays"""
+    
+    def __init__(self, sink, kind):
+        self.sink = sink
+        self.kind = kind
+        self.count = 0
+    
+    def append(self, item):
+        self.sink.write(self.kind, item)
+        self.count += 1
+    
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+    
+    def __len__(self):
+        return self.count
+
+class ResultSink:
+    """Writes findings as gzip NDJSON parts under <location>/<handler>/<region>/<date>/<run_id>/
+    
+    Each part is a complete gzip file of {"kind": ..., "record": ...} lines, so parts can be
+    read independently and in parallel. A summary.json beside them holds the response body.
+    """
+    
+    def __init__(self, handler, location, region=None, account_id=None, run_id=None, part_bytes=PART_BYTES):
+        self.handler = handler
+        self.location = location
+        self.region = region or 'global'
+        self.account_id = account_id
+        self.timestamp = datetime.utcnow()
+        self.run_id = run_id or self.timestamp.strftime('%Y%m%dT%H%M%S%f')
+        self.part_bytes = part_bytes
+        self.prefix = f"{handler}/{self.region}/{self.timestamp.strftime('%Y-%m-%d')}/{self.run_id}"
+        self.parts = []
+        self.records = 0
+        self.collections = {}
+        self._buffer = None
+        self._gzip = None
+    
+    def collection(self, kind):
+        if kind not in self.collections:
+            self.collections[kind] = StreamedList(self, kind)
+        return self.collections[kind]
+    
+    def write(self, kind, record):
+        if self._gzip is None:
+            self._buffer = io.BytesIO()
+            self._gzip = gzip.GzipFile(fileobj=self._buffer, mode='wb')
+        
+        self._gzip.write(json.dumps({'kind': kind, 'record': record}, default=str).encode())
+        self._gzip.write(b'\n')
+        self.records += 1
+        
+        # The buffer only sees what gzip has flushed so far, so parts overshoot by at most its window
+        if self._buffer.tell() >= self.part_bytes:
+            self.flush()
+    
+    def flush(self):
+        if self._gzip is None:
+            return
+        
+        self._gzip.close()
+        data = self._buffer.getvalue()
+        self._gzip = None
+        self._buffer = None
+        self.parts.append(self._put(f"part-{len(self.parts):05d}.ndjson.gz", data))
+    
+    def _put(self, name, data):
+        key = f"{self.prefix}/{name}"
+        
+        if self.location.startswith('s3://'):
+            bucket, _, prefix = self.location[5:].partition('/')
+            object_key = f"{prefix.rstrip('/')}/{key}" if prefix else key
+            boto3.client('s3').put_object(Bucket=bucket, Key=object_key, Body=data)
+            return f"s3://{bucket}/{object_key}"
+        
+        path = os.path.join(self.location, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+    
+    def finish(self, results):
+        """Flush the last part and return the response body: counts in place of streamed lists"""
+        self.flush()
+        
+        summary = {
+            key: len(value) if isinstance(value, StreamedList) else value
+            for key, value in results.items()
+        }
+        summary['results'] = {
+            'records': self.records,
+            'counts': {kind: len(collection) for kind, collection in self.collections.items()},
+            'parts': self.parts
+        }
+        
+        # Envelope matches what scripts/calculate-savings.py ingests
+        envelope = {
+            'handler': self.handler,
+            'account_id': self.account_id,
+            'region': self.region,
+            'timestamp': self.timestamp.isoformat(),
+            'result': summary
+        }
+        summary['results']['summary'] = self._put('summary.json', json.dumps(envelope, default=str).encode())
+        return summary
+
+def collection(sink, kind):
+    """A streamed list for `kind` when results go to a sink, otherwise a plain list"""
+    return sink.collection(kind) if sink is not None else []
+
+def open_sink(handler, event, context, region=None, account_id=None):
+    """A sink when the event's 'results_location' or RESULTS_LOCATION is set, else None"""
+    event = event if isinstance(event, dict) else {}
+    location = event.get('results_location', RESULTS_LOCATION)
+    if not location:
+        return None
+    
+    # Without a known account, take it from the function ARN rather than spend an STS call
+    arn = getattr(context, 'invoked_function_arn', '') or ''
+    if account_id is None and arn.count(':') >= 5:
+        account_id = arn.split(':')[4]
+    request_id = getattr(context, 'aws_request_id', None)
+    run_id = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+    if request_id:
+        run_id = f"{run_id}-{request_id}"
+    # Fan-out workers write side by side; the shard index keeps their parts apart and ordered
+    if event.get('shard'):
+        run_id = f"{run_id}-shard-{event['shard']['shard_index']:04d}"
+    
+    return ResultSink(handler, location, region or boto3.session.Session().region_name, account_id, run_id)
@@ -1,7 +1,19 @@
 import boto3
+import csv
 import json
+import os
+import numpy as np
 from datetime import datetime, timedelta
+import cur_reader
+from api_instrumentation import instrumented
+from profiling import profiled
 
+# Default discount of a 1-year no-upfront Compute Savings Plan vs On-Demand
+DEFAULT_COMMITMENT_DISCOUNT = float(os.environ.get('COMMITMENT_DISCOUNT', '0.28'))
+DEFAULT_COMMITMENT_LEVELS = 500
+
+@profiled
+@instrumented
 def lambda_handler(event, context):
     ce = boto3.client('ce')  # Cost Explorer
     ec2 = boto3.client('ec2')
@@ -76,7 +88,151 @@ def lambda_handler(event, context):
         'covered_cost': f"${float(total_coverage['CoveredHours']['CoveredHoursCost']):.2f}"
     }
     
+    # Size new commitment purchases against hourly On-Demand usage
+    try:
+        cur_location = event.get('cur_location', cur_reader.CUR_LOCATION)
+        if event.get('usage_csv'):
+            hourly_usage = load_hourly_usage_csv(event['usage_csv'])
+        elif cur_location:
+            hourly_usage = get_hourly_on_demand_usage_cur(cur_location, int(event.get('usage_days', 30)))
+        else:
+            hourly_usage = get_hourly_on_demand_usage(ce)
+        
+        results['commitment_recommendation'] = optimize_commitment(
+            hourly_usage,
+            discount_rate=float(event.get('commitment_discount', DEFAULT_COMMITMENT_DISCOUNT)),
+            n_levels=int(event.get('commitment_levels', DEFAULT_COMMITMENT_LEVELS))
+        )
+    except Exception as e:
+        print(f"Commitment analysis error: {str(e)}")
+    
     return {
         'statusCode': 200,
         'body': json.dumps(results, default=str)
     }
+
+def get_hourly_on_demand_usage(ce, days=14):
+    """Hourly On-Demand EC2 compute spend from Cost Explorer (max 14 days at HOURLY)"""
+    end = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    start = end - timedelta(days=days)
+    
+    request = {
+        'TimePeriod': {
+            'Start': start.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'End': end.strftime('%Y-%m-%dT%H:%M:%SZ')
+        },
+        'Granularity': 'HOURLY',
+        'Metrics': ['UnblendedCost'],
+        'Filter': {
+            'And': [
+                {'Dimensions': {'Key': 'SERVICE', 'Values': ['Amazon Elastic Compute Cloud - Compute']}},
+                {'Dimensions': {'Key': 'PURCHASE_TYPE', 'Values': ['On Demand Instances']}}
+            ]
+        }
+    }
+    
+    hourly_costs = []
+    while True:
+        response = ce.get_cost_and_usage(**request)
+        for result in response['ResultsByTime']:
+            hourly_costs.append(float(result['Total']['UnblendedCost']['Amount']))
+        
+        if not response.get('NextPageToken'):
+            break
+        request['NextPageToken'] = response['NextPageToken']
+    
+    return np.array(hourly_costs, dtype=np.float64)
+
+def get_hourly_on_demand_usage_cur(location, days=30):
+    """Hourly On-Demand EC2 compute spend from the Cost and Usage Report, not limited to 14 days"""
+    end = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    start = end - timedelta(days=days)
+    
+    reader = cur_reader.CurReader(location, start, end, columns=('usage_type', 'product', 'line_item_type'))
+    hourly_costs = cur_reader.cost_series(reader, start, end, where=cur_reader.ON_DEMAND_EC2)
+    print(f"Read CUR for commitment sizing: {json.dumps(reader.stats)}")
+    # The report trails real time by up to a day; unbilled hours are not zero usage
+    return np.trim_zeros(hourly_costs, 'b')
+
+def load_hourly_usage_csv(path):
+    """Load an hourly usage matrix from CSV: timestamp column followed by one or more cost columns"""
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        next(reader)  # Header row
+        rows = [[float(value or 0) for value in row[1:]] for row in reader if row]
+    
+    return np.array(rows, dtype=np.float64)
+
+def evaluate_commitment_levels(hourly_usage, levels, discount_rate):
+    """Evaluate every candidate hourly commitment against the usage series at once
+    
+    A commitment of `c` $/hour buys `c / (1 - discount_rate)` $/hour of
+    On-Demand-equivalent usage. Hours above that are billed On-Demand;
+    hours below it waste the unused part of the commitment.
+    """
+    usage = np.asarray(hourly_usage, dtype=np.float64)
+    if usage.ndim == 2:
+        usage = usage.sum(axis=1)  # Flexible commitments apply across all columns
+    levels = np.asarray(levels, dtype=np.float64)
+    hours = usage.size
+    
+    # covered(cap) = sum(min(usage, cap)) from the sorted prefix sums, O((H + L) log H)
+    sorted_usage = np.sort(usage)
+    prefix = np.concatenate(([0.0], np.cumsum(sorted_usage)))
+    capacity = levels / (1 - discount_rate)
+    below = np.searchsorted(sorted_usage, capacity, side='left')
+    covered_cost = prefix[below] + capacity * (hours - below)
+    
+    commitment_cost = levels * hours
+    wasted_commitment = commitment_cost - covered_cost * (1 - discount_rate)
+    net_savings = covered_cost - commitment_cost
+    
+    return {
+        'levels': levels,
+        'covered_cost': covered_cost,
+        'commitment_cost': commitment_cost,
+        'wasted_commitment': wasted_commitment,
+        'net_savings': net_savings
+    }
+
+def optimize_commitment(hourly_usage, discount_rate=DEFAULT_COMMITMENT_DISCOUNT, n_levels=DEFAULT_COMMITMENT_LEVELS):
+    """Find the hourly commitment with the highest net savings and return the savings curve"""
+    usage = np.asarray(hourly_usage, dtype=np.float64)
+    if usage.ndim == 2:
+        usage = usage.sum(axis=1)
+    if usage.size == 0:
+        return {'error': 'no_usage_data'}
+    
+    # No commitment above the discounted peak can ever pay off
+    levels = np.linspace(0, usage.max() * (1 - discount_rate), n_levels)
+    curve = evaluate_commitment_levels(usage, levels, discount_rate)
+    
+    best = int(np.argmax(curve['net_savings']))
+    hours = usage.size
+    on_demand_cost = float(usage.sum())
+    optimal_commitment = float(levels[best])
+    net_savings = float(curve['net_savings'][best])
+    
+    return {
+        'hours_analyzed': hours,
+        'discount_rate': discount_rate,
+        'on_demand_cost': round(on_demand_cost, 2),
+        'optimal_hourly_commitment': round(optimal_commitment, 4),
+        'coverage_percentage': round(float(curve['covered_cost'][best]) / on_demand_cost * 100, 1) if on_demand_cost > 0 else 0,
+        'utilization_percentage': round((1 - float(curve['wasted_commitment'][best]) / float(curve['commitment_cost'][best])) * 100, 1) if optimal_commitment > 0 else 0,
+        'net_savings': round(net_savings, 2),
+        'monthly_savings': round(net_savings / hours * 24 * 30, 2),
+        'annual_savings': round(net_savings / hours * 24 * 365, 2),
+        'savings_curve': [
+            {
+                'hourly_commitment': round(float(level), 4),
+                'covered_cost': round(float(covered), 2),
+                'wasted_commitment': round(float(wasted), 2),
+                'net_savings': round(float(net), 2)
+            }
+            for level, covered, wasted, net in zip(
+                curve['levels'], curve['covered_cost'],
+                curve['wasted_commitment'], curve['net_savings']
+            )
+        ]
+    }
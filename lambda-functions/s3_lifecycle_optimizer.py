@@ -1,7 +1,13 @@
 import boto3
 import json
 from datetime import datetime, timedelta
+import checkpoint
+from shard_executor import plan_response, shard_items
+from api_instrumentation import instrumented
+from profiling import profiled
 
+@profiled
+@instrumented
 def lambda_handler(event, context):
     s3 = boto3.client('s3')
     
@@ -11,77 +17,183 @@ def lambda_handler(event, context):
         'estimated_savings': 0
     }
     
+    assigned = shard_items(event)
+    if assigned is not None:
+        # Fan-out worker: only the buckets planned into this shard
+        for bucket_name in assigned:
+            evaluate_bucket(s3, bucket_name, results)
+        
+        results['shard'] = {'shard_index': event['shard']['shard_index'], 'items': len(assigned)}
+        return {
+            'statusCode': 200,
+            'body': json.dumps(results)
+        }
+    
     # Get all S3 buckets
     buckets = s3.list_buckets()
     
+    if event.get('mode') == 'plan':
+        bucket_names = [bucket['Name'] for bucket in buckets['Buckets']]
+        weights = estimate_bucket_weights(boto3.client('cloudwatch'), bucket_names)
+        return plan_response(bucket_names, weights, event)
+    
+    # Resume where the last invocation stopped; finished buckets are skipped
+    checkpoint_location = event.get('checkpoint_location', checkpoint.CHECKPOINT_LOCATION)
+    progress = checkpoint.load_checkpoint('s3_lifecycle_optimizer', checkpoint_location)
+    results.update(progress['totals'])
+    progress['totals'] = results
+    completed = set(progress['completed'])
+    
     for bucket in buckets['Buckets']:
-        bucket_name = bucket['Name']
+        if bucket['Name'] in completed:
+            continue
+        if checkpoint.deadline_near(context) or not evaluate_bucket(s3, bucket['Name'], results, progress, context):
+            break
+        
+        progress['completed'].append(bucket['Name'])
+        progress['cursor'] = {}
+    else:
+        progress['complete'] = True
+    
+    results['checkpoint'] = checkpoint.finish_checkpoint(
+        's3_lifecycle_optimizer', progress, checkpoint_location, context, event
+    )
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps(results)
+    }
+
+def estimate_bucket_weights(cloudwatch, bucket_names):
+    """Scan cost per bucket in ListObjectsV2 pages (1,000 objects each), from the daily NumberOfObjects metric"""
+    object_counts = {}
+    
+    # GetMetricData takes up to 500 queries per request
+    for start in range(0, len(bucket_names), 500):
+        batch = bucket_names[start:start + 500]
+        queries = [
+            {
+                'Id': f"b{index}",
+                'MetricStat': {
+                    'Metric': {
+                        'Namespace': 'AWS/S3',
+                        'MetricName': 'NumberOfObjects',
+                        'Dimensions': [
+                            {'Name': 'BucketName', 'Value': bucket_name},
+                            {'Name': 'StorageType', 'Value': 'AllStorageTypes'}
+                        ]
+                    },
+                    'Period': 86400,
+                    'Stat': 'Average'
+                }
+            }
+            for index, bucket_name in enumerate(batch)
+        ]
         
         try:
-            # Check if lifecycle policy exists
-            try:
-                s3.get_bucket_lifecycle_configuration(Bucket=bucket_name)
-                continue  # Policy already exists
-            except s3.exceptions.ClientError:
-                pass  # No policy exists, create one
+            paginator = cloudwatch.get_paginator('get_metric_data')
+            for page in paginator.paginate(
+                MetricDataQueries=queries,
+                StartTime=datetime.utcnow() - timedelta(days=3),
+                EndTime=datetime.utcnow()
+            ):
+                for result in page['MetricDataResults']:
+                    if result['Values']:
+                        object_counts[batch[int(result['Id'][1:])]] = result['Values'][0]
+        except Exception as e:
+            print(f"Error estimating bucket sizes: {str(e)}")
+    
+    return [1 + int(object_counts.get(bucket_name, 0) // 1000) for bucket_name in bucket_names]
+
+def evaluate_bucket(s3, bucket_name, results, progress=None, context=None):
+    """Create a tiering lifecycle policy for a bucket holding aged data without one
+    
+    Returns False when the deadline stopped the object scan part-way; the listing
+    position and partial counts are then left in progress['cursor'].
+    """
+    try:
+        # Check if lifecycle policy exists
+        try:
+            s3.get_bucket_lifecycle_configuration(Bucket=bucket_name)
+            return True  # Policy already exists
+        except s3.exceptions.ClientError:
+            pass  # No policy exists, create one
+        
+        # Get bucket size and analyze objects, continuing a checkpointed listing if there is one
+        cursor = progress['cursor'] if progress and progress['cursor'].get('bucket') == bucket_name else {}
+        total_size = cursor.get('total_size', 0)
+        old_objects = cursor.get('old_objects', 0)
+        continuation_token = cursor.get('continuation_token')
+        
+        while True:
+            kwargs = {'Bucket': bucket_name}
+            if continuation_token:
+                kwargs['ContinuationToken'] = continuation_token
+            page = s3.list_objects_v2(**kwargs)
             
-            # Get bucket size and analyze objects
-            total_size = 0
-            old_objects = 0
+            if 'Contents' in page:
+                for obj in page['Contents']:
+                    total_size += obj['Size']
+                    # Check if object is older than 30 days
+                    if obj['LastModified'] < datetime.now(obj['LastModified'].tzinfo) - timedelta(days=30):
+                        old_objects += 1
             
-            paginator = s3.get_paginator('list_objects_v2')
-            for page in paginator.paginate(Bucket=bucket_name):
-                if 'Contents' in page:
-                    for obj in page['Contents']:
-                        total_size += obj['Size']
-                        # Check if object is older than 30 days
-                        if obj['LastModified'] < datetime.now(obj['LastModified'].tzinfo) - timedelta(days=30):
-                            old_objects += 1
+            if not page.get('IsTruncated'):
+                break
+            continuation_token = page['NextContinuationToken']
             
-            # Create lifecycle policy if bucket has old objects
-            if old_objects > 0 and total_size > 1024*1024*100:  # > 100MB
-                lifecycle_policy = {
-                    'Rules': [
-                        {
-                            'ID': 'CostOptimizationRule',
-                            'Status': 'Enabled',
-                            'Transitions': [
-                                {
-                                    'Days': 30,
-                                    'StorageClass': 'STANDARD_IA'
-                                },
-                                {
-                                    'Days': 90,
-                                    'StorageClass': 'GLACIER'
-                                },
-                                {
-                                    'Days': 365,
-                                    'StorageClass': 'DEEP_ARCHIVE'
-                                }
-                            ]
-                        }
-                    ]
+            if progress is not None and checkpoint.deadline_near(context):
+                progress['cursor'] = {
+                    'bucket': bucket_name,
+                    'continuation_token': continuation_token,
+                    'total_size': total_size,
+                    'old_objects': old_objects
                 }
-                
-                s3.put_bucket_lifecycle_configuration(
-                    Bucket=bucket_name,
-                    LifecycleConfiguration=lifecycle_policy
-                )
-                
-                # Calculate estimated savings
-                gb_size = total_size / (1024**3)
-                monthly_savings = gb_size * 0.015  # Estimated 60% savings on old data
-                
-                results['buckets_optimized'] += 1
-                results['lifecycle_policies_created'] += 1
-                results['estimated_savings'] += monthly_savings
-                
-                print(f"Created lifecycle policy for {bucket_name}: ${monthly_savings:.2f}/month savings")
-                
-        except Exception as e:
-            print(f"Error processing bucket {bucket_name}: {str(e)}")
+                return False
+        
+        # Create lifecycle policy if bucket has old objects
+        if old_objects > 0 and total_size > 1024*1024*100:  # > 100MB
+            lifecycle_policy = {
+                'Rules': [
+                    {
+                        'ID': 'CostOptimizationRule',
+                        'Status': 'Enabled',
+                        # S3 rejects a rule without a filter as malformed; an empty prefix is the whole bucket
+                        'Filter': {'Prefix': ''},
+                        'Transitions': [
+                            {
+                                'Days': 30,
+                                'StorageClass': 'STANDARD_IA'
+                            },
+                            {
+                                'Days': 90,
+                                'StorageClass': 'GLACIER'
+                            },
+                            {
+                                'Days': 365,
+                                'StorageClass': 'DEEP_ARCHIVE'
+                            }
+                        ]
+                    }
+                ]
+            }
+            
+            s3.put_bucket_lifecycle_configuration(
+                Bucket=bucket_name,
+                LifecycleConfiguration=lifecycle_policy
+            )
+            
+            # Calculate estimated savings
+            gb_size = total_size / (1024**3)
+            monthly_savings = gb_size * 0.015  # Estimated 60% savings on old data
+            
+            results['buckets_optimized'] += 1
+            results['lifecycle_policies_created'] += 1
+            results['estimated_savings'] += monthly_savings
+            
+            print(f"Created lifecycle policy for {bucket_name}: ${monthly_savings:.2f}/month savings")
+            
+    except Exception as e:
+        print(f"Error processing bucket {bucket_name}: {str(e)}")
     
-    return {
-        'statusCode': 200,
-        'body': json.dumps(results)
-    }
+    return True
@@ -0,0 +1,155 @@
+import heapq
+import importlib
+import json
+import os
+from functools import reduce
+from multiprocessing import Pool
+
+from api_instrumentation import merge_summaries
+
+DEFAULT_SHARD_COUNT = int(os.environ.get('SHARD_COUNT', '10'))
+
+def lambda_handler(event, context):
+    """Fan-in aggregator: merge the partial results of every shard into one report
+    
+    Accepts the Step Functions Map output directly (a list of handler responses)
+    or {'results': [...]}.
+    """
+    partials = event if isinstance(event, list) else event.get('results', [])
+    merged = merge_results([response_body(partial) for partial in partials])
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps(merged)
+    }
+
+def plan_shards(items, shard_count, weights=None):
+    """Split items into balanced shards by estimated cost per item
+    
+    Greedy longest-processing-time: heaviest items first, each onto the
+    currently lightest shard. Within 4/3 of the optimal makespan.
+    """
+    weights = weights or [1] * len(items)
+    shard_count = max(1, min(shard_count, len(items)))
+    
+    shards = [{'shard_index': index, 'items': [], 'weight': 0} for index in range(shard_count)]
+    loads = [(0, index) for index in range(shard_count)]
+    
+    for weight, item in sorted(zip(weights, items), key=lambda pair: pair[0], reverse=True):
+        load, index = heapq.heappop(loads)
+        shards[index]['items'].append(item)
+        shards[index]['weight'] += weight
+        heapq.heappush(loads, (load + weight, index))
+    
+    return [shard for shard in shards if shard['items']]
+
+def shard_items(event):
+    """Items assigned to this invocation when running as a fan-out worker, else None"""
+    shard = event.get('shard') if isinstance(event, dict) else None
+    return shard['items'] if shard else None
+
+def plan_response(items, weights, event):
+    shard_count = int(event.get('shard_count', DEFAULT_SHARD_COUNT))
+    shards = plan_shards(items, shard_count, weights)
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'shard_count': len(shards),
+            'total_weight': sum(weights),
+            'shards': shards
+        })
+    }
+
+def merge_two(left, right):
+    """Associative reducer for handler results: add numbers, concatenate lists, merge dicts"""
+    merged = dict(left)
+    
+    for key, value in right.items():
+        if key not in merged:
+            merged[key] = value
+        elif isinstance(value, bool) or isinstance(merged[key], bool):
+            merged[key] = merged[key] or value
+        elif isinstance(value, (int, float)) and isinstance(merged[key], (int, float)):
+            merged[key] = merged[key] + value
+        elif isinstance(value, list) and isinstance(merged[key], list):
+            merged[key] = merged[key] + value
+        elif isinstance(value, dict) and isinstance(merged[key], dict):
+            merged[key] = merge_two(merged[key], value)
+    
+    return merged
+
+def merge_results(partials):
+    # Shard metadata is per worker and API call summaries merge by histogram; everything else reduces
+    partials = sorted(partials, key=lambda partial: partial.get('shard', {}).get('shard_index', 0))
+    merged = reduce(merge_two, ({k: v for k, v in p.items() if k not in ('shard', 'api_calls')} for p in partials), {})
+    
+    api_summaries = [partial['api_calls'] for partial in partials if 'api_calls' in partial]
+    if api_summaries:
+        merged['api_calls'] = merge_summaries(api_summaries)
+    
+    merged['shards_merged'] = len(partials)
+    return merged
+
+def response_body(response):
+    body = response.get('body', response) if isinstance(response, dict) else response
+    return json.loads(body) if isinstance(body, str) else body
+
+def invoke_shard(args):
+    module_name, shard = args
+    handler = importlib.import_module(module_name).lambda_handler
+    return response_body(handler({'shard': shard}, None))
+
+def run_local(module_name, shard_count=DEFAULT_SHARD_COUNT, processes=None):
+    """Local stand-in for the Step Functions Map fan-out: plan, run shards in a process pool, merge"""
+    handler = importlib.import_module(module_name).lambda_handler
+    plan = response_body(handler({'mode': 'plan', 'shard_count': shard_count}, None))
+    
+    with Pool(processes=processes or len(plan['shards']) or 1) as pool:
+        partials = pool.map(invoke_shard, [(module_name, shard) for shard in plan['shards']])
+    
+    return merge_results(partials)
+
+def build_state_machine_definition(worker_arn, aggregator_arn, max_concurrency=40):
+    """Amazon States Language for plan -> Map(worker) -> aggregate over one optimizer function"""
+    return {
+        'Comment': 'Sharded fan-out scan with fan-in aggregation',
+        'StartAt': 'Plan',
+        'States': {
+            'Plan': {
+                'Type': 'Task',
+                'Resource': worker_arn,
+                'Parameters': {'mode': 'plan', 'shard_count.$': '$.shard_count'},
+                'ResultSelector': {'plan.$': 'States.StringToJson($.body)'},
+                'Next': 'Scan'
+            },
+            'Scan': {
+                'Type': 'Map',
+                'ItemsPath': '$.plan.shards',
+                'MaxConcurrency': max_concurrency,
+                'Parameters': {'shard.$': '$$.Map.Item.Value'},
+                'Iterator': {
+                    'StartAt': 'ScanShard',
+                    'States': {
+                        'ScanShard': {
+                            'Type': 'Task',
+                            'Resource': worker_arn,
+                            'Retry': [{
+                                'ErrorEquals': ['Lambda.TooManyRequestsException', 'Lambda.ServiceException'],
+                                'IntervalSeconds': 2,
+                                'BackoffRate': 2,
+                                'MaxAttempts': 5
+                            }],
+                            'End': True
+                        }
+                    }
+                },
+                'Next': 'Aggregate'
+            },
+            'Aggregate': {
+                'Type': 'Task',
+                'Resource': aggregator_arn,
+                'End': True
+            }
+        }
+    }
@@ -1,70 +1,134 @@
 import boto3
 import json
+import os
+from botocore.exceptions import WaiterError
+from resource_events import parse_resource_event
+from api_instrumentation import instrumented
+from profiling import profiled
+from result_sink import collection, open_sink
 
+# Event mode waits this long for instances from a RunInstances call to become describable
+INSTANCE_WAIT_SECONDS = int(os.environ.get('INSTANCE_WAIT_SECONDS', '30'))
+INSTANCE_WAIT_DELAY = 5
+
+@profiled
+@instrumented
 def lambda_handler(event, context):
-    ec2 = boto3.client('ec2')
-    autoscaling = boto3.client('autoscaling')
+    resource_event = parse_resource_event(event)
+    region = resource_event['region'] if resource_event else None
+    
+    ec2 = boto3.client('ec2', region_name=region)
+    autoscaling = boto3.client('autoscaling', region_name=region)
+    
+    if resource_event:
+        # Event mode: evaluate only the instances from the RunInstances call
+        instance_ids = resource_event['resource_ids']
+        instances = wait_for_instances(ec2, instance_ids) if instance_ids else {'Reservations': []}
+        asgs = {'AutoScalingGroups': []}
+    else:
+        # Analyze current On-Demand instances for Spot conversion; analyze_inventory drops
+        # Spot and Scheduled instances, so no server-side lifecycle filter is needed
+        instances = ec2.describe_instances(
+            Filters=[{'Name': 'instance-state-name', 'Values': ['running']}]
+        )
+        
+        # Analyze Auto Scaling Groups for mixed instance types
+        asgs = autoscaling.describe_auto_scaling_groups()
+    
+    inventory = {
+        'instances': [
+            instance
+            for reservation in instances['Reservations']
+            for instance in reservation['Instances']
+        ],
+        'auto_scaling_groups': asgs['AutoScalingGroups']
+    }
+    
+    sink = open_sink('spot_optimizer', event, context, ec2.meta.region_name)
+    results = analyze_inventory(inventory, {'ec2': ec2}, sink)
+    
+    if resource_event:
+        results['event'] = resource_event
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps(sink.finish(results) if sink else results)
+    }
+
+def wait_for_instances(ec2, instance_ids, timeout=None):
+    """Describe instances from a RunInstances call once EC2 knows about them
+    
+    DescribeInstances is eventually consistent, so IDs from the event can be unknown for a
+    moment. Instances still unknown at the timeout, or terminated meanwhile, are left out
+    for the scheduled scan rather than failing the invocation into an EventBridge retry.
+    """
+    timeout = INSTANCE_WAIT_SECONDS if timeout is None else timeout
+    try:
+        ec2.get_waiter('instance_exists').wait(
+            InstanceIds=instance_ids,
+            WaiterConfig={'Delay': INSTANCE_WAIT_DELAY, 'MaxAttempts': max(1, timeout // INSTANCE_WAIT_DELAY)}
+        )
+    except WaiterError as e:
+        print(f"Instances {', '.join(instance_ids)} not found yet: {str(e)}")
+    
+    return ec2.describe_instances(Filters=[{'Name': 'instance-id', 'Values': instance_ids}])
+
+def analyze_inventory(inventory, clients, sink=None):
+    """Find Spot candidates among On-Demand instances and On-Demand-only ASGs"""
+    ec2 = clients['ec2']
     
     results = {
-        'spot_opportunities': [],
-        'asg_recommendations': [],
+        'spot_opportunities': collection(sink, 'spot_opportunities'),
+        'asg_recommendations': collection(sink, 'asg_recommendations'),
         'potential_savings': 0
     }
     
-    # Analyze current On-Demand instances for Spot conversion
-    instances = ec2.describe_instances(
-        Filters=[
-            {'Name': 'instance-state-name', 'Values': ['running']},
-            {'Name': 'instance-lifecycle', 'Values': ['normal']}  # On-Demand only
-        ]
-    )
-    
-    for reservation in instances['Reservations']:
-        for instance in reservation['Instances']:
-            instance_type = instance['InstanceType']
-            az = instance['Placement']['AvailabilityZone']
+    for instance in inventory['instances']:
+        # Running (or just launched) On-Demand only; Spot and Scheduled instances carry InstanceLifecycle
+        if instance['State']['Name'] not in ('pending', 'running') or instance.get('InstanceLifecycle'):
+            continue
+        
+        instance_type = instance['InstanceType']
+        az = instance['Placement']['AvailabilityZone']
+        
+        # Check if workload is suitable for Spot (non-critical tags)
+        tags = {tag['Key']: tag['Value'] for tag in instance.get('Tags', [])}
+        environment = tags.get('Environment', '').lower()
+        workload_type = tags.get('WorkloadType', '').lower()
+        
+        # Suitable for Spot: dev, test, batch, analytics
+        if any(keyword in environment for keyword in ['dev', 'test', 'staging']) or \
+           any(keyword in workload_type for keyword in ['batch', 'analytics', 'processing']):
             
-            # Check if workload is suitable for Spot (non-critical tags)
-            tags = {tag['Key']: tag['Value'] for tag in instance.get('Tags', [])}
-            environment = tags.get('Environment', '').lower()
-            workload_type = tags.get('WorkloadType', '').lower()
+            # Get current Spot pricing
+            spot_prices = ec2.describe_spot_price_history(
+                InstanceTypes=[instance_type],
+                ProductDescriptions=['Linux/UNIX'],
+                AvailabilityZone=az,
+                MaxResults=1
+            )
             
-            # Suitable for Spot: dev, test, batch, analytics
-            if any(keyword in environment for keyword in ['dev', 'test', 'staging']) or \
-               any(keyword in workload_type for keyword in ['batch', 'analytics', 'processing']):
+            if spot_prices['SpotPriceHistory']:
+                spot_price = float(spot_prices['SpotPriceHistory'][0]['SpotPrice'])
+                on_demand_price = get_on_demand_price(instance_type)
                 
-                # Get current Spot pricing
-                spot_prices = ec2.describe_spot_price_history(
-                    InstanceTypes=[instance_type],
-                    ProductDescriptions=['Linux/UNIX'],
-                    AvailabilityZone=az,
-                    MaxResults=1
-                )
-                
-                if spot_prices['SpotPriceHistory']:
-                    spot_price = float(spot_prices['SpotPriceHistory'][0]['SpotPrice'])
-                    on_demand_price = get_on_demand_price(instance_type)
+                if spot_price < on_demand_price * 0.7:  # >30% savings
+                    monthly_savings = (on_demand_price - spot_price) * 24 * 30
                     
-                    if spot_price < on_demand_price * 0.7:  # >30% savings
-                        monthly_savings = (on_demand_price - spot_price) * 24 * 30
-                        
-                        results['spot_opportunities'].append({
-                            'instance_id': instance['InstanceId'],
-                            'instance_type': instance_type,
-                            'current_price': f"${on_demand_price:.4f}/hour",
-                            'spot_price': f"${spot_price:.4f}/hour",
-                            'savings_percentage': f"{((on_demand_price - spot_price) / on_demand_price * 100):.1f}%",
-                            'monthly_savings': f"${monthly_savings:.2f}",
-                            'environment': environment,
-                            'recommendation': 'Convert to Spot Instance'
-                        })
-                        
-                        results['potential_savings'] += monthly_savings
-    
-    # Analyze Auto Scaling Groups for mixed instance types
-    asgs = autoscaling.describe_auto_scaling_groups()
+                    results['spot_opportunities'].append({
+                        'instance_id': instance['InstanceId'],
+                        'instance_type': instance_type,
+                        'current_price': f"${on_demand_price:.4f}/hour",
+                        'spot_price': f"${spot_price:.4f}/hour",
+                        'savings_percentage': f"{((on_demand_price - spot_price) / on_demand_price * 100):.1f}%",
+                        'monthly_savings': f"${monthly_savings:.2f}",
+                        'environment': environment,
+                        'recommendation': 'Convert to Spot Instance'
+                    })
+                    
+                    results['potential_savings'] += monthly_savings
     
-    for asg in asgs['AutoScalingGroups']:
+    for asg in inventory['auto_scaling_groups']:
         asg_name = asg['AutoScalingGroupName']
         
         # Check if ASG uses only On-Demand instances
@@ -82,10 +146,7 @@ def lambda_handler(event, context):
                     'diversification': 'Use 3+ instance types across AZs'
                 })
     
-    return {
-        'statusCode': 200,
-        'body': json.dumps(results)
-    }
+    return results
 
 def get_on_demand_price(instance_type):
     # Simplified On-Demand pricing
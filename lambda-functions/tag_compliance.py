@@ -0,0 +1,253 @@
+import boto3
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import rate_limiter
+
+# Each rule checks one tag key: it must be present, and may have to match a pattern
+# (full match) and/or be one of the allowed values. Override with TAG_COMPLIANCE_RULES.
+DEFAULT_RULES = [
+    {'name': 'environment', 'key': 'Environment', 'allowed': ['production', 'prod', 'staging', 'development', 'dev']},
+    {'name': 'owner', 'key': 'Owner'},
+    {'name': 'project', 'key': 'Project'},
+    {'name': 'cost-center', 'key': 'CostCenter', 'pattern': r'CC-\d{4}|[a-z][a-z0-9-]*'}
+]
+
+# Role assumed in member accounts; the management account is scanned with its own credentials
+MEMBER_ROLE_NAME = os.environ.get('TAG_COMPLIANCE_ROLE_NAME', 'OrganizationAccountAccessRole')
+REGIONS = [region for region in os.environ.get('TAG_COMPLIANCE_REGIONS', '').split(',') if region]
+MAX_WORKERS = int(os.environ.get('TAG_COMPLIANCE_MAX_WORKERS', '8'))
+# Rule results are packed into bitsets every this many resources
+PACK_RESOURCES = 8192
+
+POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.int64)
+
+class TagRule:
+    """One precompiled rule; results are cached per tag value since values repeat heavily"""
+    
+    def __init__(self, name, key, pattern=None, allowed=None):
+        self.name = name
+        self.key = key
+        self.pattern = re.compile(pattern) if pattern else None
+        self.allowed = frozenset(allowed) if allowed else None
+        self._results = {}
+    
+    def passes(self, value):
+        if value is None:
+            return False
+        
+        result = self._results.get(value)
+        if result is None:
+            result = (
+                (self.pattern is None or self.pattern.fullmatch(value) is not None)
+                and (self.allowed is None or value in self.allowed)
+            )
+            self._results[value] = result
+        return result
+
+def load_rules(rules=None):
+    if rules is None:
+        rules = json.loads(os.environ.get('TAG_COMPLIANCE_RULES', 'null')) or DEFAULT_RULES
+    return [TagRule(rule.get('name', rule['key']), rule['key'], rule.get('pattern'), rule.get('allowed')) for rule in rules]
+
+def popcount(bits, axis=-1):
+    return POPCOUNT[bits].sum(axis=axis)
+
+class ComplianceScan:
+    """Per-rule pass bitsets and service codes for the resources of one account/region
+    
+    Tags are evaluated as each page arrives and only one bit per rule per resource is
+    kept, plus a 2-byte service code, so millions of resources stay in a few MB.
+    """
+    
+    def __init__(self, rules):
+        self.rules = rules
+        self.services = {}
+        self.count = 0
+        self._packed = []
+        self._pending = []
+        self._pending_count = 0
+        self._codes = []
+    
+    def add(self, resources):
+        """Evaluate a GetResources page: [{'ResourceARN': ..., 'Tags': [{'Key', 'Value'}]}]"""
+        if not resources:
+            return
+        
+        passed = np.empty((len(self.rules), len(resources)), dtype=bool)
+        codes = np.empty(len(resources), dtype=np.uint16)
+        for column, resource in enumerate(resources):
+            tags = {tag['Key']: tag['Value'] for tag in resource.get('Tags', [])}
+            for row, rule in enumerate(self.rules):
+                passed[row, column] = rule.passes(tags.get(rule.key))
+            
+            service = resource['ResourceARN'].split(':')[2]
+            codes[column] = self.services.setdefault(service, len(self.services))
+        
+        self._pending.append(passed)
+        self._pending_count += len(resources)
+        self._codes.append(codes)
+        self.count += len(resources)
+        if self._pending_count >= PACK_RESOURCES:
+            self._pack(final=False)
+    
+    def _pack(self, final):
+        block = np.concatenate(self._pending, axis=1)
+        # Pack whole bytes only until the end, so bits stay aligned across blocks
+        cut = block.shape[1] if final else block.shape[1] - block.shape[1] % 8
+        self._packed.append(np.packbits(block[:, :cut], axis=1))
+        self._pending = [block[:, cut:]] if cut < block.shape[1] else []
+        self._pending_count = block.shape[1] - cut
+    
+    def bitsets(self):
+        """(rules x bytes) pass bitsets, padded with zero bits, and the per-resource service codes"""
+        if self._pending:
+            self._pack(final=True)
+        self._codes = [np.concatenate(self._codes)] if self._codes else []
+        
+        bits = np.concatenate(self._packed, axis=1) if self._packed else np.zeros((len(self.rules), 0), dtype=np.uint8)
+        self._packed = [bits]
+        codes = self._codes[0] if self._codes else np.zeros(0, dtype=np.uint16)
+        return bits, codes
+    
+    def counts(self):
+        """Resource and pass counts overall and per service, from popcounts over the bitsets"""
+        bits, codes = self.bitsets()
+        compliant = np.bitwise_and.reduce(bits, axis=0) if len(self.rules) else np.zeros(bits.shape[1], dtype=np.uint8)
+        
+        by_service = {}
+        for service, code in self.services.items():
+            mask = np.packbits(codes == code)
+            by_service[service] = {
+                'resources': int(np.count_nonzero(codes == code)),
+                'rules': popcount(bits & mask).tolist(),
+                'compliant': int(popcount(compliant & mask))
+            }
+        
+        return {
+            'resources': self.count,
+            'rules': popcount(bits).tolist(),
+            'compliant': int(popcount(compliant)),
+            'by_service': by_service
+        }
+
+def add_counts(total, counts):
+    total['resources'] += counts['resources']
+    total['compliant'] += counts['compliant']
+    total['rules'] = [a + b for a, b in zip(total['rules'], counts['rules'])]
+
+def merge_counts(total, counts):
+    """Add one scan's counts into a running total of the same shape"""
+    if not total:
+        return json.loads(json.dumps(counts))
+    
+    add_counts(total, counts)
+    for service, values in counts['by_service'].items():
+        if service in total['by_service']:
+            add_counts(total['by_service'][service], values)
+        else:
+            total['by_service'][service] = dict(values)
+    return total
+
+def percentage(passed, total):
+    return round(passed / total * 100, 1) if total else 100.0
+
+def summarize(counts, rules):
+    """Compliance percentages overall, per rule and per service"""
+    return {
+        'resources': counts['resources'],
+        'compliant_resources': counts['compliant'],
+        'compliance_percentage': percentage(counts['compliant'], counts['resources']),
+        'by_rule': {
+            rule.name: percentage(passed, counts['resources'])
+            for rule, passed in zip(rules, counts['rules'])
+        },
+        'by_service': {
+            service: {
+                'resources': values['resources'],
+                'compliance_percentage': percentage(values['compliant'], values['resources']),
+                'by_rule': {rule.name: percentage(passed, values['resources']) for rule, passed in zip(rules, values['rules'])}
+            }
+            for service, values in sorted(counts['by_service'].items())
+        }
+    }
+
+def account_session(account_id, caller_account_id, role_name=MEMBER_ROLE_NAME, rate_limited=True):
+    """A session in the account: own credentials for the caller, else an assumed role
+    
+    Safe to call from worker threads, since STS is called through a session of its own.
+    """
+    if account_id == caller_account_id:
+        session = boto3.session.Session()
+    else:
+        credentials = boto3.session.Session().client('sts').assume_role(
+            RoleArn=f"arn:aws:iam::{account_id}:role/{role_name}",
+            RoleSessionName='finops-governance'
+        )['Credentials']
+        session = boto3.session.Session(
+            aws_access_key_id=credentials['AccessKeyId'],
+            aws_secret_access_key=credentials['SecretAccessKey'],
+            aws_session_token=credentials['SessionToken']
+        )
+    return rate_limiter.install(session) if rate_limited else session
+
+def scan_region(tagging, rules):
+    """Page through every tagged resource in one account/region
+    
+    GetResources only returns resources that have, or once had, tags; resources that were
+    never tagged are not listed by the API.
+    """
+    scan = ComplianceScan(rules)
+    
+    for page in tagging.get_paginator('get_resources').paginate(ResourcesPerPage=100):
+        scan.add(page['ResourceTagMappingList'])
+    return scan.counts()
+
+def scan_organization(account_ids, regions=None, rules=None, max_workers=MAX_WORKERS, caller_account_id=None):
+    """Tag compliance per account across regions, one worker per account/region pair
+    
+    Returns ({account_id: summary}, organization summary, {account_id: error}).
+    """
+    rules = load_rules(rules)
+    regions = regions or REGIONS or [boto3.session.Session().region_name]
+    caller_account_id = caller_account_id or boto3.client('sts').get_caller_identity()['Account']
+    
+    # boto3 sessions are not thread-safe, so every account/region client is created up front
+    clients = {}
+    errors = {}
+    for account_id in account_ids:
+        try:
+            session = account_session(account_id, caller_account_id)
+            for region in regions:
+                clients[(account_id, region)] = session.client('resourcegroupstaggingapi', region_name=region)
+        except Exception as e:
+            print(f"Could not access account {account_id} for tag compliance: {str(e)}")
+            errors[account_id] = str(e)
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            key: pool.submit(scan_region, tagging, rules)
+            for key, tagging in clients.items()
+        }
+        
+        account_counts = {}
+        for (account_id, region), future in futures.items():
+            try:
+                account_counts[account_id] = merge_counts(account_counts.get(account_id), future.result())
+            except Exception as e:
+                print(f"Tag compliance scan failed for {account_id} in {region}: {str(e)}")
+                errors[account_id] = str(e)
+    
+    organization = {}
+    for counts in account_counts.values():
+        organization = merge_counts(organization, counts)
+    
+    return (
+        {account_id: summarize(counts, rules) for account_id, counts in account_counts.items()},
+        summarize(organization, rules) if organization else None,
+        errors
+    )
@@ -1,10 +1,48 @@
 import boto3
 import json
+from api_instrumentation import instrumented
+from profiling import profiled
 
+@profiled
+@instrumented
 def lambda_handler(event, context):
     ec2 = boto3.client('ec2')
     elbv2 = boto3.client('elbv2')
     
+    # Inventory the resources the cleanup rules look at
+    security_groups = ec2.describe_security_groups()
+    instances = ec2.describe_instances()
+    eips = ec2.describe_addresses()
+    
+    try:
+        load_balancers = elbv2.describe_load_balancers()['LoadBalancers']
+    except Exception as e:
+        print(f"Error listing load balancers: {str(e)}")
+        load_balancers = []
+    
+    inventory = {
+        'security_groups': security_groups['SecurityGroups'],
+        'instances': [
+            instance
+            for reservation in instances['Reservations']
+            for instance in reservation['Instances']
+        ],
+        'addresses': eips['Addresses'],
+        'load_balancers': load_balancers
+    }
+    
+    results = analyze_inventory(inventory, {'ec2': ec2, 'elbv2': elbv2})
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps(results)
+    }
+
+def analyze_inventory(inventory, clients):
+    """Remove unused security groups and EIPs, report load balancers without healthy targets"""
+    ec2 = clients['ec2']
+    elbv2 = clients['elbv2']
+    
     results = {
         'unused_security_groups': 0,
         'unused_load_balancers': 0,
@@ -12,18 +50,22 @@ def lambda_handler(event, context):
         'estimated_savings': 0
     }
     
-    # Clean up unused security groups
-    security_groups = ec2.describe_security_groups()
-    instances = ec2.describe_instances()
-    
     # Get all security groups in use
     used_sgs = set()
-    for reservation in instances['Reservations']:
-        for instance in reservation['Instances']:
-            for sg in instance['SecurityGroups']:
-                used_sgs.add(sg['GroupId'])
+    for instance in inventory['instances']:
+        for sg in instance['SecurityGroups']:
+            used_sgs.add(sg['GroupId'])
+    
+    # Without a complete instance listing every group would look unused
+    listing_errors = inventory.get('errors', {})
+    security_groups = inventory['security_groups']
+    if 'instances' in listing_errors:
+        print(f"Skipping security group cleanup: instance listing failed: {listing_errors['instances']}")
+        results['skipped'] = {'security_groups': f"instance listing failed: {listing_errors['instances']}"}
+        security_groups = []
     
-    for sg in security_groups['SecurityGroups']:
+    # Clean up unused security groups
+    for sg in security_groups:
         if sg['GroupName'] != 'default' and sg['GroupId'] not in used_sgs:
             try:
                 ec2.delete_security_group(GroupId=sg['GroupId'])
@@ -33,8 +75,7 @@ def lambda_handler(event, context):
                 print(f"Cannot delete SG {sg['GroupId']}: {str(e)}")
     
     # Clean up unused Elastic IPs
-    eips = ec2.describe_addresses()
-    for eip in eips['Addresses']:
+    for eip in inventory['addresses']:
         if 'InstanceId' not in eip and 'NetworkInterfaceId' not in eip:
             try:
                 ec2.release_address(AllocationId=eip['AllocationId'])
@@ -46,8 +87,7 @@ def lambda_handler(event, context):
     
     # Identify unused load balancers (no targets)
     try:
-        load_balancers = elbv2.describe_load_balancers()
-        for lb in load_balancers['LoadBalancers']:
+        for lb in inventory['load_balancers']:
             lb_arn = lb['LoadBalancerArn']
             
             # Check target groups
@@ -69,7 +109,4 @@ def lambda_handler(event, context):
     except Exception as e:
         print(f"Error checking load balancers: {str(e)}")
     
-    return {
-        'statusCode': 200,
-        'body': json.dumps(results)
-    }
+    return results
@@ -1,101 +1,332 @@
 #!/usr/bin/env python3
 """
 Performance Benchmarks for FinOps Platform
-Measures execution time and resource usage
+Runs each Lambda handler against moto-backed synthetic fleets of increasing size
+and measures wall time, memory and AWS API calls per operation
 """
 
-import time
+import argparse
+import importlib
+import io
 import json
+import math
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, redirect_stdout
 from datetime import datetime
+from multiprocessing import get_context
+
+import boto3
+
+import fleet_generator
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(REPO_ROOT, 'lambda-functions'))
+
+REGION = 'us-east-1'
+DEFAULT_SIZES = [100, 1000, 10000]
+DEFAULT_OUTPUT = os.path.join(REPO_ROOT, 'results', 'benchmark-results.json')
+DEFAULT_BASELINE = os.path.join(REPO_ROOT, 'results', 'benchmark-baseline.json')
+
+# Lambda pricing (us-east-1, x86) used to turn measured time into cost per run
+LAMBDA_GB_SECOND = 0.0000166667
+LAMBDA_MEMORY_MB = 512
+
+# Fleet composition per handler, as resource count per unit of fleet size
+BENCHMARKS = {
+    'ec2_rightsizing': {'instances': 1},
+    'spot_optimizer': {'instances': 1},
+    'cost_optimizer': {'volumes': 1, 'snapshots': 0.5},
+    'unused_resources_cleanup': {'security_groups': 1, 'instances': 0.5, 'load_balancers': 0.01, 'addresses': 0.1},
+    'data_transfer_optimizer': {'instances': 1, 'nat_gateways': 0.01},
+    's3_lifecycle_optimizer': {'buckets': 1, 'objects': 10},
+    'rds_optimizer': {'db_instances': 1}
+}
+
+# Wall-time changes below this many seconds are noise, whatever the ratio
+MIN_WALL_DELTA = 0.05
+
+def start_mocks(stack):
+    # Imported here so the parent process never patches botocore
+    import moto
+    for name in ['mock_ec2', 'mock_s3', 'mock_cloudwatch', 'mock_rds', 'mock_elbv2',
+                 'mock_autoscaling', 'mock_cloudfront', 'mock_sts']:
+        stack.enter_context(getattr(moto, name)())
+
+# Resources the fleet generator does not insert directly; these go through the API
+def create_addresses(count):
+    ec2 = boto3.client('ec2', region_name=REGION)
+    for _ in range(count):
+        ec2.allocate_address(Domain='vpc')
+
+def create_nat_gateways(count):
+    ec2 = boto3.client('ec2', region_name=REGION)
+    subnets = ec2.describe_subnets()['Subnets']
+    for index in range(count):
+        allocation = ec2.allocate_address(Domain='vpc')
+        ec2.create_nat_gateway(
+            SubnetId=subnets[index % len(subnets)]['SubnetId'],
+            AllocationId=allocation['AllocationId']
+        )
+
+def create_db_instances(count):
+    rds = boto3.client('rds', region_name=REGION)
+    for index in range(count):
+        rds.create_db_instance(
+            DBInstanceIdentifier=f"bench-db-{index:05d}",
+            DBInstanceClass=['db.t3.medium', 'db.m5.large', 'db.r5.xlarge'][index % 3],
+            Engine='postgres',
+            AllocatedStorage=20,
+            MasterUsername='bench',
+            MasterUserPassword='benchmark-password'
+        )
+
+API_BUILDERS = {
+    'addresses': create_addresses,
+    'nat_gateways': create_nat_gateways,
+    'db_instances': create_db_instances
+}
+
+def build_fleet(profile, size, seed=0, metric_days=0):
+    """Bulk-insert the handler's fleet; metric_days stays 0 by default because moto
+    scans every stored datapoint on each GetMetricStatistics call"""
+    counts = {key: 0 for key in fleet_generator.DEFAULT_COUNTS}
+    counts['metric_days'] = metric_days
+    for resource_type, ratio in profile.items():
+        counts[resource_type] = max(1, int(size * ratio))
+    
+    api_counts = {key: counts.pop(key) for key in list(counts) if key in API_BUILDERS}
+    fleet_generator.generate_fleet(counts, seed=seed, region=REGION)
+    for resource_type, count in api_counts.items():
+        API_BUILDERS[resource_type](count)
+
+class ApiCallCounter:
+    """Counts AWS API calls per service.Operation via botocore before-call events"""
+    
+    def __init__(self):
+        self.counts = {}
+    
+    def __call__(self, model, **kwargs):
+        key = f"{model.service_model.service_name}.{model.name}"
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+def peak_rss_mb():
+    # ru_maxrss is kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def run_case(handler_name, size, trace_memory=True, seed=0, metric_days=0):
+    """Build a fresh fleet and time one handler invocation; runs in its own process"""
+    os.environ.setdefault('AWS_DEFAULT_REGION', REGION)
+    for key in ['AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY']:
+        os.environ.setdefault(key, 'testing')
+    
+    with ExitStack() as stack:
+        start_mocks(stack)
+        
+        setup_start = time.perf_counter()
+        build_fleet(BENCHMARKS[handler_name], size, seed, metric_days)
+        setup_seconds = time.perf_counter() - setup_start
+        
+        handler = importlib.import_module(handler_name).lambda_handler
+        
+        # Clients created by the handler inherit the default session's event hooks
+        counter = ApiCallCounter()
+        boto3.setup_default_session(region_name=REGION)
+        boto3.DEFAULT_SESSION.events.register('before-call', counter)
+        
+        rss_before = peak_rss_mb()
+        if trace_memory:
+            tracemalloc.start()
+        
+        error = None
+        start = time.perf_counter()
+        try:
+            with redirect_stdout(io.StringIO()):
+                handler({}, None)
+        except Exception as e:
+            error = f"{type(e).__name__}: {str(e)}"
+        wall_seconds = time.perf_counter() - start
+        
+        tracemalloc_peak = tracemalloc.get_traced_memory()[1] if trace_memory else 0
+        if trace_memory:
+            tracemalloc.stop()
+    
+    return {
+        'handler': handler_name,
+        'size': size,
+        'wall_seconds': round(wall_seconds, 4),
+        'setup_seconds': round(setup_seconds, 4),
+        'tracemalloc_peak_mb': round(tracemalloc_peak / (1024 * 1024), 3),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'rss_growth_mb': round(peak_rss_mb() - rss_before, 1),
+        'api_calls': dict(sorted(counter.counts.items())),
+        'api_call_total': sum(counter.counts.values()),
+        'cost_per_run': round(wall_seconds * LAMBDA_MEMORY_MB / 1024 * LAMBDA_GB_SECOND, 8),
+        'error': error
+    }
 
-def benchmark_optimization_functions():
-    """Benchmark all optimization functions"""
-    
-    benchmarks = {
-        'ebs_optimization': {
-            'avg_execution_time': '45 seconds',
-            'memory_usage': '256 MB',
-            'resources_processed': '50-200 volumes',
-            'cost_per_execution': '$0.02'
-        },
-        'ec2_rightsizing': {
-            'avg_execution_time': '120 seconds', 
-            'memory_usage': '512 MB',
-            'resources_processed': '100-500 instances',
-            'cost_per_execution': '$0.05'
-        },
-        'spot_optimization': {
-            'avg_execution_time': '90 seconds',
-            'memory_usage': '512 MB', 
-            'resources_processed': '50-300 instances',
-            'cost_per_execution': '$0.04'
-        },
-        'eks_optimization': {
-            'avg_execution_time': '180 seconds',
-            'memory_usage': '1024 MB',
-            'resources_processed': '10-50 clusters',
-            'cost_per_execution': '$0.08'
-        },
-        's3_lifecycle': {
-            'avg_execution_time': '300 seconds',
-            'memory_usage': '512 MB',
-            'resources_processed': '100-1000 buckets', 
-            'cost_per_execution': '$0.10'
-        }
+def run_benchmarks(handlers, sizes, trace_memory=True, seed=0, metric_days=0):
+    results = []
+    
+    for handler_name in handlers:
+        for size in sizes:
+            # A fresh process per case keeps peak RSS and moto state independent
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('fork')) as pool:
+                result = pool.submit(run_case, handler_name, size, trace_memory, seed, metric_days).result()
+            
+            status = result['error'] or 'ok'
+            print(f"   {handler_name:<26} n={size:<6} {result['wall_seconds']:>9.3f}s "
+                  f"{result['tracemalloc_peak_mb']:>8.1f} MB {result['api_call_total']:>7} calls  {status}")
+            results.append(result)
+    
+    return {
+        'generated_at': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'sizes': sizes,
+        'trace_memory': trace_memory,
+        'seed': seed,
+        'metric_days': metric_days,
+        'results': results,
+        'scaling': scaling_exponents(results)
     }
+
+def scaling_exponents(results):
+    """Empirical exponent k in time ~ n^k between consecutive fleet sizes"""
+    by_handler = {}
+    for result in results:
+        if not result['error']:
+            by_handler.setdefault(result['handler'], []).append(result)
     
-    print("🚀 FinOps Platform Performance Benchmarks")
+    scaling = {}
+    for handler_name, runs in by_handler.items():
+        runs = sorted(runs, key=lambda run: run['size'])
+        scaling[handler_name] = [
+            {
+                'from_size': small['size'],
+                'to_size': large['size'],
+                'time_exponent': round(math.log(large['wall_seconds'] / small['wall_seconds']) / math.log(large['size'] / small['size']), 2),
+                'api_call_exponent': round(math.log(max(large['api_call_total'], 1) / max(small['api_call_total'], 1)) / math.log(large['size'] / small['size']), 2)
+            }
+            for small, large in zip(runs, runs[1:])
+            if small['wall_seconds'] > 0
+        ]
+    return scaling
+
+def compare_to_baseline(report, baseline, tolerance):
+    """Regressions against a stored run: time/memory beyond tolerance, any extra API calls, or a run with no baseline"""
+    baseline_runs = {(run['handler'], run['size']): run for run in baseline['results']}
+    regressions = []
+    
+    for run in report['results']:
+        base = baseline_runs.get((run['handler'], run['size']))
+        # An unmatched run would otherwise pass unchecked
+        if base is None:
+            regressions.append({
+                'handler': run['handler'],
+                'size': run['size'],
+                'metric': 'baseline',
+                'baseline': None,
+                'current': 'no baseline entry for this size'
+            })
+            continue
+        if run['error'] or base['error']:
+            continue
+        
+        for metric in ['wall_seconds', 'tracemalloc_peak_mb', 'peak_rss_mb']:
+            if not base[metric]:
+                continue
+            if metric == 'wall_seconds' and run[metric] - base[metric] < MIN_WALL_DELTA:
+                continue
+            if run[metric] > base[metric] * (1 + tolerance):
+                regressions.append({
+                    'handler': run['handler'],
+                    'size': run['size'],
+                    'metric': metric,
+                    'baseline': base[metric],
+                    'current': run[metric],
+                    'change_pct': round((run[metric] / base[metric] - 1) * 100, 1)
+                })
+        
+        # API call counts are deterministic for a given fleet, so any increase counts
+        for operation, count in run['api_calls'].items():
+            if count > base['api_calls'].get(operation, 0):
+                regressions.append({
+                    'handler': run['handler'],
+                    'size': run['size'],
+                    'metric': f"api_calls.{operation}",
+                    'baseline': base['api_calls'].get(operation, 0),
+                    'current': count
+                })
+    
+    return regressions
+
+def print_summary(report):
+    print(f"\n📈 SCALING (time ~ n^k)")
     print("=" * 60)
+    for handler_name, steps in report['scaling'].items():
+        curve = ', '.join(f"{step['from_size']}→{step['to_size']}: k={step['time_exponent']}" for step in steps)
+        print(f"   {handler_name:<26} {curve}")
+    
+    failures = [run for run in report['results'] if run['error']]
+    if failures:
+        print(f"\n⚠️  FAILED RUNS")
+        for run in failures:
+            print(f"   {run['handler']} n={run['size']}: {run['error']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark Lambda handlers against synthetic moto fleets')
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                        help='Comma-separated fleet sizes')
+    parser.add_argument('--handlers', default=','.join(BENCHMARKS), help='Comma-separated handler modules')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='Where to write the JSON results')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Stored results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed time/memory growth over baseline')
+    parser.add_argument('--update-baseline', action='store_true', help='Save this run as the new baseline')
+    parser.add_argument('--seed', type=int, default=0, help='Fleet generator seed')
+    parser.add_argument('--metric-days', type=int, default=0, help='Days of hourly CPU datapoints per instance')
+    parser.add_argument('--no-tracemalloc', action='store_true', help='Skip tracemalloc (it slows allocation-heavy code)')
+    args = parser.parse_args(argv)
     
-    total_monthly_cost = 0
+    sizes = [int(size) for size in args.sizes.split(',')]
+    handlers = args.handlers.split(',')
+    unknown = [handler_name for handler_name in handlers if handler_name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Unknown handlers: {', '.join(unknown)}")
     
-    for func_name, metrics in benchmarks.items():
-        print(f"\n📊 {func_name.replace('_', ' ').title()}")
-        print(f"   Execution Time: {metrics['avg_execution_time']}")
-        print(f"   Memory Usage:   {metrics['memory_usage']}")
-        print(f"   Resources:      {metrics['resources_processed']}")
-        print(f"   Cost/Run:       {metrics['cost_per_execution']}")
+    print("🚀 FinOps Platform Performance Benchmarks")
+    print("=" * 60)
+    report = run_benchmarks(handlers, sizes, not args.no_tracemalloc, args.seed, args.metric_days)
+    print_summary(report)
+    
+    if os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline) as f:
+            report['regressions'] = compare_to_baseline(report, json.load(f), args.tolerance)
         
-        # Calculate monthly cost (daily execution)
-        daily_cost = float(metrics['cost_per_execution'].replace('$', ''))
-        monthly_cost = daily_cost * 30
-        total_monthly_cost += monthly_cost
-    
-    print(f"\n💰 OPERATIONAL COSTS")
-    print(f"   Monthly Platform Cost: ${total_monthly_cost:.2f}")
-    print(f"   Annual Platform Cost:  ${total_monthly_cost * 12:.2f}")
-    
-    # Calculate efficiency metrics
-    annual_savings = 21795.84  # From calculate-savings.py
-    annual_platform_cost = total_monthly_cost * 12
-    net_savings = annual_savings - annual_platform_cost
-    efficiency_ratio = annual_savings / annual_platform_cost
-    
-    print(f"\n📈 EFFICIENCY METRICS")
-    print(f"   Annual Savings:        ${annual_savings:,.2f}")
-    print(f"   Platform Cost:         ${annual_platform_cost:.2f}")
-    print(f"   Net Savings:           ${net_savings:,.2f}")
-    print(f"   Efficiency Ratio:      {efficiency_ratio:.1f}x")
-    print(f"   Cost Efficiency:       {((net_savings/annual_savings)*100):.1f}%")
-
-def benchmark_scalability():
-    """Show scalability metrics"""
-    
-    print(f"\n🔄 SCALABILITY METRICS")
-    print("=" * 40)
-    
-    scalability = {
-        'AWS Accounts': 'Up to 100 accounts',
-        'Resources/Scan': '10,000+ resources',
-        'Concurrent Executions': '50 Lambda functions',
-        'Data Processing': '1TB+ cost data/month',
-        'Alert Response Time': '<5 minutes',
-        'Uptime SLA': '99.9%'
-    }
+        print(f"\n🔍 BASELINE COMPARISON ({args.baseline})")
+        for regression in report['regressions']:
+            print(f"   ❌ {regression['handler']} n={regression['size']} {regression['metric']}: "
+                  f"{regression['baseline']} → {regression['current']}")
+        if not report['regressions']:
+            print("   ✅ No regressions")
+    
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+    
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline updated: {args.baseline}")
     
-    for metric, value in scalability.items():
-        print(f"   {metric:<20}: {value}")
+    return 1 if report.get('regressions') else 0
 
 if __name__ == "__main__":
-    benchmark_optimization_functions()
-    benchmark_scalability()
+    sys.exit(main())
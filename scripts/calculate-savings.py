@@ -1,9 +1,27 @@
 #!/usr/bin/env python3
 """
 Real Cost Savings Calculator for FinOps Platform
-Generates realistic savings metrics based on AWS pricing
+Rolls the optimizers' actual outputs up into a savings cube and reports
+monthly/annual totals and ROI from it. The `estimate` command keeps the
+original assumption-based figures for environments with no scan history.
+    
+    calculate-savings.py ingest results/ --cube results/savings-cube
+    calculate-savings.py report --cube results/savings-cube --start 2024-01-01
+    calculate-savings.py estimate
 """
 
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import date
+
+import savings_cube
+
+DEFAULT_CUBE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'results', 'savings-cube')
+IMPLEMENTATION_COST = 15000  # One-time cost
+
 def calculate_ebs_savings():
     """Calculate EBS gp2 to gp3 conversion savings"""
     # Average EBS usage: 500GB across 20 volumes
@@ -131,7 +149,7 @@ def generate_report():
     print(f"   3-Year ROI:      ${total_annual * 3:,.2f}")
     
     # Calculate ROI
-    implementation_cost = 15000  # One-time cost
+    implementation_cost = IMPLEMENTATION_COST
     roi_percentage = ((total_annual - implementation_cost) / implementation_cost) * 100
     
     print(f"\n📈 BUSINESS METRICS")
@@ -139,5 +157,92 @@ def generate_report():
     print(f"   Payback Period:      {implementation_cost / total_monthly:.1f} months")
     print(f"   Annual ROI:          {roi_percentage:.0f}%")
 
-if __name__ == "__main__":
+def print_cube_report(report):
+    period = report['period']
+    print("🏆 AWS FinOps Platform - Identified Savings Report")
+    print(f"   Period: {period['start']} to {period['end']} ({period['days_with_findings']} days with findings)")
+    print("=" * 60)
+    
+    for category, monthly in sorted(report['by_category'].items(), key=lambda item: item[1], reverse=True):
+        print(f"📊 {category}")
+        print(f"   Monthly Savings: ${monthly:,.2f}")
+        print(f"   Annual Savings:  ${monthly * 12:,.2f}")
+        print()
+    
+    if len(report['by_month']) > 1:
+        print("📅 BY MONTH (monthly run rate)")
+        for month, monthly in report['by_month'].items():
+            print(f"   {month}: ${monthly:,.2f}")
+        print()
+    
+    top_accounts = sorted(report['by_account'].items(), key=lambda item: item[1], reverse=True)[:10]
+    if len(report['by_account']) > 1:
+        print(f"🏢 TOP ACCOUNTS ({len(report['by_account'])} total)")
+        for account, monthly in top_accounts:
+            print(f"   {account}: ${monthly:,.2f}/month")
+        print()
+    
+    print("💰 TOTAL IMPACT")
+    print(f"   Monthly Savings: ${report['monthly_savings']:,.2f}")
+    print(f"   Annual Savings:  ${report['annual_savings']:,.2f}")
+    
+    roi = report.get('roi')
+    if roi:
+        print(f"\n📈 BUSINESS METRICS")
+        print(f"   Implementation Cost: ${roi['implementation_cost']:,.2f}")
+        if roi['payback_months'] is not None:
+            print(f"   Payback Period:      {roi['payback_months']:.1f} months")
+        print(f"   Annual ROI:          {roi['annual_roi_percentage']:.0f}%")
+        print(f"   3-Year Savings:      ${roi['three_year_savings']:,.2f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Identified savings rollup and ROI')
+    commands = parser.add_subparsers(dest='command')
+    
+    ingest = commands.add_parser('ingest', help='Stream handler outputs into the savings cube')
+    ingest.add_argument('paths', nargs='+', help='Output files or directories (.json, .ndjson, optionally .gz)')
+    ingest.add_argument('--cube', default=DEFAULT_CUBE, help='Cube directory')
+    ingest.add_argument('--account', help='Account ID for records that do not carry one')
+    ingest.add_argument('--region', help='Region for records that do not carry one')
+    ingest.add_argument('--date', type=date.fromisoformat, help='Day for records without a timestamp (default: file mtime)')
+    
+    report = commands.add_parser('report', help='Monthly/annual totals and ROI from the savings cube')
+    report.add_argument('--cube', default=DEFAULT_CUBE, help='Cube directory')
+    report.add_argument('--start', type=date.fromisoformat, help='First day (inclusive)')
+    report.add_argument('--end', type=date.fromisoformat, help='Last day (inclusive)')
+    report.add_argument('--category', action='append', help='Only this category (repeatable)')
+    report.add_argument('--account', action='append', help='Only this account (repeatable)')
+    report.add_argument('--implementation-cost', type=float, default=IMPLEMENTATION_COST)
+    report.add_argument('--json', action='store_true', help='Print the report as JSON')
+    
+    commands.add_parser('estimate', help='Assumption-based estimate (no scan history needed)')
+    args = parser.parse_args(argv)
+    
+    if args.command == 'ingest':
+        start = time.perf_counter()
+        summary = savings_cube.ingest(args.paths, args.cube, args.account, args.region, args.date)
+        summary['seconds'] = round(time.perf_counter() - start, 2)
+        print(json.dumps(summary, indent=2))
+        return 0
+    
+    if args.command == 'report':
+        if not os.path.exists(os.path.join(args.cube, savings_cube.CUBE_FILE)):
+            print(f"No savings cube at {args.cube}; run 'ingest' first or use 'estimate'")
+            return 1
+        
+        start = time.perf_counter()
+        cube = savings_cube.SavingsCube.load(args.cube)
+        result = savings_cube.summarize(cube, args.start, args.end, args.category, args.account, args.implementation_cost)
+        result['query_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        
+        if args.json:
+            print(json.dumps(result, indent=2))
+        else:
+            print_cube_report(result)
+        return 0
+    
     generate_report()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
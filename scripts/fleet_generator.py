@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Synthetic Fleet Generator for FinOps Platform load testing
+Populates moto's in-memory backends directly, skipping the per-item API round trips,
+so 100k-resource accounts build in seconds with reproducible distributions
+"""
+
+import argparse
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from dateutil.tz import tzutc
+
+REGION = 'us-east-1'
+
+# Resource counts for a mid-sized account; scale() multiplies them
+DEFAULT_COUNTS = {
+    'instances': 1000,
+    'volumes': 1500,
+    'snapshots': 1000,
+    'security_groups': 300,
+    'network_interfaces': 300,
+    'load_balancers': 30,
+    'buckets': 20,
+    'objects': 5000,
+    'metric_days': 7
+}
+
+# (value, weight) distributions
+INSTANCE_TYPES = [('t3.medium', 30), ('m5.large', 25), ('m5.xlarge', 15), ('c5.2xlarge', 10), ('r5.large', 10), ('t3.large', 10)]
+VOLUME_TYPES = [('gp2', 45), ('gp3', 40), ('io1', 5), ('st1', 5), ('sc1', 5)]
+STORAGE_CLASSES = [('STANDARD', 80), ('STANDARD_IA', 15), ('GLACIER', 5)]
+ENVIRONMENTS = [('production', 40), ('staging', 30), ('development', 30)]
+TEAMS = ['platform', 'data', 'payments', 'search', 'ml', 'web']
+# Average CPU bands: idle, low, normal, hot
+CPU_PROFILES = [((0.5, 5), 20), ((5, 20), 40), ((20, 60), 30), ((60, 95), 10)]
+
+TAGGED_FRACTION = 0.8
+STOPPED_FRACTION = 0.1
+SPOT_FRACTION = 0.1
+UNATTACHED_VOLUME_FRACTION = 0.3
+ORPHANED_SNAPSHOT_FRACTION = 0.3
+MAX_AGE_DAYS = 720
+
+def scale(factor, counts=None):
+    """Multiply every resource count (metric_days stays as is)"""
+    counts = dict(counts or DEFAULT_COUNTS)
+    return {key: value if key == 'metric_days' else int(value * factor) for key, value in counts.items()}
+
+def weighted(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights=weights)[0]
+
+def age_timestamp(rng, now):
+    # Most resources are young; a long tail is years old
+    days = min(rng.expovariate(1 / 120), MAX_AGE_DAYS)
+    return now - timedelta(days=days, seconds=rng.randrange(86400))
+
+def moto_time(value):
+    return value.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+def random_tags(rng):
+    if rng.random() > TAGGED_FRACTION:
+        return {}
+    tags = {'Environment': weighted(rng, ENVIRONMENTS), 'Team': rng.choice(TEAMS)}
+    if rng.random() < 0.7:
+        tags['CostCenter'] = f"CC-{rng.randrange(1000, 1010)}"
+    return tags
+
+@contextmanager
+def fast_backend_lookups(ec2_backend):
+    """Swap moto's linear-scan lookups for dict lookups while bulk inserting
+    
+    Instance creation looks up its AMI, its root volume and itself by scanning
+    every existing resource, which makes building large fleets quadratic.
+    """
+    instance_index = {}
+    original_get_instance = ec2_backend.get_instance
+    
+    def get_instance(instance_id):
+        if instance_id in instance_index:
+            return instance_index[instance_id]
+        # A just-created instance sits at the end of the newest reservation
+        latest = next(reversed(ec2_backend.reservations.values()), None)
+        for instance in reversed(latest.instances if latest else []):
+            if instance.id == instance_id:
+                return instance
+        return original_get_instance(instance_id)
+    
+    def describe_images(ami_ids=None, filters=None, **kwargs):
+        image_id = (filters or {}).get('image-id')
+        return [ec2_backend.amis[image_id]] if image_id in ec2_backend.amis else []
+    
+    def describe_volumes(volume_ids=None, filters=None):
+        return [ec2_backend.volumes[volume_id] for volume_id in volume_ids or []]
+    
+    group_index = {}
+    
+    def get_security_group_from_id(group_id):
+        if group_id not in group_index:
+            group_index.update(
+                (group.id, group) for groups in ec2_backend.groups.values() for group in groups.values()
+            )
+        return group_index.get(group_id)
+    
+    overrides = {
+        'get_instance': get_instance,
+        'describe_images': describe_images,
+        'describe_volumes': describe_volumes,
+        'get_security_group_from_id': get_security_group_from_id
+    }
+    for name, override in overrides.items():
+        setattr(ec2_backend, name, override)
+    try:
+        yield instance_index
+    finally:
+        for name in overrides:
+            delattr(ec2_backend, name)
+
+def generate_fleet(counts=None, seed=0, region=REGION, account_id=None, now=None):
+    """Populate the active moto mocks with a synthetic account; returns counts and build time
+    
+    Must run inside mock_ec2 / mock_elbv2 / mock_s3 / mock_cloudwatch. The same seed
+    (and the same `now`) yields the same resource IDs, attributes and metrics.
+    """
+    from moto.cloudwatch.models import MetricDatum, cloudwatch_backends
+    from moto.core import DEFAULT_ACCOUNT_ID
+    from moto.ec2.models import ec2_backends
+    from moto.elbv2.models import elbv2_backends
+    from moto.moto_api._internal import mock_random
+    from moto.s3.models import s3_backends
+    
+    counts = dict(DEFAULT_COUNTS, **(counts or {}))
+    account_id = account_id or DEFAULT_ACCOUNT_ID
+    rng = random.Random(seed)
+    mock_random.seed(seed)
+    now = now or datetime.utcnow()
+    start = time.perf_counter()
+    
+    ec2 = ec2_backends[account_id][region]
+    default_vpc = next(vpc for vpc in ec2.vpcs.values() if vpc.is_default)
+    subnets = [subnet for zone in ec2.subnets.values() for subnet in zone.values() if subnet.vpc_id == default_vpc.id]
+    image_id = next(iter(ec2.amis))
+    summary = {'seed': seed, 'region': region}
+    
+    with fast_backend_lookups(ec2) as instance_index:
+        security_groups = [
+            ec2.create_security_group(f"fleet-sg-{index:06d}", 'synthetic fleet', vpc_id=default_vpc.id)
+            for index in range(counts['security_groups'])
+        ]
+        summary['security_groups'] = len(security_groups)
+        
+        # Instances arrive in reservations of 1-20, each with one type, subnet and security group
+        instances = []
+        while len(instances) < counts['instances']:
+            batch = min(rng.randint(1, 20), counts['instances'] - len(instances))
+            subnet = rng.choice(subnets)
+            reservation = ec2.add_instances(
+                image_id, batch, None, [],
+                instance_type=weighted(rng, INSTANCE_TYPES),
+                # Types come from our own list; skipping validation avoids a scan of every offering
+                is_instance_type_default=True,
+                region_name=region,
+                subnet_id=subnet.id,
+                security_group_ids=[rng.choice(security_groups).id] if security_groups else []
+            )
+            for instance in reservation.instances:
+                instance_index[instance.id] = instance
+                instance.launch_time = moto_time(age_timestamp(rng, now))
+                instance.add_tags(random_tags(rng))
+                if rng.random() < SPOT_FRACTION:
+                    instance.lifecycle = 'spot'
+                if rng.random() < STOPPED_FRACTION:
+                    instance.stop()
+                instances.append(instance)
+        summary['instances'] = len(instances)
+        
+        volumes = []
+        for _ in range(counts['volumes']):
+            # Attached volumes live in their instance's zone, using the next free /dev/sdf../dev/sdz
+            instance = rng.choice(instances) if instances and rng.random() > UNATTACHED_VOLUME_FRACTION else None
+            if instance is not None and len(instance.block_device_mapping) > 20:
+                instance = None
+            zone = instance._placement.zone if instance is not None else rng.choice(subnets).availability_zone
+            
+            volume_type = weighted(rng, VOLUME_TYPES)
+            volume = ec2.create_volume(
+                size=max(8, min(int(rng.lognormvariate(4.5, 1.0)), 16000)),
+                zone_name=zone,
+                volume_type=volume_type,
+                iops=3000 if volume_type == 'io1' else None
+            )
+            volume.create_time = moto_time(age_timestamp(rng, now))
+            volume.add_tags(random_tags(rng))
+            if instance is not None:
+                device = f"/dev/sd{chr(ord('e') + len(instance.block_device_mapping))}"
+                ec2.attach_volume(volume.id, instance.id, device)
+            volumes.append(volume)
+        
+        snapshots = []
+        for _ in range(counts['snapshots'] if volumes else 0):
+            volume = rng.choice(volumes)
+            snapshot = ec2.create_snapshot(volume.id, 'synthetic fleet backup')
+            snapshot.start_time = moto_time(age_timestamp(rng, now))
+            snapshot.add_tags(random_tags(rng))
+            snapshots.append(snapshot)
+        
+        # Deleting the source of some snapshots leaves the stale-snapshot case cleanup looks for
+        orphaned = set()
+        for snapshot in snapshots:
+            volume = snapshot.volume
+            if volume.id not in orphaned and volume.attachment is None and rng.random() < ORPHANED_SNAPSHOT_FRACTION:
+                ec2.delete_volume(volume.id)
+                orphaned.add(volume.id)
+        summary['volumes'] = len(ec2.volumes)
+        summary['snapshots'] = len(snapshots)
+        
+        for index in range(counts['network_interfaces']):
+            eni = ec2.create_network_interface(
+                rng.choice(subnets), None,
+                group_ids=[rng.choice(security_groups).id] if security_groups else None,
+                description=f"fleet-eni-{index:06d}"
+            )
+            eni.add_tags(random_tags(rng))
+        summary['network_interfaces'] = counts['network_interfaces']
+    
+    elbv2 = elbv2_backends[account_id][region]
+    for index in range(counts['load_balancers']):
+        elbv2.create_load_balancer(
+            f"fleet-lb-{index:05d}",
+            [rng.choice(security_groups).id] if security_groups else [],
+            [subnet.id for subnet in rng.sample(subnets, min(2, len(subnets)))],
+            loadbalancer_type=rng.choice(['application', 'network'])
+        )
+    summary['load_balancers'] = counts['load_balancers']
+    
+    # Object bodies stay empty; only the reported size is synthetic
+    s3 = s3_backends[account_id]['global']
+    buckets = [f"fleet-{seed}-bucket-{index:04d}" for index in range(counts['buckets'])]
+    for bucket_name in buckets:
+        s3.create_bucket(bucket_name, region)
+    for index in range(counts['objects'] if buckets else 0):
+        key = s3.put_object(
+            rng.choice(buckets),
+            f"data/{index // 1000:04d}/object-{index:07d}.bin",
+            b'',
+            storage=weighted(rng, STORAGE_CLASSES)
+        )
+        key.contentsize = int(rng.lognormvariate(13, 2))
+        key.last_modified = age_timestamp(rng, now)
+    summary['buckets'] = len(buckets)
+    summary['objects'] = counts['objects'] if buckets else 0
+    
+    # Hourly CPU for every running instance, appended straight to the metric store
+    cloudwatch = cloudwatch_backends[account_id][region]
+    hours = counts['metric_days'] * 24
+    end = now.replace(minute=0, second=0, microsecond=0, tzinfo=tzutc())
+    datapoints = 0
+    for instance in instances:
+        if instance.state != 'running':
+            continue
+        low, high = weighted(rng, CPU_PROFILES)
+        template = MetricDatum('AWS/EC2', 'CPUUtilization', 0.0, [{'Name': 'InstanceId', 'Value': instance.id}], end, 'Percent')
+        
+        # Clone one datum per series instead of rebuilding its dimensions for every hour.
+        # object.__new__ also skips moto's per-model instance tracking; the backend list owns them
+        for hour in range(1, hours + 1):
+            datum = object.__new__(MetricDatum)
+            datum.__dict__.update(template.__dict__, value=rng.uniform(low, high), timestamp=end - timedelta(hours=hour))
+            cloudwatch.metric_data.append(datum)
+        datapoints += hours
+    summary['datapoints'] = datapoints
+    
+    summary['resources'] = sum(summary[key] for key in [
+        'instances', 'volumes', 'snapshots', 'security_groups', 'network_interfaces',
+        'load_balancers', 'buckets', 'objects'
+    ])
+    summary['build_seconds'] = round(time.perf_counter() - start, 2)
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build a synthetic fleet in moto and report build time')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplier on the default resource counts')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    
+    from moto import mock_cloudwatch, mock_ec2, mock_elbv2, mock_s3
+    
+    with mock_ec2(), mock_elbv2(), mock_s3(), mock_cloudwatch():
+        summary = generate_fleet(scale(args.scale), seed=args.seed)
+    
+    print(f"🏗️  Synthetic fleet (seed {summary['seed']})")
+    for key, value in summary.items():
+        if key not in ('seed', 'region'):
+            print(f"   {key:<20}: {value:,}" if isinstance(value, int) else f"   {key:<20}: {value}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+Savings Rollup Cube for FinOps Platform
+Streams optimizer outputs (JSON / NDJSON, optionally gzipped) into a dense
+day x category x account array of identified monthly savings kept on disk,
+so period totals and ROI are array slices instead of re-reading every run
+"""
+
+import gzip
+import json
+import os
+from datetime import date, datetime
+
+import numpy as np
+
+CUBE_FILE = 'cube.npz'
+RECORDED_FILE = 'recorded.npz'
+MANIFEST_FILE = 'manifest.json'
+
+# Handler -> (report category, savings key, months the reported figure covers, signature key).
+# A dotted savings key reaches into a nested figure.
+# The signature key only appears in that handler's result, so bare results can be attributed.
+HANDLERS = {
+    'cost_optimizer': ('EBS Optimization', 'estimated_savings', 1, 'volumes_optimized'),
+    'ec2_rightsizing': ('EC2 Right-sizing', 'potential_savings', 1, 'underutilized_instances'),
+    'spot_optimizer': ('Spot Instances', 'potential_savings', 1, 'asg_recommendations'),
+    's3_lifecycle_optimizer': ('S3 Lifecycle', 'estimated_savings', 1, 'buckets_optimized'),
+    'unused_resources_cleanup': ('Unused Resources', 'estimated_savings', 1, 'unused_security_groups'),
+    'data_transfer_optimizer': ('Data Transfer', 'potential_savings', 1, 'nat_gateway_optimization'),
+    'rds_optimizer': ('RDS Optimization', 'potential_savings', 1, 'idle_databases'),
+    'eks_cost_optimizer': ('EKS Optimization', 'potential_savings', 1, 'cluster_analysis'),
+    'k8s_resource_optimizer': ('Kubernetes Optimization', 'potential_savings.total_potential_monthly_savings', 1, 'resource_recommendations'),
+    # ri_optimizer reports annual savings
+    'ri_optimizer': ('Reserved Instances', 'potential_savings', 12, 'ri_recommendations')
+}
+
+UNKNOWN_ACCOUNT = 'unknown'
+
+def identify_handler(result):
+    for handler, (_, _, _, signature) in HANDLERS.items():
+        if signature in result:
+            return handler
+    return None
+
+def parse_day(value):
+    if isinstance(value, (int, float)):
+        return datetime.utcfromtimestamp(value).date()
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00')[:19]).date()
+
+def unwrap(record):
+    """Lambda responses carry the result as a JSON string in 'body'"""
+    if isinstance(record, dict) and isinstance(record.get('body'), str):
+        try:
+            body = json.loads(record['body'])
+        except ValueError:
+            return record
+        if isinstance(body, dict):
+            for key in ['handler', 'account_id', 'region', 'timestamp']:
+                if key in record and key not in body:
+                    body[key] = record[key]
+            return body
+    return record
+
+def extract_findings(record, defaults):
+    """Yield (day, category, account, region, monthly_savings) for one output record
+    
+    Understands orchestrator reports, envelopes ({"handler", "account_id", "region",
+    "timestamp", "result"}) and bare handler results; missing fields come from `defaults`.
+    """
+    record = unwrap(record)
+    if not isinstance(record, dict):
+        return
+    
+    day = parse_day(record['timestamp']) if record.get('timestamp') else defaults['day']
+    account = str(record.get('account_id') or defaults.get('account') or UNKNOWN_ACCOUNT)
+    
+    # Orchestrator report: one result per region and stage
+    if isinstance(record.get('regions'), dict) and 'savings_by_stage' in record:
+        for region, region_report in record['regions'].items():
+            for handler in record['savings_by_stage']:
+                result = region_report.get(handler)
+                if isinstance(result, dict) and handler in HANDLERS:
+                    category, key, months, _ = HANDLERS[handler]
+                    yield day, category, account, region, savings_value(result, key) / months
+        return
+    
+    result = unwrap(record['result']) if isinstance(record.get('result'), dict) else record
+    handler = record.get('handler') or identify_handler(result)
+    if handler not in HANDLERS:
+        return
+    
+    category, key, months, _ = HANDLERS[handler]
+    region = record.get('region') or defaults.get('region') or 'all'
+    yield day, category, account, region, savings_value(result, key) / months
+
+def savings_value(result, key):
+    value = result
+    for part in key.split('.'):
+        value = value.get(part) if isinstance(value, dict) else None
+    return float(value or 0)
+
+def open_text(path):
+    return gzip.open(path, 'rt') if path.endswith('.gz') else open(path)
+
+def read_records(path):
+    """Stream records from an NDJSON file line by line, or load a JSON document / list"""
+    name = path[:-3] if path.endswith('.gz') else path
+    
+    with open_text(path) as f:
+        if name.endswith(('.ndjson', '.jsonl')):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+        
+        document = json.load(f)
+        if isinstance(document, list):
+            yield from document
+        else:
+            yield document
+
+def output_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    if name.endswith(('.json', '.ndjson', '.jsonl', '.json.gz', '.ndjson.gz', '.jsonl.gz')):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+class SavingsCube:
+    """Identified monthly savings per day x category x account, plus how many findings fed each cell
+    
+    `recorded` keeps the figure each (day, category, account, region) last contributed,
+    so a later ingest of the same key replaces it instead of adding to it. It lives in its
+    own file and is only read when first used, so queries touch just the dense arrays.
+    """
+    
+    def __init__(self, start_day=None, categories=None, accounts=None, savings=None, findings=None, recorded=None, directory=None):
+        self.start_day = start_day
+        self.directory = directory
+        self._recorded = dict(recorded) if recorded is not None else None
+        self.categories = list(categories or [])
+        self.accounts = list(accounts or [])
+        shape = (0, len(self.categories), len(self.accounts))
+        self.savings = savings if savings is not None else np.zeros(shape)
+        self.findings = findings if findings is not None else np.zeros(shape, dtype=np.int32)
+        self.category_index = {name: i for i, name in enumerate(self.categories)}
+        self.account_index = {name: i for i, name in enumerate(self.accounts)}
+    
+    @classmethod
+    def load(cls, directory):
+        path = os.path.join(directory, CUBE_FILE)
+        if not os.path.exists(path):
+            return cls(directory=directory)
+        
+        with np.load(path) as data:
+            start_day = int(data['start_day'])
+            return cls(
+                start_day=date.fromordinal(start_day) if start_day else None,
+                categories=data['categories'].tolist(),
+                accounts=data['accounts'].tolist(),
+                savings=data['savings'],
+                findings=data['findings'],
+                directory=directory
+            )
+    
+    @property
+    def recorded(self):
+        if self._recorded is None:
+            self._recorded = load_recorded(self.directory) if self.directory else {}
+        return self._recorded
+    
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        # An index never read this session is unchanged on disk
+        if self._recorded is not None:
+            save_recorded(self._recorded, directory)
+        
+        path = os.path.join(directory, CUBE_FILE)
+        # Write-then-rename so a reader never sees a half-written cube
+        with open(f"{path}.tmp", 'wb') as f:
+            np.savez(
+                f,
+                start_day=np.int64(self.start_day.toordinal() if self.start_day else 0),
+                categories=np.array(self.categories, dtype=str),
+                accounts=np.array(self.accounts, dtype=str),
+                savings=self.savings,
+                findings=self.findings
+            )
+        os.replace(f"{path}.tmp", path)
+    
+    @property
+    def days(self):
+        return self.savings.shape[0]
+    
+    def end_day(self):
+        return date.fromordinal(self.start_day.toordinal() + self.days - 1) if self.days else None
+    
+    def _grow(self, first_day, last_day, new_categories, new_accounts):
+        # Axes only ever grow; the day axis stays contiguous so a period is a plain slice
+        start = min(first_day, self.start_day) if self.start_day else first_day
+        end = max(last_day, self.end_day()) if self.days else last_day
+        before = (self.start_day - start).days if self.start_day else 0
+        shape = ((end - start).days + 1, len(self.categories) + len(new_categories), len(self.accounts) + len(new_accounts))
+        
+        for name in ['savings', 'findings']:
+            old = getattr(self, name)
+            grown = np.zeros(shape, dtype=old.dtype)
+            grown[before:before + old.shape[0], :old.shape[1], :old.shape[2]] = old
+            setattr(self, name, grown)
+        
+        for category in new_categories:
+            self.category_index[category] = len(self.categories)
+            self.categories.append(category)
+        for account in new_accounts:
+            self.account_index[account] = len(self.accounts)
+            self.accounts.append(account)
+        self.start_day = start
+    
+    def add(self, findings):
+        """Add (day, category, account, monthly_savings) rows in one vectorized scatter"""
+        return self._scatter([(day, category, account, amount, 1) for day, category, account, amount in findings])
+    
+    def record(self, findings):
+        """Set (day, category, account, region, monthly_savings) rows, replacing what an earlier ingest recorded for the same key
+        
+        A replaced key scatters only the difference and does not count as another finding.
+        """
+        rows = []
+        for day, category, account, region, amount in findings:
+            key = (day.toordinal(), category, account, region)
+            previous = self.recorded.get(key)
+            self.recorded[key] = amount
+            rows.append((day, category, account, amount - (previous or 0.0), 0 if previous is not None else 1))
+        return self._scatter(rows)
+    
+    def _scatter(self, rows):
+        if not rows:
+            return 0
+        
+        days, categories, accounts, amounts, counts = zip(*rows)
+        new_categories = sorted(set(categories) - set(self.category_index))
+        new_accounts = sorted(set(accounts) - set(self.account_index))
+        self._grow(min(days), max(days), new_categories, new_accounts)
+        
+        origin = self.start_day.toordinal()
+        index = (
+            np.array([day.toordinal() - origin for day in days]),
+            np.array([self.category_index[category] for category in categories]),
+            np.array([self.account_index[account] for account in accounts])
+        )
+        np.add.at(self.savings, index, np.array(amounts, dtype=float))
+        np.add.at(self.findings, index, np.array(counts, dtype=np.int32))
+        return len(rows)
+    
+    def select(self, start=None, end=None, categories=None, accounts=None):
+        """Slice of (savings, findings) for an inclusive day range and optional category/account filters"""
+        if not self.days:
+            empty = np.zeros((0, 0, 0))
+            return empty, empty, self.start_day
+        
+        first = max((start - self.start_day).days, 0) if start else 0
+        last = min((end - self.start_day).days, self.days - 1) if end else self.days - 1
+        category_rows = [self.category_index[c] for c in categories if c in self.category_index] if categories else slice(None)
+        account_rows = [self.account_index[a] for a in accounts if a in self.account_index] if accounts else slice(None)
+        
+        window = slice(first, max(last + 1, first))
+        savings = self.savings[window][:, category_rows][:, :, account_rows]
+        findings = self.findings[window][:, category_rows][:, :, account_rows]
+        return savings, findings, date.fromordinal(self.start_day.toordinal() + first)
+
+def monthly_run_rate(savings, findings):
+    """Monthly savings per (category, account): the mean daily figure over days that reported
+    
+    Each run reports what it found that day as a monthly amount, so days are averaged
+    rather than summed and days without a run do not pull the rate down.
+    """
+    reported_days = (findings > 0).sum(axis=0)
+    return savings.sum(axis=0) / np.maximum(reported_days, 1)
+
+def month_boundaries(first_day, days):
+    """Offsets into the day axis where each calendar month starts, plus 'YYYY-MM' labels"""
+    offsets, labels = [], []
+    for offset in range(days):
+        current = date.fromordinal(first_day.toordinal() + offset)
+        if offset == 0 or current.day == 1:
+            offsets.append(offset)
+            labels.append(current.strftime('%Y-%m'))
+    return offsets, labels
+
+def summarize(cube, start=None, end=None, categories=None, accounts=None, implementation_cost=0):
+    """Monthly/annual savings by category, account and calendar month, plus ROI, from the cube"""
+    savings, findings, first_day = cube.select(start, end, categories, accounts)
+    selected_categories = [c for c in cube.categories if not categories or c in categories]
+    selected_accounts = [a for a in cube.accounts if not accounts or a in accounts]
+    
+    report = {
+        'period': {
+            'start': first_day.isoformat() if first_day else None,
+            'end': date.fromordinal(first_day.toordinal() + savings.shape[0] - 1).isoformat() if savings.shape[0] else None,
+            'days_with_findings': int((findings.sum(axis=(1, 2)) > 0).sum()) if savings.size else 0
+        },
+        'by_category': {},
+        'by_account': {},
+        'by_month': {},
+        'monthly_savings': 0.0,
+        'annual_savings': 0.0
+    }
+    if not savings.size:
+        return report
+    
+    rate = monthly_run_rate(savings, findings)
+    report['by_category'] = {name: round(float(value), 2) for name, value in zip(selected_categories, rate.sum(axis=1))}
+    report['by_account'] = {name: round(float(value), 2) for name, value in zip(selected_accounts, rate.sum(axis=0))}
+    
+    # Per-month run rate: reduceat sums each calendar month's days in one pass
+    offsets, labels = month_boundaries(first_day, savings.shape[0])
+    monthly_savings = np.add.reduceat(savings, offsets, axis=0)
+    monthly_days = np.add.reduceat((findings > 0).astype(np.int32), offsets, axis=0)
+    per_month = (monthly_savings / np.maximum(monthly_days, 1)).sum(axis=(1, 2))
+    report['by_month'] = {label: round(float(value), 2) for label, value in zip(labels, per_month)}
+    
+    monthly = float(rate.sum())
+    report['monthly_savings'] = round(monthly, 2)
+    report['annual_savings'] = round(monthly * 12, 2)
+    
+    if implementation_cost:
+        report['roi'] = {
+            'implementation_cost': implementation_cost,
+            'annual_roi_percentage': round((monthly * 12 - implementation_cost) / implementation_cost * 100, 1),
+            'payback_months': round(implementation_cost / monthly, 1) if monthly else None,
+            'three_year_savings': round(monthly * 36, 2)
+        }
+    return report
+
+def load_recorded(directory):
+    """{(day ordinal, category, account, region): monthly savings} last ingested per key"""
+    path = os.path.join(directory, RECORDED_FILE)
+    if not os.path.exists(path):
+        return {}
+    
+    with np.load(path) as data:
+        keys = zip(data['days'].tolist(), data['categories'].tolist(), data['accounts'].tolist(), data['regions'].tolist())
+        return dict(zip(keys, data['amounts'].tolist()))
+
+def save_recorded(recorded, directory):
+    path = os.path.join(directory, RECORDED_FILE)
+    with open(f"{path}.tmp", 'wb') as f:
+        np.savez(
+            f,
+            days=np.array([key[0] for key in recorded], dtype=np.int64),
+            categories=np.array([key[1] for key in recorded], dtype=str),
+            accounts=np.array([key[2] for key in recorded], dtype=str),
+            regions=np.array([key[3] for key in recorded], dtype=str),
+            amounts=np.array(list(recorded.values()), dtype=float)
+        )
+    os.replace(f"{path}.tmp", path)
+
+def load_manifest(directory):
+    path = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def ingest(paths, directory, account=None, region=None, day=None):
+    """Stream output files into the cube at `directory`; files already ingested are skipped
+    
+    The latest record per (day, category, account, region) wins, within one ingest and
+    against what earlier ingests recorded, so a re-run of a scan on the same day
+    replaces rather than doubles its findings.
+    """
+    cube = SavingsCube.load(directory)
+    manifest = load_manifest(directory)
+    latest = {}
+    files = 0
+    records = 0
+    
+    for path in output_files(paths):
+        stat = os.stat(path)
+        fingerprint = f"{stat.st_size}:{int(stat.st_mtime)}"
+        if manifest.get(os.path.abspath(path)) == fingerprint:
+            continue
+        
+        defaults = {
+            'account': account,
+            'region': region,
+            'day': day or datetime.utcfromtimestamp(stat.st_mtime).date()
+        }
+        try:
+            for record in read_records(path):
+                records += 1
+                for found_day, category, found_account, found_region, amount in extract_findings(record, defaults):
+                    latest[(found_day, category, found_account, found_region)] = amount
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Skipping {path}: {str(e)}")
+            continue
+        
+        manifest[os.path.abspath(path)] = fingerprint
+        files += 1
+    
+    added = cube.record([key + (amount,) for key, amount in latest.items()])
+    cube.save(directory)
+    with open(os.path.join(directory, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    
+    return {
+        'files': files,
+        'records': records,
+        'findings': added,
+        'days': cube.days,
+        'categories': len(cube.categories),
+        'accounts': len(cube.accounts)
+    }
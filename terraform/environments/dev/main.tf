@@ -29,6 +29,10 @@ module "iam" {
   
   environment  = "dev"
   project_name = "aws-finops-platform"
+  
+  # Bucket part of the s3:// CUR location the functions read
+  cur_bucket_name = var.cur_location == "" ? "" : split("/", trimprefix(var.cur_location, "s3://"))[0]
+  
   common_tags = {
     Environment = "dev"
     Project     = "aws-finops-platform"
@@ -105,6 +109,19 @@ module "lambda_functions" {
         ENVIRONMENT   = "dev"
       }
     }
+    
+    fleet-scan-orchestrator = {
+      source_file = "fleet_scan_orchestrator.py"
+      handler     = "fleet_scan_orchestrator.lambda_handler"
+      timeout     = 900
+      memory_size = 1024
+      tier        = "strategic"
+      env_vars = {
+        FUNCTION_TYPE            = "cost_optimization"
+        ORCHESTRATOR_MAX_WORKERS = "8"
+        ENVIRONMENT              = "dev"
+      }
+    }
   }
   
   # Dev schedules (less frequent for testing)
@@ -114,11 +131,38 @@ module "lambda_functions" {
     unused-resources-cleanup = "cron(0 16 ? * FRI *)"  # 4 PM Fridays
   }
   
+  # Event-mode evaluation of newly created resources
+  lambda_event_patterns = {
+    cost-optimizer = jsonencode({
+      source      = ["aws.ec2"]
+      detail-type = ["AWS API Call via CloudTrail"]
+      detail      = { eventName = ["CreateVolume"] }
+    })
+  }
+  
   common_env_vars = {
     ENVIRONMENT = "dev"
     REGION      = "us-east-1"
     PROJECT     = "aws-finops-platform"
     LOG_LEVEL   = "DEBUG"
+    
+    # Resumable scans flush their cursor here before the Lambda timeout
+    CHECKPOINT_LOCATION = "s3://${module.storage.reports_bucket_name}/checkpoints"
+    
+    # Profiles land here when PROFILE=cpu,memory is set or an event carries "profile"
+    PROFILE_LOCATION = "s3://${module.storage.reports_bucket_name}/profiles"
+    
+    # Findings stream here as gzip NDJSON parts; responses carry counts and object keys
+    RESULTS_LOCATION = "s3://${module.storage.reports_bucket_name}/findings"
+    
+    # Cost and Usage Report export read in place of Cost Explorer when set
+    CUR_LOCATION = var.cur_location
+    
+    # Hourly anomaly mode keeps its per-series ring buffers here between runs
+    ANOMALY_STATE_LOCATION = "s3://${module.storage.reports_bucket_name}/anomaly-state"
+    
+    # Kubernetes node/pod indexes and their resourceVersions persist here between runs
+    K8S_INVENTORY_LOCATION = "s3://${module.storage.reports_bucket_name}/k8s-inventory"
   }
   
   sns_topic_arn = module.monitoring.sns_topic_arn
@@ -25,3 +25,9 @@ variable "common_tags" {
     Owner       = "dev-team"
   }
 }
+
+variable "cur_location" {
+  description = "s3:// prefix of the Cost and Usage Report export; empty uses Cost Explorer"
+  type        = string
+  default     = ""
+}
@@ -56,6 +56,8 @@ resource "aws_iam_role_policy" "lambda_cost_optimization_policy" {
           "ec2:ReleaseAddress",
           "ec2:DeleteSecurityGroup",
           "ec2:DescribeReservedInstances",
+          "ec2:DescribeNatGateways",
+          "ec2:DescribeVpcEndpoints",
           
           # RDS Optimization
           "rds:DescribeDBInstances",
@@ -79,6 +81,7 @@ resource "aws_iam_role_policy" "lambda_cost_optimization_policy" {
           
           # CloudWatch
           "cloudwatch:GetMetricStatistics",
+          "cloudwatch:GetMetricData",
           "cloudwatch:PutMetricData",
           "cloudwatch:ListMetrics",
           
@@ -89,13 +92,29 @@ resource "aws_iam_role_policy" "lambda_cost_optimization_policy" {
           # EKS/Kubernetes
           "eks:DescribeCluster",
           "eks:ListClusters",
+          "eks:DescribeNodegroup",
+          "eks:ListNodegroups",
           
           # Organizations (for multi-account)
           "organizations:ListAccounts",
-          "organizations:DescribeOrganization"
+          "organizations:DescribeOrganization",
+          
+          # Tag compliance
+          "tag:GetResources",
+          
+          # Budgets
+          "budgets:ViewBudget"
         ]
         Resource = "*"
       },
+      {
+        Effect = "Allow"
+        Action = [
+          # Tag compliance and budget checks in member accounts
+          "sts:AssumeRole"
+        ]
+        Resource = "arn:aws:iam::*:role/OrganizationAccountAccessRole"
+      },
       {
         Effect = "Allow"
         Action = [
@@ -141,6 +160,30 @@ resource "aws_iam_role_policy" "lambda_cost_optimization_policy" {
   })
 }
 
+# Read access to the Cost and Usage Report export, when one is configured
+resource "aws_iam_role_policy" "lambda_cur_read" {
+  count = var.cur_bucket_name == "" ? 0 : 1
+
+  name = "${var.project_name}-${var.environment}-cur-read-policy"
+  role = aws_iam_role.lambda_execution_role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect   = "Allow"
+        Action   = ["s3:ListBucket"]
+        Resource = "arn:aws:s3:::${var.cur_bucket_name}"
+      },
+      {
+        Effect   = "Allow"
+        Action   = ["s3:GetObject"]
+        Resource = "arn:aws:s3:::${var.cur_bucket_name}/*"
+      }
+    ]
+  })
+}
+
 # Attach AWS managed policies
 resource "aws_iam_role_policy_attachment" "lambda_basic_execution" {
   role       = aws_iam_role.lambda_execution_role.name
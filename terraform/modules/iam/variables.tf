@@ -12,3 +12,9 @@ variable "common_tags" {
   description = "Common tags for all resources"
   type        = map(string)
 }
+
+variable "cur_bucket_name" {
+  description = "Bucket the Cost and Usage Report is exported to; empty grants no CUR access"
+  type        = string
+  default     = ""
+}
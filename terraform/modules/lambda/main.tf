@@ -1,11 +1,14 @@
 # Lambda Module - All FinOps Functions
 
 # Package Lambda functions
+# Handlers import shared modules (fleet_inventory, ...), so each package
+# ships the whole lambda-functions directory
 data "archive_file" "lambda_packages" {
   for_each = var.lambda_functions
 
   type        = "zip"
-  source_file = "${path.module}/../../../lambda-functions/${each.value.source_file}"
+  source_dir  = "${path.module}/../../../lambda-functions"
+  excludes    = ["__pycache__"]
   output_path = "${path.module}/packages/${each.key}.zip"
 }
 
@@ -93,6 +96,35 @@ resource "aws_lambda_permission" "allow_eventbridge" {
   source_arn    = aws_cloudwatch_event_rule.lambda_schedules[each.key].arn
 }
 
+# EventBridge Rules for event-mode evaluation of single resources
+resource "aws_cloudwatch_event_rule" "lambda_resource_events" {
+  for_each = var.lambda_event_patterns
+
+  name          = "${var.environment}-${each.key}-resource-events"
+  description   = "Resource change events for ${each.key} function"
+  event_pattern = each.value
+
+  tags = var.common_tags
+}
+
+resource "aws_cloudwatch_event_target" "lambda_resource_event_targets" {
+  for_each = var.lambda_event_patterns
+
+  rule      = aws_cloudwatch_event_rule.lambda_resource_events[each.key].name
+  target_id = "${each.key}ResourceEventTarget"
+  arn       = aws_lambda_function.finops_functions[each.key].arn
+}
+
+resource "aws_lambda_permission" "allow_eventbridge_resource_events" {
+  for_each = var.lambda_event_patterns
+
+  statement_id  = "AllowResourceEventsFromEventBridge-${each.key}"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.finops_functions[each.key].function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.lambda_resource_events[each.key].arn
+}
+
 # Lambda function aliases for blue/green deployments
 resource "aws_lambda_alias" "function_aliases" {
   for_each = var.lambda_functions
@@ -102,3 +134,22 @@ resource "aws_lambda_alias" "function_aliases" {
   function_name    = aws_lambda_function.finops_functions[each.key].function_name
   function_version = "$LATEST"
 }
+
+# Resumable scans re-invoke themselves to continue past the timeout (CHECKPOINT_REINVOKE).
+# The functions share one execution role, so the grant lists exactly their ARNs; it lives
+# here rather than in the IAM module because the ARNs only exist once the functions do
+resource "aws_iam_role_policy" "lambda_self_invoke" {
+  name = "${var.environment}-lambda-self-invoke"
+  role = element(split("/", var.lambda_execution_role_arn), length(split("/", var.lambda_execution_role_arn)) - 1)
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect   = "Allow"
+        Action   = ["lambda:InvokeFunction"]
+        Resource = [for function in aws_lambda_function.finops_functions : function.arn]
+      }
+    ]
+  })
+}
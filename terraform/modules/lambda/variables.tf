@@ -51,3 +51,9 @@ variable "common_tags" {
   description = "Common tags for all resources"
   type        = map(string)
 }
+
+variable "lambda_event_patterns" {
+  description = "Map of Lambda function key to EventBridge event pattern (JSON) for event-mode evaluation; CloudTrail API call events need an active trail"
+  type        = map(string)
+  default     = {}
+}
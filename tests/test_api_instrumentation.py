@@ -0,0 +1,44 @@
+import json
+import boto3
+import sys
+import os
+from types import SimpleNamespace
+from moto import mock_ec2, mock_cloudwatch
+
+# Add lambda functions to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda-functions'))
+
+import api_instrumentation
+from ec2_rightsizing import lambda_handler
+
+@mock_ec2
+@mock_cloudwatch
+def test_handler_response_carries_api_call_summary():
+    """Test every AWS call made by a handler is counted per operation"""
+    ec2 = boto3.client('ec2', region_name='us-east-1')
+    ec2.run_instances(ImageId='ami-12345678', MinCount=3, MaxCount=3, InstanceType='t3.large')
+    
+    body = json.loads(lambda_handler({}, None)['body'])
+    operations = body['api_calls']['operations']
+    
+    assert operations['ec2.DescribeInstances']['calls'] == 1
+    assert operations['cloudwatch.GetMetricStatistics']['calls'] == 3
+    assert sum(operations['cloudwatch.GetMetricStatistics']['histogram']) == 3
+    assert body['api_calls']['total_calls'] == 4
+
+def test_throttles_counted_and_summaries_merge():
+    """Test throttled attempts are counted and shard summaries add up"""
+    api_instrumentation.reset()
+    model = SimpleNamespace(name='DescribeInstances', service_model=SimpleNamespace(service_name='ec2'))
+    throttled = (None, {'Error': {'Code': 'RequestLimitExceeded'}})
+    
+    assert api_instrumentation.on_needs_retry(throttled, model) is None
+    api_instrumentation.record_call(model, {}, retries=1)
+    first = api_instrumentation.summary()
+    
+    merged = api_instrumentation.merge_summaries([first, first])
+    op = merged['operations']['ec2.DescribeInstances']
+    
+    assert first['total_throttles'] == 1
+    assert (op['calls'], op['retries'], op['throttles']) == (2, 2, 2)
+    assert sum(op['histogram']) == 2
@@ -0,0 +1,100 @@
+import json
+import boto3
+import sys
+import os
+from datetime import datetime
+from moto import mock_ec2, mock_cloudwatch, mock_s3
+
+# Add lambda functions and scripts to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda-functions'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from checkpoint import remaining_items
+from cost_optimizer import lambda_handler
+import fleet_generator
+import s3_lifecycle_optimizer
+
+class DeadlineContext:
+    """Lambda context whose deadline arrives after a fixed number of checks"""
+    function_name = 'cost-optimizer'
+    
+    def __init__(self, checks_before_deadline):
+        self.checks_left = checks_before_deadline
+    
+    def get_remaining_time_in_millis(self):
+        self.checks_left -= 1
+        return 600000 if self.checks_left >= 0 else 1000
+
+def test_remaining_items_follows_cursor():
+    """Test the cursor skips finished items and phases"""
+    items = [{'Id': 'c'}, {'Id': 'a'}, {'Id': 'b'}]
+    phases = ['volumes', 'snapshots']
+    
+    assert [i['Id'] for i in remaining_items(items, 'Id', {}, 'volumes', phases)] == ['a', 'b', 'c']
+    assert [i['Id'] for i in remaining_items(items, 'Id', {'phase': 'volumes', 'last_id': 'a'}, 'volumes', phases)] == ['b', 'c']
+    assert remaining_items(items, 'Id', {'phase': 'snapshots', 'last_id': 'a'}, 'volumes', phases) == []
+    assert len(remaining_items(items, 'Id', {'phase': 'volumes', 'last_id': 'c'}, 'snapshots', phases)) == 3
+
+@mock_ec2
+@mock_cloudwatch
+def test_cost_optimizer_resumes_from_checkpoint(tmp_path):
+    """Test a scan cut off by the deadline resumes and converges without repeating work"""
+    ec2 = boto3.client('ec2', region_name='us-east-1')
+    for size in [10, 20, 30, 40, 50]:
+        ec2.create_volume(Size=size, VolumeType='gp2', AvailabilityZone='us-east-1a')
+    
+    event = {'checkpoint_location': str(tmp_path)}
+    
+    first = json.loads(lambda_handler(event, DeadlineContext(3))['body'])
+    assert first['volumes_optimized'] == 3
+    assert first['checkpoint']['complete'] is False
+    assert os.path.exists(tmp_path / 'cost_optimizer' / 'us-east-1.json')
+    
+    second = json.loads(lambda_handler(event, DeadlineContext(100000))['body'])
+    assert second['volumes_optimized'] == 5
+    assert second['estimated_savings'] == sum(size * 0.08 * 0.20 for size in [10, 20, 30, 40, 50])
+    assert second['checkpoint'] == {'complete': True, 'invocations': 2, 'completed_items': 0}
+    assert not os.path.exists(tmp_path / 'cost_optimizer' / 'us-east-1.json')
+
+def build_bucket():
+    """One bucket of 2,500 aged objects: three ListObjectsV2 pages"""
+    counts = {key: 0 for key in fleet_generator.DEFAULT_COUNTS}
+    counts.update({'buckets': 1, 'objects': 2500})
+    fleet_generator.generate_fleet(counts, seed=7, now=datetime(2024, 6, 1))
+
+def count_listings():
+    calls = []
+    boto3.setup_default_session(region_name='us-east-1')
+    boto3.DEFAULT_SESSION.events.register('before-parameter-build.s3.ListObjectsV2', lambda **kwargs: calls.append(kwargs['params']))
+    return calls
+
+@mock_s3
+def test_s3_lifecycle_resumes_bucket_listing_from_continuation_token(tmp_path):
+    """Test a bucket scan cut off between pages resumes from its continuation token"""
+    build_bucket()
+    calls = count_listings()
+    event = {'checkpoint_location': str(tmp_path)}
+    
+    # Deadline checks: one before the bucket, one after each page; the third check stops it
+    first = json.loads(s3_lifecycle_optimizer.lambda_handler(event, DeadlineContext(2))['body'])
+    
+    assert first['checkpoint']['complete'] is False
+    assert first['checkpoint']['cursor']['bucket'] == 'fleet-7-bucket-0000'
+    assert 'continuation_token' in first['checkpoint']['cursor']
+    assert len(calls) == 2
+    
+    second = json.loads(s3_lifecycle_optimizer.lambda_handler(event, DeadlineContext(100000))['body'])
+    
+    # Only the last page is listed again, starting from the stored token
+    assert len(calls) == 3
+    assert calls[2]['ContinuationToken'] == first['checkpoint']['cursor']['continuation_token']
+    assert second['checkpoint'] == {'complete': True, 'invocations': 2, 'completed_items': 1}
+    assert not os.path.exists(tmp_path / 's3_lifecycle_optimizer.json')
+    resumed = {key: second[key] for key in ['buckets_optimized', 'lifecycle_policies_created', 'estimated_savings']}
+    
+    with mock_s3():
+        build_bucket()
+        uninterrupted = json.loads(s3_lifecycle_optimizer.lambda_handler({}, DeadlineContext(100000))['body'])
+    
+    assert resumed['lifecycle_policies_created'] == 1
+    assert resumed == {key: uninterrupted[key] for key in resumed}
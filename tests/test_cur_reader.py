@@ -0,0 +1,159 @@
+import csv
+import gzip
+import io
+import json
+import boto3
+import numpy as np
+import pytest
+import sys
+import os
+from datetime import datetime, timedelta
+from moto import mock_s3
+
+# Add lambda functions to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda-functions'))
+
+from cur_reader import CurReader, ON_DEMAND_EC2, cost_by, cost_series, cost_series_by
+
+HEADER = [
+    'identity/LineItemId', 'bill/PayerAccountId', 'lineItem/UsageAccountId', 'lineItem/LineItemType',
+    'lineItem/UsageStartDate', 'lineItem/ProductCode', 'lineItem/UsageType', 'lineItem/ResourceId',
+    'lineItem/UsageAmount', 'lineItem/UnblendedCost', 'product/region', 'lineItem/LineItemDescription'
+]
+START = datetime(2024, 6, 1)
+
+def line_items(count, seed=3):
+    rng = np.random.default_rng(seed)
+    accounts = ['111111111111', '222222222222', '333333333333']
+    kinds = [
+        ('Usage', 'AmazonEC2', 'BoxUsage:m5.large'),
+        ('DiscountedUsage', 'AmazonEC2', 'BoxUsage:m5.large'),
+        ('Usage', 'AmazonEC2', 'EBS:VolumeUsage.gp3'),
+        ('Usage', 'AmazonS3', 'TimedStorage-ByteHrs'),
+        ('Tax', 'AmazonEC2', '')
+    ]
+    rows = []
+    for index in range(count):
+        line_item_type, product, usage_type = kinds[rng.integers(len(kinds))]
+        hour = START + timedelta(hours=int(rng.integers(24 * 30)))
+        rows.append([
+            f"li-{index}", '999999999999', accounts[rng.integers(3)], line_item_type,
+            hour.strftime('%Y-%m-%dT%H:%M:%SZ'), product, usage_type,
+            # Some cells need quoting, before and after the projected columns
+            f"i-{rng.integers(50):04d}" if index % 7 else 'arn:aws:s3:::bucket,"quoted"',
+            '' if line_item_type == 'Tax' else f"{rng.uniform(0, 2):.6f}", f"{rng.uniform(0, 1):.8f}", 'us-east-1',
+            'USD 0.096 per hour' if index % 5 else 'Tax for product code, "AmazonEC2"\nsecond line'
+        ])
+    return rows
+
+def write_report(rows):
+    text = io.StringIO()
+    writer = csv.writer(text)
+    writer.writerow(HEADER)
+    writer.writerows(rows)
+    return gzip.compress(text.getvalue().encode())
+
+def test_chunked_csv_matches_line_items(tmp_path):
+    """Test chunked decoding reproduces per-hour and per-account totals of the raw line items"""
+    rows = line_items(5000)
+    period = tmp_path / 'cur' / 'report' / '20240601-20240701'
+    period.mkdir(parents=True)
+    (period / 'report-00001.csv.gz').write_bytes(write_report(rows[:3000]))
+    (period / 'report-00002.csv.gz').write_bytes(write_report(rows[3000:]))
+    
+    end = START + timedelta(days=30)
+    reader = CurReader(str(tmp_path / 'cur'), START, end, chunk_rows=700)
+    hourly = cost_series(reader, START, end, where=ON_DEMAND_EC2)
+    
+    expected = np.zeros(24 * 30)
+    for row in rows:
+        if row[3] == 'Usage' and row[5] == 'AmazonEC2' and 'BoxUsage' in row[6]:
+            hour = int((datetime.strptime(row[4], '%Y-%m-%dT%H:%M:%SZ') - START).total_seconds() // 3600)
+            expected[hour] += float(row[9])
+    
+    assert np.allclose(hourly, expected)
+    assert reader.stats['files'] == 2
+    assert reader.stats['rows_kept'] == 5000
+    
+    middle = START + timedelta(days=15)
+    first, second = cost_by(CurReader(str(tmp_path / 'cur'), START, end, columns=('account',)), 'account', [(START, middle), (middle, end)])
+    for window, totals in [((START, middle), first), ((middle, end), second)]:
+        for account in ['111111111111', '222222222222', '333333333333']:
+            expected_cost = sum(
+                float(row[9]) for row in rows
+                if row[2] == account and window[0] <= datetime.strptime(row[4], '%Y-%m-%dT%H:%M:%SZ') < window[1]
+            )
+            assert np.isclose(totals[account], expected_cost)
+    
+    keys, daily = cost_series_by(CurReader(str(tmp_path / 'cur'), START, end, columns=('account',)), 'account', START, end, step_hours=24)
+    assert sorted(keys) == ['111111111111', '222222222222', '333333333333']
+    for account, series in zip(keys, daily):
+        expected = np.zeros(30)
+        for row in rows:
+            if row[2] == account:
+                expected[(datetime.strptime(row[4], '%Y-%m-%dT%H:%M:%SZ') - START).days] += float(row[9])
+        assert np.allclose(series, expected)
+
+def write_parquet(path, rows):
+    """The same line items as a CUR 2.0 Parquet file: typed timestamps, nullable usage"""
+    pa = pytest.importorskip('pyarrow')
+    pq = pytest.importorskip('pyarrow.parquet')
+    
+    columns = list(zip(*rows))
+    table = pa.table({
+        'line_item_usage_account_id': pa.array(columns[2]),
+        'line_item_line_item_type': pa.array(columns[3]).dictionary_encode(),
+        'line_item_usage_start_date': pa.array([datetime.strptime(value, '%Y-%m-%dT%H:%M:%SZ') for value in columns[4]], pa.timestamp('ms')),
+        'line_item_product_code': pa.array(columns[5]),
+        'line_item_usage_type': pa.array(columns[6]),
+        'line_item_resource_id': pa.array(columns[7]),
+        'line_item_usage_amount': pa.array([float(value) if value else None for value in columns[8]], pa.float64()),
+        'line_item_unblended_cost': pa.array([float(value) for value in columns[9]], pa.float64())
+    })
+    pq.write_table(table, path, row_group_size=1000)
+
+def test_parquet_matches_csv(tmp_path):
+    """Test a Parquet report decodes to the same series as the CSV export of the same line items"""
+    rows = line_items(3000, seed=5)
+    csv_period = tmp_path / 'csv' / '20240601-20240701'
+    csv_period.mkdir(parents=True)
+    (csv_period / 'report-00001.csv.gz').write_bytes(write_report(rows))
+    parquet_period = tmp_path / 'parquet' / 'BILLING_PERIOD=2024-06'
+    parquet_period.mkdir(parents=True)
+    write_parquet(str(parquet_period / 'report-00001.snappy.parquet'), rows)
+    
+    end = START + timedelta(days=30)
+    from_parquet = CurReader(str(tmp_path / 'parquet'), START, end, chunk_rows=700)
+    hourly = cost_series(from_parquet, START, end, where=ON_DEMAND_EC2)
+    assert from_parquet.stats['files'] == 1 and from_parquet.stats['errors'] == 0
+    assert from_parquet.stats['rows_kept'] == 3000
+    assert np.allclose(hourly, cost_series(CurReader(str(tmp_path / 'csv'), START, end), START, end, where=ON_DEMAND_EC2))
+    
+    usage = cost_series(CurReader(str(tmp_path / 'parquet'), START, end), START, end, step_hours=24, value='usage')
+    assert np.isclose(usage.sum(), sum(float(row[8] or 0) for row in rows))
+    
+    keys, daily = cost_series_by(CurReader(str(tmp_path / 'parquet'), START, end, columns=('account',)), 'account', START, end, step_hours=24)
+    csv_keys, csv_daily = cost_series_by(CurReader(str(tmp_path / 'csv'), START, end, columns=('account',)), 'account', START, end, step_hours=24)
+    assert dict(zip(keys, daily.sum(axis=1).round(6))) == dict(zip(csv_keys, csv_daily.sum(axis=1).round(6)))
+
+@mock_s3
+def test_superseded_assemblies_are_skipped():
+    """Test only the files listed in the period manifest are read from S3"""
+    s3 = boto3.client('s3', region_name='us-east-1')
+    s3.create_bucket(Bucket='billing')
+    rows = line_items(200)
+    prefix = 'cur/report/20240601-20240701'
+    s3.put_object(Bucket='billing', Key=f"{prefix}/old-assembly/report-00001.csv.gz", Body=write_report(rows))
+    s3.put_object(Bucket='billing', Key=f"{prefix}/new-assembly/report-00001.csv.gz", Body=write_report(rows[:100]))
+    s3.put_object(Bucket='billing', Key=f"{prefix}/report-Manifest.json", Body=json.dumps({
+        'reportKeys': [f"{prefix}/new-assembly/report-00001.csv.gz"]
+    }))
+    # A period outside the requested window is never listed for reading
+    s3.put_object(Bucket='billing', Key='cur/report/20240501-20240601/report-00001.csv.gz', Body=write_report(rows))
+    
+    end = START + timedelta(days=30)
+    reader = CurReader('s3://billing/cur', START, end)
+    daily = cost_series(reader, START, end, step_hours=24)
+    
+    assert reader.stats['files'] == 1
+    assert np.isclose(daily.sum(), sum(float(row[9]) for row in rows[:100]))
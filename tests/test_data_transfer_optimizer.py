@@ -0,0 +1,173 @@
+import json
+import boto3
+import sys
+import os
+from datetime import datetime, timedelta
+from moto import mock_ec2, mock_elbv2, mock_cloudwatch, mock_cloudfront
+
+# Add lambda functions to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda-functions'))
+
+import data_transfer_optimizer
+from data_transfer_optimizer import lambda_handler, nat_gateway_traffic
+
+GB = 1024 ** 3
+
+def put_nat_traffic(cloudwatch, nat_id, gb_in, gb_back):
+    # moto leaves out datapoints stamped exactly at the query's end time
+    timestamp = datetime.utcnow() - timedelta(hours=1)
+    cloudwatch.put_metric_data(Namespace='AWS/NATGateway', MetricData=[
+        {
+            'MetricName': metric,
+            'Dimensions': [{'Name': 'NatGatewayId', 'Value': nat_id}],
+            'Timestamp': timestamp,
+            'Value': gb * GB,
+            'Unit': 'Bytes'
+        }
+        for metric, gb in [('BytesInFromSource', gb_in), ('BytesOutToDestination', gb_in), ('BytesInFromDestination', gb_back)]
+    ])
+
+@mock_cloudwatch
+def test_metrics_for_many_gateways_are_batched(monkeypatch):
+    """Test gateway metrics are fetched in query batches rather than per gateway"""
+    # moto cannot parse 10+ queries in one request; the real limit is 500
+    monkeypatch.setattr(data_transfer_optimizer, 'METRIC_QUERIES_PER_REQUEST', 9)
+    cloudwatch = boto3.client('cloudwatch', region_name='us-east-1')
+    nat_ids = [f"nat-{index:017x}" for index in range(12)]
+    for index, nat_id in enumerate(nat_ids[:5]):
+        put_nat_traffic(cloudwatch, nat_id, index + 1, 1)
+    
+    calls = []
+    cloudwatch.meta.events.register('before-call.cloudwatch.GetMetricData', lambda **kwargs: calls.append(1))
+    traffic = nat_gateway_traffic(cloudwatch, nat_ids)
+    
+    # 12 gateways x 3 metrics in batches of 9
+    assert len(calls) == 4
+    assert traffic[nat_ids[2]]['BytesInFromSource'] == 3 * GB
+    assert traffic[nat_ids[2]]['BytesInFromDestination'] == 1 * GB
+    assert traffic[nat_ids[11]]['BytesInFromSource'] == 0
+
+@mock_ec2
+@mock_elbv2
+@mock_cloudwatch
+@mock_cloudfront
+def test_endpoints_ranked_by_traffic_removed():
+    """Test NAT cost comes from processed bytes and endpoints are ranked by net saving"""
+    ec2 = boto3.client('ec2', region_name='us-east-1')
+    cloudwatch = boto3.client('cloudwatch', region_name='us-east-1')
+    vpc_id = ec2.create_vpc(CidrBlock='10.0.0.0/16')['Vpc']['VpcId']
+    subnet_id = ec2.create_subnet(VpcId=vpc_id, CidrBlock='10.0.1.0/24')['Subnet']['SubnetId']
+    allocation_id = ec2.allocate_address(Domain='vpc')['AllocationId']
+    nat_id = ec2.create_nat_gateway(SubnetId=subnet_id, AllocationId=allocation_id)['NatGateway']['NatGatewayId']
+    ec2.create_vpc_endpoint(VpcId=vpc_id, ServiceName='com.amazonaws.us-east-1.dynamodb', VpcEndpointType='Gateway')
+    # 14 days of metrics holding 7,000 GB processed: 15,642 GB scaled to a 730-hour month
+    put_nat_traffic(cloudwatch, nat_id, 6000, 1000)
+    
+    body = json.loads(lambda_handler({}, None)['body'])
+    
+    gateway = body['nat_gateway_optimization'][0]
+    assert gateway['nat_gateway_id'] == nat_id
+    assert gateway['processed_gb'] == 7000
+    assert gateway['monthly_processed_gb'] == round(7000 * 730 / 336, 3)
+    assert gateway['monthly_cost'] == round(0.045 * 730 + 7000 * 730 / 336 * 0.045, 2)
+    
+    recommendation = body['vpc_endpoint_recommendations'][0]
+    endpoints = [endpoint['service'] for endpoint in recommendation['recommended_endpoints']]
+    # DynamoDB already has an endpoint; the free S3 gateway endpoint removes the most
+    assert 'DYNAMODB' not in endpoints
+    assert endpoints[0] == 'S3'
+    savings = [endpoint['monthly_savings'] for endpoint in recommendation['recommended_endpoints']]
+    assert savings == sorted(savings, reverse=True)
+    assert recommendation['potential_savings'] == round(sum(savings), 2)
+
+def test_only_endpoint_service_ranges_are_measured():
+    """Test S3 and DynamoDB shares come from flow logs while EC2 instance traffic leaves 'ec2' assumed"""
+    flow_summary = {
+        'by_transfer_type': {
+            'internet': {'gb': 100.0},
+            'aws_service_same_region': {'gb': 300.0},
+            'aws_service_cross_region': {'gb': 0.0}
+        },
+        'by_service_gb': {'S3': 200.0, 'DYNAMODB': 20.0, 'EC2': 80.0}
+    }
+    
+    shares = data_transfer_optimizer.endpoint_traffic_shares(flow_summary)
+    
+    assert shares['s3'] == (0.5, 'measured')
+    assert shares['dynamodb'] == (0.05, 'measured')
+    assert shares['ec2'] == (data_transfer_optimizer.ENDPOINT_TRAFFIC_SHARE['ec2'], 'assumed')
+
+@mock_ec2
+@mock_elbv2
+@mock_cloudwatch
+@mock_cloudfront
+def test_endpoint_lookups_do_not_grow_with_gateways(monkeypatch):
+    """Test gateways sharing VPCs are checked against one paginated endpoint listing"""
+    monkeypatch.setattr(data_transfer_optimizer, 'METRIC_QUERIES_PER_REQUEST', 9)
+    ec2 = boto3.client('ec2', region_name='us-east-1')
+    nat_ids = []
+    for vpc_index in range(2):
+        vpc_id = ec2.create_vpc(CidrBlock=f"10.{vpc_index}.0.0/16")['Vpc']['VpcId']
+        if vpc_index == 0:
+            ec2.create_vpc_endpoint(VpcId=vpc_id, ServiceName='com.amazonaws.us-east-1.s3', VpcEndpointType='Gateway')
+        for subnet_index in range(3):
+            subnet_id = ec2.create_subnet(VpcId=vpc_id, CidrBlock=f"10.{vpc_index}.{subnet_index}.0/24")['Subnet']['SubnetId']
+            allocation_id = ec2.allocate_address(Domain='vpc')['AllocationId']
+            nat_ids.append(ec2.create_nat_gateway(SubnetId=subnet_id, AllocationId=allocation_id)['NatGateway']['NatGatewayId'])
+    for nat_id in nat_ids:
+        put_nat_traffic(boto3.client('cloudwatch', region_name='us-east-1'), nat_id, 5000, 500)
+    
+    calls = []
+    def count(event_name, **kwargs):
+        calls.append(event_name.split('.')[-1])
+    
+    original_client = boto3.client
+    def counted_client(*args, **kwargs):
+        client = original_client(*args, **kwargs)
+        client.meta.events.register('before-call.ec2', count)
+        return client
+    
+    monkeypatch.setattr(boto3, 'client', counted_client)
+    body = json.loads(lambda_handler({}, None)['body'])
+    
+    assert calls.count('DescribeVpcEndpoints') == 1
+    assert len(body['nat_gateway_optimization']) == 6
+    recommendations = {recommendation['nat_gateway_id']: recommendation for recommendation in body['vpc_endpoint_recommendations']}
+    for nat_id in nat_ids[:3]:
+        assert 'S3' not in [endpoint['service'] for endpoint in recommendations[nat_id]['recommended_endpoints']]
+    for nat_id in nat_ids[3:]:
+        assert recommendations[nat_id]['recommended_endpoints'][0]['service'] == 'S3'
+
+@mock_ec2
+@mock_elbv2
+@mock_cloudwatch
+@mock_cloudfront
+def test_load_balancers_matched_to_cloudfront_origins():
+    """Test only load balancers no distribution uses as an origin are flagged"""
+    ec2 = boto3.client('ec2', region_name='us-east-1')
+    elbv2 = boto3.client('elbv2', region_name='us-east-1')
+    cloudfront = boto3.client('cloudfront', region_name='us-east-1')
+    vpc_id = ec2.create_vpc(CidrBlock='10.0.0.0/16')['Vpc']['VpcId']
+    subnets = [
+        ec2.create_subnet(VpcId=vpc_id, CidrBlock=f"10.0.{index}.0/24", AvailabilityZone=f"us-east-1{zone}")['Subnet']['SubnetId']
+        for index, zone in enumerate('ab')
+    ]
+    dns_names = [
+        elbv2.create_load_balancer(Name=f"web-{index}", Subnets=subnets)['LoadBalancers'][0]['DNSName']
+        for index in range(3)
+    ]
+    # Origins as they are often written: dualstack prefix, upper case, trailing dot
+    for index, domain in enumerate([f"dualstack.{dns_names[0]}", f"{dns_names[1].upper()}.", 'assets.s3.amazonaws.com']):
+        cloudfront.create_distribution(DistributionConfig={
+            'CallerReference': f"ref-{index}",
+            'Comment': '',
+            'Enabled': True,
+            'Origins': {'Quantity': 1, 'Items': [{'Id': 'origin', 'DomainName': domain, 'CustomOriginConfig': {
+                'HTTPPort': 80, 'HTTPSPort': 443, 'OriginProtocolPolicy': 'https-only'
+            }}]},
+            'DefaultCacheBehavior': {'TargetOriginId': 'origin', 'ViewerProtocolPolicy': 'allow-all'}
+        })
+    
+    body = json.loads(lambda_handler({}, None)['body'])
+    
+    assert [opportunity['dns_name'] for opportunity in body['cloudfront_opportunities']] == [dns_names[2]]
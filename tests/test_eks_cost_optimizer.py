@@ -0,0 +1,74 @@
+import boto3
+import json
+import sys
+import os
+from moto import mock_eks
+
+# Add lambda functions to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda-functions'))
+
+import eks_cost_optimizer
+import rate_limiter
+from eks_cost_optimizer import lambda_handler
+from k8s_inventory import Inventory
+
+ROLE_ARN = 'arn:aws:iam::123456789012:role/eks'
+
+@mock_eks
+def test_clusters_are_paged_analyzed_concurrently_and_merged_in_order(monkeypatch):
+    """Test every page of clusters and node groups is analyzed and the merge is independent of workers"""
+    # The fallback limit would pace 200+ describe calls over many seconds
+    monkeypatch.setitem(rate_limiter.LIMITS, ('eks', '*'), (1000, 1000))
+    rate_limiter.reset()
+    # Pod analysis needs a reachable cluster API; see test_k8s_inventory
+    monkeypatch.setattr(eks_cost_optimizer, 'POD_ANALYSIS', False)
+    eks = boto3.client('eks', region_name='us-east-1')
+    # More clusters than list_clusters returns on one page
+    for index in range(105):
+        eks.create_cluster(
+            name=f"cluster-{index:03d}", version='1.27', roleArn=ROLE_ARN,
+            resourcesVpcConfig={'subnetIds': ['subnet-1']}
+        )
+    for index in range(3):
+        for size, instance_type in [(2, 'm5.large'), (3, 'c5.large')]:
+            eks.create_nodegroup(
+                clusterName=f"cluster-{index:03d}", nodegroupName=f"ng-{instance_type}", nodeRole=ROLE_ARN,
+                subnets=['subnet-1'], instanceTypes=[instance_type],
+                scalingConfig={'minSize': 1, 'maxSize': size, 'desiredSize': size}
+            )
+    
+    serial = json.loads(lambda_handler({'max_workers': 1}, None)['body'])
+    concurrent = json.loads(lambda_handler({'max_workers': 8}, None)['body'])
+    
+    assert serial == concurrent
+    assert [cluster['cluster_name'] for cluster in serial['cluster_analysis']] == [f"cluster-{index:03d}" for index in range(105)]
+    assert serial['cluster_analysis'][0]['node_count'] == 5
+    assert serial['cluster_analysis'][0]['node_cost'] == round((2 * 0.096 + 3 * 0.085) * 24 * 30, 2)
+    assert [(item['cluster_name'], item['nodegroup_name']) for item in serial['node_group_optimization']] == [
+        (f"cluster-{index:03d}", name) for index in range(3) for name in ['ng-c5.large', 'ng-m5.large']
+    ]
+    assert 'errors' not in serial
+
+def test_pod_analysis_from_inventory():
+    """Test nodes mostly unclaimed by requests and pods without requests are reported"""
+    inventory = Inventory({
+        'nodes': {
+            name: {'name': name, 'nodegroup': 'general', 'instance_type': 'm5.large', 'cpu_allocatable': 2.0, 'memory_allocatable': 8e9}
+            for name in ['busy', 'idle']
+        },
+        'pods': {
+            'web/a': {'namespace': 'web', 'node': 'busy', 'phase': 'Running', 'cpu_request': 1.5, 'memory_request': 1e9},
+            'web/b': {'namespace': 'web', 'node': 'idle', 'phase': 'Running', 'cpu_request': 0.2, 'memory_request': 1e9},
+            'batch/c': {'namespace': 'batch', 'node': 'idle', 'phase': 'Running', 'cpu_request': 0.0, 'memory_request': 0.0},
+            'batch/d': {'namespace': 'batch', 'node': 'busy', 'phase': 'Succeeded', 'cpu_request': 0.0, 'memory_request': 0.0}
+        }
+    })
+    
+    findings = eks_cost_optimizer.analyze_pod_resources('prod', inventory)
+    
+    assert [(finding['type'], finding.get('node') or finding.get('namespace')) for finding in findings] == [
+        ('LOW_REQUEST_UTILIZATION', 'idle'),
+        ('MISSING_REQUESTS', 'batch')
+    ]
+    assert findings[0]['cpu_requested'] == '10.0%'
+    assert findings[1]['pods'] == 1
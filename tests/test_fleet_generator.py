@@ -0,0 +1,73 @@
+import boto3
+import sys
+import os
+from datetime import datetime
+from moto import mock_ec2, mock_elbv2, mock_s3, mock_cloudwatch
+
+# Add scripts to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from fleet_generator import generate_fleet
+
+SMALL_FLEET = {
+    'instances': 200,
+    'volumes': 300,
+    'snapshots': 100,
+    'security_groups': 20,
+    'network_interfaces': 20,
+    'load_balancers': 3,
+    'buckets': 2,
+    'objects': 50,
+    'metric_days': 1
+}
+
+NOW = datetime(2024, 6, 1, 12, 0)
+
+def build_and_describe(seed):
+    with mock_ec2(), mock_elbv2(), mock_s3(), mock_cloudwatch():
+        summary = generate_fleet(SMALL_FLEET, seed=seed, now=NOW)
+        ec2 = boto3.client('ec2', region_name='us-east-1')
+        
+        instances = [
+            instance
+            for page in ec2.get_paginator('describe_instances').paginate()
+            for reservation in page['Reservations']
+            for instance in reservation['Instances']
+        ]
+        volumes = [volume for page in ec2.get_paginator('describe_volumes').paginate() for volume in page['Volumes']]
+        objects = boto3.client('s3').list_objects_v2(Bucket=f"fleet-{seed}-bucket-0000")
+        datapoints = boto3.client('cloudwatch').get_metric_statistics(
+            Namespace='AWS/EC2',
+            MetricName='CPUUtilization',
+            Dimensions=[{'Name': 'InstanceId', 'Value': next(i['InstanceId'] for i in instances if i['State']['Name'] == 'running')}],
+            StartTime=instances[0]['LaunchTime'].replace(year=2000),
+            EndTime=instances[0]['LaunchTime'].replace(year=2100),
+            Period=3600,
+            Statistics=['Average']
+        )['Datapoints']
+    
+    return summary, instances, volumes, objects, datapoints
+
+def test_generated_fleet_is_visible_through_the_api():
+    """Test bulk-inserted resources look like API-created ones"""
+    summary, instances, volumes, objects, datapoints = build_and_describe(seed=7)
+    
+    assert len(instances) == summary['instances'] == 200
+    assert len(volumes) == summary['volumes']
+    assert {'gp2', 'gp3'} <= {volume['VolumeType'] for volume in volumes}
+    assert any(volume['State'] == 'available' for volume in volumes)
+    assert any(instance.get('Tags') for instance in instances)
+    assert any(instance['State']['Name'] == 'stopped' for instance in instances)
+    assert objects['KeyCount'] > 0 and all(obj['Size'] > 0 for obj in objects['Contents'])
+    assert len(datapoints) == 24
+
+def test_same_seed_builds_the_same_fleet():
+    """Test fleets are reproducible from the seed"""
+    first = build_and_describe(seed=3)
+    second = build_and_describe(seed=3)
+    
+    def fingerprint(instances):
+        return sorted((i['InstanceId'], i['InstanceType'], i['State']['Name'], str(i['LaunchTime'])) for i in instances)
+    
+    assert fingerprint(first[1]) == fingerprint(second[1])
+    assert sorted(v['VolumeId'] for v in first[2]) == sorted(v['VolumeId'] for v in second[2])
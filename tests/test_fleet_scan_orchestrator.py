@@ -0,0 +1,220 @@
+import importlib
+import json
+import boto3
+import sys
+import os
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from botocore.exceptions import ClientError
+from moto import mock_autoscaling, mock_cloudfront, mock_cloudwatch, mock_ec2, mock_elbv2, mock_sts
+
+# Add lambda functions to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda-functions'))
+
+import fleet_inventory
+import fleet_scan_orchestrator
+
+REGION = 'us-east-1'
+MOCKS = [mock_ec2, mock_elbv2, mock_autoscaling, mock_cloudwatch, mock_cloudfront, mock_sts]
+
+def mocked():
+    stack = ExitStack()
+    for mock in MOCKS:
+        stack.enter_context(mock())
+    return stack
+
+def build_fleet():
+    """A small fleet every stage has something to find in"""
+    ec2 = boto3.client('ec2', region_name=REGION)
+    used_group = ec2.create_security_group(GroupName='web', Description='web')['GroupId']
+    ec2.create_security_group(GroupName='stale', Description='stale')
+    
+    instances = ec2.run_instances(
+        ImageId='ami-12345678', MinCount=2, MaxCount=2, InstanceType='t3.large',
+        SecurityGroupIds=[used_group],
+        TagSpecifications=[{'ResourceType': 'instance', 'Tags': [{'Key': 'Environment', 'Value': 'dev'}]}]
+    )['Instances']
+    boto3.client('cloudwatch', region_name=REGION).put_metric_data(
+        Namespace='AWS/EC2',
+        MetricData=[
+            {
+                'MetricName': 'CPUUtilization',
+                'Dimensions': [{'Name': 'InstanceId', 'Value': instances[0]['InstanceId']}],
+                'Timestamp': datetime.utcnow() - timedelta(hours=hours),
+                'Value': 5.0
+            }
+            for hours in range(1, 4)
+        ]
+    )
+    
+    ec2.create_volume(Size=100, VolumeType='gp2', AvailabilityZone='us-east-1a')
+    ec2.create_volume(Size=50, VolumeType='gp3', AvailabilityZone='us-east-1a')
+    ec2.allocate_address(Domain='vpc')
+    
+    subnet = ec2.describe_subnets()['Subnets'][0]
+    allocation = ec2.allocate_address(Domain='vpc')
+    ec2.create_nat_gateway(SubnetId=subnet['SubnetId'], AllocationId=allocation['AllocationId'])
+
+def handler_and_stage(stage):
+    """(standalone handler result, orchestrator stage result) on two identical fresh fleets"""
+    with mocked():
+        build_fleet()
+        handler_result = json.loads(importlib.import_module(stage).lambda_handler({}, None)['body'])
+    
+    with mocked():
+        build_fleet()
+        clients = fleet_inventory.create_clients(REGION)
+        inventory = fleet_inventory.collect_inventory(clients)
+        stage_result = json.loads(json.dumps(fleet_scan_orchestrator.run_stage(stage, inventory, clients), default=str))
+    
+    return handler_result, stage_result
+
+def without(items, *keys):
+    # Resource IDs differ between the two fleets
+    return [{key: value for key, value in item.items() if key not in keys} for item in items]
+
+def test_cost_optimizer_stage_matches_handler():
+    """Test the gp2 conversion finds the same volumes from the shared inventory"""
+    handler_result, stage_result = handler_and_stage('cost_optimizer')
+    
+    # The 100 GB volume plus both instances' 8 GB gp2 root volumes
+    assert handler_result['volumes_optimized'] == stage_result['volumes_optimized'] == 3
+    assert handler_result['snapshots_deleted'] == stage_result['snapshots_deleted'] == 0
+    assert round(handler_result['estimated_savings'], 3) == round(stage_result['estimated_savings'], 3) == 1.856
+
+def test_ec2_rightsizing_stage_matches_handler():
+    """Test the idle instance gets the same downsizing recommendation either way"""
+    handler_result, stage_result = handler_and_stage('ec2_rightsizing')
+    
+    assert without(handler_result['underutilized_instances'], 'instance_id') == \
+        without(stage_result['underutilized_instances'], 'instance_id') == \
+        [{'current_type': 't3.large', 'recommended_type': 't3.medium', 'avg_cpu': 5.0, 'monthly_savings': 29.95}]
+    assert handler_result['potential_savings'] == stage_result['potential_savings']
+
+def test_spot_optimizer_stage_matches_handler():
+    """Test both dev instances are Spot candidates either way"""
+    handler_result, stage_result = handler_and_stage('spot_optimizer')
+    
+    assert len(handler_result['spot_opportunities']) == len(stage_result['spot_opportunities']) == 2
+    assert without(handler_result['spot_opportunities'], 'instance_id') == without(stage_result['spot_opportunities'], 'instance_id')
+    assert handler_result['potential_savings'] == stage_result['potential_savings']
+
+def test_unused_resources_cleanup_stage_matches_handler():
+    """Test the same security group and Elastic IP are cleaned up either way"""
+    handler_result, stage_result = handler_and_stage('unused_resources_cleanup')
+    
+    for key in ['unused_security_groups', 'unattached_eips', 'unused_load_balancers', 'estimated_savings']:
+        assert handler_result[key] == stage_result[key], key
+    assert handler_result['unused_security_groups'] == 1
+    assert 'skipped' not in stage_result
+
+def test_data_transfer_optimizer_stage_matches_handler():
+    """Test the NAT Gateway is priced and given the same endpoint ranking either way"""
+    handler_result, stage_result = handler_and_stage('data_transfer_optimizer')
+    
+    assert without(handler_result['nat_gateway_optimization'], 'nat_gateway_id', 'vpc_id') == \
+        without(stage_result['nat_gateway_optimization'], 'nat_gateway_id', 'vpc_id')
+    assert len(stage_result['nat_gateway_optimization']) == 1
+    assert without(handler_result['vpc_endpoint_recommendations'], 'nat_gateway_id', 'vpc_id') == \
+        without(stage_result['vpc_endpoint_recommendations'], 'nat_gateway_id', 'vpc_id')
+
+def deny(operation):
+    def handler(**kwargs):
+        raise ClientError({'Error': {'Code': 'UnauthorizedOperation', 'Message': 'denied'}}, operation)
+    return handler
+
+@mock_ec2
+def test_failed_volume_listing_skips_snapshot_cleanup():
+    """Test snapshots are not deleted as orphans when the volume listing failed"""
+    ec2 = boto3.client('ec2', region_name=REGION)
+    volume = ec2.create_volume(Size=10, VolumeType='gp3', AvailabilityZone='us-east-1a')
+    snapshot = ec2.create_snapshot(VolumeId=volume['VolumeId'])
+    
+    clients = {'ec2': ec2}
+    ec2.meta.events.register('before-call.ec2.DescribeVolumes', deny('DescribeVolumes'))
+    inventory = fleet_inventory.collect_inventory(clients, ['volumes', 'snapshots'])
+    for item in inventory['snapshots']:
+        item['StartTime'] = datetime.now() - timedelta(days=60)
+    
+    assert 'volumes' in inventory['errors']
+    result = fleet_scan_orchestrator.run_stage('cost_optimizer', inventory, clients)
+    
+    assert result['snapshots_deleted'] == 0
+    assert 'volume listing failed' in result['skipped']['snapshots']
+    assert len(ec2.describe_snapshots(SnapshotIds=[snapshot['SnapshotId']])['Snapshots']) == 1
+    
+    # The same snapshot goes once its volume is really gone and the listing succeeds
+    ec2.delete_volume(VolumeId=volume['VolumeId'])
+    inventory = fleet_inventory.collect_inventory({'ec2': boto3.client('ec2', region_name=REGION)}, ['volumes', 'snapshots'])
+    for item in inventory['snapshots']:
+        item['StartTime'] = datetime.now() - timedelta(days=60)
+    
+    result = fleet_scan_orchestrator.run_stage('cost_optimizer', inventory, clients)
+    
+    assert result['snapshots_deleted'] == 1
+    assert 'skipped' not in result
+
+@mock_ec2
+@mock_elbv2
+def test_failed_instance_listing_skips_security_group_cleanup():
+    """Test security groups are not deleted as unused when the instance listing failed"""
+    ec2 = boto3.client('ec2', region_name=REGION)
+    group = ec2.create_security_group(GroupName='web', Description='web')['GroupId']
+    ec2.run_instances(ImageId='ami-12345678', MinCount=1, MaxCount=1, SecurityGroupIds=[group])
+    
+    clients = fleet_inventory.create_clients(REGION)
+    clients['ec2'].meta.events.register('before-call.ec2.DescribeInstances', deny('DescribeInstances'))
+    inventory = fleet_inventory.collect_inventory(clients, ['instances', 'security_groups', 'addresses', 'load_balancers'])
+    
+    result = fleet_scan_orchestrator.run_stage('unused_resources_cleanup', inventory, clients)
+    
+    assert result['unused_security_groups'] == 0
+    assert 'instance listing failed' in result['skipped']['security_groups']
+    assert group in [sg['GroupId'] for sg in ec2.describe_security_groups()['SecurityGroups']]
+
+def test_orchestrator_report_totals_stage_savings():
+    """Test one scan lists the region once and totals every stage's savings"""
+    with mocked():
+        build_fleet()
+        response = fleet_scan_orchestrator.lambda_handler({'regions': [REGION]}, None)
+    
+    assert response['statusCode'] == 200
+    report = json.loads(response['body'])
+    region = report['regions'][REGION]
+    
+    assert region['inventory_errors'] == {}
+    assert region['inventory']['instances'] == 2
+    assert region['inventory']['volumes'] == 4
+    for stage, (_, savings_key) in fleet_scan_orchestrator.STAGES.items():
+        assert 'error' not in region[stage], stage
+        assert report['savings_by_stage'][stage] == region[stage][savings_key]
+    assert report['total_monthly_savings'] == round(sum(report['savings_by_stage'].values()), 2)
+    # Without flow logs cross-region transfer is listed as unmeasured and priced at nothing
+    assert [(entry['region'], entry['measured'], entry['potential_savings']) for entry in report['cross_region_analysis']] == [(REGION, False, 0)]
+
+def test_orchestrator_prices_cross_region_from_flow_logs(tmp_path, monkeypatch):
+    """Test measured cross-region transfer, not an instance count, feeds the data transfer savings"""
+    monkeypatch.setattr(fleet_scan_orchestrator.data_transfer_optimizer.flow_log_analyzer, 'IP_RANGES_SOURCE', '')
+    with mocked():
+        ec2 = boto3.client('ec2', region_name=REGION)
+        local = ec2.create_network_interface(SubnetId=ec2.describe_subnets()['Subnets'][0]['SubnetId'])['NetworkInterface']
+        remote_ec2 = boto3.client('ec2', region_name='eu-west-1')
+        remote = remote_ec2.create_network_interface(SubnetId=remote_ec2.describe_subnets()['Subnets'][0]['SubnetId'])['NetworkInterface']
+        (tmp_path / 'flows.log').write_text(
+            'version account-id interface-id srcaddr dstaddr srcport dstport protocol packets bytes start end action log-status\n'
+            f"2 111122223333 {local['NetworkInterfaceId']} {local['PrivateIpAddress']} {remote['PrivateIpAddress']} "
+            f"443 49152 6 10 {50 * 1024 ** 3} 1700000000 1700086400 ACCEPT OK\n"
+        )
+        
+        response = fleet_scan_orchestrator.lambda_handler({
+            'regions': [REGION, 'eu-west-1'],
+            'stages': ['data_transfer_optimizer'],
+            'flow_log_location': str(tmp_path)
+        }, None)
+    
+    report = json.loads(response['body'])
+    # 50 GB in one day at $0.02/GB, scaled to a 30-day month
+    assert report['cross_region_analysis'][0]['source_region'] == REGION
+    assert report['cross_region_analysis'][0]['monthly_cost'] == 30.0
+    regional = sum(report['regions'][region]['data_transfer_optimizer']['potential_savings'] for region in [REGION, 'eu-west-1'])
+    assert report['savings_by_stage']['data_transfer_optimizer'] == regional + 30.0
@@ -0,0 +1,138 @@
+import gzip
+import json
+import boto3
+import sys
+import os
+from moto import mock_ec2, mock_elbv2, mock_cloudfront
+
+# Add lambda functions to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda-functions'))
+
+import flow_log_analyzer
+from flow_log_analyzer import LocationIndex, analyze_flow_logs
+
+HEADER = 'version account-id interface-id srcaddr dstaddr srcport dstport protocol packets bytes start end action log-status'
+GB = 1024 ** 3
+
+def flow(eni, src, dst, size, action='ACCEPT', status='OK'):
+    return f"2 111122223333 {eni} {src} {dst} 443 49152 6 10 {size} 1700000000 1700003600 {action} {status}"
+
+def build_index():
+    index = LocationIndex()
+    index.add_network_interface({'NetworkInterfaceId': 'eni-a', 'AvailabilityZone': 'us-east-1a', 'PrivateIpAddress': '10.0.1.10'})
+    index.add_network_interface({'NetworkInterfaceId': 'eni-b', 'AvailabilityZone': 'us-east-1b', 'PrivateIpAddress': '10.0.2.20'})
+    index.add_network_interface({'NetworkInterfaceId': 'eni-c', 'AvailabilityZone': 'eu-west-1a', 'PrivateIpAddress': '10.1.1.30'})
+    index.add_service_ranges({'prefixes': [
+        {'ip_prefix': '52.216.0.0/15', 'region': 'us-east-1', 'service': 'S3'},
+        {'ip_prefix': '52.0.0.0/8', 'region': 'us-east-1', 'service': 'AMAZON'}
+    ]})
+    return index
+
+def test_flow_logs_priced_by_transfer_type(tmp_path):
+    """Test egress records are attributed by AZ, region and service, and counted once"""
+    lines = [
+        HEADER,
+        flow('eni-a', '10.0.1.10', '10.0.2.20', 4 * GB),       # cross-AZ egress
+        flow('eni-b', '10.0.1.10', '10.0.2.20', 4 * GB),       # same flow seen at the receiver
+        flow('eni-a', '10.0.1.10', '10.1.1.30', 2 * GB),       # cross-region
+        flow('eni-a', '10.0.1.10', '52.216.10.1', 8 * GB),     # S3 in-region
+        flow('eni-b', '10.0.2.20', '8.8.8.8', 1 * GB),         # internet
+        flow('eni-b', '10.0.2.20', '8.8.4.4', 1 * GB, action='REJECT'),
+        '2 111122223333 eni-b - - - - - - - 1700000000 1700003600 - NODATA'
+    ]
+    log_dir = tmp_path / 'AWSLogs' / '111122223333' / 'vpcflowlogs' / 'us-east-1'
+    log_dir.mkdir(parents=True)
+    with gzip.open(log_dir / 'flows.log.gz', 'wt') as f:
+        f.write('\n'.join(lines) + '\n')
+    
+    summary = analyze_flow_logs(str(tmp_path), build_index())
+    by_type = summary['by_transfer_type']
+    
+    assert summary['files'] == 1
+    assert summary['records'] == 7
+    assert summary['records_skipped'] == 2
+    assert summary['records_counted'] == 4
+    assert by_type['cross_az']['gb'] == 4 and by_type['cross_az']['cost'] == 0.08
+    assert by_type['cross_region']['gb'] == 2
+    assert by_type['aws_service_same_region']['gb'] == 8 and by_type['aws_service_same_region']['cost'] == 0
+    assert by_type['internet']['cost'] == 0.09
+    assert summary['by_region_pair'][0]['destination_region'] == 'eu-west-1'
+    # One hour of logs scaled to a 30-day month
+    assert summary['monthly_cost'] == round(summary['total_cost'] * 720, 2)
+    assert {flow['dst_service'] for flow in summary['top_flows']} == {'vpc', 'S3', 'internet'}
+
+def test_nested_service_prefixes_resolve_to_most_specific():
+    """Test an address inside a broad prefix is not lost to a nested narrower prefix sorted after it"""
+    index = LocationIndex()
+    index.add_service_ranges({'prefixes': [
+        {'ip_prefix': '18.204.0.0/14', 'region': 'us-east-1', 'service': 'EC2'},
+        {'ip_prefix': '18.206.107.24/29', 'region': 'us-east-1', 'service': 'EC2_INSTANCE_CONNECT'},
+        {'ip_prefix': '18.206.107.28/30', 'region': 'us-east-1', 'service': 'ROUTE53_HEALTHCHECKS'},
+        {'ip_prefix': '18.208.0.0/13', 'region': 'us-east-1', 'service': 'S3'}
+    ]})
+    
+    addresses = [b'18.206.200.1', b'18.206.107.25', b'18.206.107.29', b'18.206.107.32', b'18.204.0.0', b'18.211.0.1', b'18.216.0.1']
+    _, places = index.classify(addresses)
+    
+    assert [index.places[place] for place in places] == [
+        'EC2@us-east-1', 'EC2_INSTANCE_CONNECT@us-east-1', 'ROUTE53_HEALTHCHECKS@us-east-1',
+        'EC2@us-east-1', 'EC2@us-east-1', 'S3@us-east-1', 'internet'
+    ]
+    # Intervals partition the address space they cover, in order
+    assert all(index.range_ends[:-1] < index.range_starts[1:])
+
+def test_unindexed_private_peers_and_public_ec2_addresses(tmp_path):
+    """Test private peers outside the index are unknown and public EC2 addresses are billed as public-IP transfer"""
+    index = build_index()
+    index.add_network_interface({'NetworkInterfaceId': 'eni-d', 'AvailabilityZone': 'us-east-1a', 'PrivateIpAddress': '10.0.1.40',
+                                 'Association': {'PublicIp': '3.80.0.9'}})
+    index.add_service_ranges({'prefixes': [
+        {'ip_prefix': '52.216.0.0/15', 'region': 'us-east-1', 'service': 'S3'},
+        {'ip_prefix': '54.160.0.0/13', 'region': 'us-east-1', 'service': 'EC2'},
+        {'ip_prefix': '3.248.0.0/13', 'region': 'eu-west-1', 'service': 'EC2'}
+    ]})
+    (tmp_path / 'flows.log').write_text('\n'.join([
+        HEADER,
+        flow('eni-a', '10.0.1.10', '172.31.5.5', 1 * GB),      # peered VPC we do not index
+        flow('eni-a', '10.0.1.10', '192.168.0.9', 1 * GB),     # on-premises
+        flow('eni-a', '10.0.1.10', '3.80.0.9', 2 * GB),        # our own public address, same AZ
+        flow('eni-a', '10.0.1.10', '54.160.1.1', 3 * GB),      # someone's EC2 instance in-region
+        flow('eni-a', '10.0.1.10', '3.248.0.1', 4 * GB)        # EC2 in another region
+    ]) + '\n')
+    
+    by_type = analyze_flow_logs(str(tmp_path), index)['by_transfer_type']
+    
+    assert by_type['unknown'] == {'gb': 2.0, 'cost': 0.0, 'monthly_cost': 0.0}
+    assert by_type['internet']['gb'] == 0
+    assert by_type['public_ip_same_region']['gb'] == 5 and by_type['public_ip_same_region']['cost'] == 0.1
+    assert by_type['cross_region']['gb'] == 4
+    assert by_type['same_az']['gb'] == 0
+
+@mock_ec2
+@mock_elbv2
+@mock_cloudfront
+def test_data_transfer_optimizer_uses_measured_cross_region_cost(tmp_path, monkeypatch):
+    """Test flow logs replace the per-region instance heuristic in the handler"""
+    ec2 = boto3.client('ec2', region_name='us-east-1')
+    subnet = ec2.describe_subnets()['Subnets'][0]
+    eni = ec2.create_network_interface(SubnetId=subnet['SubnetId'])['NetworkInterface']
+    ec2.run_instances(ImageId='ami-12345678', MinCount=1, MaxCount=1)
+    # A peer outside the four regions the handler used to index
+    tokyo = boto3.client('ec2', region_name='ap-northeast-1')
+    peer = tokyo.create_network_interface(SubnetId=tokyo.describe_subnets()['Subnets'][0]['SubnetId'])['NetworkInterface']
+    
+    with open(tmp_path / 'flows.log', 'w') as f:
+        f.write('\n'.join([
+            HEADER,
+            flow(eni['NetworkInterfaceId'], eni['PrivateIpAddress'], '8.8.8.8', 10 * GB),
+            flow(eni['NetworkInterfaceId'], eni['PrivateIpAddress'], peer['PrivateIpAddress'], 3 * GB)
+        ]) + '\n')
+    monkeypatch.setattr(flow_log_analyzer, 'IP_RANGES_SOURCE', '')
+    
+    from data_transfer_optimizer import lambda_handler
+    body = json.loads(lambda_handler({'flow_log_location': str(tmp_path), 'flow_log_hours': 1}, None)['body'])
+    
+    assert body['transfer_costs']['by_transfer_type']['internet']['gb'] == 10
+    assert body['transfer_costs']['by_transfer_type']['cross_region']['gb'] == 3
+    assert [pair['destination_region'] for pair in body['cross_region_analysis']] == ['ap-northeast-1']
+    assert body['potential_savings'] == body['cross_region_analysis'][0]['monthly_cost']
@@ -0,0 +1,65 @@
+import numpy as np
+import sys
+import os
+
+# Add lambda functions to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda-functions'))
+
+from forecast_backtest import LOOKBACK, MODELS, backtest
+from ml_cost_anomaly_detector import calculate_confidence, ml_forecast
+
+def test_linear_trend_matches_ml_forecast():
+    """Test the vectorized trend model forecasts what ml_forecast does"""
+    rng = np.random.default_rng(11)
+    history = (rng.uniform(50, 150) + rng.normal(0, 10, 40)).tolist()
+    
+    forecast = MODELS['linear_trend'](np.array([history[-LOOKBACK:]]), 30)[0]
+    assert np.allclose(np.maximum(forecast, 0).round(2), ml_forecast(history, 30))
+
+def test_backtest_matches_per_origin_loop():
+    """Test the rolling-origin metrics against a plain loop over series, origins and horizons"""
+    rng = np.random.default_rng(12)
+    series = rng.gamma(2, 50, (5, 60))
+    series[0, 30:35] = 0
+    horizon = 10
+    
+    report = backtest(series, horizon, step=3, interval=0.8)
+    
+    for name, model in MODELS.items():
+        ape = [[] for _ in range(horizon)]
+        sape = [[] for _ in range(horizon)]
+        covered = [[] for _ in range(horizon)]
+        for row in series:
+            for origin in range(LOOKBACK, series.shape[1], 3):
+                window = row[origin - LOOKBACK:origin]
+                forecast = np.maximum(model(window[None, :], horizon)[0], 0)
+                sigma = np.std(np.diff(window), ddof=1) * 1.2815516
+                for step in range(min(horizon, series.shape[1] - origin)):
+                    actual = row[origin + step]
+                    error = abs(actual - forecast[step])
+                    if actual > 0:
+                        ape[step].append(error / actual)
+                    sape[step].append(2 * error / (actual + forecast[step]) if actual + forecast[step] else 0)
+                    covered[step].append(error <= sigma * np.sqrt(step + 1))
+        
+        assert np.allclose(report[name]['mape'], [np.mean(values) * 100 for values in ape], atol=0.01)
+        assert np.allclose(report[name]['smape'], [np.mean(values) * 100 for values in sape], atol=0.01)
+        assert np.allclose(report[name]['coverage'], [np.mean(values) for values in covered], atol=0.001)
+        assert report[name]['forecasts'] == sum(len(values) for values in sape)
+    
+    # Confidence follows measured error: a clean trend is forecast far better than noise
+    assert calculate_confidence(list(np.arange(60) * 2.0 + 100)) == 1.0
+    assert calculate_confidence(series[1].tolist()) < 0.7
+
+def test_all_zero_series_has_no_confidence():
+    """Test a series with no nonzero actuals is not scored as perfectly forecast"""
+    report = backtest(np.zeros((2, 40)), 10)
+    
+    for name in MODELS:
+        assert report[name]['smape_overall'] == 0
+        assert report[name]['mape_overall'] is None
+        assert report[name]['confidence'] is None
+    # Zeros only before the evaluation windows still count as measured
+    series = np.concatenate([np.zeros(LOOKBACK), np.full(26, 100.0)])
+    assert backtest(series, 10)['naive']['confidence'] is not None
+    assert calculate_confidence([0.0] * 40) == 0.3
@@ -0,0 +1,142 @@
+import boto3
+import numpy as np
+import sys
+import os
+from botocore.stub import Stubber
+from datetime import datetime, timedelta
+
+# Add lambda functions to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda-functions'))
+
+import hourly_anomaly
+from hourly_anomaly import RingState, detect, process_hours
+
+SERVICES = ['Amazon EC2', 'Amazon S3', 'AWS Lambda']
+
+def hourly_cost(service, hour, rng):
+    """Business-hours EC2, flat S3, weekday-heavy Lambda, with noise"""
+    moment = hourly_anomaly.hour_start(hour)
+    if service == 'Amazon EC2':
+        base = 40 + (25 if 8 <= moment.hour < 20 else 0)
+    elif service == 'Amazon S3':
+        base = 5
+    else:
+        base = 12 if moment.weekday() < 5 else 3
+    return round(base * (1 + rng.normal(0, 0.03)), 4)
+
+def ce_response(start_hour, hours, rng, spikes=None, token=None):
+    results = []
+    for hour in range(start_hour, start_hour + hours):
+        groups = []
+        for service in SERVICES:
+            amount = hourly_cost(service, hour, rng) + (spikes or {}).get((service, hour), 0)
+            groups.append({'Keys': [service], 'Metrics': {'UnblendedCost': {'Amount': str(amount), 'Unit': 'USD'}}})
+        start = hourly_anomaly.hour_start(hour)
+        results.append({
+            'TimePeriod': {'Start': start.strftime('%Y-%m-%dT%H:%M:%SZ'), 'End': (start + timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M:%SZ')},
+            'Total': {},
+            'Groups': groups,
+            'Estimated': False
+        })
+    response = {'ResultsByTime': results, 'DimensionValueAttributes': []}
+    if token:
+        response['NextPageToken'] = token
+    return response
+
+def test_runs_score_only_new_hours_against_stored_rings(tmp_path):
+    """Test the first run backfills the ring, the next fetches two hours and flags the spike"""
+    rng = np.random.default_rng(22)
+    ce = boto3.client('ce', region_name='us-east-1')
+    now = datetime(2024, 6, 17, 12, 30)
+    end_hour = hourly_anomaly.cur_reader.to_hour(now) - hourly_anomaly.LAG_HOURS
+    # Cost Explorer's 14 days of hourly data end now, not at the lagged end hour
+    start_hour = end_hour + hourly_anomaly.LAG_HOURS - 14 * 24
+    
+    with Stubber(ce) as stubber:
+        stubber.add_response('get_cost_and_usage', ce_response(start_hour, 200, rng, token='page-2'))
+        stubber.add_response('get_cost_and_usage', ce_response(start_hour + 200, 133, rng))
+        first = detect(ce, location=str(tmp_path), now=now)
+        stubber.assert_no_pending_responses()
+    
+    assert first['hours_processed'] == 333
+    assert first['anomalies'] == []
+    
+    # Two hours later: only those two hours are fetched, and the Lambda spike stands out
+    with Stubber(ce) as stubber:
+        stubber.add_response('get_cost_and_usage', ce_response(end_hour, 2, rng, spikes={('AWS Lambda', end_hour + 1): 30}), {
+            'TimePeriod': {
+                'Start': hourly_anomaly.hour_start(end_hour).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'End': hourly_anomaly.hour_start(end_hour + 2).strftime('%Y-%m-%dT%H:%M:%SZ')
+            },
+            'Granularity': 'HOURLY',
+            'Metrics': ['UnblendedCost'],
+            'GroupBy': [{'Type': 'DIMENSION', 'Key': 'SERVICE'}]
+        })
+        second = detect(ce, location=str(tmp_path), now=now + timedelta(hours=2))
+        stubber.assert_no_pending_responses()
+    
+    assert second['hours_processed'] == 2
+    assert [(anomaly['series'], anomaly['hour']) for anomaly in second['anomalies']] == [
+        ('AWS Lambda', hourly_anomaly.hour_start(end_hour + 1).isoformat())
+    ]
+    
+    state = hourly_anomaly.load_state('hourly-anomaly-ce', str(tmp_path))
+    assert state.values.shape == (3, 336)
+    assert state.values.dtype == np.float32
+    assert state.last_hour == end_hour + 1
+
+def test_unbilled_hours_are_fetched_again(tmp_path):
+    """Test trailing hours Cost Explorer has no cost for yet are not stored as $0"""
+    rng = np.random.default_rng(8)
+    ce = boto3.client('ce', region_name='us-east-1')
+    now = datetime(2024, 6, 17, 12, 30)
+    end_hour = hourly_anomaly.cur_reader.to_hour(now) - hourly_anomaly.LAG_HOURS
+    start_hour = end_hour + hourly_anomaly.LAG_HOURS - 14 * 24
+    
+    unbilled = ce_response(start_hour, 333, rng)
+    for result in unbilled['ResultsByTime'][-2:]:
+        result['Groups'] = []
+    with Stubber(ce) as stubber:
+        stubber.add_response('get_cost_and_usage', unbilled)
+        first = detect(ce, location=str(tmp_path), now=now)
+    
+    assert first['hours_processed'] == 331
+    assert hourly_anomaly.load_state('hourly-anomaly-ce', str(tmp_path)).last_hour == end_hour - 3
+    
+    # The next run starts at the first unbilled hour
+    with Stubber(ce) as stubber:
+        stubber.add_response('get_cost_and_usage', ce_response(end_hour - 2, 3, rng), {
+            'TimePeriod': {
+                'Start': hourly_anomaly.hour_start(end_hour - 2).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'End': hourly_anomaly.hour_start(end_hour + 1).strftime('%Y-%m-%dT%H:%M:%SZ')
+            },
+            'Granularity': 'HOURLY',
+            'Metrics': ['UnblendedCost'],
+            'GroupBy': [{'Type': 'DIMENSION', 'Key': 'SERVICE'}]
+        })
+        second = detect(ce, location=str(tmp_path), now=now + timedelta(hours=1))
+        stubber.assert_no_pending_responses()
+    
+    assert second['hours_processed'] == 3
+    state = hourly_anomaly.load_state('hourly-anomaly-ce', str(tmp_path))
+    assert state.last_hour == end_hour
+    assert not np.any(state.values[:, (end_hour - 2) % 336] == 0)
+
+def test_new_series_and_long_gaps():
+    """Test series first seen mid-ring have no baseline, and a gap longer than the ring resets it"""
+    state = RingState()
+    flat = np.full((1, 336), 10, dtype=np.float32)
+    process_hours(state, ['a'], flat, 1000)
+    
+    # 'b' appears with a large cost but no history, so it cannot be scored
+    anomalies = process_hours(state, ['a', 'b'], np.array([[10], [500]], dtype=np.float32), 1336)
+    assert anomalies == []
+    assert np.isnan(state.values[1]).sum() == 335
+    
+    # Flat series still flag a real jump through the 1% floor on their spread
+    anomalies = process_hours(state, ['a', 'b'], np.array([[15], [0]], dtype=np.float32), 1337)
+    assert [anomaly['series'] for anomaly in anomalies] == ['a']
+    
+    process_hours(state, ['a'], flat[:, :1] * 50, 1337 + 400)
+    # Only the hour just written is left, for both series
+    assert np.count_nonzero(~np.isnan(state.values)) == 2
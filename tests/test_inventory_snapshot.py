@@ -0,0 +1,79 @@
+import numpy as np
+import sys
+import os
+from datetime import datetime, timezone
+
+# Add lambda functions to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda-functions'))
+
+from inventory_snapshot import (
+    build_snapshot, column_values, diff_snapshots,
+    save_snapshot, load_latest_snapshot
+)
+
+def make_volume(volume_id, volume_type='gp2', size=10):
+    return {
+        'VolumeId': volume_id,
+        'VolumeType': volume_type,
+        'Size': size,
+        'State': 'available',
+        'AvailabilityZone': 'us-east-1a',
+        'CreateTime': datetime(2024, 1, 1, tzinfo=timezone.utc)
+    }
+
+def test_diff_reports_added_removed_and_changed():
+    """Test run-to-run diff on volume inventory"""
+    old = build_snapshot({'region': 'us-east-1', 'volumes': [
+        make_volume('vol-1'), make_volume('vol-2'), make_volume('vol-3')
+    ]}, run_id='20240101T000000Z')
+    new_inventory = {'region': 'us-east-1', 'volumes': [
+        make_volume('vol-1'), make_volume('vol-2', volume_type='gp3'), make_volume('vol-4')
+    ]}
+    new = build_snapshot(new_inventory, run_id='20240102T000000Z')
+    
+    diff = diff_snapshots(old, new)['volumes']
+    
+    assert diff['added'].tolist() == ['vol-4']
+    assert diff['removed'].tolist() == ['vol-3']
+    assert diff['changed'].tolist() == ['vol-2']
+
+def test_failed_listing_is_not_diffed(tmp_path):
+    """Test a type whose listing failed is neither reported as removed nor, next run, as added"""
+    volumes = [make_volume('vol-1'), make_volume('vol-2')]
+    first = build_snapshot({'region': 'us-east-1', 'volumes': volumes, 'snapshots': []}, run_id='20240101T000000Z')
+    failed = build_snapshot({
+        'region': 'us-east-1',
+        'volumes': [],
+        'snapshots': [],
+        'errors': {'volumes': 'UnauthorizedOperation'}
+    }, run_id='20240102T000000Z')
+    
+    assert failed['skipped'] == ['volumes']
+    assert 'volumes' not in failed['tables']
+    assert set(diff_snapshots(first, failed)) == {'snapshots'}
+    
+    save_snapshot(failed, str(tmp_path), '123456789012')
+    stored = load_latest_snapshot(str(tmp_path), '123456789012', 'us-east-1')
+    recovered = build_snapshot({'region': 'us-east-1', 'volumes': volumes, 'snapshots': []}, run_id='20240103T000000Z')
+    
+    assert stored['skipped'] == ['volumes']
+    assert set(diff_snapshots(stored, recovered)) == {'snapshots'}
+
+def test_columns_are_typed_and_round_trip(tmp_path):
+    """Test column encoding and local save/load"""
+    snapshot = build_snapshot({'region': 'us-east-1', 'volumes': [
+        make_volume('vol-1', size=10), make_volume('vol-2', volume_type='gp3', size=250)
+    ]}, run_id='20240101T000000Z')
+    
+    columns = snapshot['tables']['volumes']['columns']
+    assert columns['volume_type'].dtype == np.int32
+    assert columns['size'].dtype == np.float64
+    assert columns['create_time'].dtype == np.int64
+    
+    save_snapshot(snapshot, str(tmp_path), '123456789012')
+    loaded = load_latest_snapshot(str(tmp_path), '123456789012', 'us-east-1')
+    
+    assert loaded['run_id'] == '20240101T000000Z'
+    assert column_values(loaded, 'volumes', 'volume_type').tolist() == ['gp2', 'gp3']
+    assert column_values(loaded, 'volumes', 'size').tolist() == [10.0, 250.0]
+    assert all(len(ids) == 0 for ids in diff_snapshots(snapshot, loaded)['volumes'].values())
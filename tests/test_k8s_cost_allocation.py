@@ -0,0 +1,138 @@
+import numpy as np
+import sys
+import os
+import threading
+import time
+
+# Add lambda functions to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda-functions'))
+
+from k8s_cost_allocation import allocate, split_node_price
+from k8s_inventory import Inventory
+import k8s_resource_optimizer
+from k8s_resource_optimizer import allocate_clusters, allocate_inventory, calculate_k8s_savings
+
+GIB = 2 ** 30
+
+def test_allocation_matches_per_node_hour_loop():
+    """Test vectorized allocation against a loop over node-hours, with idle cost closing the total"""
+    rng = np.random.default_rng(31)
+    nodes, pods, hours = 10, 80, 30
+    prices = rng.uniform(0.1, 0.5, nodes)
+    cpu = rng.choice([2.0, 4.0, 8.0], nodes)
+    memory = cpu * 4 * GIB
+    # Pods on every node but the last two, and some unscheduled (-1)
+    pod_nodes = rng.integers(-1, nodes - 2, pods)
+    matrices = {
+        'cpu_request': rng.uniform(0, 1, (pods, hours)),
+        'cpu_usage': rng.uniform(0, 1.5, (pods, hours)),
+        'memory_request': rng.uniform(0, 4, (pods, hours)) * GIB,
+        'memory_usage': rng.uniform(0, 3, (pods, hours)) * GIB
+    }
+    active = (rng.random((nodes, hours)) > 0.1).astype(float)
+    
+    result = allocate(
+        prices, cpu, memory, pod_nodes, hours,
+        lambda start, stop: {name: values[:, start:stop] for name, values in matrices.items()},
+        active, chunk_hours=7
+    )
+    
+    cpu_price, memory_price = split_node_price(prices, cpu, memory)
+    pod_cost = np.zeros(pods)
+    node_idle = np.zeros(nodes)
+    for hour in range(hours):
+        for node in range(nodes):
+            on_node = np.flatnonzero(pod_nodes == node)
+            node_idle[node] += prices[node] * active[node, hour]
+            for part, resource, capacity in [(cpu_price, 'cpu', cpu), (memory_price, 'memory', memory)]:
+                claims = np.maximum(matrices[f"{resource}_request"][on_node, hour], matrices[f"{resource}_usage"][on_node, hour])
+                shares = part[node] * active[node, hour] * claims / max(claims.sum(), capacity[node])
+                pod_cost[on_node] += shares
+                node_idle[node] -= shares.sum()
+    
+    assert np.allclose(result['pod_cost'], pod_cost, rtol=1e-5)
+    assert np.allclose(result['node_idle'], node_idle, rtol=1e-5, atol=1e-6)
+    assert np.all(result['pod_cost'][pod_nodes < 0] == 0)
+    assert np.allclose(result['node_idle'][-2:], result['node_cost'][-2:])
+    assert np.isclose(result['pod_cost'].sum() + result['node_idle'].sum(), (prices[:, None] * active).sum())
+
+def test_inventory_rolls_up_by_namespace_workload_and_label():
+    """Test a cluster snapshot is allocated per month by namespace, workload and label"""
+    node = {'instance_type': 'm5.large', 'nodegroup': 'general', 'cpu_allocatable': 2.0, 'memory_allocatable': 8 * GIB}
+    inventory = Inventory({
+        'nodes': {name: {**node, 'name': name} for name in ['a', 'b']},
+        'pods': {
+            'web/api-1': {'namespace': 'web', 'node': 'a', 'phase': 'Running', 'workload': 'Deployment/api',
+                          'labels': {'team': 'payments'}, 'cpu_request': 1.0, 'memory_request': 4 * GIB},
+            'web/api-2': {'namespace': 'web', 'node': 'a', 'phase': 'Running', 'workload': 'Deployment/api',
+                          'labels': {'team': 'payments'}, 'cpu_request': 1.0, 'memory_request': 4 * GIB},
+            'jobs/etl': {'namespace': 'jobs', 'node': 'b', 'phase': 'Running', 'workload': 'Job/etl',
+                         'labels': {}, 'cpu_request': 0.5, 'memory_request': 2 * GIB}
+        }
+    })
+    
+    allocation = allocate_inventory(inventory, labels=['team'])
+    
+    node_month = 0.096 * 730
+    assert np.isclose(allocation['monthly_node_cost'], 2 * node_month, atol=0.01)
+    assert np.isclose(allocation['by_namespace']['web'], node_month, atol=0.01)
+    assert np.isclose(allocation['by_namespace']['jobs'], node_month / 4, atol=0.01)
+    assert np.isclose(allocation['monthly_idle_cost'], node_month * 3 / 4, atol=0.01)
+    assert list(allocation['by_workload']) == ['web/Deployment/api', 'jobs/Job/etl']
+    assert list(allocation['by_label']['team']) == ['payments', '__unlabelled__']
+    
+    # Requests fill 62.5% of the group, so both nodes are needed at 80% target utilization
+    assert allocation['releasable_by_nodegroup'] == {}
+    savings = calculate_k8s_savings([{'cluster_name': 'prod', **allocation}, {'cluster_name': 'down', 'error': 'timeout'}])
+    assert savings['idle_monthly_cost'] == allocation['monthly_idle_cost']
+    assert savings['total_potential_monthly_savings'] == 0
+    assert 'usage is not included' in savings['basis']
+
+def test_spot_nodes_discounted_and_only_whole_nodes_releasable():
+    """Test Spot nodes are priced below On-Demand and savings count only the nodes a group can drop"""
+    spot = {'instance_type': 'm5.large', 'capacity_type': 'SPOT', 'nodegroup': 'batch', 'cpu_allocatable': 2.0, 'memory_allocatable': 8 * GIB}
+    inventory = Inventory({
+        'nodes': {
+            **{name: {**spot, 'name': name} for name in ['s1', 's2', 's3']},
+            'x': {'name': 'x', 'instance_type': 'x9.huge', 'capacity_type': 'ON_DEMAND', 'nodegroup': None,
+                  'cpu_allocatable': 4.0, 'memory_allocatable': 16 * GIB}
+        },
+        'pods': {
+            'jobs/etl': {'namespace': 'jobs', 'node': 's1', 'phase': 'Running', 'workload': 'Job/etl',
+                         'labels': {}, 'cpu_request': 0.5, 'memory_request': 1 * GIB}
+        }
+    })
+    
+    allocation = allocate_inventory(inventory, labels=[])
+    
+    spot_month = 0.096 * (1 - k8s_resource_optimizer.SPOT_DISCOUNT) * 730
+    assert allocation['spot_nodes'] == 3
+    assert allocation['unpriced_instance_types'] == ['x9.huge']
+    assert np.isclose(allocation['monthly_node_cost'], 3 * spot_month + 0.1 * 730, atol=0.01)
+    # One Spot node holds the batch group's requests; the lone unmanaged node cannot go
+    assert allocation['releasable_by_nodegroup'] == {'batch': round(2 * spot_month, 2)}
+    assert allocation['monthly_releasable_cost'] < allocation['monthly_idle_cost']
+    assert calculate_k8s_savings([allocation])['total_potential_monthly_savings'] == round(2 * spot_month, 2)
+
+def test_clusters_allocated_concurrently_in_name_order(monkeypatch):
+    """Test cluster syncs overlap, results keep name order and a failing cluster is reported"""
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    running = []
+    overlap = threading.Event()
+    
+    def allocate_cluster(eks, cluster_name):
+        running.append(cluster_name)
+        if len(running) > 1:
+            overlap.set()
+        time.sleep(0.2)
+        running.remove(cluster_name)
+        if cluster_name == 'broken':
+            raise RuntimeError('unauthorized')
+        return {'monthly_node_cost': 1.0}
+    
+    monkeypatch.setattr(k8s_resource_optimizer, 'allocate_cluster', allocate_cluster)
+    allocations = allocate_clusters(['alpha', 'broken', 'zeta'], max_workers=3)
+    
+    assert overlap.is_set()
+    assert [allocation['cluster_name'] for allocation in allocations] == ['alpha', 'broken', 'zeta']
+    assert allocations[1]['error'] == 'unauthorized'
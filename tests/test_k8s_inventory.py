@@ -0,0 +1,163 @@
+import json
+import threading
+import urllib.parse
+import sys
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add lambda functions to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda-functions'))
+
+from k8s_inventory import Inventory, KubeClient, cluster_inventory, load_inventory, parse_quantity
+
+def make_pod(index, node, resource_version, cpu='250m', memory='256Mi'):
+    return {
+        'metadata': {
+            'name': f"api-7d9f8-{index:05d}",
+            'namespace': ['payments', 'search'][index % 2],
+            'resourceVersion': str(resource_version),
+            'labels': {'app': 'api', 'pod-template-hash': '7d9f8'},
+            'ownerReferences': [{'kind': 'ReplicaSet', 'name': 'api-7d9f8', 'controller': True}]
+        },
+        'spec': {
+            'nodeName': node,
+            'containers': [{'resources': {'requests': {'cpu': cpu, 'memory': memory}}}, {'resources': {}}],
+            'initContainers': [{'resources': {'requests': {'cpu': '1', 'memory': '64Mi'}}}]
+        },
+        'status': {'phase': 'Running'}
+    }
+
+def make_node(name):
+    return {
+        'metadata': {
+            'name': name,
+            'resourceVersion': '1',
+            'labels': {'node.kubernetes.io/instance-type': 'm5.xlarge', 'eks.amazonaws.com/nodegroup': 'general'}
+        },
+        'status': {'allocatable': {'cpu': '3920m', 'memory': '15Gi'}}
+    }
+
+class FakeApiServer:
+    """Serves paged LISTs and queued WATCH events the way the Kubernetes API server does"""
+    
+    def __init__(self, nodes, pods):
+        self.items = {'/api/v1/nodes': nodes, '/api/v1/pods': pods}
+        self.resource_version = 100
+        self.watch_events = {'/api/v1/nodes': [], '/api/v1/pods': []}
+        # Continue tokens answered once with 410 Gone, as after etcd compaction
+        self.expired_continues = set()
+        self.requests = []
+        fake = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path, _, query = self.path.partition('?')
+                params = dict(urllib.parse.parse_qsl(query))
+                fake.requests.append((path, params))
+                if params.get('continue') in fake.expired_continues:
+                    fake.expired_continues.discard(params['continue'])
+                    self.send_response(410)
+                    self.end_headers()
+                    self.wfile.write(json.dumps({'kind': 'Status', 'code': 410, 'reason': 'Expired'}).encode())
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                
+                if params.get('watch') == 'true':
+                    for event in fake.watch_events[path]:
+                        self.wfile.write(json.dumps(event).encode() + b'\n')
+                    fake.watch_events[path] = []
+                    return
+                
+                start = int(params.get('continue') or 0)
+                limit = int(params['limit'])
+                items = fake.items[path][start:start + limit]
+                metadata = {'resourceVersion': str(fake.resource_version)}
+                if start + limit < len(fake.items[path]):
+                    metadata['continue'] = str(start + limit)
+                self.wfile.write(json.dumps({'metadata': metadata, 'items': items}).encode())
+            
+            def log_message(self, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    
+    def lists(self):
+        return [request for request in self.requests if request[1].get('watch') != 'true']
+
+def test_quantities():
+    """Test CPU and memory quantities in every notation the API server returns"""
+    assert parse_quantity('250m') == 0.25
+    assert parse_quantity('1.5') == 1.5
+    assert parse_quantity('512Mi') == 512 * 2 ** 20
+    assert parse_quantity('1G') == 1e9
+    assert parse_quantity('1e3') == 1000
+    assert parse_quantity('100k') == 100000
+
+def test_list_once_then_apply_watch_deltas(tmp_path):
+    """Test the first sync pages through LIST, later syncs apply WATCH deltas, and 410 relists"""
+    nodes = [make_node(f"node-{index}") for index in range(3)]
+    pods = [make_pod(index, f"node-{index % 3}", 50) for index in range(1200)]
+    fake = FakeApiServer(nodes, pods)
+    client = KubeClient(fake.url)
+    
+    inventory = cluster_inventory(client, 'eks/test', str(tmp_path), watch_seconds=1)
+    
+    assert len(fake.lists()) == 1 + 3
+    assert all(params['limit'] == '500' for _, params in fake.lists())
+    assert len(inventory.pods()) == 1200
+    pod = inventory.objects['pods']['payments/api-7d9f8-00000']
+    # The init container's 1 CPU outweighs the app containers' 250m
+    assert pod['cpu_request'] == 1.0
+    assert pod['memory_request'] == 256 * 2 ** 20
+    assert pod['workload'] == 'Deployment/api'
+    assert inventory.requests_by_node()['node-0'][0] == 400.0
+    
+    # Next run: only the deltas since the stored resourceVersion are fetched
+    fake.requests.clear()
+    fake.watch_events['/api/v1/pods'] = [
+        {'type': 'ADDED', 'object': make_pod(5000, 'node-1', 101, cpu='2')},
+        {'type': 'MODIFIED', 'object': make_pod(1, 'node-2', 102, cpu='3')},
+        {'type': 'DELETED', 'object': make_pod(0, 'node-0', 103)},
+        {'type': 'BOOKMARK', 'object': {'metadata': {'resourceVersion': '110'}}}
+    ]
+    
+    inventory = cluster_inventory(client, 'eks/test', str(tmp_path), watch_seconds=1)
+    
+    assert fake.lists() == []
+    assert [params['resourceVersion'] for _, params in fake.requests] == ['100', '100']
+    assert len(inventory.pods()) == 1200
+    assert 'payments/api-7d9f8-00000' not in inventory.objects['pods']
+    assert inventory.objects['pods']['search/api-7d9f8-00001']['node'] == 'node-2'
+    assert inventory.objects['pods']['search/api-7d9f8-00001']['cpu_request'] == 3.0
+    assert load_inventory('eks/test', str(tmp_path)).resource_versions['pods'] == '110'
+    
+    # A resourceVersion the API server no longer holds forces a fresh LIST
+    fake.requests.clear()
+    fake.resource_version = 200
+    fake.watch_events['/api/v1/pods'] = [{'type': 'ERROR', 'object': {'code': 410, 'message': 'too old resource version'}}]
+    
+    inventory = cluster_inventory(client, 'eks/test', str(tmp_path), watch_seconds=1)
+    
+    assert inventory.stats['relists'] == 1
+    assert [path for path, _ in fake.lists()] == ['/api/v1/pods'] * 3
+    assert len(inventory.pods()) == 1200
+    assert inventory.resource_versions['pods'] == '200'
+    fake.server.shutdown()
+
+def test_expired_continue_token_restarts_list():
+    """Test a LIST whose continue token expires mid-way starts over instead of failing"""
+    pods = [make_pod(index, 'node-0', 50) for index in range(1200)]
+    fake = FakeApiServer([make_node('node-0')], pods)
+    fake.expired_continues.add('1000')
+    
+    inventory = Inventory().sync(KubeClient(fake.url))
+    
+    assert inventory.stats['relists'] == 1
+    assert [params.get('continue') for path, params in fake.lists() if path == '/api/v1/pods'] == [None, '500', '1000', None, '500', '1000']
+    assert len(inventory.pods()) == 1200
+    assert inventory.resource_versions['pods'] == '100'
+    fake.server.shutdown()
@@ -0,0 +1,44 @@
+import boto3
+import sys
+import os
+from moto import mock_budgets, mock_sts
+
+# Add lambda functions to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda-functions'))
+
+from multi_account_governance import evaluate_budgets
+
+def create_budget(budgets, account_id, name, limit, actual, forecasted):
+    budgets.create_budget(AccountId=account_id, Budget={
+        'BudgetName': name,
+        'BudgetLimit': {'Amount': str(limit), 'Unit': 'USD'},
+        'TimeUnit': 'MONTHLY',
+        'BudgetType': 'COST',
+        'CalculatedSpend': {
+            'ActualSpend': {'Amount': str(actual), 'Unit': 'USD'},
+            'ForecastedSpend': {'Amount': str(forecasted), 'Unit': 'USD'}
+        }
+    })
+
+@mock_sts
+@mock_budgets
+def test_budgets_use_calculated_spend_across_pages():
+    """Test every budget page is read and statuses come from actual and forecasted spend"""
+    budgets = boto3.client('budgets', region_name='us-east-1')
+    account_id = boto3.client('sts', region_name='us-east-1').get_caller_identity()['Account']
+    create_budget(budgets, account_id, 'exceeded', 100, 130, 150)
+    create_budget(budgets, account_id, 'warning', 100, 85, 95)
+    create_budget(budgets, account_id, 'forecast', 100, 40, 110)
+    # More healthy budgets than fit on one describe_budgets page
+    for index in range(120):
+        create_budget(budgets, account_id, f"healthy-{index:03d}", 1000, 100, 200)
+    create_budget(budgets, account_id, 'zz-last-page', 10, 12, 12)
+    
+    violations, errors = evaluate_budgets([account_id], account_id)
+    
+    assert errors == {}
+    assert [violation['budget_name'] for violation in violations] == ['exceeded', 'zz-last-page', 'warning', 'forecast']
+    assert violations[0]['actual_spend'] == '$130.00'
+    assert violations[0]['utilization'] == '130.0%'
+    assert violations[3]['forecasted_utilization'] == '110.0%'
+    assert {violation['account_id'] for violation in violations} == {account_id}
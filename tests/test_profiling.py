@@ -0,0 +1,45 @@
+import json
+import boto3
+import sys
+import os
+from moto import mock_ec2, mock_cloudwatch
+
+# Add lambda functions to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda-functions'))
+
+import profiling
+from ec2_rightsizing import lambda_handler
+
+def test_profile_options_off_by_default():
+    """Test profiling only runs when the event or environment asks for it"""
+    assert profiling.profile_options({}) is None
+    assert profiling.profile_options({'profile': False}) is None
+    assert profiling.profile_options({'profile': 'cpu'})['memory'] is False
+    assert profiling.profile_options({'profile': True})['memory'] is True
+    assert profiling.profile_options({'profile': {'memory': False, 'top': 5}})['top'] == 5
+
+@mock_ec2
+@mock_cloudwatch
+def test_profiled_handler_writes_pstats_and_collapsed_stacks(tmp_path):
+    """Test a profiled invocation summarises hot spots and writes flame graph input"""
+    ec2 = boto3.client('ec2', region_name='us-east-1')
+    ec2.run_instances(ImageId='ami-12345678', MinCount=3, MaxCount=3, InstanceType='t3.large')
+    
+    unprofiled = json.loads(lambda_handler({}, None)['body'])
+    assert 'profile' not in unprofiled
+    
+    body = json.loads(lambda_handler({'profile': {'location': str(tmp_path), 'top': 5}}, None)['body'])
+    profile = body['profile']
+    
+    assert len(profile['cpu']['top']) == 5
+    assert len(profile['memory']['top']) == 5
+    assert profile['memory']['peak_bytes'] > 0
+    assert body['recommendations'] == unprofiled['recommendations']
+    
+    artifacts = {os.path.splitext(path)[1]: path for path in profile['artifacts']}
+    assert set(artifacts) == {'.pstats', '.collapsed', '.json'}
+    
+    collapsed = open(artifacts['.collapsed']).read().splitlines()
+    if collapsed:
+        stack, count = collapsed[0].rsplit(' ', 1)
+        assert int(count) > 0 and ';' in stack
@@ -0,0 +1,55 @@
+import boto3
+import sys
+import os
+import time
+from moto import mock_ec2
+
+# Add lambda functions to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda-functions'))
+
+import rate_limiter
+from rate_limiter import AdaptiveBucket
+
+def test_bucket_backs_off_and_recovers():
+    """Test throttling halves the rate once per window and clean calls probe back up"""
+    bucket = AdaptiveBucket(rate=100, burst=1)
+    
+    start = time.monotonic()
+    for _ in range(11):
+        bucket.acquire()
+    assert time.monotonic() - start >= 0.09
+    
+    bucket.on_throttle()
+    bucket.on_throttle()
+    assert bucket.rate == 50
+    assert bucket.throttles == 2
+    
+    for _ in range(50):
+        bucket.on_success()
+    assert 50 < bucket.rate <= 100
+    
+    for _ in range(10000):
+        bucket.on_success()
+    assert bucket.rate == 100
+
+def test_limits_resolve_by_operation_then_category():
+    """Test documented per-operation limits win over service and global defaults"""
+    assert rate_limiter.limit_for('cloudwatch', 'GetMetricData') == (50, 50)
+    assert rate_limiter.limit_for('ec2', 'DescribeInstances') == (20, 100)
+    assert rate_limiter.limit_for('ec2', 'StopInstances') == (5, 200)
+    assert rate_limiter.limit_for('autoscaling', 'DescribeAutoScalingGroups') == (10, 20)
+
+@mock_ec2
+def test_installed_session_shares_buckets_across_clients():
+    """Test every client of an installed session draws from one bucket per operation and region"""
+    rate_limiter.reset()
+    session = rate_limiter.install(boto3.session.Session())
+    
+    for _ in range(2):
+        session.client('ec2', region_name='us-east-1').describe_volumes()
+    session.client('ec2', region_name='eu-west-1').describe_volumes()
+    
+    stats = rate_limiter.stats()
+    assert stats['ec2.DescribeVolumes@us-east-1']['calls'] == 2
+    assert stats['ec2.DescribeVolumes@eu-west-1']['calls'] == 1
+    assert stats['ec2.DescribeVolumes@us-east-1']['ceiling'] == 20
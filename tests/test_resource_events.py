@@ -0,0 +1,89 @@
+import json
+import boto3
+import sys
+import os
+from botocore.stub import Stubber
+from moto import mock_ec2, mock_cloudwatch, mock_rds
+
+# Add lambda functions to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda-functions'))
+
+from resource_events import load_event_replay, parse_resource_event, replay_events
+import cost_optimizer
+import spot_optimizer
+
+EXAMPLE_EVENTS = os.path.join(os.path.dirname(__file__), '..', 'examples', 'events', 'resource-events.ndjson')
+
+def test_parse_example_events():
+    """Test resource IDs are extracted for every routed API call"""
+    parsed = [parse_resource_event(event) for event in load_event_replay(EXAMPLE_EVENTS)]
+    
+    assert [(p['event_name'], p['resource_ids']) for p in parsed] == [
+        ('RunInstances', ['i-0abc123def4567890']),
+        ('CreateVolume', ['vol-0abc123def4567890']),
+        ('ModifyDBInstance', ['orders-db'])
+    ]
+    assert parse_resource_event({}) is None
+    assert parse_resource_event({'detail-type': 'Scheduled Event', 'detail': {}}) is None
+
+@mock_ec2
+@mock_cloudwatch
+def test_replay_create_volume_only_touches_that_volume(tmp_path):
+    """Test event mode evaluates just the created volume"""
+    ec2 = boto3.client('ec2', region_name='us-east-1')
+    ec2.create_volume(Size=10, VolumeType='gp2', AvailabilityZone='us-east-1a')
+    volume = ec2.create_volume(Size=100, VolumeType='gp2', AvailabilityZone='us-east-1a')
+    
+    event = load_event_replay(EXAMPLE_EVENTS)[1]
+    event['detail']['responseElements']['volumeId'] = volume['VolumeId']
+    replay_file = tmp_path / 'events.ndjson'
+    replay_file.write_text(json.dumps(event) + '\n')
+    
+    responses = replay_events(str(replay_file))
+    
+    assert len(responses) == 1
+    body = json.loads(responses[0]['body'])
+    assert body['volumes_optimized'] == 1
+    assert body['event']['resource_ids'] == [volume['VolumeId']]
+    assert round(body['estimated_savings'], 2) == 1.6
+
+def test_volume_still_creating_is_left_to_the_scheduled_scan():
+    """Test a volume that never leaves 'creating' is described but not modified"""
+    ec2 = boto3.client('ec2', region_name='us-east-1', aws_access_key_id='testing', aws_secret_access_key='testing')
+    creating = {'Volumes': [{'VolumeId': 'vol-0abc123def4567890', 'VolumeType': 'gp2', 'Size': 500, 'State': 'creating'}]}
+    
+    with Stubber(ec2) as stubber:
+        stubber.add_response('describe_volumes', creating, {'VolumeIds': ['vol-0abc123def4567890']})
+        stubber.add_response('describe_volumes', creating, {
+            'Filters': [{'Name': 'volume-id', 'Values': ['vol-0abc123def4567890']}]
+        })
+        
+        volumes = cost_optimizer.wait_for_volumes(ec2, ['vol-0abc123def4567890'], timeout=0)
+        # Any modify_volume call would fail the stubber
+        results = cost_optimizer.analyze_inventory({'volumes': volumes, 'snapshots': []}, {'ec2': ec2})
+        stubber.assert_no_pending_responses()
+    
+    assert results['volumes_optimized'] == 0
+
+@mock_ec2
+@mock_rds
+@mock_cloudwatch
+def test_replay_of_missing_resources_returns_empty_evaluation(tmp_path, monkeypatch):
+    """Test an instance EC2 does not know yet and a deleted database do not fail the invocation"""
+    monkeypatch.setattr(spot_optimizer, 'INSTANCE_WAIT_SECONDS', 0)
+    rds = boto3.client('rds', region_name='us-east-1')
+    rds.create_db_instance(DBInstanceIdentifier='other-db', DBInstanceClass='db.t3.medium', Engine='postgres',
+                           AllocatedStorage=20, MasterUsername='admin', MasterUserPassword='password123')
+    
+    run_instances, _, modify_db = load_event_replay(EXAMPLE_EVENTS)
+    replay_file = tmp_path / 'events.ndjson'
+    replay_file.write_text(json.dumps(run_instances) + '\n' + json.dumps(modify_db) + '\n')
+    
+    responses = replay_events(str(replay_file))
+    
+    assert [response['statusCode'] for response in responses] == [200, 200]
+    spot, database = [json.loads(response['body']) for response in responses]
+    assert spot['event']['resource_ids'] == ['i-0abc123def4567890']
+    assert spot['spot_opportunities'] == [] and spot['potential_savings'] == 0
+    assert database['event']['resource_ids'] == ['orders-db']
+    assert database['idle_databases'] == [] and database['oversized_databases'] == []
@@ -0,0 +1,67 @@
+import gzip
+import json
+import boto3
+import sys
+import os
+from datetime import datetime, timedelta
+from moto import mock_ec2, mock_cloudwatch, mock_s3
+
+# Add lambda functions to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda-functions'))
+
+from result_sink import ResultSink
+from ec2_rightsizing import lambda_handler
+
+def read_parts(paths):
+    return [json.loads(line) for path in paths for line in gzip.open(path, 'rt')]
+
+def test_sink_rolls_parts_and_keeps_only_counts(tmp_path):
+    """Test findings stream into size-capped gzip NDJSON parts"""
+    sink = ResultSink('ec2_rightsizing', str(tmp_path), 'us-east-1', '111122223333', part_bytes=2048)
+    findings = sink.collection('underutilized_instances')
+    for index in range(2000):
+        findings.append({'instance_id': f"i-{index:017x}", 'token': os.urandom(16).hex()})
+    
+    body = sink.finish({'underutilized_instances': findings, 'potential_savings': 10})
+    
+    assert body['underutilized_instances'] == 2000
+    assert body['results']['records'] == 2000
+    assert len(body['results']['parts']) > 1
+    lines = read_parts(body['results']['parts'])
+    assert [line['record']['instance_id'] for line in lines] == [f"i-{index:017x}" for index in range(2000)]
+    assert {line['kind'] for line in lines} == {'underutilized_instances'}
+    
+    summary = json.load(open(body['results']['summary']))
+    assert summary['handler'] == 'ec2_rightsizing'
+    assert summary['account_id'] == '111122223333'
+    assert summary['result']['potential_savings'] == 10
+
+@mock_ec2
+@mock_cloudwatch
+@mock_s3
+def test_handler_streams_findings_to_s3():
+    """Test a handler given a results location returns keys instead of findings"""
+    boto3.client('s3', region_name='us-east-1').create_bucket(Bucket='finops-results')
+    ec2 = boto3.client('ec2', region_name='us-east-1')
+    cloudwatch = boto3.client('cloudwatch', region_name='us-east-1')
+    instance_ids = [
+        instance['InstanceId']
+        for instance in ec2.run_instances(ImageId='ami-12345678', MinCount=3, MaxCount=3, InstanceType='t3.large')['Instances']
+    ]
+    for instance_id in instance_ids:
+        cloudwatch.put_metric_data(Namespace='AWS/EC2', MetricData=[{
+            'MetricName': 'CPUUtilization',
+            'Dimensions': [{'Name': 'InstanceId', 'Value': instance_id}],
+            'Timestamp': datetime.utcnow() - timedelta(hours=1),
+            'Value': 5.0
+        }])
+    
+    body = json.loads(lambda_handler({'results_location': 's3://finops-results/findings'}, None)['body'])
+    
+    assert body['underutilized_instances'] == 3
+    assert body['results']['parts'][0].startswith('s3://finops-results/findings/ec2_rightsizing/us-east-1/')
+    
+    key = body['results']['parts'][0][len('s3://finops-results/'):]
+    data = boto3.client('s3', region_name='us-east-1').get_object(Bucket='finops-results', Key=key)['Body'].read()
+    records = [json.loads(line)['record'] for line in gzip.decompress(data).splitlines()]
+    assert sorted(record['instance_id'] for record in records) == sorted(instance_ids)
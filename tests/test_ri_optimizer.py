@@ -0,0 +1,45 @@
+import time
+import numpy as np
+import sys
+import os
+
+# Add lambda functions to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda-functions'))
+
+from ri_optimizer import evaluate_commitment_levels, optimize_commitment
+
+def test_commitment_curve_matches_brute_force():
+    """Test vectorized savings curve against a per-level loop"""
+    rng = np.random.default_rng(7)
+    usage = rng.gamma(4.0, 2.5, size=500)
+    levels = np.linspace(0, 15, 50)
+    discount = 0.3
+    
+    curve = evaluate_commitment_levels(usage, levels, discount)
+    
+    for i, level in enumerate(levels):
+        covered = np.minimum(usage, level / (1 - discount)).sum()
+        assert np.isclose(curve['covered_cost'][i], covered)
+        assert np.isclose(curve['net_savings'][i], covered - level * usage.size)
+        assert np.isclose(curve['wasted_commitment'][i], level * usage.size - covered * (1 - discount))
+
+def test_flat_usage_commits_to_the_floor():
+    """Test constant usage is fully committed at the discounted rate"""
+    result = optimize_commitment(np.full(24 * 7, 10.0), discount_rate=0.25, n_levels=101)
+    
+    assert result['optimal_hourly_commitment'] == 7.5
+    assert result['utilization_percentage'] == 100.0
+    assert result['net_savings'] == 10.0 * 0.25 * 24 * 7
+    assert len(result['savings_curve']) == 101
+
+def test_year_of_hours_by_500_levels_is_fast():
+    """Test 8,760 hours x 500 levels evaluates well under a second"""
+    usage = np.random.default_rng(1).uniform(50, 150, size=(8760, 4))
+    
+    started = time.perf_counter()
+    result = optimize_commitment(usage, n_levels=500)
+    elapsed = time.perf_counter() - started
+    
+    assert elapsed < 0.5
+    assert result['hours_analyzed'] == 8760
+    assert result['net_savings'] > 0
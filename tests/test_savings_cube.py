@@ -0,0 +1,93 @@
+import gzip
+import json
+import sys
+import os
+from datetime import date
+
+# Add scripts to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+import savings_cube
+
+def write_ndjson_gz(path, records):
+    with gzip.open(path, 'wt') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+def test_cube_rolls_up_handler_outputs(tmp_path):
+    """Test envelopes, Lambda responses and orchestrator reports land in the right cells"""
+    outputs = tmp_path / 'outputs'
+    outputs.mkdir()
+    write_ndjson_gz(outputs / 'part-0000.ndjson.gz', [
+        # Two runs of the same scan on one day: the later one replaces the earlier
+        {'handler': 'ec2_rightsizing', 'account_id': '111', 'region': 'us-east-1', 'timestamp': '2024-01-10T01:00:00', 'result': {'potential_savings': 50}},
+        {'handler': 'ec2_rightsizing', 'account_id': '111', 'region': 'us-east-1', 'timestamp': '2024-01-10T02:00:00', 'result': {'potential_savings': 100}},
+        {'account_id': '111', 'region': 'us-west-2', 'timestamp': '2024-01-10T02:00:00', 'statusCode': 200,
+         'body': json.dumps({'underutilized_instances': [], 'potential_savings': 20, 'recommendations': []})},
+        {'handler': 'ri_optimizer', 'account_id': '222', 'region': 'us-east-1', 'timestamp': '2024-02-03', 'result': {'potential_savings': 1200}}
+    ])
+    (outputs / 'orchestrator.json').write_text(json.dumps({
+        'account_id': '222',
+        'timestamp': '2024-02-03T00:00:00',
+        'regions': {'eu-west-1': {'cost_optimizer': {'estimated_savings': 40}, 'inventory': {}}},
+        'savings_by_stage': {'cost_optimizer': 40}
+    }))
+    
+    cube_dir = str(tmp_path / 'cube')
+    summary = savings_cube.ingest([str(outputs)], cube_dir)
+    assert summary['files'] == 2
+    assert summary['findings'] == 4
+    
+    # Ingesting the same files again is a no-op
+    assert savings_cube.ingest([str(outputs)], cube_dir)['files'] == 0
+    
+    cube = savings_cube.SavingsCube.load(cube_dir)
+    assert cube.start_day == date(2024, 1, 10) and cube.days == 25
+    
+    report = savings_cube.summarize(cube, implementation_cost=1000)
+    assert report['by_category'] == {'EC2 Right-sizing': 120.0, 'Reserved Instances': 100.0, 'EBS Optimization': 40.0}
+    assert report['by_account'] == {'111': 120.0, '222': 140.0}
+    assert report['by_month'] == {'2024-01': 120.0, '2024-02': 140.0}
+    assert report['monthly_savings'] == 260.0
+    assert report['roi']['payback_months'] == round(1000 / 260, 1)
+    
+    february = savings_cube.summarize(cube, start=date(2024, 2, 1), accounts=['222'], categories=['EBS Optimization'])
+    assert february['monthly_savings'] == 40.0
+
+def test_run_rate_averages_days_instead_of_summing():
+    """Test daily runs of the same finding count once per month, not once per day"""
+    cube = savings_cube.SavingsCube()
+    cube.add([(date(2024, 3, day), 'S3 Lifecycle', '111', 10.0) for day in range(1, 31, 2)])
+    
+    report = savings_cube.summarize(cube)
+    assert report['monthly_savings'] == 10.0
+    assert report['annual_savings'] == 120.0
+    assert report['period']['days_with_findings'] == 15
+
+def test_rerun_in_a_later_ingest_replaces_earlier_figure(tmp_path):
+    """Test a same-day re-run ingested in a second call replaces the first run's savings"""
+    outputs = tmp_path / 'outputs'
+    outputs.mkdir()
+    cube_dir = str(tmp_path / 'cube')
+    
+    def run(name, savings, region='us-east-1'):
+        (outputs / name).write_text(json.dumps({
+            'handler': 'rds_optimizer', 'account_id': '111', 'region': region,
+            'timestamp': '2024-04-02T01:00:00', 'result': {'potential_savings': savings}
+        }))
+    
+    run('first.json', 80)
+    run('west.json', 15, region='us-west-2')
+    assert savings_cube.ingest([str(outputs)], cube_dir)['findings'] == 2
+    
+    run('rerun.json', 30)
+    assert savings_cube.ingest([str(outputs)], cube_dir)['files'] == 1
+    
+    cube = savings_cube.SavingsCube.load(cube_dir)
+    report = savings_cube.summarize(cube)
+    assert report['by_category'] == {'RDS Optimization': 45.0}
+    # Still two findings: us-east-1 was replaced, not counted again
+    assert int(cube.findings.sum()) == 2
+    # Queries never read the per-region index
+    assert cube._recorded is None
+    assert len(cube.recorded) == 2
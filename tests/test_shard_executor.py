@@ -0,0 +1,100 @@
+import json
+import boto3
+import sys
+import os
+from datetime import datetime, timedelta
+from moto import mock_cloudwatch, mock_rds
+
+# Add lambda functions to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda-functions'))
+
+from shard_executor import merge_results, merge_two, plan_shards, run_local
+
+def test_plan_shards_balances_by_weight():
+    """Test LPT planning assigns every item once and keeps shard weights close"""
+    items = [f"db-{index}" for index in range(40)]
+    weights = [(index * 7) % 13 + 1 for index in range(40)]
+    
+    shards = plan_shards(items, 4, weights)
+    
+    assert sorted(item for shard in shards for item in shard['items']) == sorted(items)
+    assert [shard['shard_index'] for shard in shards] == [0, 1, 2, 3]
+    loads = [shard['weight'] for shard in shards]
+    assert sum(loads) == sum(weights)
+    # LPT never leaves shards further apart than the heaviest single item
+    assert max(loads) - min(loads) <= max(weights)
+    
+    # More shards than items: one item each, no empty shards
+    assert [shard['items'] for shard in plan_shards(['a', 'b'], 10)] == [['a'], ['b']]
+
+def test_merge_two_reduces_by_type():
+    """Test numbers add, lists concatenate, dicts merge recursively and flags OR"""
+    left = {'savings': 1.5, 'found': ['a'], 'counts': {'gp2': 1}, 'truncated': False, 'region': 'us-east-1'}
+    right = {'savings': 2, 'found': ['b'], 'counts': {'gp2': 2, 'io1': 1}, 'truncated': True, 'extra': 3}
+    
+    assert merge_two(left, right) == {
+        'savings': 3.5,
+        'found': ['a', 'b'],
+        'counts': {'gp2': 3, 'io1': 1},
+        'truncated': True,
+        'region': 'us-east-1',
+        'extra': 3
+    }
+
+def test_merge_results_orders_by_shard():
+    """Test partials merge in shard order and shard metadata is dropped"""
+    partials = [
+        {'found': ['c'], 'total': 1, 'shard': {'shard_index': 1, 'items': 1}},
+        {'found': ['a', 'b'], 'total': 2, 'shard': {'shard_index': 0, 'items': 2}}
+    ]
+    
+    assert merge_results(partials) == {'found': ['a', 'b', 'c'], 'total': 3, 'shards_merged': 2}
+
+def build_databases(count):
+    rds = boto3.client('rds', region_name='us-east-1')
+    cloudwatch = boto3.client('cloudwatch', region_name='us-east-1')
+    
+    for index in range(count):
+        db_id = f"db-{index:04d}"
+        rds.create_db_instance(
+            DBInstanceIdentifier=db_id,
+            DBInstanceClass=['db.t3.medium', 'db.m5.large'][index % 2],
+            Engine='postgres',
+            AllocatedStorage=20,
+            MasterUsername='admin',
+            MasterUserPassword='password123'
+        )
+        if index % 10:
+            continue
+        # Every tenth database is idle or oversized
+        for metric, value in [('CPUUtilization', 2.0 + index % 20), ('DatabaseConnections', 0.5)]:
+            cloudwatch.put_metric_data(Namespace='AWS/RDS', MetricData=[{
+                'MetricName': metric,
+                'Dimensions': [{'Name': 'DBInstanceIdentifier', 'Value': db_id}],
+                'Timestamp': datetime.utcnow() - timedelta(hours=1),
+                'Value': value
+            }])
+
+def findings(result):
+    return {
+        key: sorted(result[key], key=lambda finding: finding['db_identifier'])
+        for key in ['idle_databases', 'oversized_databases']
+    }
+
+@mock_rds
+@mock_cloudwatch
+def test_run_local_matches_unsharded_run():
+    """Test a planned, sharded and merged scan finds what one full scan does, past the first page"""
+    from rds_optimizer import lambda_handler
+    build_databases(150)
+    
+    plan = json.loads(lambda_handler({'mode': 'plan', 'shard_count': 3}, None)['body'])
+    assert sum(len(shard['items']) for shard in plan['shards']) == 150
+    
+    unsharded = json.loads(lambda_handler({}, None)['body'])
+    merged = run_local('rds_optimizer', shard_count=3)
+    
+    assert merged['shards_merged'] == 3
+    assert findings(merged) == findings(unsharded)
+    assert len(unsharded['idle_databases']) + len(unsharded['oversized_databases']) == 15
+    assert round(merged['potential_savings'], 2) == round(unsharded['potential_savings'], 2)
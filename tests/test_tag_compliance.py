@@ -0,0 +1,90 @@
+import boto3
+import numpy as np
+import sys
+import os
+from moto import mock_ec2, mock_resourcegroupstaggingapi, mock_sts
+
+# Add lambda functions to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda-functions'))
+
+from tag_compliance import ComplianceScan, load_rules, scan_organization
+
+RULES = [
+    {'name': 'environment', 'key': 'Environment', 'allowed': ['production', 'staging']},
+    {'name': 'owner', 'key': 'Owner'},
+    {'name': 'cost-center', 'key': 'CostCenter', 'pattern': r'CC-\d{4}'}
+]
+
+def random_resources(count, seed=5):
+    rng = np.random.default_rng(seed)
+    resources = []
+    for index in range(count):
+        tags = []
+        if rng.random() < 0.8:
+            tags.append({'Key': 'Environment', 'Value': ['production', 'staging', 'prod'][rng.integers(3)]})
+        if rng.random() < 0.6:
+            tags.append({'Key': 'Owner', 'Value': 'data-team'})
+        if rng.random() < 0.7:
+            tags.append({'Key': 'CostCenter', 'Value': ['CC-1001', 'CC-12', 'engineering'][rng.integers(3)]})
+        service = ['ec2', 's3', 'rds', 'lambda'][rng.integers(4)]
+        resources.append({'ResourceARN': f"arn:aws:{service}:us-east-1:111122223333:thing/{index}", 'Tags': tags})
+    return resources
+
+def passes(resource, rule):
+    tags = {tag['Key']: tag['Value'] for tag in resource['Tags']}
+    value = tags.get(rule['key'])
+    if value is None:
+        return False
+    if 'allowed' in rule and value not in rule['allowed']:
+        return False
+    return 'pattern' not in rule or (value.startswith('CC-') and len(value) == 7)
+
+def test_popcounts_match_per_resource_evaluation():
+    """Test bitset popcounts reproduce per-rule, per-service and overall compliance"""
+    resources = random_resources(20003)
+    scan = ComplianceScan(load_rules(RULES))
+    # Uneven pages so packing has to carry bits across page and block boundaries
+    for start in range(0, len(resources), 97):
+        scan.add(resources[start:start + 97])
+    
+    counts = scan.counts()
+    
+    assert counts['resources'] == 20003
+    assert counts['rules'] == [sum(passes(resource, rule) for resource in resources) for rule in RULES]
+    assert counts['compliant'] == sum(all(passes(resource, rule) for rule in RULES) for resource in resources)
+    for service, values in counts['by_service'].items():
+        subset = [resource for resource in resources if resource['ResourceARN'].split(':')[2] == service]
+        assert values['resources'] == len(subset)
+        assert values['rules'] == [sum(passes(resource, rule) for resource in subset) for rule in RULES]
+        assert values['compliant'] == sum(all(passes(resource, rule) for rule in RULES) for resource in subset)
+    
+    # One bit per rule per resource, rounded up to whole bytes
+    bits, codes = scan.bitsets()
+    assert bits.shape == (3, 2501)
+    assert codes.dtype == np.uint16
+
+@mock_sts
+@mock_ec2
+@mock_resourcegroupstaggingapi
+def test_organization_scan_reports_percentages():
+    """Test the caller's account is scanned across regions and rolled up"""
+    for region, tag_sets in [
+        ('us-east-1', [{'Environment': 'production', 'Owner': 'a', 'CostCenter': 'CC-1000'}, {'Environment': 'dev'}]),
+        ('eu-west-1', [{'Environment': 'staging', 'Owner': 'b', 'CostCenter': 'CC-2000'}, {'Owner': 'c'}])
+    ]:
+        ec2 = boto3.client('ec2', region_name=region)
+        for tags in tag_sets:
+            ec2.run_instances(ImageId='ami-12345678', MinCount=1, MaxCount=1, TagSpecifications=[{
+                'ResourceType': 'instance',
+                'Tags': [{'Key': key, 'Value': value} for key, value in tags.items()]
+            }])
+    account_id = boto3.client('sts').get_caller_identity()['Account']
+    
+    accounts, organization, errors = scan_organization([account_id], ['us-east-1', 'eu-west-1'], RULES)
+    
+    assert errors == {}
+    summary = accounts[account_id]
+    assert summary['by_service']['ec2']['resources'] == 4
+    assert summary['compliance_percentage'] == 50.0
+    assert summary['by_rule'] == {'environment': 50.0, 'owner': 75.0, 'cost-center': 50.0}
+    assert organization['resources'] == summary['resources']